@@ -12,7 +12,7 @@ async def ocr_node(state: AgentState) -> dict:
     Sortie : exercise_statement, detected_subject, detected_level, exercise_type
     """
     try:
-        result = await extract_exercise_from_image(state["image_bytes"])
+        result = await extract_exercise_from_image(state["image_bytes"], user_id=state.get("user_id"))
 
         if not result.statement:
             return {"error": "OCR_FAILED: Impossible d'extraire l'énoncé de l'image."}
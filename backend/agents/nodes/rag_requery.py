@@ -1,6 +1,7 @@
 """
 Noeud RAG re-query — affine la recherche quand un spécialiste demande plus de contexte.
-Fusionne les nouveaux chunks avec les précédents (dédupliqués).
+Fusionne les nouveaux chunks avec les précédents (dédupliqués, une section
+entière absorbant les extraits qu'elle contient).
 """
 from agents.state import AgentState
 from rag.retrieval import search_relevant_chunks
@@ -37,20 +38,32 @@ async def rag_requery_node(state: AgentState) -> dict:
                 "similarity": c.similarity,
                 "chunk_index": c.chunk_index,
                 "course_id": c.course_id,
+                "section_index": c.section_index,
+                "section_heading": c.section_heading,
             }
             for c in new_chunks
         ]
 
-        # Fusion et déduplication par (course_id, chunk_index)
+        # Fusion et déduplication par (course_id, chunk_index) ; une section
+        # entière remplace les extraits de cette section
         existing = state.get("retrieved_chunks", [])
-        seen = {
-            (c["course_id"], c["chunk_index"])
-            for c in existing
+        candidates = [*existing, *new_chunks_dicts]
+        sections = {
+            (c["course_id"], c.get("section_index"))
+            for c in candidates
+            if c.get("section_heading")
         }
 
-        merged = list(existing)
-        for chunk in new_chunks_dicts:
-            key = (chunk["course_id"], chunk["chunk_index"])
+        merged = []
+        seen = set()
+        for chunk in candidates:
+            section = (chunk["course_id"], chunk.get("section_index"))
+            if chunk.get("section_heading"):
+                key = ("section", *section)
+            elif section in sections:
+                continue
+            else:
+                key = (chunk["course_id"], chunk["chunk_index"])
             if key not in seen:
                 merged.append(chunk)
                 seen.add(key)
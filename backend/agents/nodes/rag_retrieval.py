@@ -34,6 +34,8 @@ async def rag_retrieval_node(state: AgentState) -> dict:
                 "similarity": c.similarity,
                 "chunk_index": c.chunk_index,
                 "course_id": c.course_id,
+                "section_index": c.section_index,
+                "section_heading": c.section_heading,
             }
             for c in chunks
         ]
@@ -191,8 +191,10 @@ class BaseSpecialist(ABC):
         parts = []
         for i, chunk in enumerate(chunks, 1):
             similarity_pct = int(chunk.get("similarity", 0) * 100)
+            # Plusieurs extraits d'une même section : la section entière
+            label = f"Section « {chunk['section_heading']} »" if chunk.get("section_heading") else f"Extrait {i}"
             parts.append(
-                f"[Extrait {i} — {chunk.get('course_title', 'Cours')} "
+                f"[{label} — {chunk.get('course_title', 'Cours')} "
                 f"({chunk.get('subject', '')}), pertinence {similarity_pct}%]\n"
                 f"{chunk.get('content', '')}"
             )
@@ -8,6 +8,7 @@ Usage dans une route :
     from api.auth import get_current_user_id
     user_id: str = Depends(get_current_user_id)
 """
+import hmac
 import logging
 
 import httpx
@@ -91,3 +92,23 @@ async def get_current_user_id(
         )
 
     return user_id
+
+
+async def require_metrics_token(
+    authorization: str = Header("", alias="Authorization"),
+) -> None:
+    """
+    Protège GET /metrics : les métriques agrègent tous les élèves (coût OCR,
+    caches, jobs), un JWT d'élève ne suffit donc pas. Route introuvable tant
+    que settings.metrics_token n'est pas défini.
+    """
+    expected = get_settings().metrics_token
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    token = authorization.split(" ", 1)[1] if authorization.startswith("Bearer ") else ""
+    if not hmac.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token de métriques invalide",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
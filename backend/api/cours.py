@@ -1,32 +1,62 @@
 """
-API cours - ingestion de cours via photo (OCR + chunking + embedding + stockage).
-Upload asynchrone : retourne un job_id immédiatement, poll GET /jobs/{job_id}.
+API cours - ingestion de cours via photo(s) (OCR + chunking + embedding + stockage)
+ou via document numérique (PDF, Markdown, texte — extraction locale, sans OCR).
+Upload asynchrone : le job est enregistré dans la file upload_jobs et traité
+par un worker d'ingestion (workers/ingestion.py) ; retourne un job_id
+immédiatement. La progression est poussée en SSE par GET /jobs/{job_id}/events
+(GET /jobs/{job_id} reste disponible pour un simple état ponctuel).
+
+Uploads idempotents : un envoi rejoué (même en-tête Idempotency-Key, ou même
+contenu) renvoie le job ou le cours existant (200) au lieu d'un nouveau job.
+
+Édition (PATCH /{course_id}) : corrige le texte ou les métadonnées d'un cours ;
+seuls les chunks modifiés sont ré-embeddés.
 """
+import asyncio
+import hashlib
+import json
 import logging
-import uuid
-from datetime import datetime, timezone
+import tempfile
+import time
+from pathlib import Path
 from typing import Literal
 
-from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Request, UploadFile
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from api.auth import get_current_user_id
 from api.ratelimit import limiter
+from config import get_settings
 from db.client import get_supabase
-from rag.ocr import extract_course_from_image
-from rag.chunking import chunk_course_text
-from rag.embeddings import embed_chunks
-from rag.retrieval import store_chunks, delete_course_chunks
-
+from db.jobs import (
+    IdempotencyConflict,
+    JobKind,
+    UploadedFile,
+    UploadJob,
+    enqueue_job,
+    get_job,
+    release_content_hash,
+    upload_content_hash,
+    watch_job,
+)
+from rag.documents import document_kind
+from rag.ingestion import CourseEditConflict, edit_course
+from rag.ocr_cache import image_sha256
+from rag.quality import ImageQualityError, check_image_quality
+from rag.retrieval import delete_course_chunks
+from workers.ingestion import notify_worker
+
+settings = get_settings()
 logger = logging.getLogger("studybuddy.cours")
 router = APIRouter()
 
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10 MB
 ALLOWED_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif"}
-
-# In-memory job store — acceptable pour un déploiement single-instance (Railway MVP)
-# Jobs sont courts (< 30s), une perte sur restart force juste un retry côté user
-_JOBS: dict[str, dict] = {}
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024  # 50 MB
+_UPLOAD_READ_SIZE = 1024 * 1024
+_MAX_IDEMPOTENCY_KEY = 255
+_SSE_KEEPALIVE = 15.0  # s sans événement avant un commentaire SSE (proxys qui coupent les connexions muettes)
 
 
 # ── Modèles ──────────────────────────────────────────────────────────────────
@@ -46,6 +76,7 @@ class UploadJobResponse(BaseModel):
     status: Literal["queued", "processing", "done", "error"]
     course: CourseResponse | None = None
     error: str | None = None
+    timings: dict[str, float] | None = None  # Durée de chaque étape (s), une fois le job terminé
 
 
 class CourseListItem(BaseModel):
@@ -67,68 +98,95 @@ class CourseDetail(BaseModel):
     created_at: str
 
 
-# ── Background task ───────────────────────────────────────────────────────────
+class CourseEdit(BaseModel):
+    raw_content: str | None = None
+    title: str | None = None
+    subject: str | None = None
+    level: str | None = None
+    keywords: list[str] | None = None
+
+
+class CourseEditResponse(BaseModel):
+    course: CourseDetail
+    chunk_count: int
+    embedded: int  # Chunks nouveaux, embeddés par cette édition
+    kept: int      # Chunks inchangés, seulement réindexés
+    removed: int
+    timings: dict[str, float]
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
 
-async def _process_upload(job_id: str, image_bytes: bytes, user_id: str) -> None:
-    """OCR → chunking → embedding → stockage pgvector. Résultat dans _JOBS[job_id]."""
-    _JOBS[job_id] = {"status": "processing"}
-    logger.info("[UPLOAD] background start job=%s user=%s", job_id, user_id)
+def _job_response(job: UploadJob) -> UploadJobResponse:
+    result = job.result or {}
+    return UploadJobResponse(
+        job_id=job.id,
+        status=job.status,
+        course=result.get("course"),
+        # Erreur d'une tentative qui sera retentée : le job est encore en file
+        error=job.error if job.status == "error" else None,
+        timings=result.get("timings"),
+    )
+
+
+def _check_idempotency_key(key: str | None) -> str | None:
+    if key is not None and not 0 < len(key) <= _MAX_IDEMPOTENCY_KEY:
+        raise HTTPException(status_code=400, detail="En-tête Idempotency-Key invalide (1 à 255 caractères)")
+    return key
 
+
+async def _enqueue(
+    response: Response,
+    user_id: str,
+    kind: JobKind,
+    files: list[UploadedFile],
+    content_hash: str,
+    idempotency_key: str | None,
+    options: dict | None = None,
+) -> UploadJobResponse:
+    """Enregistre le job, ou renvoie (200) celui — ou le cours — déjà issu du même upload."""
     try:
-        # 1. OCR
-        ocr_result = await extract_course_from_image(image_bytes)
-        if not ocr_result.content:
-            _JOBS[job_id] = {"status": "error", "error": "Impossible d'extraire du texte de cette image."}
-            return
-
-        logger.info("[UPLOAD] OCR OK job=%s titre=%s", job_id, ocr_result.title)
-
-        # 2. Insertion en base
-        supabase = get_supabase()
-        course_id = str(uuid.uuid4())
-        now = datetime.now(timezone.utc).isoformat()
-        supabase.table("courses").insert({
-            "id": course_id,
-            "user_id": user_id,
-            "title": ocr_result.title,
-            "subject": ocr_result.subject,
-            "level": ocr_result.level,
-            "keywords": ocr_result.keywords,
-            "raw_content": ocr_result.content,
-            "created_at": now,
-        }).execute()
-
-        # 3. Chunking
-        chunks = chunk_course_text(
-            text=ocr_result.content,
-            course_id=course_id,
-            subject=ocr_result.subject,
-            title=ocr_result.title,
-            keywords=ocr_result.keywords,
+        job, created = await enqueue_job(
+            user_id, kind, files, options=options, idempotency_key=idempotency_key, content_hash=content_hash,
         )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if created:
+        notify_worker()
+        return UploadJobResponse(job_id=job.id, status="queued")
+
+    logger.info("[UPLOAD] upload déjà reçu user=%s job_id=%s status=%s", user_id, job.id, job.status)
+    response.status_code = 200
+    return _job_response(job)
 
-        # 4. Embedding + stockage pgvector
-        chunks_with_embeddings = await embed_chunks(chunks)
-        await store_chunks(chunks_with_embeddings=chunks_with_embeddings, user_id=user_id, course_id=course_id)
 
-        logger.info("[UPLOAD] SUCCES job=%s course_id=%s chunks=%d", job_id, course_id, len(chunks))
+def _final_event(job: UploadJob) -> dict:
+    """Dernier événement du flux, déduit de l'état du job (done ou error)."""
+    if job.status == "done":
+        result = job.result or {}
+        return {"stage": "done", "at": job.updated_at, "course": result.get("course"), "timings": result.get("timings")}
+    return {"stage": "error", "at": job.updated_at, "error": job.error}
 
-        _JOBS[job_id] = {
-            "status": "done",
-            "course": CourseResponse(
-                id=course_id,
-                title=ocr_result.title,
-                subject=ocr_result.subject,
-                level=ocr_result.level,
-                keywords=ocr_result.keywords,
-                chunk_count=len(chunks),
-                created_at=now,
-            ),
-        }
 
-    except Exception as e:
-        logger.error("[UPLOAD] ERREUR job=%s: %s", job_id, e, exc_info=True)
-        _JOBS[job_id] = {"status": "error", "error": str(e)}
+async def _spool_upload(file: UploadFile, max_size: int) -> tuple[Path, str]:
+    """
+    Copie l'upload sur disque par blocs : le fichier n'est jamais entièrement
+    en mémoire. Retourne le chemin et le SHA-256 du contenu.
+    """
+    suffix = Path(file.filename or "").suffix
+    size = 0
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(prefix="studybuddy-import-", suffix=suffix, delete=False) as tmp:
+        path = Path(tmp.name)
+        while block := await file.read(_UPLOAD_READ_SIZE):
+            size += len(block)
+            if size > max_size:
+                tmp.close()
+                path.unlink(missing_ok=True)
+                raise HTTPException(status_code=413, detail="Document trop lourd. Taille maximale : 50 MB")
+            tmp.write(block)
+            digest.update(block)
+    return path, digest.hexdigest()
 
 
 # ── Routes ────────────────────────────────────────────────────────────────────
@@ -137,31 +195,91 @@ async def _process_upload(job_id: str, image_bytes: bytes, user_id: str) -> None
 @limiter.limit("5/minute")
 async def upload_course(
     request: Request,
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
+    response: Response,
+    file: list[UploadFile] = File(...),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
     user_id: str = Depends(get_current_user_id),
 ):
     """
-    Upload asynchrone d'un cours.
+    Upload asynchrone d'un cours : une photo, ou plusieurs pages du même cours
+    (un champ `file` par page, dans l'ordre des pages).
     Retourne immédiatement {job_id, status:'queued'}.
-    Poll GET /jobs/{job_id} toutes les 2s pour suivre le traitement.
+    Suivre le traitement en SSE : GET /jobs/{job_id}/events.
+
+    Rejouer la requête (même Idempotency-Key, ou mêmes photos) renvoie le job
+    existant, ou directement le cours s'il est déjà créé.
     """
-    if file.content_type not in ALLOWED_TYPES:
+    idempotency_key = _check_idempotency_key(idempotency_key)
+    if len(file) > settings.upload_max_pages:
         raise HTTPException(
             status_code=400,
-            detail="Format non supporté. Formats acceptés : JPEG, PNG, WEBP, HEIC",
+            detail=f"Trop de pages. Maximum : {settings.upload_max_pages} photos par cours",
         )
 
-    image_bytes = await file.read()
-    if len(image_bytes) > MAX_IMAGE_SIZE:
-        raise HTTPException(status_code=413, detail="Image trop lourde. Taille maximale : 10 MB")
+    pages = []
+    for number, page in enumerate(file, start=1):
+        prefix = f"Page {number} : " if len(file) > 1 else ""
+        if page.content_type not in ALLOWED_TYPES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{prefix}Format non supporté. Formats acceptés : JPEG, PNG, WEBP, HEIC",
+            )
+
+        image_bytes = await page.read()
+        if len(image_bytes) > MAX_IMAGE_SIZE:
+            raise HTTPException(status_code=413, detail=f"{prefix}Image trop lourde. Taille maximale : 10 MB")
+
+        # Photo floue, sombre ou trop petite : refusée avant de payer un appel Vision
+        try:
+            await check_image_quality(image_bytes, kind="course")
+        except ImageQualityError as e:
+            raise HTTPException(status_code=422, detail={"code": e.code, "message": f"{prefix}{e}", "page": number})
+        pages.append((image_bytes, page.content_type, page.filename))
+
+    content_hash = upload_content_hash([image_sha256(data) for data, _, _ in pages])
+    job = await _enqueue(response, user_id, "photo", pages, content_hash, idempotency_key)
+
+    logger.info(
+        "[UPLOAD] job_id=%s status=%s user=%s fichiers=%s",
+        job.job_id, job.status, user_id, ", ".join(str(page.filename) for page in file),
+    )
+    return job
+
+
+@router.post("/import", response_model=UploadJobResponse, status_code=202)
+@limiter.limit("5/minute")
+async def import_course_document(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    subject: str = Form(None),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Import asynchrone d'un cours numérique (PDF avec couche texte, Markdown, texte).
+    Le texte est extrait localement, sans OCR. Même suivi que /upload :
+    GET /jobs/{job_id}/events. Idempotent comme /upload.
+    """
+    idempotency_key = _check_idempotency_key(idempotency_key)
+    kind = document_kind(file.filename, file.content_type)
+    if kind is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Format non supporté. Formats acceptés : PDF, Markdown (.md), texte (.txt)",
+        )
 
-    job_id = str(uuid.uuid4())
-    _JOBS[job_id] = {"status": "queued"}
-    background_tasks.add_task(_process_upload, job_id, image_bytes, user_id)
+    path, content_hash = await _spool_upload(file, MAX_DOCUMENT_SIZE)
+    try:
+        job = await _enqueue(
+            response, user_id, "document", [(path, file.content_type, file.filename)], content_hash,
+            idempotency_key, options={"document_kind": kind, "subject": subject},
+        )
+    finally:
+        path.unlink(missing_ok=True)
 
-    logger.info("[UPLOAD] job queued job_id=%s user=%s fichier=%s", job_id, user_id, file.filename)
-    return UploadJobResponse(job_id=job_id, status="queued")
+    logger.info("[IMPORT] job_id=%s status=%s user=%s fichier=%s", job.job_id, job.status, user_id, file.filename)
+    return job
 
 
 @router.get("/jobs/{job_id}", response_model=UploadJobResponse)
@@ -169,16 +287,74 @@ async def get_upload_job(
     job_id: str,
     user_id: str = Depends(get_current_user_id),
 ):
-    """Retourne le statut d'un job d'upload."""
-    job = _JOBS.get(job_id)
+    """Retourne le statut d'un job d'upload (lisible depuis n'importe quel worker)."""
+    job = await get_job(job_id, user_id)
     if job is None:
         raise HTTPException(status_code=404, detail="Job introuvable (expiré ou inexistant)")
+    return _job_response(job)
 
-    return UploadJobResponse(
-        job_id=job_id,
-        status=job.get("status", "queued"),
-        course=job.get("course"),
-        error=job.get("error"),
+
+@router.get("/jobs/{job_id}/events")
+async def stream_upload_job(
+    job_id: str,
+    request: Request,
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Progression d'un job en SSE, à la place du polling : un événement
+    {stage, at, ...} par étape — queued, ocr (ou extraction), chunking,
+    embedding (done/total), storing, retry — puis done (course, timings) ou
+    error, qui ferme le flux.
+
+    Le job est relu dès qu'un worker du même process signale un changement,
+    sinon toutes les settings.job_events_poll_interval secondes : l'élève
+    n'est authentifié qu'une fois, à l'ouverture du flux.
+    """
+    job = await get_job(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable (expiré ou inexistant)")
+
+    def sse(data: dict) -> str:
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def generate():
+        nonlocal job
+        sent = 0
+        last_write = time.monotonic()
+        with watch_job(job_id) as changed:
+            if job.status == "queued" and not job.events:
+                yield sse({"stage": "queued", "at": job.updated_at})
+            while True:
+                for event in job.events[sent:]:
+                    yield sse(event)
+                    last_write = time.monotonic()
+                sent = max(sent, len(job.events))
+                if job.status in ("done", "error"):
+                    yield sse(_final_event(job))
+                    return
+                if await request.is_disconnected():
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=settings.job_events_poll_interval)
+                except TimeoutError:
+                    if time.monotonic() - last_write >= _SSE_KEEPALIVE:
+                        yield ": keep-alive\n\n"
+                        last_write = time.monotonic()
+                changed.clear()
+                try:
+                    refreshed = await get_job(job_id, user_id)
+                except Exception as e:
+                    logger.warning("[JOBS] relecture impossible job=%s: %s", job_id, e)
+                    continue
+                if refreshed is None:
+                    yield sse({"stage": "error", "at": None, "error": "Job introuvable (expiré ou inexistant)"})
+                    return
+                job = refreshed
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -217,6 +393,43 @@ def get_course(
     return result.data
 
 
+@router.patch("/{course_id}", response_model=CourseEditResponse)
+@limiter.limit("20/minute")
+async def update_course(
+    request: Request,
+    course_id: str,
+    body: CourseEdit,
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Corrige un cours (faute d'OCR, titre, matière...) sans le ré-uploader :
+    le texte est re-chunké et seuls les chunks qui ont changé sont embeddés.
+    """
+    edits = body.model_dump(exclude_none=True)
+    logger.info("[EDIT] course_id=%s user=%s champs=%s", course_id, user_id, ", ".join(edits) or "-")
+    if not edits:
+        raise HTTPException(status_code=400, detail="Aucune modification")
+    if any(not edits[key].strip() for key in ("raw_content", "title", "subject", "level") if key in edits):
+        raise HTTPException(status_code=400, detail="Le contenu et les métadonnées du cours ne peuvent pas être vides")
+
+    try:
+        edited = await edit_course(course_id, user_id, **edits)
+    except CourseEditConflict:
+        raise HTTPException(status_code=409, detail="Cours modifié entretemps, recharge-le puis réessaie")
+    if edited is None:
+        raise HTTPException(status_code=404, detail="Cours introuvable")
+
+    logger.info("[EDIT] SUCCES course_id=%s embeddés=%d", course_id, edited.embedded)
+    return CourseEditResponse(
+        course=edited.course,
+        chunk_count=edited.chunk_count,
+        embedded=edited.embedded,
+        kept=len(edited.diff.kept),
+        removed=len(edited.diff.removed),
+        timings=edited.timings,
+    )
+
+
 @router.delete("/{course_id}", status_code=204)
 async def delete_course(
     course_id: str,
@@ -226,7 +439,7 @@ async def delete_course(
     supabase = get_supabase()
     result = (
         supabase.table("courses")
-        .select("id")
+        .select("id, content_hash")
         .eq("id", course_id)
         .eq("user_id", user_id)
         .execute()
@@ -235,4 +448,7 @@ async def delete_course(
         raise HTTPException(status_code=404, detail="Cours introuvable")
     await delete_course_chunks(course_id)
     supabase.table("courses").delete().eq("id", course_id).execute()
+    # Les jobs qui renvoyaient ce cours ne doivent plus bloquer un nouvel import du même fichier
+    if result.data[0].get("content_hash"):
+        await release_content_hash(user_id, result.data[0]["content_hash"])
     logger.info("[DELETE] SUCCES course_id=%s", course_id)
@@ -27,6 +27,8 @@ from agents.nodes.evaluator import evaluator_node
 from api.auth import get_current_user_id
 from api.ratelimit import limiter
 from rag.ocr import extract_exercise_from_image
+from rag.preprocessing import UnsupportedImageError
+from rag.quality import ImageQualityError, check_image_quality
 from rag.retrieval import search_relevant_chunks
 from config import get_settings
 
@@ -91,6 +93,10 @@ async def correct_exercise(
     """
     image_bytes = await file.read()
     _validate_image(file, image_bytes)
+    try:
+        await check_image_quality(image_bytes, kind="exercise")
+    except ImageQualityError as e:
+        raise HTTPException(status_code=422, detail={"code": e.code, "message": str(e)})
 
     initial_state = make_initial_state(
         image_bytes=image_bytes,
@@ -158,7 +164,16 @@ async def correct_exercise_stream(
         logger.info("[STREAM] phase OCR start")
         yield sse({"type": "phase", "phase": "ocr", "status": "running"})
         try:
-            exercise = await extract_exercise_from_image(image_bytes)
+            await check_image_quality(image_bytes, kind="exercise")
+        except ImageQualityError as e:
+            yield sse({"type": "error", "code": e.code, "message": str(e)})
+            return
+        try:
+            exercise = await extract_exercise_from_image(image_bytes, user_id=user_id)
+        except UnsupportedImageError as e:
+            logger.warning("[STREAM] image refusée: %s", e)
+            yield sse({"type": "error", "code": "IMAGE_UNSUPPORTED", "message": str(e)})
+            return
         except Exception as e:
             logger.error("[STREAM] OCR ERREUR: %s", e, exc_info=True)
             yield sse({"type": "error", "code": "OCR_FAILED", "message": str(e)})
@@ -204,6 +219,7 @@ async def correct_exercise_stream(
                 "content": c.content, "course_title": c.course_title,
                 "subject": c.subject, "similarity": c.similarity,
                 "chunk_index": c.chunk_index, "course_id": c.course_id,
+                "section_index": c.section_index, "section_heading": c.section_heading,
             }
             for c in chunks
         ]
@@ -321,6 +337,7 @@ async def followup_stream(
                 "content": c.content, "course_title": c.course_title,
                 "subject": c.subject, "similarity": c.similarity,
                 "chunk_index": c.chunk_index, "course_id": c.course_id,
+                "section_index": c.section_index, "section_heading": c.section_heading,
             }
             for c in chunks
         ]
@@ -0,0 +1,199 @@
+"""
+Utilitaires partagés par les benchmarks.
+
+Les benchmarks se lancent depuis backend/ :
+    python -m benchmarks.bench_ocr_preprocessing [--live]
+
+Sans --live, aucune clé API n'est nécessaire : des valeurs factices sont
+injectées dans l'environnement avant l'import de config.
+"""
+import io
+import os
+import random
+from html.parser import HTMLParser
+from pathlib import Path
+
+TEST_MATERIALS = Path(__file__).resolve().parents[2] / "test-materials"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".heic", ".heif"}
+
+_PLACEHOLDER_ENV = {
+    "ANTHROPIC_API_KEY": "bench",
+    "VOYAGE_API_KEY": "bench",
+    "SUPABASE_URL": "http://localhost",
+    "SUPABASE_ANON_KEY": "bench",
+    "SUPABASE_SERVICE_ROLE_KEY": "bench",
+}
+
+_BLOCK_TAGS = {"h1", "h2", "h3", "div", "p", "li", "br", "ul", "ol", "tr"}
+
+
+def bootstrap_env(live: bool = False) -> None:
+    """Injecte des clés factices si le benchmark ne touche pas aux vraies APIs."""
+    if live:
+        return
+    for key, value in _PLACEHOLDER_ENV.items():
+        os.environ.setdefault(key, value)
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.parts: list[str] = []
+        self._skip = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("style", "script", "head"):
+            self._skip = True
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("style", "script", "head"):
+            self._skip = False
+        elif tag in ("h1", "h2", "h3", "div", "ul", "ol"):
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(path: Path) -> str:
+    """Extrait le texte d'un support HTML de test-materials (un bloc par ligne)."""
+    parser = _TextExtractor()
+    parser.feed(path.read_text(encoding="utf-8"))
+    lines = [" ".join(line.split()) for line in "".join(parser.parts).split("\n")]
+    text = "\n".join(lines)
+    while "\n\n\n" in text:
+        text = text.replace("\n\n\n", "\n\n")
+    return text.strip()
+
+
+def _page_font(width: int, density: int):
+    from PIL import ImageFont
+
+    return ImageFont.load_default(size=max(12, width // density))
+
+
+def layout_lines(text: str, size: tuple[int, int] = (3024, 4032), density: int = 55) -> list[tuple[str, float]]:
+    """
+    Lignes effectivement rendues par render_page, avec leur ordonnée (fraction de la hauteur).
+    `density` : nombre de caractères par largeur de page (plus grand = police plus petite).
+    """
+    width, height = size
+    line_height = int(_page_font(width, density).size * 1.6)
+    y = height // 20
+    placed: list[tuple[str, float]] = []
+    for line in text.split("\n"):
+        if y > height - line_height:
+            break
+        placed.append((line, (y + line_height / 2) / height))
+        y += line_height if line.strip() else line_height // 2
+    return placed
+
+
+def render_page(
+    text: str,
+    size: tuple[int, int] = (3024, 4032),
+    exif_rotate: bool = True,
+    density: int = 55,
+) -> bytes:
+    """
+    Rend un texte sur une « photo de téléphone » synthétique (JPEG 12 MP).
+    Avec exif_rotate, l'image est stockée couchée avec une orientation EXIF,
+    comme le fait l'appareil photo d'un iPhone tenu en portrait.
+    """
+    from PIL import Image, ImageDraw
+
+    width, height = size
+    image = Image.new("RGB", size, (246, 243, 236))
+    draw = ImageDraw.Draw(image)
+    font = _page_font(width, density)
+    rng = random.Random(42)
+
+    for line, y_fraction in layout_lines(text, size, density):
+        y = int(y_fraction * height - font.size * 0.8)
+        draw.text((width // 14, y), line, fill=(20, 20, 20), font=font)
+
+    # Grain de capteur
+    for _ in range(width * height // 400):
+        x, yy = rng.randrange(width), rng.randrange(height)
+        shade = rng.randrange(200, 255)
+        image.putpixel((x, yy), (shade, shade, shade))
+
+    buffer = io.BytesIO()
+    if exif_rotate:
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotation 90° horaire à l'affichage
+        image.transpose(Image.Transpose.ROTATE_90).save(buffer, format="JPEG", quality=95, exif=exif)
+    else:
+        image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def load_samples(directory: Path = TEST_MATERIALS) -> list[tuple[str, bytes]]:
+    """
+    Retourne les images du dossier ; les supports HTML sont rendus en photos
+    synthétiques pour que le benchmark tourne sur le dépôt tel quel.
+    """
+    samples: list[tuple[str, bytes]] = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() in IMAGE_SUFFIXES:
+            samples.append((path.name, path.read_bytes()))
+        elif path.suffix.lower() == ".html":
+            samples.append((f"{path.stem}.jpg (rendu)", render_page(html_to_text(path))))
+    return samples
+
+
+def _pdf_escape(text: str) -> bytes:
+    raw = text.encode("cp1252", errors="replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def render_pdf(pages: list[str], title: str | None = None, lines_per_page: int = 50) -> bytes:
+    """
+    PDF minimal avec couche texte (Helvetica, WinAnsi), une page par entrée.
+    Suffisant pour mesurer l'extraction locale sans dépendance d'écriture PDF.
+    """
+    objects: list[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # /Pages, rempli une fois les pages connues
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for text in pages:
+        stream = [b"BT /F1 10 Tf 12 TL 50 800 Td"]
+        for line in text.splitlines()[:lines_per_page]:
+            stream.append(b"(" + _pdf_escape(line[:100]) + b") '")
+        stream.append(b"ET")
+        content = b"\n".join(stream)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    info_id = None
+    if title:
+        # Chaîne d'information en UTF-16BE (les métadonnées n'utilisent pas WinAnsi)
+        objects.append(b"<< /Title <FEFF" + title.encode("utf-16-be").hex().upper().encode() + b"> >>")
+        info_id = len(objects)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    trailer = b"<< /Size %d /Root 1 0 R" % (len(objects) + 1)
+    if info_id:
+        trailer += b" /Info %d 0 R" % info_id
+    out.write(b"trailer\n" + trailer + b" >>\nstartxref\n%d\n%%%%EOF\n" % xref)
+    return out.getvalue()
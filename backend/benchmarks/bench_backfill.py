@@ -0,0 +1,204 @@
+"""
+Benchmark — import en masse (scripts/backfill_courses.py) hors ligne, avec le
+substitut local de l'API Message Batches.
+
+    python -m benchmarks.bench_backfill
+    python -m benchmarks.bench_backfill --photos 120 --latency 0.05
+
+Le dossier contient des photos rendues depuis test-materials, plus une photo
+floue (refusée avant OCR) et une copie (dédupliquée). Le modèle simulé renvoie
+une sortie hors schéma pour une photo sur dix (relance ciblée). Voyage et
+Supabase sont simulés.
+
+Le scénario interrompt l'import deux fois — pendant le batch, puis pendant le
+stockage — et vérifie qu'à la troisième exécution chaque cours est stocké
+exactement une fois, et que seules les requêtes en vol au moment de l'arrêt
+sont rejouées.
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from benchmarks._common import TEST_MATERIALS, bootstrap_env, html_to_text, render_page
+
+PHOTO_SIZE = (1200, 1600)
+
+
+def _make_photos(directory: Path, count: int) -> int:
+    """Écrit les photos ; retourne le nombre de photos à lire par OCR."""
+    from PIL import Image, ImageFilter
+
+    lines: list[str] = []
+    for path in sorted(TEST_MATERIALS.glob("*.html")):
+        lines.extend(line for line in html_to_text(path).splitlines() if line.strip())
+    for index in range(count):
+        start = (index * 7) % len(lines)
+        text = f"Cours n°{index + 1}\n" + "\n".join((lines[start:] + lines)[:30])
+        (directory / f"page-{index:03d}.jpg").write_bytes(render_page(text, PHOTO_SIZE, exif_rotate=False))
+
+    shutil.copy(directory / "page-000.jpg", directory / "page-000-copie.jpg")
+    blurry = Image.open(directory / "page-001.jpg").filter(ImageFilter.GaussianBlur(12))
+    buffer = io.BytesIO()
+    blurry.save(buffer, format="JPEG", quality=85)
+    (directory / "page-001-floue.jpg").write_bytes(buffer.getvalue())
+    return count
+
+
+class _FakeVision:
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+        self.repairs = 0
+
+    async def create(self, model, max_tokens, messages, tools, tool_choice):
+        import anthropic
+
+        self.calls += 1
+        repair = isinstance(messages[0]["content"], str)
+        self.repairs += repair
+        await asyncio.sleep(self.latency)
+        paragraphs = [f"## Partie {i}\n" + "Le développement d'une expression littérale. " * 12 for i in range(6)]
+        tool_input = {
+            "title": f"Cours simulé {self.calls}", "subject": "Mathématiques", "level": "3ème",
+            "content": "\n\n".join(paragraphs), "keywords": ["développement", "factorisation"],
+        }
+        if not repair and self.calls % 10 == 0:
+            tool_input["keywords"] = [{"mot": "développement"}]   # Hors schéma : relance ciblée
+        return anthropic.types.Message.model_validate({
+            "id": f"msg_{self.calls}", "type": "message", "role": "assistant", "model": model,
+            "content": [{"type": "tool_use", "id": f"toolu_{self.calls}", "name": tool_choice["name"], "input": tool_input}],
+            "stop_reason": "tool_use", "stop_sequence": None,
+            "usage": {"input_tokens": 1600, "output_tokens": 700},
+        })
+
+
+class _FakeVoyage:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def embed(self, texts, model, input_type):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(embeddings=[[0.0] * 1024 for _ in texts])
+
+
+class _FakeStore:
+    """Tables courses / course_chunks en mémoire ; peut simuler un arrêt après n cours."""
+
+    def __init__(self) -> None:
+        self.courses: dict[str, int] = {}
+        self.inserts = 0
+        self.crash_after: int | None = None
+
+    async def save_course(self, course_id, user_id, ingested) -> str:
+        if self.crash_after is not None and self.inserts >= self.crash_after:
+            raise ConnectionError("arrêt simulé pendant le stockage")
+        self.inserts += 1
+        self.courses[course_id] = len(ingested.chunks_with_embeddings)
+        return "2026-01-01T00:00:00+00:00"
+
+    def get_supabase(self):
+        store = self
+
+        class _Query:
+            def delete(self):
+                return self
+
+            def eq(self, column, value):
+                store.courses.pop(value, None)
+                return self
+
+            def execute(self):
+                return SimpleNamespace(data=[])
+
+        return SimpleNamespace(table=lambda name: _Query())
+
+
+async def run(photos: int, latency: float) -> None:
+    from rag import embeddings, ocr
+    from rag.batches import LocalMessageBatches
+    from scripts import backfill_courses as backfill
+
+    vision, voyage, store = _FakeVision(latency), _FakeVoyage(), _FakeStore()
+    ocr.client = SimpleNamespace(messages=vision)
+    embeddings.provider.client = voyage
+    backfill.save_course = store.save_course
+    backfill.get_supabase = store.get_supabase
+
+    workdir = Path(tempfile.mkdtemp(prefix="backfill-"))
+    try:
+        expected = _make_photos(workdir, photos)
+        checkpoint_path = workdir / ".backfill-checkpoint.json"
+        state_dir = workdir / ".backfill-checkpoint.batches"
+        user_id = "00000000-0000-0000-0000-000000000001"
+
+        def executed() -> int:
+            return sum(len(p.read_text().splitlines()) for p in state_dir.glob("*.results.jsonl"))
+
+        async def attempt(label: str, stop_when=None) -> None:
+            checkpoint = backfill.Checkpoint.load(checkpoint_path, user_id)
+            batches = LocalMessageBatches(state_dir, vision.create, concurrency=8)
+            start = time.perf_counter()
+            task = asyncio.create_task(
+                backfill.run_backfill(workdir, checkpoint, batches, poll_interval=0.05, group_size=16)
+            )
+            if stop_when is not None:
+                while not task.done() and not stop_when():
+                    await asyncio.sleep(0.02)
+                task.cancel()
+            try:
+                await task
+                outcome = "terminé"
+            except (asyncio.CancelledError, ConnectionError) as e:
+                outcome = f"interrompu ({type(e).__name__})"
+            finally:
+                await batches.aclose()
+            counts = backfill.Checkpoint.load(checkpoint_path, user_id).counts()
+            print(f"{label:30} {outcome:26} {time.perf_counter() - start:6.2f}s  {dict(sorted(counts.items()))}")
+
+        print(f"{photos} photos (+1 floue, +1 copie), latence Vision simulée {latency * 1000:.0f} ms\n")
+        # 1. Arrêt pendant le batch, une fois la moitié des requêtes exécutée
+        await attempt("1. arrêt pendant le batch", stop_when=lambda: executed() >= photos // 2)
+        executed_before_resume = executed()
+        # 2. Arrêt pendant le stockage, après 5 cours
+        store.crash_after = store.inserts + 5
+        await attempt("2. arrêt pendant le stockage")
+        # 3. Reprise complète
+        store.crash_after = None
+        await attempt("3. reprise")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\nRequêtes du batch exécutées avant l'arrêt : {executed_before_resume}, reprises ensuite : "
+          f"{expected - executed_before_resume}")
+    in_flight = vision.calls - vision.repairs - expected
+    print(f"Appels Vision : {vision.calls} pour {expected} photos à lire "
+          f"({vision.repairs} relances ciblées, {in_flight} requêtes en vol perdues à l'arrêt du substitut local)")
+    print(f"Appels Voyage : {voyage.calls}")
+    print(f"Cours stockés : {len(store.courses)} / {expected}, insertions : {store.inserts}")
+    print(f"Coût OCR estimé (tarif batch) : {ocr.OCR_COST.total():.2f} $")
+    print(f"Via POST /api/cours/upload (5/min) : ~{expected / 5:.0f} min")
+    assert len(store.courses) == expected
+    assert in_flight <= 8   # Au plus la concurrence du substitut ; rien n'est rejoué avec la vraie API
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2, help="Latence d'une requête Vision simulée (s)")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    os.environ["OCR_CACHE_ENABLED"] = "false"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+    asyncio.run(run(args.photos, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmark — chunking d'un cours (rag/chunking.chunk_course_text), mode
+"chars" (chunk_size en caractères) contre mode "tokens" (budget en tokens
+estimés, coupures qui respectent formules, listes et définitions).
+
+    python -m benchmarks.bench_chunking
+    python -m benchmarks.bench_chunking --corpus-mb 4 --max-tokens 256
+
+Deux corpus :
+- test-materials : les supports HTML, un cours par fichier ;
+- synthétique : ~1 MB de cours générés (titres, définitions numérotées,
+  listes, formules, calculs sur plusieurs lignes, longs paragraphes sans
+  ligne vide — le cas où le mode "chars" retombe sur sa coupure rfind).
+
+Mesure le débit (chunks/s, Mo/s), la distribution de la taille des chunks
+(tokens estimés), le nombre de chunks et de tokens d'embedding par cours,
+et le nombre de formules, calculs et éléments de liste qu'aucun chunk ne
+contient en entier.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks._common import TEST_MATERIALS, bootstrap_env, html_to_text
+
+_WORDS = (
+    "fonction dérivée variable coefficient équation solution théorème propriété valeur "
+    "courbe tangente limite nombre réel entier produit somme facteur expression calcul "
+    "méthode résultat exemple triangle angle longueur vecteur force énergie vitesse"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(_WORDS, k=rng.randint(8, 18))
+    return " ".join(words).capitalize() + "."
+
+
+def _formula(rng: random.Random) -> str:
+    a, b, c = rng.randint(2, 9), rng.randint(1, 20), rng.randint(1, 50)
+    return rng.choice([
+        f"f(x) = {a}x² + {b}x − {c}",
+        f"({a}x + {b})² = {a * a}x² + {2 * a * b}x + {b * b}",
+        f"v = d / t = {c} / {a} ≈ {c / a:.2f} m/s",
+        f"E = m × g × h = {a} × 9,81 × {b}",
+    ])
+
+
+def _derivation(rng: random.Random) -> str:
+    """Calcul détaillé sur plusieurs lignes, en formule centrée."""
+    a, b = rng.randint(2, 9), rng.randint(1, 9)
+    steps = [f"({a}x + {b})({a}x − {b}) + {b}x({a}x − {b})"]
+    for step in range(rng.randint(6, 14)):
+        steps.append(f"= {a * a}x² − {b * b} + {a * b}x² − {b * b}x + {step}(x − {step})")
+    return "$$\n" + "\n".join(line.strip() for line in steps) + "\n$$"
+
+
+def _synthetic_course(rng: random.Random, index: int) -> tuple[str, list[str]]:
+    """Texte d'un cours et ses unités insécables (formules, éléments de liste, calculs)."""
+    units: list[str] = []
+
+    def formula() -> str:
+        units.append(_formula(rng))
+        return units[-1]
+
+    parts = [f"# Chapitre {index} : {rng.choice(_WORDS).capitalize()} et {rng.choice(_WORDS)}"]
+    for section in range(1, rng.randint(4, 7)):
+        parts.append(f"## {section}. {rng.choice(_WORDS).capitalize()}")
+        parts.append(f"Définition {section} : " + " ".join(_sentence(rng) for _ in range(2)))
+        # Paragraphe long, formules au fil du texte et calcul centré, sans ligne vide
+        lines = [
+            " ".join(_sentence(rng) for _ in range(rng.randint(2, 5))) + f" On a {formula()} donc le résultat suit."
+            for _ in range(rng.randint(3, 8))
+        ]
+        units.append(_derivation(rng))
+        lines.insert(rng.randint(0, len(lines)), units[-1])
+        parts.append("\n".join(lines))
+        # Liste dont certains éléments enchaînent plusieurs formules sans point
+        items = []
+        for _ in range(rng.randint(3, 7)):
+            formulas = " ; ".join(formula() for _ in range(rng.randint(1, 6)))
+            items.append(f"- {_sentence(rng)[:-1]} : {formulas}")
+        units.extend(items)
+        parts.append("\n".join(items))
+        parts.append(formula())
+    return "\n\n".join(parts), units
+
+
+def _synthetic_corpus(megabytes: float, seed: int = 7) -> list[tuple[str, list[str]]]:
+    rng = random.Random(seed)
+    courses, size = [], 0
+    while size < megabytes * 1_000_000:
+        course = _synthetic_course(rng, len(courses) + 1)
+        courses.append(course)
+        size += len(course[0].encode("utf-8"))
+    return courses
+
+
+def _protected_lines(text: str) -> list[str]:
+    """Formules et éléments de liste d'un support, à retrouver entiers dans un chunk."""
+    from rag.chunking import _LIST_ITEM, _RELATION
+
+    return [
+        line.strip() for line in text.splitlines()
+        if _LIST_ITEM.match(line) or (_RELATION.search(line) and len(line) < 120)
+    ]
+
+
+def _run(label: str, courses: list[tuple[str, list[str]]], mode: str, max_tokens: int) -> None:
+    from rag.chunking import chunk_course_text, estimate_tokens
+
+    chunk_size = max_tokens if mode == "tokens" else None
+    start = time.perf_counter()
+    results = [
+        chunk_course_text(text, "c", "Mathématiques", "Cours", [], chunk_size=chunk_size, mode=mode)
+        for text, _ in courses
+    ]
+    elapsed = time.perf_counter() - start
+
+    contents = [chunk.content for chunks in results for chunk in chunks]
+    sizes = sorted(estimate_tokens(content) for content in contents)
+    per_course = [len(chunks) for chunks in results]
+    tokens_per_course = [sum(estimate_tokens(chunk.content) for chunk in chunks) for chunks in results]
+    broken = total = 0
+    for (_, units), chunks in zip(courses, results):
+        for unit in units:
+            total += 1
+            broken += not any(unit in chunk.content for chunk in chunks)
+
+    megabytes = sum(len(text.encode("utf-8")) for text, _ in courses) / 1_000_000
+    print(
+        f"{label:16} {mode:6} {len(contents) / elapsed:>9.0f} {megabytes / elapsed:>6.2f} "
+        f"{statistics.mean(per_course):>8.1f} {sizes[0]:>5} {sizes[len(sizes) // 2]:>5} "
+        f"{sizes[int(len(sizes) * 0.9)]:>5} {sizes[-1]:>5} {statistics.mean(tokens_per_course):>9.0f} "
+        f"{broken:>5}/{total}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-mb", type=float, default=1.0, help="Taille du corpus synthétique (Mo)")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Budget du mode tokens (défaut : settings)")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    from config import get_settings
+
+    max_tokens = args.max_tokens or get_settings().chunk_max_tokens
+    materials = [(text, _protected_lines(text)) for text in map(html_to_text, sorted(TEST_MATERIALS.glob("*.html")))]
+    synthetic = _synthetic_corpus(args.corpus_mb)
+
+    print(f"test-materials : {len(materials)} cours · synthétique : {len(synthetic)} cours, {args.corpus_mb:.1f} Mo")
+    print(f"budget mode tokens : {max_tokens} · tailles en tokens estimés\n")
+    print(f"{'corpus':16} {'mode':6} {'chunks/s':>9} {'Mo/s':>6} {'chk/cours':>8} {'min':>5} "
+          f"{'p50':>5} {'p90':>5} {'max':>5} {'tok/cours':>9} {'coupés':>9}")
+    for label, courses in (("test-materials", materials), ("synthétique", synthetic)):
+        for mode in ("chars", "tokens"):
+            _run(label, courses, mode, max_tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Benchmark — stockage d'un cours : ancien chemin (insert du cours, puis
+chunks et embeddings par lots de 50, puis sections) contre la RPC
+create_course_with_chunks (migration 013), pour des cours de 10, 100 et
+1000 chunks.
+
+    python -m benchmarks.bench_course_insert                      # hors ligne
+    python -m benchmarks.bench_course_insert --rtt 80             # réseau lent
+    python -m benchmarks.bench_course_insert --live --user-id <uuid> -n 5
+
+Hors ligne : un client Supabase factice compte les allers-retours HTTP et
+les octets envoyés ; la latence est modélisée par rtt × allers-retours +
+octets / débit, plus le temps de sérialisation mesuré côté client.
+
+En --live, chaque chemin crée réellement n cours par taille dans le projet
+Supabase configuré (embeddings du fournisseur local), au nom de --user-id, puis les
+supprime.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from types import SimpleNamespace
+
+from benchmarks._common import bootstrap_env
+
+SIZES = (10, 100, 1000)
+
+
+def _course(n_chunks: int, rng: random.Random):
+    """IngestedCourse synthétique : n chunks distincts, embeddings du fournisseur local, 4 sections."""
+    from rag.chunking import CourseSection, make_text_chunk
+    from rag.embedding_providers import LocalProvider
+    from rag.ingestion import IngestedCourse
+    from rag.ocr import CourseOCRResult
+
+    course_id = str(uuid.uuid4())
+    chunks = [
+        make_text_chunk(
+            f"Paragraphe {i} du cours : " + " ".join(rng.choices(["dérivée", "fonction", "limite", "x²"], k=120)),
+            i, course_id, "Mathématiques", "Bench", [], n_chunks, section_index=i * 4 // n_chunks,
+        )
+        for i in range(n_chunks)
+    ]
+    pairs = list(zip(chunks, LocalProvider(1024).embed_sync([chunk.content for chunk in chunks])))
+    sections = [CourseSection(index, f"Partie {index}", "…") for index in range(4)]
+    ocr = CourseOCRResult(
+        title="Bench", subject="Mathématiques", level="1ère",
+        content="\n\n".join(chunk.content for chunk in chunks), keywords=[], raw_text="",
+    )
+    return course_id, IngestedCourse(ocr=ocr, chunks_with_embeddings=pairs, sections=sections)
+
+
+async def _legacy_save(course_id: str, user_id: str, ingested) -> None:
+    """Ancien save_course (copie de référence) : un appel par table, chunks par lots."""
+    from db.client import get_supabase
+    from rag.retrieval import store_chunks
+
+    course = ingested.ocr
+    get_supabase().table("courses").insert({
+        "id": course_id, "user_id": user_id, "title": course.title, "subject": course.subject,
+        "level": course.level, "keywords": course.keywords, "raw_content": course.content,
+    }).execute()
+    await store_chunks(ingested.chunks_with_embeddings, user_id=user_id, course_id=course_id)
+    get_supabase().table("course_sections").insert([
+        {"course_id": course_id, "user_id": user_id, "section_index": s.section_index,
+         "heading": s.heading, "content": s.content}
+        for s in ingested.sections
+    ]).execute()
+
+
+class _RecordingClient:
+    """Client Supabase factice : chaque execute() est un aller-retour, son corps JSON est compté."""
+
+    def __init__(self) -> None:
+        self.trips = 0
+        self.bytes = 0
+
+    def _request(self, body):
+        client = self
+
+        class _Builder:
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self
+
+            def execute(self):
+                client.trips += 1
+                client.bytes += len(json.dumps(body).encode("utf-8"))
+                return SimpleNamespace(data=[], count=0)
+
+        return _Builder()
+
+    def table(self, name):
+        client = self
+
+        class _Table:
+            def insert(self, rows):
+                return client._request(rows)
+
+            def upsert(self, rows, **kwargs):
+                return client._request(rows)
+
+        return _Table()
+
+    def rpc(self, name, params):
+        return self._request(params)
+
+
+async def offline(rtt_ms: float, bandwidth_mbps: float) -> None:
+    import db.client
+    from rag import ingestion, retrieval
+
+    rng = random.Random(3)
+    print(f"modèle réseau : rtt {rtt_ms:.0f} ms, débit {bandwidth_mbps:.0f} Mbit/s\n")
+    print(f"{'chunks':>6} {'chemin':8} {'allers-retours':>14} {'Mo envoyés':>10} {'sérial. ms':>10} {'latence ms':>10}")
+    for size in SIZES:
+        course_id, ingested = _course(size, rng)
+        for label, save in (("lots", _legacy_save), ("rpc", ingestion.save_course)):
+            client = _RecordingClient()
+            db.client.get_supabase = retrieval.get_supabase = ingestion.get_supabase = lambda: client
+            start = time.perf_counter()
+            await save(course_id, "00000000-0000-0000-0000-000000000001", ingested)
+            cpu_ms = (time.perf_counter() - start) * 1000
+            network_ms = client.trips * rtt_ms + client.bytes * 8 / (bandwidth_mbps * 1000)
+            print(
+                f"{size:>6} {label:8} {client.trips:>14} {client.bytes / 1e6:>10.2f} "
+                f"{cpu_ms:>10.1f} {cpu_ms + network_ms:>10.0f}"
+            )
+
+
+async def live(user_id: str, repeats: int) -> None:
+    from db.client import get_supabase
+    from rag.ingestion import save_course
+
+    rng = random.Random(3)
+    print(f"{'chunks':>6} {'chemin':8} {'p50 ms':>8} {'min ms':>8} {'max ms':>8}")
+    for size in SIZES:
+        for label, save in (("lots", _legacy_save), ("rpc", save_course)):
+            latencies, created = [], []
+            for _ in range(repeats):
+                course_id, ingested = _course(size, rng)
+                start = time.perf_counter()
+                await save(course_id, user_id, ingested)
+                latencies.append((time.perf_counter() - start) * 1000)
+                created.append(course_id)
+            get_supabase().table("courses").delete().in_("id", created).execute()
+            print(
+                f"{size:>6} {label:8} {statistics.median(latencies):>8.0f} "
+                f"{min(latencies):>8.0f} {max(latencies):>8.0f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="Écritures réelles dans Supabase")
+    parser.add_argument("--user-id", help="Propriétaire des cours créés en --live")
+    parser.add_argument("-n", "--repeats", type=int, default=3, help="Cours créés par taille et par chemin en --live")
+    parser.add_argument("--rtt", type=float, default=30.0, help="Aller-retour modélisé hors ligne (ms)")
+    parser.add_argument("--bandwidth", type=float, default=100.0, help="Débit montant modélisé hors ligne (Mbit/s)")
+    args = parser.parse_args()
+
+    bootstrap_env(live=args.live)
+    if args.live:
+        if not args.user_id:
+            parser.error("--live nécessite --user-id")
+        asyncio.run(live(args.user_id, args.repeats))
+    else:
+        asyncio.run(offline(args.rtt, args.bandwidth))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark — import d'un cours numérique (PDF 40 pages) sans OCR.
+
+    python -m benchmarks.bench_document_import              # Voyage simulé
+    python -m benchmarks.bench_document_import --pages 120 --embed-latency 0.3
+
+Le PDF est généré à partir des supports de test-materials (couche texte),
+puis passe par rag.ingestion.ingest_course_document : extraction page par
+page → chunking incrémental → embedding (Voyage simulé, latence fixe par
+appel). Le stockage Supabase n'est pas mesuré. Aucun token Vision consommé.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from benchmarks._common import TEST_MATERIALS, bootstrap_env, html_to_text, render_pdf
+
+LINES_PER_PAGE = 50
+
+
+def _make_pages(count: int) -> list[str]:
+    lines: list[str] = []
+    for path in sorted(TEST_MATERIALS.glob("*.html")):
+        lines.extend(line for line in html_to_text(path).splitlines())
+    lines = lines or ["Cours de mathématiques 3ème — le théorème de Pythagore."]
+    pages = []
+    for index in range(count):
+        start = (index * LINES_PER_PAGE) % len(lines)
+        page = (lines[start:] + lines)[:LINES_PER_PAGE]
+        pages.append("\n".join(page))
+    return pages
+
+
+class _FakeVoyage:
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+        self.inputs = 0
+
+    async def embed(self, texts, model, input_type):
+        self.calls += 1
+        self.inputs += len(texts)
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(embeddings=[[0.0] * 1024 for _ in texts])
+
+
+async def run(pages: int, latency: float) -> None:
+    from rag import embeddings
+    from rag.ingestion import ingest_course_document
+
+    fake = _FakeVoyage(latency)
+    embeddings.provider.client = fake
+
+    pdf = render_pdf(_make_pages(pages), title="Mathématiques 3ème — Géométrie et calcul")
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(pdf)
+        path = Path(tmp.name)
+
+    try:
+        start = time.perf_counter()
+        ingested = await ingest_course_document(path, "pdf", "bench-course", filename="cours.pdf")
+        elapsed = time.perf_counter() - start
+    finally:
+        path.unlink(missing_ok=True)
+
+    course = ingested.ocr
+    print(f"PDF : {pages} pages, {len(pdf) / 1024:.0f} Ko, {len(course.content)} caractères extraits")
+    print(f"Titre : {course.title!r}  matière : {course.subject}  niveau : {course.level}")
+    print(f"Chunks : {len(ingested.chunks_with_embeddings)}  appels Voyage : {fake.calls} "
+          f"(latence simulée {latency * 1000:.0f} ms)")
+    print(f"Durée totale : {elapsed:.2f}s  ({pages / elapsed:.0f} pages/s) — tokens Vision : 0 "
+          f"(au lieu de {pages} appels OCR)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--embed-latency", type=float, default=0.25, help="Latence simulée d'un appel Voyage (s)")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+    asyncio.run(run(args.pages, args.embed_latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark — fournisseur d'embeddings local (rag/embedding_providers.py) et
+mode dégradé de rag.embeddings quand Voyage est indisponible.
+
+    python -m benchmarks.bench_embedding_providers
+    python -m benchmarks.bench_embedding_providers --pages 600 --outage 3 --cooldown 1
+
+1. Débit du fournisseur local via embed_chunks (chunks de --chunk-chars
+   caractères, cours synthétiques de bench_chunking ; une page ≈ 2 500
+   caractères).
+2. Qualité : chaque requête est un extrait de 120 caractères d'un chunk,
+   reformulé (casse, ponctuation) ; rappel@1 et @5 du chunk d'origine,
+   idf uniforme puis appris sur le corpus (fit).
+3. Panne : un Voyage simulé répond 503 pendant --outage s. Des embed_query
+   s'enchaînent ; on relève la latence, le modèle qui a répondu, et le
+   retour à Voyage après --cooldown s.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from benchmarks._common import bootstrap_env
+
+_PAGE_CHARS = 2500
+
+
+class _FlakyVoyage:
+    """Voyage simulé : 503 jusqu'à `down_until` (time.monotonic), puis vecteurs nuls."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.down_until = 0.0
+        self.calls = 0
+
+    async def embed(self, texts, model, input_type):
+        import voyageai.error
+
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if time.monotonic() < self.down_until:
+            raise voyageai.error.ServiceUnavailableError("503")
+        return SimpleNamespace(embeddings=[[0.0] * 1024 for _ in texts])
+
+
+def _corpus(pages: int, chunk_chars: int):
+    from benchmarks.bench_chunking import _synthetic_course
+    from rag.chunking import make_text_chunk
+
+    rng = random.Random(5)
+    text = ""
+    while len(text) < pages * _PAGE_CHARS:
+        text += _synthetic_course(rng, 1)[0] + "\n\n"
+    text = text[: pages * _PAGE_CHARS]
+    return [
+        make_text_chunk(text[i : i + chunk_chars], index, "c", "Mathématiques", "Cours", [])
+        for index, i in enumerate(range(0, len(text), chunk_chars))
+    ]
+
+
+def _rephrase(text: str, rng: random.Random) -> str:
+    words = [word.strip(".,;:!?()") for word in text.split()[1:-1]]   # Premier et dernier mots tronqués
+    return " ".join(word.upper() if rng.random() < 0.2 else word for word in words)
+
+
+async def throughput(args: argparse.Namespace, chunks) -> None:
+    from rag import embeddings
+    from rag.embedding_providers import LocalProvider
+
+    embeddings.provider = LocalProvider(1024)
+    start = time.perf_counter()
+    pairs = await embeddings.embed_chunks(chunks)
+    elapsed = time.perf_counter() - start
+    print(f"1. débit local : {len(pairs)} chunks en {elapsed:.2f}s · {len(pairs) / elapsed:,.0f} chunks/s · "
+          f"{args.pages / elapsed * 60:,.0f} pages/min ({embeddings.provider.model})\n")
+
+
+def quality(chunks) -> None:
+    from rag.chunking import chunk_body
+    from rag.embedding_providers import LocalProvider
+
+    rng = random.Random(9)
+    texts = [chunk_body(chunk.content) for chunk in chunks]   # Texte embeddé par embed_chunks
+    queries = []
+    for text in texts:
+        start = rng.randrange(len(text) - 120) if len(text) > 200 else 0
+        queries.append(_rephrase(text[start : start + 120], rng))
+
+    print(f"2. qualité : {len(queries)} requêtes sur {len(texts)} chunks")
+    print(f"   {'idf':10} {'rappel@1':>8} {'rappel@5':>8} {'sim. cible':>10} {'sim. médiane':>12}")
+    for label, local in (("uniforme", LocalProvider(1024)), ("appris", LocalProvider(1024).fit(texts))):
+        documents = np.array(local.embed_sync(texts))
+        scores = np.array(local.embed_sync(queries)) @ documents.T
+        ranks = (scores > scores[np.arange(len(queries)), np.arange(len(queries))][:, None]).sum(axis=1)
+        print(f"   {label:10} {np.mean(ranks < 1):>8.2f} {np.mean(ranks < 5):>8.2f} "
+              f"{np.mean(np.diag(scores)):>10.2f} {np.median(scores):>12.2f}")
+    print()
+
+
+async def outage(args: argparse.Namespace) -> None:
+    from rag import embeddings
+    from rag.embedding_providers import LocalProvider, VoyageProvider
+
+    voyage = VoyageProvider("bench", "voyage-3")
+    voyage.client = _FlakyVoyage(args.latency)
+    embeddings.provider, embeddings.fallback = voyage, LocalProvider(1024)
+    voyage.client.down_until = time.monotonic() + args.outage
+
+    print(f"3. panne de Voyage pendant {args.outage:.0f}s, secours {args.cooldown:.0f}s avant de resonder Voyage")
+    print(f"   {'t s':>5} {'requêtes':>8} {'modèle':34} {'latence max ms':>14} {'appels Voyage':>13}")
+    start = time.monotonic()
+    while time.monotonic() - start < args.outage + args.cooldown * 2:
+        calls = voyage.client.calls
+        results = []
+
+        async def timed(index: int) -> None:
+            query_start = time.perf_counter()
+            _, model = await embeddings.embed_query_with_model(f"question {index} sur les dérivées")
+            results.append((model, time.perf_counter() - query_start))
+
+        await asyncio.gather(*(timed(i) for i in range(args.queries)))
+        for model in sorted({model for model, _ in results}):
+            latency = max(seconds for m, seconds in results if m == model)
+            count = sum(m == model for m, _ in results)
+            print(f"   {time.monotonic() - start:>5.1f} {count:>8} {model:34} {latency * 1000:>14.0f} "
+                  f"{voyage.client.calls - calls:>13}")
+        await asyncio.sleep(args.interval)
+    print(f"\n   textes servis par le secours : {embeddings.EMBED_FALLBACKS.total():.0f}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    chunks = _corpus(args.pages, args.chunk_chars)
+    await throughput(args, chunks)
+    quality(chunks)
+    await outage(args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--chunk-chars", type=int, default=800, help="Taille des chunks (mode chars)")
+    parser.add_argument("--outage", type=float, default=3.0, help="Durée de la panne simulée (s)")
+    parser.add_argument("--cooldown", type=float, default=1.0, help="embedding_fallback_cooldown_s (s)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latence d'un appel Voyage simulé (s)")
+    parser.add_argument("--queries", type=int, default=20, help="embed_query simultanés par vague")
+    parser.add_argument("--interval", type=float, default=0.5, help="Pause entre deux vagues (s)")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    logging.basicConfig(level=logging.WARNING, format="   %(message)s")
+    logging.getLogger("studybuddy.embeddings").setLevel(logging.ERROR)
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+    os.environ["EMBED_RETRY_BASE_DELAY"] = "0.05"
+    os.environ["EMBED_MAX_RETRIES"] = "3"
+    os.environ["EMBEDDING_FALLBACK_COOLDOWN_S"] = str(args.cooldown)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
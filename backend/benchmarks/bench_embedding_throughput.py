@@ -0,0 +1,150 @@
+"""
+Benchmark — débit d'embedding (pages/min) de rag.embeddings.embed_chunks
+face à un endpoint Voyage simulé : lots remplis par tokens, envoyés en
+parallèle, retentés sur 429 / 503, contre l'ancien envoi séquentiel de lots
+fixes de 128 textes sans nouvelle tentative.
+
+    python -m benchmarks.bench_embedding_throughput
+    python -m benchmarks.bench_embedding_throughput --pages 600 --error-rate 0.1 --chunk-chars 1500
+
+Corpus : le texte des cours synthétiques de bench_chunking, coupé en
+chunks de --chunk-chars caractères (longs chunks, le cas où un lot de 128
+dépasse le plafond de tokens) ; une page photographiée ≈ 2 500 caractères.
+
+Endpoint simulé :
+- latence = --base-latency + tokens × --token-latency ;
+- refuse un lot de plus de 128 textes ou de --token-cap tokens (compte
+  Voyage ≈ 1 token / 3,5 caractères, plus pessimiste que l'estimation
+  locale) : InvalidRequestError, non retentable ;
+- au-delà de --server-concurrency requêtes simultanées : 429 avec
+  Retry-After ;
+- --error-rate : proportion de 503 transitoires.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from benchmarks._common import bootstrap_env
+
+_PAGE_CHARS = 2500
+
+
+class _StubVoyage:
+    def __init__(self, args: argparse.Namespace, seed: int = 11) -> None:
+        self.args = args
+        self.rng = random.Random(seed)
+        self.in_flight = 0
+        self.calls = self.rate_limited = self.unavailable = self.rejected = 0
+
+    async def embed(self, texts, model, input_type):
+        import voyageai.error
+
+        self.calls += 1
+        tokens = sum(len(text) / 3.5 for text in texts)
+        if len(texts) > 128 or tokens > self.args.token_cap:
+            self.rejected += 1
+            raise voyageai.error.InvalidRequestError(f"lot de {len(texts)} textes, {tokens:.0f} tokens")
+        if self.in_flight >= self.args.server_concurrency:
+            self.rate_limited += 1
+            raise voyageai.error.RateLimitError("429", headers={"retry-after": str(self.args.retry_after)})
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.args.base_latency + tokens * self.args.token_latency)
+            if self.rng.random() < self.args.error_rate:
+                self.unavailable += 1
+                raise voyageai.error.ServiceUnavailableError("503")
+            return SimpleNamespace(embeddings=[[0.0] * 8 for _ in texts])
+        finally:
+            self.in_flight -= 1
+
+
+async def _legacy_embed_chunks(chunks, client) -> None:
+    """Ancien embed_chunks (copie de référence) : lots fixes de 128, séquentiels, sans retry."""
+    for i in range(0, len(chunks), 128):
+        await client.embed([chunk.content for chunk in chunks[i : i + 128]], model="voyage-3", input_type="document")
+
+
+def _corpus(pages: int, chunk_chars: int):
+    from benchmarks.bench_chunking import _synthetic_course
+    from rag.chunking import make_text_chunk
+
+    rng = random.Random(5)
+    text = ""
+    while len(text) < pages * _PAGE_CHARS:
+        text += _synthetic_course(rng, 1)[0] + "\n\n"
+    text = text[: pages * _PAGE_CHARS]
+    return [
+        make_text_chunk(text[i : i + chunk_chars], index, "c", "Mathématiques", "Cours", [])
+        for index, i in enumerate(range(0, len(text), chunk_chars))
+    ]
+
+
+async def _measure(label: str, pages: int, chunks, stub: _StubVoyage, run) -> None:
+    from rag.embeddings import EMBED_RETRIES
+
+    retries_before = EMBED_RETRIES.total()
+    start = time.perf_counter()
+    try:
+        await run()
+        status = "ok"
+    except Exception as e:
+        status = f"échec ({type(e).__name__})"
+    elapsed = time.perf_counter() - start
+    rate = f"{pages / elapsed * 60:>9.0f}" if status == "ok" else f"{'—':>9}"
+    print(
+        f"{label:18} {rate} {elapsed:>7.2f} {stub.calls:>7} {stub.rate_limited:>5} {stub.unavailable:>5} "
+        f"{stub.rejected:>7} {EMBED_RETRIES.total() - retries_before:>8.0f}  {status}"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    from rag import embeddings
+
+    chunks = _corpus(args.pages, args.chunk_chars)
+    tokens = sum(len(chunk.content) / 3.5 for chunk in chunks)
+    print(
+        f"{args.pages} pages · {len(chunks)} chunks · {tokens / len(chunks):.0f} tokens/chunk (compte Voyage simulé)\n"
+        f"endpoint : {args.server_concurrency} requêtes simultanées, plafond {args.token_cap} tokens, "
+        f"{args.error_rate:.0%} de 503\n"
+    )
+    print(f"{'chemin':18} {'pages/min':>9} {'durée s':>7} {'appels':>7} {'429':>5} {'503':>5} {'refusés':>7} "
+          f"{'retentés':>8}  statut")
+
+    stub = _StubVoyage(args)
+    await _measure("séquentiel ×128", args.pages, chunks, stub, lambda: _legacy_embed_chunks(chunks, stub))
+
+    for concurrency in args.concurrency:
+        stub = _StubVoyage(args)
+        embeddings.provider.client = stub
+        embeddings.settings.embed_concurrency = concurrency
+        embeddings._slots.clear()
+        await _measure(f"tokens, ∥{concurrency}", args.pages, chunks, stub, lambda: embeddings.embed_chunks(chunks))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=600)
+    parser.add_argument("--chunk-chars", type=int, default=4000, help="Taille des chunks (mode chars)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--server-concurrency", type=int, default=6, help="Requêtes simultanées avant 429")
+    parser.add_argument("--token-cap", type=int, default=120_000, help="Tokens max par requête")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Proportion de 503 transitoires")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="Retry-After des 429 simulés (s)")
+    parser.add_argument("--base-latency", type=float, default=0.15, help="Latence fixe d'un appel (s)")
+    parser.add_argument("--token-latency", type=float, default=0.000004, help="Latence par token (s)")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    logging.getLogger("studybuddy.embeddings").setLevel(logging.ERROR)
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+    os.environ["EMBEDDING_FALLBACK"] = ""   # Un lot abandonné doit échouer, pas passer au secours local
+    os.environ["EMBED_RETRY_BASE_DELAY"] = "0.1"
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
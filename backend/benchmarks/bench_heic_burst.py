@@ -0,0 +1,106 @@
+"""
+Benchmark — rafale d'uploads iPhone (HEIC 12 MP) : débit de transcodage et
+réactivité de la boucle d'événements.
+
+    python -m benchmarks.bench_heic_burst                 # 24 photos, 2 workers
+    python -m benchmarks.bench_heic_burst --burst 48 --workers 4
+
+Trois stratégies pour la même rafale :
+- inline  : normalize_image directement dans la boucle (ce qu'il ne faut pas faire)
+- thread  : asyncio.to_thread (décodage HEVC en concurrence avec le GIL du process API)
+- process : rag.preprocessing.run_preprocessing (pool de processus dédié)
+
+Pendant la rafale, une tâche « battement » mesure le retard maximal de la boucle.
+"""
+import argparse
+import asyncio
+import io
+import os
+import time
+
+from benchmarks._common import TEST_MATERIALS, bootstrap_env, html_to_text, render_page
+
+TICK_S = 0.01
+
+
+def _make_heic_photos(count: int) -> list[bytes]:
+    """Quelques pages rendues en HEIC 12 MP, répétées pour former la rafale."""
+    from PIL import Image
+
+    texts = [html_to_text(p) for p in sorted(TEST_MATERIALS.glob("*.html"))[:3]] or ["Cours de test\n" * 200]
+    photos = []
+    for text in texts:
+        jpeg = render_page(text)
+        image = Image.open(io.BytesIO(jpeg))
+        buffer = io.BytesIO()
+        image.save(buffer, format="HEIF", quality=80, exif=image.getexif().tobytes())
+        photos.append(buffer.getvalue())
+    return [photos[i % len(photos)] for i in range(count)]
+
+
+async def _heartbeat(stop: asyncio.Event) -> float:
+    """Retard maximal observé entre deux réveils programmés toutes les 10 ms."""
+    worst = 0.0
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK_S
+        await asyncio.sleep(TICK_S)
+        worst = max(worst, loop.time() - expected)
+    return worst
+
+
+async def _run(strategy: str, photos: list[bytes]) -> tuple[float, float]:
+    from rag.preprocessing import normalize_image, run_preprocessing
+
+    stop = asyncio.Event()
+    beat = asyncio.create_task(_heartbeat(stop))
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    if strategy == "inline":
+        for photo in photos:
+            normalize_image(photo)
+            await asyncio.sleep(0)
+    elif strategy == "thread":
+        await asyncio.gather(*(asyncio.to_thread(normalize_image, photo) for photo in photos))
+    else:
+        await asyncio.gather(*(run_preprocessing(normalize_image, photo) for photo in photos))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    return elapsed, await beat
+
+
+async def run(burst: int) -> None:
+    from rag.preprocessing import normalize_image, run_preprocessing, shutdown_preprocessing
+
+    photos = _make_heic_photos(burst)
+    sample = normalize_image(photos[0])
+    print(f"Rafale : {burst} photos HEIC, {sum(map(len, photos)) / burst / 1024:.0f} Ko en moyenne "
+          f"→ {sample.media_type} {sample.width}x{sample.height}, {len(sample.data) / 1024:.0f} Ko\n")
+
+    # Démarrage des workers hors mesure (coût payé une fois au premier upload HEIC)
+    await run_preprocessing(normalize_image, photos[0])
+
+    print(f"{'stratégie':10} {'durée':>8} {'photos/s':>9} {'retard boucle max':>18}")
+    for strategy in ("inline", "thread", "process"):
+        elapsed, stall = await _run(strategy, photos)
+        print(f"{strategy:10} {elapsed:7.2f}s {burst / elapsed:9.1f} {stall * 1000:16.0f}ms")
+
+    shutdown_preprocessing()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=24, help="Nombre de photos dans la rafale")
+    parser.add_argument("--workers", type=int, default=None, help="Taille du pool HEIC (HEIF_WORKERS)")
+    args = parser.parse_args()
+
+    if args.workers is not None:
+        os.environ["HEIF_WORKERS"] = str(args.workers)
+    bootstrap_env()
+    asyncio.run(run(args.burst))
+
+
+if __name__ == "__main__":
+    main()
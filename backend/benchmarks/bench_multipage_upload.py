@@ -0,0 +1,122 @@
+"""
+Benchmark — upload d'un cours sur plusieurs pages (rag/ingestion.ingest_course_pages).
+
+    python -m benchmarks.bench_multipage_upload
+    python -m benchmarks.bench_multipage_upload --pages 8 --latency 2.0
+
+Les supports de test-materials sont mis bout à bout puis coupés en pages de
+taille fixe, au milieu des phrases comme sur un vrai manuel. Claude Vision est
+simulé (latence fixe par page, transcription exacte de la page) ; Voyage aussi
+(appels comptés).
+
+Compare :
+- une photo = un upload (ce que faisait l'élève jusqu'ici) : un cours par page,
+  une phrase coupée par le bas de page finit dans deux chunks de deux cours ;
+- un upload multi-pages lu séquentiellement (concurrence 1) ;
+- un upload multi-pages avec settings.ocr_page_concurrency pages en parallèle.
+"""
+import argparse
+import asyncio
+import math
+import os
+import time
+from types import SimpleNamespace
+
+from benchmarks._common import TEST_MATERIALS, bootstrap_env, html_to_text
+
+PAGE_CHARS = 1800
+
+
+def _make_pages(count: int) -> list[str]:
+    text = "\n\n".join(html_to_text(path) for path in sorted(TEST_MATERIALS.glob("*.html")))
+    while len(text) < count * PAGE_CHARS:
+        text += "\n\n" + text
+    pages = []
+    for index in range(count):
+        page = text[index * PAGE_CHARS:(index + 1) * PAGE_CHARS]
+        # Coupe à la fin d'un mot, pas forcément d'une phrase
+        pages.append(page[: page.rfind(" ")] if index < count - 1 else page)
+    return pages
+
+
+class _FakeVoyage:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def embed(self, texts, model, input_type):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(embeddings=[[0.0] * 1024 for _ in texts])
+
+
+async def run(pages: int, latency: float) -> None:
+    from rag import embeddings, ingestion
+    from rag.ocr import CourseOCRResult, page_separator
+
+    texts = _make_pages(pages)
+    photos = [f"page-{i}".encode() for i in range(pages)]
+    by_photo = dict(zip(photos, texts))
+
+    async def fake_extract(image_bytes: bytes, user_id=None, tiled=None) -> CourseOCRResult:
+        await asyncio.sleep(latency)
+        return CourseOCRResult(
+            title="Calcul littéral", subject="Mathématiques", level="3ème",
+            content=by_photo[image_bytes], keywords=["développement"], raw_text="{}",
+        )
+
+    ingestion.extract_course_from_image = fake_extract
+    voyage = _FakeVoyage()
+    embeddings.provider.client = voyage
+
+    # Texte autour de chaque jointure de pages, dans le contenu fusionné
+    merged, joins = texts[0].strip(), []
+    for text in texts[1:]:
+        merged += page_separator(merged, text.strip())
+        joins.append(merged[-20:] + text.strip()[:20])
+        merged += text.strip()
+
+    def spanning(chunks: list[str]) -> int:
+        """Jointures de pages contenues entières dans un chunk."""
+        return sum(any(join in chunk for chunk in chunks) for join in joins)
+
+    print(f"{pages} pages de ~{PAGE_CHARS} caractères, latence Vision simulée {latency:.1f} s/page\n")
+    print(f"{'scénario':34} {'total':>7} {'ocr':>7} {'chunks':>7} {'jointures':>9} {'Voyage':>7}")
+
+    voyage.calls = 0
+    start = time.perf_counter()
+    separate = [await ingestion.ingest_course_pages([photo], f"course-{i}") for i, photo in enumerate(photos)]
+    chunks = sum(len(c.chunks_with_embeddings) for c in separate)
+    ocr_time = sum(c.timings["ocr"] for c in separate)
+    print(f"{'une photo = un upload':34} {time.perf_counter() - start:6.2f}s {ocr_time:6.2f}s "
+          f"{chunks:>7} {0:>9} {voyage.calls:>7}")
+
+    concurrency = ingestion.settings.ocr_page_concurrency
+    for label, limit in (("multi-pages, séquentiel", 1), (f"multi-pages, {concurrency} en parallèle", concurrency)):
+        ingestion.settings.ocr_page_concurrency = limit
+        voyage.calls = 0
+        start = time.perf_counter()
+        course = await ingestion.ingest_course_pages(photos, "course-multi")
+        elapsed = time.perf_counter() - start
+        contents = [chunk.content for chunk, _ in course.chunks_with_embeddings]
+        print(f"{label:34} {elapsed:6.2f}s {course.timings['ocr']:6.2f}s {len(contents):>7} "
+              f"{spanning(contents):>9} {voyage.calls:>7}")
+        assert voyage.calls == math.ceil(len(contents) / 128)
+        assert course.ocr.content == merged
+    ingestion.settings.ocr_page_concurrency = concurrency
+    print(f"\nÉtapes (dernier scénario) : {course.timings}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=1.0, help="Latence d'une lecture Vision simulée (s)")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    os.environ["OCR_CACHE_ENABLED"] = "false"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+    asyncio.run(run(args.pages, args.latency))
+
+
+if __name__ == "__main__":
+    main()
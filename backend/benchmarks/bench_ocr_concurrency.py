@@ -0,0 +1,135 @@
+"""
+Benchmark — réactivité de l'API pendant des appels OCR concurrents.
+
+    python -m benchmarks.bench_ocr_concurrency [--calls 8] [--latency 2.0]
+
+Le client Anthropic de rag.ocr est remplacé par un faux client qui simule la
+latence Claude Vision. Pendant que N OCR tournent en parallèle, on mesure :
+- la latence de GET /health (via l'app FastAPI réelle, transport ASGI)
+- le débit d'un stream de tokens simulé (1 token / 5 ms, comme un stream SSE)
+
+Deux modes sont comparés :
+- bloquant : l'appel Vision bloque le thread (ancien client synchrone)
+- async    : l'appel Vision rend la main à la boucle (client actuel)
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from types import SimpleNamespace
+
+from benchmarks._common import bootstrap_env, load_samples
+
+FAKE_EXERCISE = {
+    "subject": "Mathématiques", "exercise_type": "Exercice",
+    "student_work_detected": False, "statement": "Développer A = 4(2x − 3) + 5x",
+}
+TOKEN_INTERVAL_S = 0.005
+
+
+class _FakeMessages:
+    def __init__(self, latency: float, blocking: bool) -> None:
+        self.latency = latency
+        self.blocking = blocking
+
+    async def create(self, **kwargs):
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="tool_use", id="toolu_0", name="enregistrer_exercice", input=FAKE_EXERCISE)],
+            stop_reason="end_turn",
+            usage=SimpleNamespace(input_tokens=1600, output_tokens=120),
+        )
+
+
+def _running(deadline: float, tasks: list[asyncio.Task]) -> bool:
+    """Mesure pendant au moins `duration`, et tant qu'un OCR est en cours."""
+    return time.perf_counter() < deadline or any(not t.done() for t in tasks)
+
+
+async def _probe_health(http, duration: float, tasks: list[asyncio.Task]) -> list[float]:
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration
+    while _running(deadline, tasks):
+        start = time.perf_counter()
+        r = await http.get("/health")
+        r.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.02)
+    return latencies
+
+
+async def _token_stream(duration: float, tasks: list[asyncio.Task]) -> tuple[float, float]:
+    """Simule un stream SSE : retourne (tokens/s, plus long silence en ms)."""
+    count = 0
+    max_gap = 0.0
+    start = last = time.perf_counter()
+    deadline = start + duration
+    while _running(deadline, tasks):
+        await asyncio.sleep(TOKEN_INTERVAL_S)
+        now = time.perf_counter()
+        max_gap = max(max_gap, now - last)
+        last = now
+        count += 1
+    return count / (last - start), max_gap * 1000
+
+
+async def _measure(http, duration: float, ocr_tasks: list[asyncio.Task] | None = None) -> dict:
+    tasks = ocr_tasks or []
+    health, (tps, gap) = await asyncio.gather(
+        _probe_health(http, duration, tasks), _token_stream(duration, tasks),
+    )
+    await asyncio.gather(*tasks)
+    return {
+        "health_p50": statistics.median(health) if health else float("nan"),
+        "health_max": max(health) if health else float("nan"),
+        "health_n": len(health),
+        "tokens_s": tps,
+        "max_gap": gap,
+    }
+
+
+async def run(calls: int, latency: float) -> None:
+    import httpx
+
+    import main
+    import rag.ocr as ocr
+
+    image = load_samples()[-1][1]
+    duration = latency
+    transport = httpx.ASGITransport(app=main.app)
+
+    print(f"{calls} OCR concurrents, latence Vision simulée {latency:.1f}s\n")
+    print(f"{'scénario':24} {'/health p50':>12} {'/health max':>12} {'req/health':>11} {'tokens/s':>9} {'silence max':>12}")
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        rows = [("repos", await _measure(http, duration))]
+        for label, blocking in (("OCR bloquant (avant)", True), ("OCR async (après)", False)):
+            ocr.client = SimpleNamespace(messages=_FakeMessages(latency, blocking))
+            tasks = [asyncio.create_task(ocr.extract_exercise_from_image(image)) for _ in range(calls)]
+            await asyncio.sleep(0)
+            rows.append((label, await _measure(http, duration, tasks)))
+
+    for label, m in rows:
+        print(f"{label:24} {m['health_p50']:10.1f}ms {m['health_max']:10.1f}ms {m['health_n']:11d} "
+              f"{m['tokens_s']:9.0f} {m['max_gap']:10.0f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=8, help="Nombre d'OCR lancés en parallèle")
+    parser.add_argument("--latency", type=float, default=2.0, help="Latence simulée d'un appel Vision (s)")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    # Chaque OCR simulé doit atteindre le (faux) modèle
+    os.environ["OCR_CACHE_ENABLED"] = "false"
+    os.environ["OCR_TIERED_ENABLED"] = "false"  # Un seul appel simulé par exercice
+    asyncio.run(run(args.calls, args.latency))
+
+
+if __name__ == "__main__":
+    main()
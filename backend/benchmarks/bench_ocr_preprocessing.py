@@ -0,0 +1,87 @@
+"""
+Benchmark — taille de payload et latence OCR avant/après normalisation d'image.
+
+    python -m benchmarks.bench_ocr_preprocessing            # tailles + temps de prétraitement
+    python -m benchmarks.bench_ocr_preprocessing --live     # + latence Claude Vision réelle
+
+Les images de test-materials sont utilisées si présentes, sinon les supports
+HTML sont rendus en photos 12 MP synthétiques.
+"""
+import argparse
+import base64
+import time
+from pathlib import Path
+
+from benchmarks._common import TEST_MATERIALS, bootstrap_env, load_samples
+
+
+def _ocr_latency(client, model: str, prompt: str, data: bytes, media_type: str) -> float:
+    from rag.ocr import COURSE_TOOL
+
+    start = time.perf_counter()
+    client.messages.create(
+        model=model,
+        max_tokens=4096,
+        messages=[{
+            "role": "user",
+            "content": [
+                {"type": "image", "source": {
+                    "type": "base64", "media_type": media_type,
+                    "data": base64.standard_b64encode(data).decode("utf-8"),
+                }},
+                {"type": "text", "text": prompt},
+            ],
+        }],
+        tools=[COURSE_TOOL],
+        tool_choice={"type": "tool", "name": COURSE_TOOL["name"]},
+    )
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", type=Path, default=TEST_MATERIALS)
+    parser.add_argument("--live", action="store_true", help="Mesure la latence Claude Vision réelle")
+    args = parser.parse_args()
+
+    bootstrap_env(args.live)
+    from config import get_settings
+    from rag.ocr import COURSE_OCR_PROMPT
+    from rag.preprocessing import normalize_image, sniff_media_type
+
+    settings = get_settings()
+    client = None
+    if args.live:
+        import anthropic
+        client = anthropic.Anthropic(api_key=settings.anthropic_api_key)
+
+    print(f"{'image':40} {'avant (Ko)':>11} {'après (Ko)':>11} {'b64 avant':>10} {'b64 après':>10} "
+          f"{'tokens':>13} {'prétrait.':>10}" + (f" {'OCR avant':>10} {'OCR après':>10}" if args.live else ""))
+
+    total_before = total_after = 0
+    for name, raw in load_samples(args.dir):
+        start = time.perf_counter()
+        image = normalize_image(raw)
+        prep_ms = (time.perf_counter() - start) * 1000
+
+        b64_before = len(base64.standard_b64encode(raw))
+        b64_after = len(base64.standard_b64encode(image.data))
+        total_before += b64_before
+        total_after += b64_after
+
+        line = (f"{name[:40]:40} {len(raw) / 1024:11.0f} {len(image.data) / 1024:11.0f} "
+                f"{b64_before / 1024:9.0f}K {b64_after / 1024:9.0f}K "
+                f"{image.original_tokens:6d}→{image.tokens:<6d} {prep_ms:8.0f}ms")
+        if client is not None:
+            before = _ocr_latency(client, settings.vision_model, COURSE_OCR_PROMPT, raw, sniff_media_type(raw))
+            after = _ocr_latency(client, settings.vision_model, COURSE_OCR_PROMPT, image.data, image.media_type)
+            line += f" {before:9.1f}s {after:9.1f}s"
+        print(line)
+
+    if total_before:
+        print(f"\nPayload base64 total : {total_before / 1024:.0f} Ko → {total_after / 1024:.0f} Ko "
+              f"({100 * (1 - total_after / total_before):.0f}% économisés)")
+
+
+if __name__ == "__main__":
+    main()
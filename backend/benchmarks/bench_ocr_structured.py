@@ -0,0 +1,269 @@
+"""
+Benchmark — sortie OCR contrainte par outil (schéma JSON) vs ancien format à
+préfixes de ligne (TITRE: / MATIERE: / ... / CONTENU:).
+
+    python -m benchmarks.bench_ocr_structured              # hors ligne
+    python -m benchmarks.bench_ocr_structured --live -n 5  # vrai Claude Vision
+
+Hors ligne :
+- Robustesse : écarts de format typiques du modèle (gras Markdown, accents,
+  préambule, mots-clés en liste...) passés à l'ancien parseur, et écarts de
+  schéma passés à la validation + relance ciblée (modèle simulé qui corrige).
+- Taille de sortie : les supports de test-materials encodés dans les deux
+  formats. Les tokens sont estimés par mots et ponctuation (approximation
+  grossière du BPE) ; seul --live donne les vrais usage.output_tokens.
+- Streaming : les blocs émis depuis les deltas JSON sont identiques au
+  découpage du contenu final, quelle que soit la taille des deltas.
+
+En --live, chaque support est lu n fois dans chaque format : taux d'échec de
+parsing/validation et usage.output_tokens réels.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+from types import SimpleNamespace
+
+from benchmarks._common import TEST_MATERIALS, bootstrap_env, html_to_text, load_samples
+
+LEGACY_COURSE_PROMPT = """Tu es un assistant spécialisé dans l'extraction de contenu pédagogique.
+
+Analyse cette image de cours (page de manuel, fiche de révision, notes de cours, etc.) et extrais son contenu de manière structurée.
+
+Retourne le contenu sous ce format EXACT :
+
+TITRE: [titre du cours ou de la section, ou "Sans titre" si absent]
+MATIERE: [matière détectée : Mathématiques, Physique-Chimie, SVT, Histoire-Géographie, Français, Anglais, Philosophie, etc.]
+NIVEAU: [niveau estimé : 6ème, 5ème, 4ème, 3ème, 2nde, 1ère, Terminale, ou "Inconnu"]
+
+CONTENU:
+[Retranscris fidèlement TOUT le contenu textuel de l'image.
+- Conserve la structure : titres, sous-titres, listes, définitions, formules
+- Pour les formules mathématiques, utilise une notation lisible (ex: x^2, sqrt(x), a/b)
+- Pour les schémas, décris-les brièvement entre crochets : [Schéma : ...]
+- Conserve les exemples et exercices résolus présents dans le cours]
+
+MOTS_CLES: [liste de 5-10 mots-clés séparés par des virgules, concepts importants du cours]"""
+
+# Retours à la ligne et échappements JSON (\n, \") comptent chacun pour un token, comme avec le BPE
+_TOKEN = re.compile(r"\\[nt\"\\]|\n|\w+|[^\w\s]")
+
+
+def _legacy_parse(text: str) -> dict:
+    """Ancien parseur à préfixes de ligne (copie de référence)."""
+    result = {"title": "Sans titre", "subject": "Inconnu", "level": "Inconnu", "content": "", "keywords": []}
+    content_lines: list[str] = []
+    in_content = False
+    for line in text.strip().split("\n"):
+        if line.startswith("TITRE:"):
+            result["title"] = line.replace("TITRE:", "").strip()
+        elif line.startswith("MATIERE:"):
+            result["subject"] = line.replace("MATIERE:", "").strip()
+        elif line.startswith("NIVEAU:"):
+            result["level"] = line.replace("NIVEAU:", "").strip()
+        elif line.startswith("MOTS_CLES:"):
+            result["keywords"] = [k.strip() for k in line.replace("MOTS_CLES:", "").split(",") if k.strip()]
+            in_content = False
+        elif line.startswith("CONTENU:"):
+            in_content = True
+        elif in_content:
+            content_lines.append(line)
+    result["content"] = "\n".join(content_lines).strip()
+    return result
+
+
+def _legacy_text(course: dict) -> str:
+    return (
+        f"TITRE: {course['title']}\nMATIERE: {course['subject']}\nNIVEAU: {course['level']}\n\n"
+        f"CONTENU:\n{course['content']}\n\nMOTS_CLES: {', '.join(course['keywords'])}"
+    )
+
+
+def _legacy_ok(parsed: dict, expected: dict) -> bool:
+    """Échec si un champ est perdu ou pollué (pas seulement si le contenu est vide)."""
+    return (
+        parsed["content"] == expected["content"]
+        and parsed["title"] == expected["title"]
+        and parsed["subject"] == expected["subject"]
+        and parsed["level"] == expected["level"]
+        and parsed["keywords"] == expected["keywords"]
+    )
+
+
+def _legacy_variants(course: dict) -> dict[str, str]:
+    text = _legacy_text(course)
+    return {
+        "conforme": text,
+        "préambule": "Voici le contenu extrait de l'image :\n\n" + text,
+        "gras Markdown": re.sub(r"^(TITRE|MATIERE|NIVEAU|CONTENU|MOTS_CLES):", r"**\1:**", text, flags=re.MULTILINE),
+        "accent MATIÈRE": text.replace("MATIERE:", "MATIÈRE:"),
+        "espace avant :": text.replace("CONTENU:", "CONTENU :"),
+        "mots-clés en liste": text.replace(
+            f"MOTS_CLES: {', '.join(course['keywords'])}",
+            "MOTS_CLES:\n" + "\n".join(f"- {k}" for k in course["keywords"]),
+        ),
+        "contenu piégé": text.replace("CONTENU:\n", "CONTENU:\nNIVEAU: voir chapitre 2\n"),
+    }
+
+
+def _tool_variants(course: dict) -> dict[str, object]:
+    return {
+        "conforme": course,
+        "mots-clés en chaîne": {**course, "keywords": ", ".join(course["keywords"])},
+        "titre absent": {k: v for k, v in course.items() if k != "title"},
+        "champ null": {**course, "level": None},
+        "mots-clés en objets": {**course, "keywords": [{"mot": k} for k in course["keywords"]]},
+        "contenu en liste": {**course, "content": course["content"].split("\n\n")},
+        "entrée non-objet": json.dumps(course),
+    }
+
+
+class _RepairingMessages:
+    """Modèle simulé : la relance ciblée (sans image) renvoie l'entrée conforme."""
+
+    def __init__(self, first: object, fixed: dict) -> None:
+        self.first = first
+        self.fixed = fixed
+        self.calls = 0
+        self.repair_sent_image = False
+
+    async def create(self, model, max_tokens, messages, tools, tool_choice):
+        self.calls += 1
+        if self.calls > 1:
+            self.repair_sent_image |= '"type": "image"' in json.dumps(messages)
+        tool_input = self.first if self.calls == 1 else self.fixed
+        block = SimpleNamespace(type="tool_use", id=f"toolu_{self.calls}", name=tool_choice["name"], input=tool_input)
+        return SimpleNamespace(
+            content=[block], stop_reason="tool_use",
+            usage=SimpleNamespace(input_tokens=1600, output_tokens=len(json.dumps(tool_input)) // 3),
+        )
+
+
+def _course_from(text: str) -> dict:
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    title = paragraphs[0].split("\n")[0][:80] if paragraphs else "Sans titre"
+    return {
+        "title": title, "subject": "Mathématiques", "level": "3ème",
+        "content": "\n\n".join(paragraphs), "keywords": ["développement", "factorisation", "identités remarquables"],
+    }
+
+
+async def robustness(courses: list[dict]) -> None:
+    from rag import ocr
+    from rag.preprocessing import NormalizedImage
+
+    image = NormalizedImage(
+        data=b"", media_type="image/webp", width=1176, height=1568,
+        original_bytes=0, original_tokens=0, tokens=0,
+    )
+
+    print("Ancien format — parseur à préfixes de ligne")
+    failures = total = 0
+    for name in _legacy_variants(courses[0]):
+        ok = sum(_legacy_ok(_legacy_parse(_legacy_variants(c)[name]), c) for c in courses)
+        failures += len(courses) - ok
+        total += len(courses)
+        print(f"  {name:24} {ok}/{len(courses)} corrects")
+    print(f"  → échecs : {failures}/{total} ({failures / total:.0%}), sans moyen de relancer\n")
+
+    print("Outil forcé — validation puis relance ciblée")
+    initial_failures = final_failures = calls = total = 0
+    for name in _tool_variants(courses[0]):
+        for course in courses:
+            fake = _RepairingMessages(_tool_variants(course)[name], course)
+            ocr.client = SimpleNamespace(messages=fake)
+            result, _, errors = await ocr._structured_ocr("course", image, ocr.COURSE_OCR_PROMPT, 4096)
+            initial_failures += fake.calls > 1
+            final_failures += bool(errors) or result is None or result.content != course["content"]
+            assert not fake.repair_sent_image
+            calls += fake.calls
+            total += 1
+        print(f"  {name:24} {'relance' if fake.calls > 1 else 'accepté':8} → {'échec' if errors else 'ok'}")
+    print(f"  → invalides au 1er appel : {initial_failures}/{total}, après relance : {final_failures}/{total} "
+          f"({calls / total:.2f} appel/image)\n")
+
+
+def output_size(courses: list[dict]) -> None:
+    print(f"{'support':36} {'lignes (car/tok)':>18} {'JSON (car/tok)':>16} {'surcoût':>8}")
+    for course in courses:
+        legacy = _legacy_text(course)
+        structured = json.dumps(course, ensure_ascii=False)
+        legacy_tokens, json_tokens = len(_TOKEN.findall(legacy)), len(_TOKEN.findall(structured))
+        print(f"{course['title'][:36]:36} {len(legacy):>9}/{legacy_tokens:<8} {len(structured):>8}/{json_tokens:<7} "
+              f"{json_tokens / legacy_tokens - 1:+7.1%}")
+    print()
+
+
+def streaming(courses: list[dict]) -> None:
+    from rag.chunking import ParagraphSplitter
+    from rag.ocr import CourseOCRResult, _CourseStreamParser, validate_ocr_output
+
+    rng = random.Random(3)
+    mismatches = 0
+    for course in courses:
+        splitter = ParagraphSplitter()
+        expected = splitter.feed(course["content"]) + splitter.flush()
+        payload = json.dumps(course, ensure_ascii=False)
+        for _ in range(20):
+            parser = _CourseStreamParser()
+            events, position = [], 0
+            while position < len(payload):
+                step = rng.randint(1, 24)
+                events.extend(parser.feed(payload[position:position + step]))
+                position += step
+            result, _ = validate_ocr_output("course", course)
+            events.extend(parser.finish(result))
+            blocks = [e.block for e in events if e.kind == "block"]
+            headers = [e for e in events if e.kind == "headers"]
+            assert isinstance(events[-1].result, CourseOCRResult)
+            mismatches += blocks != expected or len(headers) != 1 or headers[0].result.title != course["title"]
+    print(f"Streaming JSON : {len(courses) * 20} découpages aléatoires, {mismatches} écart(s) avec le contenu final\n")
+
+
+async def live(samples: list[tuple[str, bytes]], repeats: int) -> None:
+    from rag import ocr
+
+    print(f"{'format':10} {'échecs':>8} {'tokens sortie (méd.)':>22}")
+    for label in ("lignes", "outil"):
+        failures, tokens = 0, []
+        for _, photo in samples:
+            image = await ocr._prepare_image(photo)
+            for _ in range(repeats):
+                if label == "lignes":
+                    response = await ocr.client.messages.create(
+                        model=ocr.settings.vision_model, max_tokens=4096,
+                        messages=ocr._vision_messages(image, LEGACY_COURSE_PROMPT),
+                    )
+                    parsed = _legacy_parse(response.content[0].text)
+                    failed = not parsed["content"] or parsed["title"] == "Sans titre" or not parsed["keywords"]
+                else:
+                    result, response, errors = await ocr._structured_ocr(
+                        "course", image, ocr.COURSE_OCR_PROMPT, 4096, repair=False,
+                    )
+                    failed = bool(errors)
+                failures += failed
+                tokens.append(response.usage.output_tokens)
+        print(f"{label:10} {failures:>4}/{len(tokens):<3} {statistics.median(tokens):>22.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="Appels réels à Claude Vision")
+    parser.add_argument("-n", "--repeats", type=int, default=3, help="Lectures par support en --live")
+    args = parser.parse_args()
+
+    bootstrap_env(live=args.live)
+    courses = [_course_from(html_to_text(path)) for path in sorted(TEST_MATERIALS.glob("*.html"))]
+
+    if args.live:
+        asyncio.run(live(load_samples(), args.repeats))
+        return
+    asyncio.run(robustness(courses))
+    output_size(courses)
+    streaming(courses)
+
+
+if __name__ == "__main__":
+    main()
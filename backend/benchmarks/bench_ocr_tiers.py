@@ -0,0 +1,122 @@
+"""
+Benchmark — routage OCR des exercices : modèle rapide d'abord, escalade vers
+le modèle vision sur faible confiance / énoncé vide / sortie hors schéma.
+
+    python -m benchmarks.bench_ocr_tiers
+    python -m benchmarks.bench_ocr_tiers --hard 0.4 --fast-latency 2 --vision-latency 9
+
+Les modèles sont simulés : une fraction --hard des photos (manuscrit, flou)
+donne une confiance basse ou un énoncé vide au modèle rapide. Le coût est
+estimé avec les tokens simulés et la grille de prix de rag.ocr.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from benchmarks._common import bootstrap_env
+
+STATEMENT = "Développer et réduire A = 4(2x − 3) + 5x.\nQ2. Résoudre l'équation 13x − 12 = 1."
+
+
+def _answer(confidence: int | None, statement: str) -> dict:
+    answer = {
+        "subject": "Mathématiques", "exercise_type": "Exercice d'application",
+        "student_work_detected": False, "statement": statement,
+    }
+    if confidence is not None:
+        answer["confidence"] = confidence
+    return answer
+
+
+class _FakeMessages:
+    def __init__(self, fast_latency: float, vision_latency: float, hard: float, seed: int) -> None:
+        self.fast_latency = fast_latency
+        self.vision_latency = vision_latency
+        self.hard = hard
+        self.rng = random.Random(seed)
+
+    async def create(self, model, max_tokens, messages, tools, tool_choice):
+        from config import get_settings
+
+        is_fast = model != get_settings().vision_model
+        await asyncio.sleep(self.fast_latency if is_fast else self.vision_latency)
+        if not is_fast:
+            text = _answer(None, STATEMENT)
+        else:
+            roll = self.rng.random()
+            if roll < self.hard * 0.6:
+                text = _answer(self.rng.randint(30, 80), STATEMENT)       # manuscrit / flou
+            elif roll < self.hard * 0.9:
+                text = _answer(90, "")                                     # énoncé vide
+            elif roll < self.hard:
+                text = {"statement": ["Je ne peux pas lire cette image."]}  # schéma non respecté
+            else:
+                text = _answer(self.rng.randint(88, 99), STATEMENT)
+        block = SimpleNamespace(type="tool_use", id="toolu_0", name=tool_choice["name"], input=text)
+        return SimpleNamespace(
+            content=[block],
+            stop_reason="tool_use",
+            usage=SimpleNamespace(input_tokens=1600, output_tokens=len(json.dumps(text)) // 3),
+        )
+
+
+async def _run_batch(count: int, tiered: bool) -> tuple[float, float]:
+    from rag import ocr
+    from rag.preprocessing import NormalizedImage
+
+    image = NormalizedImage(
+        data=b"", media_type="image/webp", width=1176, height=1568,
+        original_bytes=0, original_tokens=0, tokens=0,
+    )
+    ocr.settings.ocr_tiered_enabled = tiered
+    cost_before = ocr.OCR_COST.total()
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        if tiered:
+            await ocr._tiered_exercise_ocr(image)
+        else:
+            await ocr._ocr_result("exercise", image, ocr.EXERCISE_OCR_PROMPT, max_tokens=2048)
+        latencies.append(time.perf_counter() - start)
+    return sum(latencies) / count, ocr.OCR_COST.total() - cost_before
+
+
+async def run(count: int, hard: float, fast_latency: float, vision_latency: float) -> None:
+    from rag import ocr
+
+    ocr.client = SimpleNamespace(messages=_FakeMessages(fast_latency, vision_latency, hard, seed=1))
+
+    vision_latency_avg, vision_cost = await _run_batch(count, tiered=False)
+    escalations_before = ocr.OCR_ESCALATIONS.total()
+    tiered_latency_avg, tiered_cost = await _run_batch(count, tiered=True)
+    escalations = ocr.OCR_ESCALATIONS.total() - escalations_before
+
+    print(f"{count} exercices, {hard:.0%} de photos difficiles "
+          f"(latence simulée rapide {fast_latency:.2f}s / vision {vision_latency:.2f}s)\n")
+    print(f"{'stratégie':18} {'latence moy.':>13} {'coût total':>11}")
+    print(f"{'vision seule':18} {vision_latency_avg:12.2f}s {vision_cost:10.4f}$")
+    print(f"{'rapide + escalade':18} {tiered_latency_avg:12.2f}s {tiered_cost:10.4f}$")
+    print(f"\nTaux d'escalade : {escalations / count:.0%}")
+    for key, value in sorted(ocr.OCR_ESCALATIONS.snapshot()["values"].items()):
+        print(f"  {key:28} {int(value)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--hard", type=float, default=0.25, help="Fraction de photos difficiles")
+    parser.add_argument("--fast-latency", type=float, default=0.02)
+    parser.add_argument("--vision-latency", type=float, default=0.08)
+    args = parser.parse_args()
+
+    bootstrap_env()
+    os.environ["OCR_CACHE_ENABLED"] = "false"
+    asyncio.run(run(args.count, args.hard, args.fast_latency, args.vision_latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark — OCR par tuiles vs OCR en un seul appel.
+
+    python -m benchmarks.bench_ocr_tiling            # modèle simulé
+    python -m benchmarks.bench_ocr_tiling --live     # vrai Claude Vision
+
+Échantillons construits à partir de test-materials :
+- une fiche dense (tout le cours sur une page portrait, petite police)
+- une double page (cours à gauche, exercice à droite, photo paysage)
+
+Mesures : temps total (wall-clock) et fidélité de la transcription par rapport
+au texte de référence (ratio difflib, 1.0 = identique).
+
+En mode simulé, le « modèle » renvoie les lignes de référence visibles dans la
+tuile (zones de chevauchement comprises) avec une latence proportionnelle au
+nombre de tokens générés : cela mesure le gain de parallélisme et la qualité
+de la fusion/déduplication, pas la qualité de lecture du modèle.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from difflib import SequenceMatcher
+
+from benchmarks._common import TEST_MATERIALS, bootstrap_env, html_to_text, layout_lines, render_page
+
+PAGE = (3024, 4032)
+SIM_BASE_LATENCY_S = 0.8
+SIM_TOKENS_PER_S = 60.0
+SIM_CHARS_PER_TOKEN = 3.5
+
+
+def _double_page(left: bytes, right: bytes) -> bytes:
+    from PIL import Image, ImageOps
+
+    pages = [ImageOps.exif_transpose(Image.open(io.BytesIO(b))) for b in (left, right)]
+    spread = Image.new("RGB", (pages[0].width * 2, pages[0].height), (246, 243, 236))
+    spread.paste(pages[0], (0, 0))
+    spread.paste(pages[1], (pages[0].width, 0))
+    buffer = io.BytesIO()
+    spread.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def _samples() -> list[dict]:
+    course = html_to_text(TEST_MATERIALS / "cours-maths-3eme.html")
+    exercise = html_to_text(TEST_MATERIALS / "exercice-maths-3eme.html")
+
+    dense_lines = layout_lines(course, PAGE, density=95)
+    left = layout_lines(course, PAGE)
+    right = layout_lines(exercise, PAGE)
+    return [
+        {
+            "name": "fiche dense (portrait)",
+            "image": render_page(course, PAGE, density=95),
+            # (ligne, x, y) en fraction de la page
+            "lines": [(line, 0.5, y) for line, y in dense_lines],
+        },
+        {
+            "name": "double page (paysage)",
+            "image": _double_page(render_page(course, PAGE), render_page(exercise, PAGE)),
+            "lines": [(line, 0.25, y) for line, y in left] + [(line, 0.75, y) for line, y in right],
+        },
+    ]
+
+
+def _reference(sample: dict) -> str:
+    return "\n".join(line for line, _, _ in sample["lines"]).strip()
+
+
+def _fidelity(text: str, reference: str) -> float:
+    norm = lambda t: "\n".join(" ".join(line.split()) for line in t.split("\n") if line.strip())
+    return SequenceMatcher(None, norm(text), norm(reference), autojunk=False).ratio()
+
+
+def _simulated_vision(sample: dict):
+    from rag.ocr import validate_ocr_output
+
+    async def fake_ocr_result(kind, image, prompt, max_tokens):
+        x0, y0, x1, y1 = image.region or (0.0, 0.0, 1.0, 1.0)
+        visible = [line for line, x, y in sample["lines"] if x0 <= x <= x1 and y0 <= y <= y1]
+        tool_input = {
+            "title": "Développement et factorisation", "subject": "Mathématiques", "level": "3ème",
+            "content": "\n".join(visible), "keywords": ["développer", "factoriser"],
+        }
+        output = json.dumps(tool_input, ensure_ascii=False)
+        await asyncio.sleep(SIM_BASE_LATENCY_S + len(output) / SIM_CHARS_PER_TOKEN / SIM_TOKENS_PER_S)
+        return validate_ocr_output(kind, tool_input)[0]
+
+    return fake_ocr_result
+
+
+async def run(live: bool) -> None:
+    import rag.ocr as ocr
+
+    print(f"{'échantillon':24} {'mode':10} {'temps':>8} {'fidélité':>9} {'lignes':>7}")
+    for sample in _samples():
+        if not live:
+            ocr._ocr_result = _simulated_vision(sample)
+        reference = _reference(sample)
+
+        for label, tiled in (("1 appel", False), ("tuiles", True)):
+            start = time.perf_counter()
+            result = await ocr.extract_course_from_image(sample["image"], tiled=tiled)
+            elapsed = time.perf_counter() - start
+            lines = sum(1 for line in result.content.split("\n") if line.strip())
+            print(f"{sample['name']:24} {label:10} {elapsed:7.1f}s {_fidelity(result.content, reference):9.3f} {lines:7d}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="Appels Claude Vision réels")
+    args = parser.parse_args()
+
+    bootstrap_env(args.live)
+    # Chaque mesure doit atteindre le modèle
+    os.environ["OCR_CACHE_ENABLED"] = "false"
+    asyncio.run(run(args.live))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark — contrôle qualité avant OCR : temps d'analyse et décisions sur des
+photos dégradées (flou, sous/surexposition, faible contraste, basse résolution).
+
+    python -m benchmarks.bench_quality_gate
+
+Les supports de test-materials sont rendus en photos 12 MP, puis dégradés.
+Une feuille presque vide (trois lignes) vérifie qu'un texte clairsemé n'est pas
+pris pour du flou.
+"""
+import argparse
+import io
+import time
+from pathlib import Path
+
+from benchmarks._common import TEST_MATERIALS, bootstrap_env, load_samples, render_page
+
+SPARSE_SHEET = "Exercice 3\nRésoudre l'équation 2x + 3 = 7\nJustifier la réponse."
+
+
+def _variants(photo: bytes) -> dict[str, bytes]:
+    from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(photo))).convert("RGB")
+
+    def encode(img) -> bytes:
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=85)
+        return buffer.getvalue()
+
+    return {
+        "originale": photo,
+        "flou r=4": encode(image.filter(ImageFilter.GaussianBlur(4))),
+        "flou r=12": encode(image.filter(ImageFilter.GaussianBlur(12))),
+        "sombre x0.2": encode(ImageEnhance.Brightness(image).enhance(0.2)),
+        "surexposée x3": encode(ImageEnhance.Brightness(image).enhance(3)),
+        "contraste x0.15": encode(ImageEnhance.Contrast(image).enhance(0.15)),
+        "300x400": encode(image.resize((300, 400))),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", type=Path, default=TEST_MATERIALS)
+    parser.add_argument("--limit", type=int, default=3, help="Nombre de supports testés")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    from rag.quality import assess_image_quality
+
+    samples = load_samples(args.dir)[:args.limit] + [("feuille clairsemée", render_page(SPARSE_SHEET))]
+    timings = []
+    print(f"{'support':28} {'variante':16} {'décision':20} {'netteté':>9} {'papier':>7} {'encre':>6} {'temps':>7}")
+    for name, photo in samples:
+        for variant, data in _variants(photo).items():
+            start = time.perf_counter()
+            report = assess_image_quality(data)
+            elapsed = (time.perf_counter() - start) * 1000
+            timings.append(elapsed)
+            print(f"{name[:28]:28} {variant:16} {report.code or 'OK':20} {report.sharpness:9.0f} "
+                  f"{report.paper_level:7.0f} {report.ink_level:6.0f} {elapsed:5.0f}ms")
+
+    timings.sort()
+    print(f"\nAnalyse : médiane {timings[len(timings) // 2]:.0f} ms, max {timings[-1]:.0f} ms "
+          f"sur {len(timings)} photos")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,18 +11,95 @@ class Settings(BaseSettings):
     supabase_jwt_secret: str = ""  # Legacy HS256 — optionnel depuis la migration ES256
     environment: str = "development"
     cors_origins: str = "http://localhost:3000"
+    metrics_token: str = ""  # Bearer exigé par GET /metrics (vide : route désactivée)
 
     # Modèles IA
     vision_model: str = "claude-sonnet-4-6"
     correction_model: str = "claude-sonnet-4-6"
     embedding_model: str = "voyage-3"
     embedding_dimensions: int = 1024
+    embedding_provider: str = "voyage"   # "voyage" ou "local" (rag/embedding_providers.py)
+    embedding_fallback: str = "local"    # Secours quand le fournisseur est indisponible ("" : aucun)
+    embedding_fallback_cooldown_s: float = 60.0  # Durée du mode dégradé avant de retenter le fournisseur
+    local_embedding_idf_path: str = ""   # Fournisseur local : idf appris (.npy), uniforme sinon
+
+    # OCR — prétraitement des images avant Claude Vision
+    ocr_max_long_edge: int = 1568      # Au-delà, l'API redimensionne elle-même
+    ocr_grayscale: bool = False        # Niveaux de gris (pages de texte sans couleur utile)
+    ocr_output_format: str = "webp"    # "webp" ou "jpeg"
+    ocr_output_quality: int = 85
+    ocr_timeout_s: float = 60.0        # Délai max d'un appel Vision (retries SDK inclus)
+    heif_workers: int = 2              # Process dédiés au décodage HEIC/HEIF (photos iPhone)
+
+    # OCR — routage des exercices : modèle rapide d'abord, escalade vers vision_model
+    ocr_tiered_enabled: bool = True
+    ocr_fast_model: str = ""               # Vide : evaluator_model
+    ocr_fast_min_confidence: float = 85.0  # Auto-évaluation (0-100) en dessous de laquelle on escalade
+    ocr_fast_min_statement_chars: int = 20 # Énoncé plus court : lecture jugée incomplète
+    ocr_fast_timeout_s: float = 20.0       # Au-delà, on passe directement au modèle vision
+
+    # Contrôle qualité des photos avant OCR (rag/quality.py)
+    quality_gate_enabled: bool = True
+    quality_min_short_edge: int = 480      # Pixels, image d'origine
+    quality_min_sharpness: float = 10.0    # Variance du laplacien (blocs les plus nets, à ~1024 px)
+    quality_min_paper_level: float = 60.0  # Luminance du fond en dessous de laquelle la photo est trop sombre
+    quality_max_paper_level: float = 250.0 # Fond saturé : un faible contraste signale une surexposition
+    quality_min_contrast: float = 40.0     # Écart de luminance fond / encre
+
+    # OCR — mode par tuiles (doubles pages, fiches denses)
+    ocr_tiling_enabled: bool = False   # Désactivé par défaut : activable par appel (tiled=True)
+    ocr_tile_min_long_edge: int = 2400 # En dessous, une seule requête suffit
+    ocr_tile_dense_min_lines: int = 45 # Lignes de texte à partir desquelles une page portrait est découpée
+    ocr_tile_overlap: float = 0.08     # Chevauchement entre tuiles (fraction de la tuile)
+    ocr_tile_concurrency: int = 4      # Appels Vision simultanés par image
+
+    # Upload de cours sur plusieurs pages
+    upload_max_pages: int = 12         # Photos par upload (un seul cours)
+    ocr_page_concurrency: int = 3      # Pages lues simultanément par Claude Vision
+
+    # File des jobs d'upload (table upload_jobs)
+    job_worker_enabled: bool = True    # Worker d'ingestion dans le process API ; False si workers dédiés
+    job_concurrency: int = 2           # Jobs traités simultanément par worker
+    job_poll_interval: float = 1.0     # Attente entre deux réclamations quand la file est vide (s)
+    job_lease_seconds: int = 120       # Bail d'un job ; renouvelé pendant le traitement
+    job_max_attempts: int = 3
+    job_retry_base_delay: float = 5.0  # Backoff exponentiel : 5 s, 10 s, 20 s...
+    job_ttl_hours: int = 24            # Jobs terminés purgés après ce délai
+    job_events_poll_interval: float = 1.0  # Relecture du job par le flux SSE sans notification locale (s)
+
+    # OCR — cache des résultats (SHA-256 exact + dHash perceptuel)
+    ocr_cache_enabled: bool = True
+    ocr_cache_persistent: bool = True  # Tier Postgres (table ocr_cache)
+    ocr_cache_max_entries: int = 512   # Taille du LRU en mémoire
+    ocr_cache_phash_max_distance: int = 28  # Distance de Hamming max sur 256 bits
+
+    # Cache des embeddings (clé : modèle, input_type, SHA-256 du texte)
+    embedding_cache_enabled: bool = True
+    embedding_cache_persistent: bool = True  # Tier Postgres (table embedding_cache)
+    embedding_cache_max_mb: int = 64          # Taille du LRU en mémoire (≈ 15 000 vecteurs de 1024 dims)
+    embedding_cache_ttl_days: int = 30        # Entrées Postgres purgées après ce délai sans utilisation
 
     # RAG
+    chunk_mode: str = "chars"          # "chars" (chunk_size en caractères) ou "tokens" (budget en tokens estimés)
     chunk_size: int = 800
     chunk_overlap: int = 100
+    chunk_max_tokens: int = 200        # Mode tokens : ≈ 800 caractères de français
+    chunk_overlap_tokens: int = 25
+    chunk_min_tokens: int = 40         # Mode tokens : un bloc plus court est fusionné avec le suivant
     retrieval_top_k: int = 5
     specialist_top_k: int = 7          # Plus de chunks pour les spécialistes
+    section_expand_min_hits: int = 2   # Feuilles d'une même section à partir desquelles on renvoie la section
+    section_max_tokens: int = 600      # Section plus longue : on garde les feuilles
+    stream_embed_batch_size: int = 8   # Lot d'embedding pendant l'OCR en streaming
+    embed_batch_max_inputs: int = 128  # Limite Voyage : 128 textes par requête
+    embed_batch_max_tokens: int = 80_000  # Limite Voyage : 120K tokens par requête (marge sur l'estimation locale)
+    embed_concurrency: int = 4         # Requêtes Voyage simultanées par process
+    embed_max_retries: int = 5         # 429 / 5xx / réseau : nouvelles tentatives avant abandon
+    embed_retry_base_delay: float = 0.5  # Backoff exponentiel : 0,5 s, 1 s, 2 s... (ou Retry-After)
+    embed_retry_max_delay: float = 30.0
+    query_embed_batch_window_ms: float = 5.0  # Attente max pour regrouper les embed_query concurrents (0 : désactivé)
+    query_embed_max_batch: int = 32    # Requêtes par appel Voyage groupé
+    embedding_orphan_grace_minutes: int = 60  # Embedding partagé sans chunk purgé après ce délai
 
     # Agents spécialistes
     evaluator_model: str = "claude-haiku-4-5-20251001"   # Modèle léger pour l'évaluation
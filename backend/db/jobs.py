@@ -0,0 +1,476 @@
+"""
+File des jobs d'upload — table Postgres `upload_jobs` (migration 006).
+
+L'API enregistre le job et dépose les fichiers dans le bucket Storage
+`course-uploads` ; un worker d'ingestion (workers/ingestion.py) le réclame via
+la fonction RPC claim_upload_jobs (FOR UPDATE SKIP LOCKED), le traite, puis
+écrit le résultat. Tout l'état est en base : n'importe quel worker uvicorn
+peut lire le statut d'un job, et un job interrompu par un redémarrage est
+repris à l'expiration de son bail.
+
+Pendant le traitement, le worker ajoute à `events` une entrée horodatée par
+étape ; le flux SSE du job les relit quand un worker du même process signale
+un changement (watch_job), et sinon à intervalle régulier.
+
+Uploads idempotents (migration 008) : un job porte l'Idempotency-Key du client
+et le hash de son contenu. Un upload rejoué retrouve le job — ou le cours —
+existant au lieu d'être retraité ; les index uniques tranchent entre deux
+retries concurrents.
+
+Le client Supabase est synchrone : chaque appel est exécuté hors de la boucle
+asyncio.
+"""
+import asyncio
+import hashlib
+import logging
+import random
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Literal
+
+from postgrest.exceptions import APIError
+
+from config import get_settings
+from db.client import get_supabase
+
+logger = logging.getLogger("studybuddy.jobs")
+settings = get_settings()
+
+JobKind = Literal["photo", "document"]
+JobStatus = Literal["queued", "processing", "done", "error"]
+
+UPLOAD_BUCKET = "course-uploads"
+
+_JOB_COLUMNS = (
+    "id, user_id, kind, status, payload, result, error, events, attempts, max_attempts, content_hash, updated_at"
+)
+
+# Fichier reçu par l'API : (contenu ou fichier temporaire, content_type, nom d'origine)
+UploadedFile = tuple[bytes | Path, str | None, str | None]
+
+
+@dataclass
+class StagedFile:
+    path: str                    # Chemin dans le bucket course-uploads
+    content_type: str | None = None
+    filename: str | None = None
+
+
+@dataclass
+class UploadJob:
+    id: str
+    user_id: str
+    kind: JobKind
+    status: JobStatus
+    payload: dict = field(default_factory=dict)
+    result: dict | None = None
+    error: str | None = None
+    events: list[dict] = field(default_factory=list)   # Étapes horodatées, dans l'ordre
+    attempts: int = 0
+    max_attempts: int = 3
+    locked_by: str | None = None
+    content_hash: str | None = None
+    updated_at: str | None = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> "UploadJob":
+        return cls(**{name: row[name] for name in cls.__dataclass_fields__ if name in row})
+
+    @property
+    def files(self) -> list[StagedFile]:
+        return [StagedFile(**f) for f in self.payload.get("files", [])]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class IdempotencyConflict(ValueError):
+    """Idempotency-Key déjà utilisée par l'élève pour un autre contenu."""
+
+
+def upload_content_hash(file_hashes: list[str]) -> str:
+    """Hash d'un upload : celui du fichier, ou des SHA-256 des pages dans l'ordre."""
+    if len(file_hashes) == 1:
+        return file_hashes[0]
+    return hashlib.sha256("\n".join(file_hashes).encode()).hexdigest()
+
+
+def _is_unique_violation(error: Exception) -> bool:
+    return isinstance(error, APIError) and error.code == "23505"
+
+
+def job_event(stage: str, **details) -> dict:
+    """Événement de progression : étape + horodatage ISO (+ détails, ex. done/total)."""
+    return {"stage": stage, "at": _now().isoformat(), **details}
+
+
+# ── Fichiers en attente (Storage) ─────────────────────────────────────────────
+
+def _upload_files(job_id: str, user_id: str, files: list[UploadedFile]) -> list[StagedFile]:
+    bucket = get_supabase().storage.from_(UPLOAD_BUCKET)
+    staged = []
+    for index, (data, content_type, filename) in enumerate(files):
+        path = f"{user_id}/{job_id}/{index}"
+        bucket.upload(path, data, file_options={"content-type": content_type or "application/octet-stream"})
+        staged.append(StagedFile(path=path, content_type=content_type, filename=filename))
+    return staged
+
+
+def _download_file(path: str) -> bytes:
+    return get_supabase().storage.from_(UPLOAD_BUCKET).download(path)
+
+
+def _remove_files(paths: list[str]) -> None:
+    if paths:
+        get_supabase().storage.from_(UPLOAD_BUCKET).remove(paths)
+
+
+async def load_file(staged: StagedFile) -> bytes:
+    return await asyncio.to_thread(_download_file, staged.path)
+
+
+async def delete_staged_files(job: UploadJob) -> None:
+    """Supprime les fichiers du job ; un échec laisse des orphelins, sans bloquer le job."""
+    try:
+        await asyncio.to_thread(_remove_files, [f.path for f in job.files])
+    except Exception as e:
+        logger.warning("[JOBS] suppression des fichiers impossible job=%s: %s", job.id, e)
+
+
+# ── Cycle de vie d'un job ─────────────────────────────────────────────────────
+
+def _insert_job(
+    job_id: str,
+    user_id: str,
+    kind: JobKind,
+    payload: dict,
+    idempotency_key: str | None,
+    content_hash: str | None,
+) -> UploadJob:
+    row = get_supabase().table("upload_jobs").insert({
+        "id": job_id,
+        "user_id": user_id,
+        "kind": kind,
+        "payload": payload,
+        "max_attempts": settings.job_max_attempts,
+        "idempotency_key": idempotency_key,
+        "content_hash": content_hash,
+    }).execute().data[0]
+    return UploadJob.from_row(row)
+
+
+def _find_job(user_id: str, column: str, value: str) -> UploadJob | None:
+    query = get_supabase().table("upload_jobs").select(_JOB_COLUMNS).eq("user_id", user_id).eq(column, value)
+    if column == "content_hash":
+        query = query.neq("status", "error")
+    result = query.limit(1).execute()
+    return UploadJob.from_row(result.data[0]) if result.data else None
+
+
+def find_course_by_hash(user_id: str, content_hash: str) -> dict | None:
+    """Cours de l'élève issu du même contenu, au format du résultat d'un job."""
+    supabase = get_supabase()
+    result = (
+        supabase.table("courses")
+        .select("id, title, subject, level, keywords, created_at")
+        .eq("user_id", user_id)
+        .eq("content_hash", content_hash)
+        .limit(1)
+        .execute()
+    )
+    if not result.data:
+        return None
+    course = result.data[0]
+    chunks = (
+        supabase.table("course_chunks")
+        .select("id", count="exact")
+        .eq("course_id", course["id"])
+        .limit(1)
+        .execute()
+    )
+    return {**course, "keywords": course["keywords"] or [], "chunk_count": chunks.count or 0}
+
+
+def _existing_upload(
+    user_id: str,
+    kind: JobKind,
+    idempotency_key: str | None,
+    content_hash: str | None,
+) -> UploadJob | None:
+    """
+    Job ou cours déjà issu de cet upload :
+    1. même Idempotency-Key (le contenu doit être le même) ;
+    2. job du même contenu, en file, en cours ou terminé ;
+    3. cours du même contenu (job purgé) : un job 'done' est créé pour lui,
+       afin que le client suive le même chemin que pour un nouvel upload.
+    """
+    if idempotency_key:
+        job = _find_job(user_id, "idempotency_key", idempotency_key)
+        if job is not None:
+            if content_hash and job.content_hash and job.content_hash != content_hash:
+                raise IdempotencyConflict("Idempotency-Key déjà utilisée pour un autre fichier")
+            return job
+    if not content_hash:
+        return None
+    job = _find_job(user_id, "content_hash", content_hash)
+    if job is not None:
+        return job
+    course = find_course_by_hash(user_id, content_hash)
+    if course is None:
+        return None
+    row = get_supabase().table("upload_jobs").insert({
+        "user_id": user_id,
+        "kind": kind,
+        "status": "done",
+        "result": {"course": course, "timings": None},
+        "idempotency_key": idempotency_key,
+        "content_hash": content_hash,
+    }).execute().data[0]
+    return UploadJob.from_row(row)
+
+
+def _lookup_existing(
+    user_id: str,
+    kind: JobKind,
+    idempotency_key: str | None,
+    content_hash: str | None,
+) -> UploadJob | None:
+    try:
+        return _existing_upload(user_id, kind, idempotency_key, content_hash)
+    except APIError as e:
+        if not _is_unique_violation(e):
+            raise
+        # Un retry concurrent vient d'enregistrer le même upload : c'est lui qu'on renvoie
+        return _existing_upload(user_id, kind, idempotency_key, content_hash)
+
+
+async def enqueue_job(
+    user_id: str,
+    kind: JobKind,
+    files: list[UploadedFile],
+    options: dict | None = None,
+    idempotency_key: str | None = None,
+    content_hash: str | None = None,
+) -> tuple[UploadJob, bool]:
+    """
+    Dépose les fichiers (contenu, content_type, filename) dans Storage puis
+    enregistre le job 'queued'. Le course_id est fixé dès maintenant : une
+    nouvelle tentative remplace le cours d'une tentative interrompue au lieu
+    d'en créer un second.
+
+    Un upload déjà reçu (même Idempotency-Key, ou même contenu) n'est pas
+    réenregistré : le job existant est renvoyé.
+
+    Returns:
+        (job, True si le job vient d'être créé)
+
+    Raises:
+        IdempotencyConflict: clé déjà utilisée pour un autre contenu
+    """
+    existing = await asyncio.to_thread(_lookup_existing, user_id, kind, idempotency_key, content_hash)
+    if existing is not None:
+        return existing, False
+
+    job_id = str(uuid.uuid4())
+    staged = await asyncio.to_thread(_upload_files, job_id, user_id, files)
+    payload = {
+        **(options or {}),
+        "course_id": str(uuid.uuid4()),
+        "files": [vars(f) for f in staged],
+    }
+    try:
+        job = await asyncio.to_thread(_insert_job, job_id, user_id, kind, payload, idempotency_key, content_hash)
+    except BaseException as e:
+        await asyncio.to_thread(_remove_files, [f.path for f in staged])
+        if _is_unique_violation(e):
+            existing = await asyncio.to_thread(_lookup_existing, user_id, kind, idempotency_key, content_hash)
+            if existing is not None:
+                return existing, False
+        raise
+    return job, True
+
+
+def _release_content_hash(user_id: str, content_hash: str) -> None:
+    (
+        get_supabase().table("upload_jobs")
+        .update({"content_hash": None})
+        .eq("user_id", user_id)
+        .eq("content_hash", content_hash)
+        .execute()
+    )
+
+
+async def release_content_hash(user_id: str, content_hash: str) -> None:
+    """Cours supprimé : le même contenu peut de nouveau être importé."""
+    await asyncio.to_thread(_release_content_hash, user_id, content_hash)
+
+
+def _get_job(job_id: str, user_id: str) -> UploadJob | None:
+    result = (
+        get_supabase().table("upload_jobs")
+        .select(_JOB_COLUMNS)
+        .eq("id", job_id)
+        .eq("user_id", user_id)
+        .limit(1)
+        .execute()
+    )
+    return UploadJob.from_row(result.data[0]) if result.data else None
+
+
+async def get_job(job_id: str, user_id: str) -> UploadJob | None:
+    """Job de l'élève, ou None (inexistant, purgé ou appartenant à un autre élève)."""
+    return await asyncio.to_thread(_get_job, job_id, user_id)
+
+
+def _claim_jobs(worker_id: str, max_jobs: int) -> list[UploadJob]:
+    result = get_supabase().rpc("claim_upload_jobs", {
+        "worker_id": worker_id,
+        "max_jobs": max_jobs,
+        "lease_seconds": settings.job_lease_seconds,
+    }).execute()
+    return [UploadJob.from_row(row) for row in result.data or []]
+
+
+async def claim_jobs(worker_id: str, max_jobs: int) -> list[UploadJob]:
+    """Réserve jusqu'à max_jobs jobs prêts (ou dont le bail a expiré)."""
+    return await asyncio.to_thread(_claim_jobs, worker_id, max_jobs)
+
+
+def _update_locked(job_id: str, worker_id: str, values: dict) -> bool:
+    """Mise à jour conditionnée au bail : un job repris par un autre worker n'est plus touché."""
+    result = (
+        get_supabase().table("upload_jobs")
+        .update({**values, "updated_at": _now().isoformat()})
+        .eq("id", job_id)
+        .eq("locked_by", worker_id)
+        .execute()
+    )
+    return bool(result.data)
+
+
+def _renew_leases(job_ids: list[str], worker_id: str) -> None:
+    now = _now().isoformat()
+    (
+        get_supabase().table("upload_jobs")
+        .update({"locked_at": now, "updated_at": now})
+        .in_("id", job_ids)
+        .eq("locked_by", worker_id)
+        .eq("status", "processing")
+        .execute()
+    )
+
+
+async def renew_leases(job_ids: list[str], worker_id: str) -> None:
+    if job_ids:
+        await asyncio.to_thread(_renew_leases, job_ids, worker_id)
+
+
+async def complete_job(job: UploadJob, worker_id: str, result: dict) -> bool:
+    return await asyncio.to_thread(_update_locked, job.id, worker_id, {
+        "status": "done",
+        "result": result,
+        "error": None,
+        "locked_by": None,
+        "locked_at": None,
+    })
+
+
+def _append_event(job_id: str, worker_id: str, event: dict) -> None:
+    get_supabase().rpc("append_upload_job_event", {
+        "job_id": job_id,
+        "worker_id": worker_id,
+        "event": event,
+    }).execute()
+
+
+async def append_job_event(job_id: str, worker_id: str, event: dict) -> None:
+    await asyncio.to_thread(_append_event, job_id, worker_id, event)
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff exponentiel avec gigue (±20 %) : les jobs d'une même panne ne repartent pas ensemble."""
+    return settings.job_retry_base_delay * 2 ** max(attempts - 1, 0) * random.uniform(0.8, 1.2)
+
+
+async def fail_job(job: UploadJob, worker_id: str, error: str, retryable: bool) -> bool:
+    """
+    Remet le job en file après un délai de backoff, ou le passe en erreur
+    définitive (erreur non retentable ou tentatives épuisées).
+
+    Returns:
+        True si le job sera retenté
+    """
+    retry = retryable and job.attempts < job.max_attempts
+    if retry:
+        values = {
+            "status": "queued",
+            "run_after": (_now() + timedelta(seconds=retry_delay(job.attempts))).isoformat(),
+        }
+    else:
+        values = {"status": "error"}
+    await asyncio.to_thread(_update_locked, job.id, worker_id, {
+        **values,
+        "error": error,
+        "locked_by": None,
+        "locked_at": None,
+    })
+    return retry
+
+
+async def release_job(job: UploadJob, worker_id: str) -> None:
+    """Rend immédiatement un job interrompu par l'arrêt du worker, sans compter la tentative."""
+    await asyncio.to_thread(_update_locked, job.id, worker_id, {
+        "status": "queued",
+        "attempts": max(job.attempts - 1, 0),
+        "run_after": _now().isoformat(),
+        "locked_by": None,
+        "locked_at": None,
+    })
+
+
+def _purge_expired(cutoff: str) -> int:
+    result = (
+        get_supabase().table("upload_jobs")
+        .delete()
+        .in_("status", ["done", "error"])
+        .lt("updated_at", cutoff)
+        .execute()
+    )
+    return len(result.data or [])
+
+
+async def purge_expired_jobs() -> int:
+    """Supprime les jobs terminés depuis plus de settings.job_ttl_hours ; retourne leur nombre."""
+    cutoff = (_now() - timedelta(hours=settings.job_ttl_hours)).isoformat()
+    return await asyncio.to_thread(_purge_expired, cutoff)
+
+
+# ── Notifications dans le process ─────────────────────────────────────────────
+# Un flux SSE servi par le process qui traite le job est réveillé dès qu'un
+# événement est écrit ; les autres relisent la table à intervalle régulier.
+
+_watchers: dict[str, set[asyncio.Event]] = {}
+
+
+@contextmanager
+def watch_job(job_id: str) -> Iterator[asyncio.Event]:
+    """Événement levé à chaque changement du job signalé dans ce process."""
+    changed = asyncio.Event()
+    _watchers.setdefault(job_id, set()).add(changed)
+    try:
+        yield changed
+    finally:
+        watchers = _watchers.get(job_id, set())
+        watchers.discard(changed)
+        if not watchers:
+            _watchers.pop(job_id, None)
+
+
+def notify_job_watchers(job_id: str) -> None:
+    for changed in _watchers.get(job_id, ()):
+        changed.set()
@@ -1,15 +1,20 @@
 import logging
 import sys
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
+import metrics
+from api.auth import require_metrics_token
 from api.ratelimit import limiter
 from config import get_settings
 from api import cours, exercice
 from api import feedback
+from rag.preprocessing import shutdown_preprocessing
+from workers.ingestion import start_worker, stop_worker
 
 # Configuration du logging global (visible dans Railway)
 logging.basicConfig(
@@ -22,10 +27,23 @@ logger = logging.getLogger("studybuddy")
 settings = get_settings()
 logger.info("StudyBuddy API demarrage - env=%s", settings.environment)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Worker d'ingestion dans le process API, sauf si des workers dédiés traitent la file
+    if settings.job_worker_enabled:
+        start_worker()
+    yield
+    await stop_worker()
+    # Arrêt propre du pool de décodage HEIC
+    shutdown_preprocessing()
+
+
 app = FastAPI(
     title="StudyBuddy API",
     description="API d aide aux devoirs - OCR, RAG et correction pas-a-pas",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Rate limiting
@@ -48,3 +66,9 @@ app.include_router(feedback.router, prefix="/api/feedback", tags=["feedback"])
 @app.get("/health")
 def health_check():
     return {"status": "ok", "version": "0.1.0"}
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+def get_metrics():
+    """Métriques en mémoire du process (compteurs, histogrammes), réservées à l'exploitation."""
+    return metrics.snapshot()
@@ -0,0 +1,91 @@
+"""
+Métriques applicatives — compteurs et histogrammes en mémoire, par process.
+
+Exposées en JSON sur GET /metrics. Usage :
+    from metrics import counter
+    OCR_CALLS = counter("ocr_calls_total", "Appels Claude Vision")
+    OCR_CALLS.inc(kind="course")
+"""
+import threading
+from bisect import bisect_left
+
+_lock = threading.Lock()
+_registry: dict[str, "Counter | Histogram"] = {}
+
+
+def _label_key(labels: dict[str, str]) -> str:
+    return ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+
+
+class Counter:
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._values: dict[str, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def snapshot(self) -> dict:
+        return {"type": "counter", "description": self.description, "values": dict(self._values)}
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...]) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[str, dict] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        with _lock:
+            series = self._series.setdefault(
+                key, {"count": 0, "sum": 0.0, "buckets": [0] * (len(self.buckets) + 1)}
+            )
+            series["count"] += 1
+            series["sum"] += value
+            series["buckets"][bisect_left(self.buckets, value)] += 1
+
+    def snapshot(self) -> dict:
+        values = {}
+        for key, series in self._series.items():
+            bounds = [str(b) for b in self.buckets] + ["+Inf"]
+            values[key] = {
+                "count": series["count"],
+                "sum": series["sum"],
+                "mean": series["sum"] / series["count"] if series["count"] else 0.0,
+                "buckets": dict(zip(bounds, series["buckets"])),
+            }
+        return {"type": "histogram", "description": self.description, "values": values}
+
+
+def counter(name: str, description: str) -> Counter:
+    """Retourne le compteur `name`, créé au premier appel."""
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = Counter(name, description)
+    return metric  # type: ignore[return-value]
+
+
+def histogram(name: str, description: str, buckets: tuple[float, ...]) -> Histogram:
+    """Retourne l'histogramme `name`, créé au premier appel."""
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = Histogram(name, description, buckets)
+    return metric  # type: ignore[return-value]
+
+
+def snapshot() -> dict:
+    """État courant de toutes les métriques enregistrées."""
+    return {name: metric.snapshot() for name, metric in sorted(_registry.items())}
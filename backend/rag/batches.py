@@ -0,0 +1,178 @@
+"""
+Message Batches — substitut local de `client.messages.batches`.
+
+Reproduit la surface utilisée par l'import en masse (create / retrieve /
+results) et renvoie les mêmes types que le SDK. Les requêtes sont exécutées
+en local, avec une concurrence bornée, par un `create` fourni : l'API Messages
+classique (pas de remise batch, mais pas d'attente de 24 h) ou un modèle
+simulé pour tester hors ligne.
+
+L'état est écrit dans un dossier (requêtes + résultats en JSONL) : comme avec
+la vraie API, un batch interrompu reprend là où il s'est arrêté au prochain
+lancement du script.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import anthropic
+import httpx
+from anthropic.types.messages import MessageBatch, MessageBatchIndividualResponse
+
+logger = logging.getLogger("studybuddy.batches")
+
+CreateMessage = Callable[..., Awaitable[anthropic.types.Message]]
+
+
+class LocalMessageBatches:
+    """Substitut de `AsyncAnthropic().messages.batches`, persistant sur disque."""
+
+    def __init__(self, state_dir: Path, create: CreateMessage, concurrency: int = 4) -> None:
+        self.state_dir = state_dir
+        self.create_message = create
+        self.concurrency = concurrency
+        self._runs: dict[str, asyncio.Task] = {}
+        state_dir.mkdir(parents=True, exist_ok=True)
+
+    def _requests_path(self, batch_id: str) -> Path:
+        return self.state_dir / f"{batch_id}.requests.jsonl"
+
+    def _results_path(self, batch_id: str) -> Path:
+        return self.state_dir / f"{batch_id}.results.jsonl"
+
+    @staticmethod
+    def _read_jsonl(path: Path) -> list[dict]:
+        if not path.exists():
+            return []
+        # Une ligne illisible (arrêt brutal pendant l'écriture) est ignorée : sa requête sera rejouée
+        lines = []
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                lines.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return lines
+
+    def _repair_results(self, batch_id: str) -> list[dict]:
+        """
+        Résultats lisibles du batch. Le fichier est réécrit sans ses lignes
+        illisibles : sinon le prochain résultat ajouté se collerait à la
+        ligne tronquée et serait perdu à son tour.
+        """
+        path = self._results_path(batch_id)
+        entries = self._read_jsonl(path)
+        if not path.exists():
+            return entries
+        text = path.read_text(encoding="utf-8")
+        if len(entries) != len(text.splitlines()) or (text and not text.endswith("\n")):
+            logger.warning("[BATCH] %s : ligne(s) de résultat tronquée(s) retirée(s)", batch_id)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries), encoding="utf-8")
+            tmp.replace(path)
+        return entries
+
+    async def _run_one(self, request: dict) -> dict:
+        try:
+            message = await self.create_message(**request["params"])
+            result = {"type": "succeeded", "message": message.model_dump(mode="json")}
+        except anthropic.APIError as e:
+            error_type = getattr(e, "type", None) or "api_error"
+            result = {"type": "errored", "error": {"type": "error", "error": {"type": error_type, "message": str(e)}}}
+        return {"custom_id": request["custom_id"], "result": result}
+
+    async def _process(self, batch_id: str) -> None:
+        done = {entry["custom_id"] for entry in self._repair_results(batch_id)}
+        pending = [r for r in self._read_jsonl(self._requests_path(batch_id)) if r["custom_id"] not in done]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        logger.info("[BATCH] %s : %d requête(s) à exécuter en local", batch_id, len(pending))
+
+        async def run(request: dict) -> None:
+            async with semaphore:
+                entry = await self._run_one(request)
+            with self._results_path(batch_id).open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        await asyncio.gather(*(run(r) for r in pending))
+
+    def _ensure_running(self, batch_id: str) -> None:
+        task = self._runs.get(batch_id)
+        if task is None or (task.done() and not self._is_ended(batch_id)):
+            self._runs[batch_id] = asyncio.create_task(self._process(batch_id))
+
+    def _is_ended(self, batch_id: str) -> bool:
+        requests = self._read_jsonl(self._requests_path(batch_id))
+        return len(self._read_jsonl(self._results_path(batch_id))) >= len(requests)
+
+    def _batch(self, batch_id: str) -> MessageBatch:
+        requests_path = self._requests_path(batch_id)
+        if not requests_path.exists():
+            raise anthropic.NotFoundError(
+                f"batch local inconnu : {batch_id}",
+                response=_error_response(batch_id),
+                body=None,
+            )
+        total = len(self._read_jsonl(requests_path))
+        results = self._read_jsonl(self._results_path(batch_id))
+        succeeded = sum(entry["result"]["type"] == "succeeded" for entry in results)
+        created_at = datetime.fromtimestamp(requests_path.stat().st_mtime, timezone.utc)
+        ended = len(results) >= total
+        return MessageBatch(
+            id=batch_id,
+            type="message_batch",
+            processing_status="ended" if ended else "in_progress",
+            request_counts={
+                "processing": total - len(results),
+                "succeeded": succeeded,
+                "errored": len(results) - succeeded,
+                "canceled": 0,
+                "expired": 0,
+            },
+            created_at=created_at,
+            expires_at=created_at + timedelta(hours=24),
+            ended_at=datetime.now(timezone.utc) if ended else None,
+            results_url=str(self._results_path(batch_id)) if ended else None,
+        )
+
+    async def create(self, *, requests: Iterable[dict]) -> MessageBatch:
+        batch_id = f"msgbatch_local_{uuid.uuid4().hex[:24]}"
+        with self._requests_path(batch_id).open("w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        self._ensure_running(batch_id)
+        return self._batch(batch_id)
+
+    async def retrieve(self, message_batch_id: str) -> MessageBatch:
+        if not self._is_ended(message_batch_id):
+            self._ensure_running(message_batch_id)
+        return self._batch(message_batch_id)
+
+    async def results(self, message_batch_id: str) -> AsyncIterator[MessageBatchIndividualResponse]:
+        if not self._is_ended(message_batch_id):
+            raise anthropic.BadRequestError(
+                f"batch local {message_batch_id} encore en cours",
+                response=_error_response(message_batch_id, status_code=400),
+                body=None,
+            )
+        entries = self._read_jsonl(self._results_path(message_batch_id))
+
+        async def iterate() -> AsyncIterator[MessageBatchIndividualResponse]:
+            for entry in entries:
+                yield MessageBatchIndividualResponse.model_validate(entry)
+
+        return iterate()
+
+    async def aclose(self) -> None:
+        """Annule les exécutions en cours (reprises au prochain lancement)."""
+        for task in self._runs.values():
+            task.cancel()
+        await asyncio.gather(*self._runs.values(), return_exceptions=True)
+
+
+def _error_response(batch_id: str, status_code: int = 404) -> httpx.Response:
+    """Réponse HTTP factice exigée par les exceptions du SDK."""
+    request = httpx.Request("GET", f"local://batches/{batch_id}")
+    return httpx.Response(status_code, request=request)
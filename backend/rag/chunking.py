@@ -3,15 +3,41 @@ Chunking module — découpe le texte d'un cours en chunks adaptés au RAG.
 
 Stratégie :
 - Priorité au découpage par blocs sémantiques (titres, paragraphes)
-- Respect d'une taille max en tokens approx. (chunk_size en caractères)
+- Respect d'une taille max : chunk_size en caractères (mode "chars", défaut)
+  ou budget en tokens estimés localement (mode "tokens", settings.chunk_mode)
 - Overlap pour conserver le contexte entre chunks
+- Mode tokens : un bloc trop long est découpé en unités insécables (formule,
+  élément de liste, définition numérotée, phrase) ; une coupure ne tombe
+  jamais au milieu d'une formule, et un titre ne termine jamais un chunk
+- Découpe incrémentale possible (IncrementalChunker) pour chunker un texte
+  pendant qu'il est encore généré par l'OCR en streaming
+- Chaque chunk stocké porte le hash de son contenu (chunk_content_hash) :
+  une édition du cours ne ré-embedde que les chunks qui ont changé
+- Et le hash de son corps, sans l'en-tête du cours, et du modèle qui l'a
+  embeddé (chunk_body_hash) : deux chunks identiques de cours différents
+  partagent un seul embedding stocké
+- Sections : le texte est aussi découpé sur ses titres (# / ## / ###, I. II.).
+  Un chunk ne chevauche jamais deux sections et porte son section_index ; la
+  section entière sert de contexte parent au retrieval (rag/retrieval.py)
 """
+import hashlib
+import re
+from collections.abc import Callable
 from dataclasses import dataclass
 
 from config import get_settings
 
 settings = get_settings()
 
+# Version de l'algorithme de découpe, incluse dans l'empreinte des cours
+# (rag.ingestion.current_chunk_scheme) : à incrémenter dès qu'un changement
+# déplace les frontières des chunks ou change le texte embeddé, à réglages égaux.
+#   1 : découpe par paragraphes (mode chars) et par budget de tokens
+#   2 : un chunk ne chevauche plus deux sections (coupure forcée aux titres,
+#       mode chars compris)
+#   3 : seul le corps du chunk est embeddé, sans l'en-tête « [matière — titre] »
+CHUNKER_VERSION = 3
+
 
 @dataclass
 class TextChunk:
@@ -20,32 +46,28 @@ class TextChunk:
     metadata: dict
 
 
-def _split_by_paragraphs(text: str) -> list[str]:
-    """Divise le texte en blocs naturels (double saut de ligne ou titres)."""
-    import re
+@dataclass
+class CourseSection:
+    section_index: int
+    heading: str  # "" pour le texte qui précède le premier titre
+    content: str
 
-    # Découpe sur les lignes vides ou les changements de section
-    blocks = re.split(r"\n{2,}|(?=\n#{1,3}\s)", text)
-    return [b.strip() for b in blocks if b.strip()]
 
+# Découpe sur les lignes vides ou les changements de section
+_PARAGRAPH_BREAK = re.compile(r"\n{2,}|(?=\n#{1,3}\s)")
+_BLANK_LINE = re.compile(r"\n{2,}")
+# Titre de section : Markdown (niveaux 1 à 3) ou numérotation romaine « II. »
+_SECTION_HEADING = re.compile(r"^\s*(?:#{1,3}\s+|[IVX]{1,6}[.)]\s+)(?=\S)")
 
-def _merge_short_blocks(blocks: list[str], min_size: int = 200) -> list[str]:
-    """Fusionne les blocs trop courts avec leur voisin."""
-    merged: list[str] = []
-    buffer = ""
 
-    for block in blocks:
-        if len(buffer) + len(block) < min_size:
-            buffer = (buffer + "\n\n" + block).strip() if buffer else block
-        else:
-            if buffer:
-                merged.append(buffer)
-            buffer = block
+def is_section_heading(block: str) -> bool:
+    return _SECTION_HEADING.match(block) is not None
 
-    if buffer:
-        merged.append(buffer)
 
-    return merged
+def _split_by_paragraphs(text: str) -> list[str]:
+    """Divise le texte en blocs naturels (double saut de ligne ou titres)."""
+    blocks = _PARAGRAPH_BREAK.split(text)
+    return [b.strip() for b in blocks if b.strip()]
 
 
 def _split_long_block(block: str, chunk_size: int, overlap: int) -> list[str]:
@@ -73,7 +95,413 @@ def _split_long_block(block: str, chunk_size: int, overlap: int) -> list[str]:
     return [c for c in chunks if c]
 
 
-def chunk_course_text(
+# ── Mode tokens ──────────────────────────────────────────────────────────────
+
+# Mots, nombres et signes isolés : proche du découpage BPE de Voyage
+_LETTERS = re.compile(r"[^\W\d_]+")
+_DIGITS = re.compile(r"\d+")
+_SIGNS = re.compile(r"[^\w\s]")
+_RELATION = re.compile(r"[=<>≤≥≠≈⇔⇒]")
+_INLINE_MATH = re.compile(r"\$[^$\n]+\$|\\\(.+?\\\)")
+_DISPLAY_MATH = {"$$": "$$", "\\[": "\\]", "\\begin{": "\\end{"}
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•▪◦–]|\d{1,2}[.)]|[a-z][.)])\s+")
+_DEFINITION = re.compile(
+    r"^\s*(?:#{1,6}\s*)?(?:\*\*)?(?:Définition|Théorème|Propriétés?|Règle|Lemme|Corollaire|Méthode"
+    r"|Exemples?|Remarque|Formule|Loi|Principe|Vocabulaire)\b",
+    re.IGNORECASE,
+)
+_HEADING = re.compile(r"^\s*#{1,6}\s")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+(?=[A-ZÀ-ÖØ-Þ«\"(\d])")
+_ABBREVIATION = re.compile(r"(?:\b[^\W\d]|\bex|\bcf|\betc|\bp|\bfig|\bvol|\bM)\.$", re.IGNORECASE)
+# Un espace voisin d'un de ces signes appartient à une formule : jamais coupé
+_MATH_SIGNS = frozenset("=+-−×÷*/^<>≤≥≠≈()[]{}²³√·|")
+_SPACE = re.compile(r"\s+")
+# Élément de liste / définition : gardé entier jusqu'à ce multiple du budget
+_PROTECTED_OVERSIZE = 2
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximation locale du nombre de tokens d'embedding (sans tokenizer) :
+    ≈ un token par tranche de 6 lettres, de 3 chiffres, et par signe. Légère
+    surestimation sur du français courant — le budget n'est jamais dépassé.
+    """
+    return (
+        sum((len(word) + 5) // 6 for word in _LETTERS.findall(text))
+        + sum((len(number) + 2) // 3 for number in _DIGITS.findall(text))
+        + len(_SIGNS.findall(text))
+    )
+
+
+@dataclass
+class _Atom:
+    """Unité insécable d'un bloc, dans le mode tokens."""
+    text: str
+    tokens: int
+    sep: str   # Séparateur avec l'unité précédente
+    kind: str  # prose | formula | item | label
+
+
+def _protected_spans(text: str) -> list[tuple[int, int]]:
+    return [match.span() for match in _INLINE_MATH.finditer(text)]
+
+
+def _inside(position: int, spans: list[tuple[int, int]]) -> bool:
+    return any(start < position < end for start, end in spans)
+
+
+def _split_sentences(text: str) -> list[str]:
+    """Phrases d'une ligne, sans couper une formule $...$ ni après une abréviation."""
+    spans = _protected_spans(text)
+    sentences, start = [], 0
+    for match in _SENTENCE_END.finditer(text):
+        if _inside(match.start(), spans) or _ABBREVIATION.search(text, start, match.start()):
+            continue
+        sentences.append(text[start:match.start()])
+        start = match.end()
+    sentences.append(text[start:])
+    return [sentence for sentence in sentences if sentence.strip()]
+
+
+def _split_words(text: str, budget: int, measure: Callable[[str], int]) -> list[str]:
+    """
+    Dernier recours pour une phrase plus longue que le budget : coupe sur les
+    espaces, sauf dans une formule (espace voisin d'un signe mathématique, ou
+    à l'intérieur de $...$).
+    """
+    spans = _protected_spans(text)
+    cuts = [
+        match.start() for match in _SPACE.finditer(text)
+        if 0 < match.start() and not _inside(match.start(), spans)
+        and text[match.start() - 1] not in _MATH_SIGNS
+        and match.end() < len(text) and text[match.end()] not in _MATH_SIGNS
+    ]
+    pieces, start, last = [], 0, None
+    for cut in cuts:
+        if last is not None and measure(text[start:cut]) > budget:
+            pieces.append(text[start:last])
+            start = last
+        last = cut
+    if last is not None and measure(text[start:]) > budget:
+        pieces.append(text[start:last])
+        start = last
+    pieces.append(text[start:])
+    return [piece.strip() for piece in pieces if piece.strip()]
+
+
+def _line_kind(line: str, tokens: int, budget: int) -> str:
+    if _LIST_ITEM.match(line):
+        return "item"
+    if _DEFINITION.match(line) or _HEADING.match(line):
+        # « Définition » seule, ou suivie de son énoncé sur la même ligne
+        return "label" if len(line.split()) <= 8 and line.rstrip()[-1:] not in ".!?" else "item"
+    if _RELATION.search(line) and tokens <= budget:
+        return "formula"
+    if len(line.split()) <= 8 and line.rstrip()[-1:] not in ".!?;,":
+        return "label"
+    return "prose"
+
+
+def _block_atoms(block: str, budget: int, measure: Callable[[str], int]) -> list[_Atom]:
+    """Découpe un bloc en unités insécables, dans l'ordre du texte."""
+    atoms: list[_Atom] = []
+    lines = block.split("\n")
+    sep = ""
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        index += 1
+        if not line.strip():
+            sep = "\n\n" if atoms else ""
+            continue
+
+        opener = next((o for o in _DISPLAY_MATH if line.lstrip().startswith(o)), None)
+        if opener is not None:
+            # Formule centrée sur plusieurs lignes : une seule unité, jamais coupée
+            closer = _DISPLAY_MATH[opener]
+            formula = [line]
+            closed = closer in line.lstrip()[len(opener):]
+            while not closed and index < len(lines):
+                formula.append(lines[index])
+                closed = closer in lines[index]
+                index += 1
+            text = "\n".join(formula)
+            atoms.append(_Atom(text, measure(text), sep, "formula"))
+            sep = "\n"
+            continue
+
+        tokens = measure(line)
+        kind = _line_kind(line, tokens, budget)
+        if kind == "item":
+            # Lignes de continuation (retour à la ligne dans l'élément)
+            while index < len(lines) and lines[index].strip() and (
+                lines[index][:1].isspace() or lines[index].lstrip()[:1].islower()
+            ) and not _LIST_ITEM.match(lines[index]):
+                tokens += measure(lines[index])
+                line += "\n" + lines[index]
+                index += 1
+            if tokens <= _PROTECTED_OVERSIZE * budget:
+                atoms.append(_Atom(line, tokens, sep, "item"))
+                sep = "\n"
+                continue
+            kind = "prose"
+
+        if kind == "prose":
+            pieces = []
+            for sentence in _split_sentences(line):
+                size = measure(sentence)
+                if size <= budget:
+                    pieces.append((sentence.strip(), size))
+                else:
+                    pieces.extend((piece, measure(piece)) for piece in _split_words(sentence, budget, measure))
+            for position, (piece, size) in enumerate(pieces):
+                atoms.append(_Atom(piece, size, sep if position == 0 else " ", "prose"))
+        else:
+            atoms.append(_Atom(line, tokens, sep, kind))
+        sep = "\n"
+    return atoms
+
+
+def _join(atoms: list[_Atom]) -> str:
+    return "".join((atom.sep if i else "") + atom.text for i, atom in enumerate(atoms)).strip()
+
+
+def _split_block_tokens(
+    block: str,
+    budget: int,
+    overlap: int,
+    measure: Callable[[str], int] = estimate_tokens,
+) -> list[str]:
+    """
+    Découpe un bloc plus long que le budget : les unités insécables sont
+    regroupées tant que le budget le permet. Un titre qui tomberait en fin de
+    chunk passe au chunk suivant ; les dernières unités d'un chunk (jusqu'à
+    `overlap` tokens) sont répétées en tête du suivant.
+    """
+    chunks: list[str] = []
+    current: list[_Atom] = []
+    size = 0     # Tokens de current
+    carried = 0  # Unités de current répétées depuis le chunk précédent
+
+    for atom in _block_atoms(block, budget, measure):
+        if current and size + atom.tokens > budget:
+            if carried == len(current) or all(a.kind == "label" for a in current[carried:]):
+                # Que de l'overlap (et des titres) : on abandonne l'overlap plutôt qu'un chunk redondant
+                current, carried = current[carried:], 0
+            else:
+                labels: list[_Atom] = []
+                while current[-1].kind == "label":
+                    labels.insert(0, current.pop())
+                chunks.append(_join(current))
+                tail: list[_Atom] = []
+                tail_size = 0
+                for previous in reversed(current[1:]):
+                    if tail_size + previous.tokens > overlap:
+                        break
+                    tail.insert(0, previous)
+                    tail_size += previous.tokens
+                current, carried = tail + labels, len(tail)
+                if sum(a.tokens for a in current) + atom.tokens > budget:
+                    current, carried = labels, 0
+            size = sum(a.tokens for a in current)
+        current.append(atom)
+        size += atom.tokens
+
+    if current and len(current) > carried:
+        chunks.append(_join(current))
+    return [chunk for chunk in chunks if chunk]
+
+
+class ParagraphSplitter:
+    """
+    Reçoit un texte par morceaux (deltas d'un stream) et renvoie les blocs
+    dès qu'ils sont terminés, c'est-à-dire suivis d'une ligne vide.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        self._buffer += text
+        last_break = None
+        for last_break in _BLANK_LINE.finditer(self._buffer):
+            pass
+        if last_break is None:
+            return []
+        complete = self._buffer[: last_break.start()]
+        self._buffer = self._buffer[last_break.end():]
+        return _split_by_paragraphs(complete)
+
+    def flush(self) -> list[str]:
+        blocks = _split_by_paragraphs(self._buffer)
+        self._buffer = ""
+        return blocks
+
+
+class IncrementalChunker:
+    """
+    Applique la même stratégie que chunk_course_text (fusion des blocs courts,
+    découpe des blocs longs) bloc par bloc : un chunk est émis dès que son
+    contenu ne peut plus changer. Les sections du texte sont construites au
+    passage (sections, chunk_sections).
+
+    En mode "tokens", chunk_size / overlap / min_block_size sont des tokens
+    estimés, et un bloc court (un titre) est toujours rattaché au suivant.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int | None = None,
+        overlap: int | None = None,
+        min_block_size: int | None = None,
+        mode: str | None = None,
+    ) -> None:
+        self.mode = mode or settings.chunk_mode
+        if self.mode == "tokens":
+            self.chunk_size = chunk_size or settings.chunk_max_tokens
+            self.overlap = overlap or settings.chunk_overlap_tokens
+            self.min_block_size = min_block_size or settings.chunk_min_tokens
+            self.measure: Callable[[str], int] = estimate_tokens
+        else:
+            self.chunk_size = chunk_size or settings.chunk_size
+            self.overlap = overlap or settings.chunk_overlap
+            self.min_block_size = min_block_size or 150
+            self.measure = len
+        self._buffer = ""
+        self._buffer_size = 0  # Mode tokens : tokens estimés du buffer
+        self.sections: list[CourseSection] = []  # Sections closes, dans l'ordre du texte
+        self.chunk_sections: list[int] = []      # section_index de chaque chunk émis, dans l'ordre
+        self._section_blocks: list[str] = []
+        self._section_headings: list[str] = []
+        self._section_has_content = False
+
+    def _finalize(self, block: str) -> list[str]:
+        if self.mode == "tokens":
+            if self._buffer_size <= self.chunk_size:
+                return [block]
+            return _split_block_tokens(block, self.chunk_size, self.overlap, self.measure)
+        if len(block) <= self.chunk_size:
+            return [block]
+        return _split_long_block(block, self.chunk_size, self.overlap)
+
+    def _tag(self, chunks: list[str]) -> list[str]:
+        self.chunk_sections.extend([len(self.sections)] * len(chunks))
+        return chunks
+
+    def _add_to_section(self, block: str) -> None:
+        self._section_blocks.append(block)
+        if is_section_heading(block) and not self._section_has_content and "\n" not in block.strip():
+            # Titres consécutifs (« # Chapitre » puis « ## I. ») : une seule section
+            self._section_headings.append(block.strip().lstrip("#").strip())
+        else:
+            self._section_has_content = True
+
+    def _close_section(self) -> None:
+        if self._section_blocks:
+            self.sections.append(CourseSection(
+                section_index=len(self.sections),
+                heading=" › ".join(self._section_headings),
+                content="\n\n".join(self._section_blocks),
+            ))
+        self._section_blocks, self._section_headings = [], []
+        self._section_has_content = False
+
+    def feed(self, block: str) -> list[str]:
+        """Ajoute un bloc ; retourne les chunks désormais définitifs."""
+        ready: list[str] = []
+        if is_section_heading(block) and self._section_has_content:
+            # Nouvelle section : le chunk en attente appartient à la précédente
+            ready = self._tag(self._finalize(self._buffer) if self._buffer else [])
+            self._buffer, self._buffer_size = "", 0
+            self._close_section()
+        self._add_to_section(block)
+        return ready + self._tag(self._feed(block))
+
+    def _feed(self, block: str) -> list[str]:
+        if self.mode == "tokens":
+            size = self.measure(block)
+            if self._buffer and self._buffer_size < self.min_block_size:
+                self._buffer += "\n\n" + block
+                self._buffer_size += size
+                return []
+        elif len(self._buffer) + len(block) < self.min_block_size:
+            self._buffer = (self._buffer + "\n\n" + block).strip() if self._buffer else block
+            return []
+        ready = self._finalize(self._buffer) if self._buffer else []
+        self._buffer = block
+        if self.mode == "tokens":
+            self._buffer_size = size
+        return ready
+
+    def flush(self) -> list[str]:
+        """Fin du texte : émet le dernier chunk en attente et clôt la dernière section."""
+        ready = self._tag(self._finalize(self._buffer) if self._buffer else [])
+        self._buffer = ""
+        self._buffer_size = 0
+        self._close_section()
+        return ready
+
+
+def chunk_content_hash(content: str) -> str:
+    """SHA-256 (hex) du contenu embeddé — identique à encode(sha256(...), 'hex') côté Postgres."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def chunk_body(content: str) -> str:
+    """Corps d'un chunk, sans l'en-tête « [matière — titre] » ajouté par make_text_chunk."""
+    if content.startswith("[") and "\n" in content:
+        return content.split("\n", 1)[1]
+    return content
+
+
+def chunk_body_hash(content: str, embedding_model: str) -> str:
+    """
+    SHA-256 (hex) du modèle d'embedding et du corps du chunk : clé de
+    l'embedding partagé (table chunk_embeddings). Même calcul que la
+    migration 016 côté Postgres.
+
+    La clé couvre exactement le texte embeddé : embed_chunks n'embedde que
+    le corps, l'en-tête reste dans le contenu stocké (prompts, citations).
+    Deux cours au même corps partagent donc un vecteur qui ne porte le
+    titre d'aucun des deux.
+
+    Le modèle fait partie de la clé : un même corps embeddé par deux modèles
+    (changement de fournisseur, secours local, re-chunking vers un nouveau
+    modèle) a deux vecteurs, et l'un n'écrase jamais l'autre.
+    """
+    return hashlib.sha256(f"{embedding_model}\n{chunk_body(content)}".encode("utf-8")).hexdigest()
+
+
+def make_text_chunk(
+    content: str,
+    chunk_index: int,
+    course_id: str,
+    subject: str,
+    title: str,
+    keywords: list[str],
+    total_chunks: int | None = None,
+    section_index: int | None = None,
+) -> TextChunk:
+    """
+    Construit un TextChunk ; le contenu stocké commence par le contexte du
+    cours, l'embedding ne porte que le corps (chunk_body).
+    """
+    return TextChunk(
+        content=f"[{subject} — {title}]\n{content}",
+        chunk_index=chunk_index,
+        metadata={
+            "course_id": course_id,
+            "subject": subject,
+            "title": title,
+            "keywords": keywords,
+            "chunk_index": chunk_index,
+            "total_chunks": total_chunks,
+            "section_index": section_index,
+        },
+    )
+
+
+def chunk_course_sections(
     text: str,
     course_id: str,
     subject: str,
@@ -81,9 +509,11 @@ def chunk_course_text(
     keywords: list[str],
     chunk_size: int | None = None,
     overlap: int | None = None,
-) -> list[TextChunk]:
+    mode: str | None = None,
+) -> tuple[list[TextChunk], list[CourseSection]]:
     """
-    Transforme le texte d'un cours en liste de chunks prêts à être vectorisés.
+    Transforme le texte d'un cours en chunks prêts à être vectorisés, et en
+    sections (contexte parent de ces chunks).
 
     Args:
         text: Contenu textuel extrait du cours (depuis OCR)
@@ -91,48 +521,43 @@ def chunk_course_text(
         subject: Matière du cours
         title: Titre du cours
         keywords: Mots-clés du cours
-        chunk_size: Taille max d'un chunk en caractères
+        chunk_size: Taille max d'un chunk (caractères, ou tokens en mode "tokens")
         overlap: Overlap entre chunks
+        mode: "chars" ou "tokens" (défaut : settings.chunk_mode)
 
     Returns:
-        Liste de TextChunk avec contenu et métadonnées
+        (TextChunk avec contenu et métadonnées, sections du cours)
     """
-    _chunk_size = chunk_size or settings.chunk_size
-    _overlap = overlap or settings.chunk_overlap
-
     # 1. Découpe en blocs naturels
     blocks = _split_by_paragraphs(text)
 
-    # 2. Fusion des blocs trop courts
-    blocks = _merge_short_blocks(blocks, min_size=150)
-
-    # 3. Découpe des blocs trop longs
+    # 2-3. Fusion des blocs trop courts, découpe des blocs trop longs
+    chunker = IncrementalChunker(chunk_size, overlap, mode=mode)
     final_chunks: list[str] = []
     for block in blocks:
-        if len(block) <= _chunk_size:
-            final_chunks.append(block)
-        else:
-            final_chunks.extend(_split_long_block(block, _chunk_size, _overlap))
+        final_chunks.extend(chunker.feed(block))
+    final_chunks.extend(chunker.flush())
 
     # 4. Construction des TextChunk avec métadonnées
-    chunks: list[TextChunk] = []
-    for i, content in enumerate(final_chunks):
-        # Le contenu envoyé à l'embedding inclut le contexte du cours
-        enriched_content = f"[{subject} — {title}]\n{content}"
-
-        chunks.append(
-            TextChunk(
-                content=enriched_content,
-                chunk_index=i,
-                metadata={
-                    "course_id": course_id,
-                    "subject": subject,
-                    "title": title,
-                    "keywords": keywords,
-                    "chunk_index": i,
-                    "total_chunks": len(final_chunks),
-                },
-            )
+    chunks = [
+        make_text_chunk(
+            content, i, course_id, subject, title, keywords,
+            total_chunks=len(final_chunks), section_index=chunker.chunk_sections[i],
         )
+        for i, content in enumerate(final_chunks)
+    ]
+    return chunks, chunker.sections
+
 
-    return chunks
+def chunk_course_text(
+    text: str,
+    course_id: str,
+    subject: str,
+    title: str,
+    keywords: list[str],
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    mode: str | None = None,
+) -> list[TextChunk]:
+    """Chunks d'un cours (voir chunk_course_sections), sans ses sections."""
+    return chunk_course_sections(text, course_id, subject, title, keywords, chunk_size, overlap, mode)[0]
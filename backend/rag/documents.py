@@ -0,0 +1,217 @@
+"""
+Extraction locale du texte d'un cours numérique (PDF avec couche texte,
+Markdown, texte brut) — aucun appel Vision.
+
+Le texte est produit page par page (PDF) ou par tranches de 64 Ko (texte),
+pour que le chunking et l'embedding démarrent avant la fin de la lecture et
+que la mémoire reste bornée sur les gros fichiers.
+
+Titre, matière et niveau sont déduits du document : métadonnées PDF, premier
+titre Markdown, première ligne, puis vocabulaire de la première page.
+"""
+import asyncio
+import codecs
+import re
+from collections import Counter
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal
+
+from pypdf import PdfReader
+from pypdf.errors import PdfReadError
+
+from agents.state import SUBJECT_MAPPING
+
+DocumentKind = Literal["pdf", "text"]
+
+_READ_SIZE = 64 * 1024
+
+_CONTENT_TYPES: dict[str, DocumentKind] = {
+    "application/pdf": "pdf",
+    "text/markdown": "text",
+    "text/x-markdown": "text",
+    "text/plain": "text",
+}
+_SUFFIXES: dict[str, DocumentKind] = {
+    ".pdf": "pdf",
+    ".md": "text",
+    ".markdown": "text",
+    ".txt": "text",
+}
+
+# Libellé stocké en base pour chaque matière (même forme que la sortie OCR)
+SUBJECT_LABELS = {
+    "mathematiques": "Mathématiques",
+    "francais": "Français",
+    "physique_chimie": "Physique-Chimie",
+    "svt": "SVT",
+    "histoire_geo": "Histoire-Géographie",
+    "anglais": "Anglais",
+    "philosophie": "Philosophie",
+}
+
+# Vocabulaire typique, en plus des noms de matière de SUBJECT_MAPPING
+_SUBJECT_HINTS = {
+    "mathematiques": ("théorème", "équation", "fonction", "dérivée", "vecteur", "triangle", "fraction", "probabilité"),
+    "francais": ("roman", "poème", "poésie", "narrateur", "figure de style", "grammaire", "conjugaison"),
+    "physique_chimie": ("énergie", "molécule", "atome", "tension", "circuit", "vitesse", "réaction chimique"),
+    "svt": ("cellule", "adn", "écosystème", "organisme", "génétique", "photosynthèse", "évolution"),
+    "histoire_geo": ("guerre", "siècle", "révolution", "territoire", "empire", "mondialisation"),
+    "anglais": ("the", "and", "vocabulary", "present perfect", "irregular verbs"),
+    "philosophie": ("conscience", "liberté", "morale", "vérité", "désir", "bonheur"),
+}
+_SUBJECT_PATTERNS = {
+    subject: re.compile(
+        r"\b(" + "|".join(
+            re.escape(term)
+            for term in sorted(
+                {k for k, v in SUBJECT_MAPPING.items() if v == subject} | set(hints),
+                key=len, reverse=True,
+            )
+        ) + r")\b",
+        re.IGNORECASE,
+    )
+    for subject, hints in _SUBJECT_HINTS.items()
+}
+
+# « seconde » / « première » sont exclus : trop ambigus dans un texte de cours
+_LEVEL_PATTERN = re.compile(
+    r"\b([3-6]\s?[èe]me|2\s?nde|1\s?[èe]re|terminale)\b",
+    re.IGNORECASE,
+)
+_LEVELS = {"6": "6ème", "5": "5ème", "4": "4ème", "3": "3ème", "2": "2nde", "1": "1ère", "t": "Terminale"}
+
+_MD_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+_MD_IMAGE = re.compile(r"!\[([^\]]*)\]\([^)]*\)")
+_MD_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_MD_EMPHASIS = re.compile(r"(\*\*|__)(.+?)\1")
+_PDF_HYPHENATION = re.compile(r"(\w)-\n(\w)")
+
+
+class DocumentError(ValueError):
+    """Document illisible ou sans texte exploitable."""
+
+
+@dataclass
+class DocumentHeaders:
+    title: str
+    subject: str
+    level: str
+
+
+def document_kind(filename: str | None, content_type: str | None) -> DocumentKind | None:
+    """Type de document d'après le content-type, ou l'extension (souvent application/octet-stream)."""
+    if content_type in _CONTENT_TYPES:
+        return _CONTENT_TYPES[content_type]
+    return _SUFFIXES.get(Path(filename or "").suffix.lower())
+
+
+def clean_markdown(block: str) -> str:
+    """Retire la syntaxe Markdown inutile au RAG (liens, images, gras) ; garde les titres."""
+    block = _MD_IMAGE.sub(r"\1", block)
+    block = _MD_LINK.sub(r"\1", block)
+    return _MD_EMPHASIS.sub(r"\2", block)
+
+
+def _clean_pdf_page(text: str) -> str:
+    return _PDF_HYPHENATION.sub(r"\1\2", text).strip()
+
+
+def detect_subject(text: str) -> str:
+    scores = Counter({
+        subject: len(pattern.findall(text)) for subject, pattern in _SUBJECT_PATTERNS.items()
+    })
+    subject, score = scores.most_common(1)[0]
+    return SUBJECT_LABELS[subject] if score else "Inconnu"
+
+
+def detect_level(text: str) -> str:
+    match = _LEVEL_PATTERN.search(text)
+    if match is None:
+        return "Inconnu"
+    return _LEVELS[match.group(1)[0].lower()]
+
+
+def detect_title(text: str, metadata_title: str | None, filename: str | None) -> str:
+    if metadata_title and len(metadata_title.strip()) > 3 and not metadata_title.lower().startswith("microsoft"):
+        return metadata_title.strip()[:200]
+    heading = _MD_HEADING.search(text)
+    if heading:
+        return clean_markdown(heading.group(2))[:200]
+    for line in text.splitlines():
+        line = line.strip()
+        if 3 < len(line) <= 120:
+            return clean_markdown(line)
+    return Path(filename or "").stem or "Sans titre"
+
+
+def detect_headers(text: str, metadata_title: str | None = None, filename: str | None = None) -> DocumentHeaders:
+    """Déduit titre / matière / niveau du début du document."""
+    title = detect_title(text, metadata_title, filename)
+    return DocumentHeaders(
+        title=title,
+        subject=detect_subject(f"{title}\n{text}"),
+        level=detect_level(f"{title}\n{text}"),
+    )
+
+
+def markdown_headings(text: str, limit: int = 8) -> list[str]:
+    """Titres de sections (niveau ≥ 2), utilisés comme mots-clés du cours."""
+    return [clean_markdown(m.group(2)) for m in _MD_HEADING.finditer(text) if len(m.group(1)) >= 2][:limit]
+
+
+# ── Lecture en flux ──────────────────────────────────────────────────────────
+
+class DocumentReader:
+    """
+    Lit un document déposé sur disque et produit son texte par morceaux.
+
+    Pour un PDF, chaque page est extraite dans un thread (pypdf est du Python
+    pur, coûteux en CPU). Les métadonnées (titre, plan) sont lues à l'ouverture.
+    """
+
+    def __init__(self, path: Path, kind: DocumentKind) -> None:
+        self.path = path
+        self.kind = kind
+        self.metadata_title: str | None = None
+        self.outline: list[str] = []
+        self.pages = 0
+        self._reader = None
+
+    def _open_pdf(self) -> None:
+        try:
+            self._reader = PdfReader(self.path)
+            if self._reader.is_encrypted:
+                self._reader.decrypt("")
+            self.pages = len(self._reader.pages)
+        except (PdfReadError, OSError, ValueError) as e:
+            raise DocumentError(f"PDF illisible : {e}") from e
+        try:
+            info = self._reader.metadata
+            self.metadata_title = info.title if info else None
+            self.outline = [
+                item.title for item in self._reader.outline if hasattr(item, "title")
+            ][:8]
+        except Exception:
+            # Métadonnées ou plan corrompus : sans conséquence pour le texte
+            pass
+
+    def _extract_page(self, index: int) -> str:
+        return _clean_pdf_page(self._reader.pages[index].extract_text() or "")
+
+    async def iter_text(self) -> AsyncIterator[str]:
+        """Texte du document, page par page (PDF) ou par tranches (texte)."""
+        if self.kind == "pdf":
+            await asyncio.to_thread(self._open_pdf)
+            for index in range(self.pages):
+                page = await asyncio.to_thread(self._extract_page, index)
+                if page:
+                    yield page + "\n\n"
+            return
+
+        decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        with self.path.open("rb") as f:
+            while chunk := await asyncio.to_thread(f.read, _READ_SIZE):
+                yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
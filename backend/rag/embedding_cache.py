@@ -0,0 +1,213 @@
+"""
+Cache des embeddings — évite de repayer un appel Voyage pour un texte déjà
+embeddé : la boucle de révision relance rag_retrieval_node avec la même
+rag_query, un élève repose sa question, un cours réimporté redonne les
+mêmes chunks.
+
+Clé : (modèle, input_type, SHA-256 du texte) — un embedding "query" n'est
+jamais servi pour un "document", ni d'un modèle à l'autre.
+
+Deux niveaux :
+- LRU en mémoire (par process), borné en octets : les vecteurs sont gardés
+  en float32 (array), une requête répétée est servie en quelques µs
+- Table Postgres `embedding_cache` (partagée entre workers, survit aux
+  redémarrages), écrite en tâche de fond pour ne pas retarder la réponse
+
+Une entrée expire ttl_days après sa dernière utilisation : last_used_at est
+rafraîchi à l'écriture, et pour les entrées servies (par l'un ou l'autre
+niveau) par lots, au plus une fois toutes les _TOUCH_INTERVAL secondes.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from config import get_settings
+from db.client import get_supabase
+from metrics import counter, histogram
+
+logger = logging.getLogger("studybuddy.embedding_cache")
+settings = get_settings()
+
+CACHE_LOOKUPS = counter("embedding_cache_lookups_total", "Textes cherchés dans le cache d'embeddings")
+CACHE_HITS = counter("embedding_cache_hits_total", "Embeddings servis depuis le cache (tier)")
+CACHE_MISSES = counter("embedding_cache_misses_total", "Embeddings absents du cache (appel Voyage)")
+CACHE_LATENCY = histogram(
+    "embedding_cache_latency_seconds",
+    "Durée d'obtention d'un lot d'embeddings, par source (memory, postgres, voyage, local)",
+    (0.00001, 0.0001, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+_ENTRY_OVERHEAD = 200   # Octets estimés par entrée hors vecteur (clé, OrderedDict)
+_DB_LOOKUP = 100        # Hash par requête sur la table
+_TOUCH_INTERVAL = 300.0  # s entre deux mises à jour groupées de last_used_at
+
+CacheKey = tuple[str, str, str]   # (modèle, input_type, sha256)
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, max_bytes: int, persistent: bool, ttl_days: int) -> None:
+        self.max_bytes = max_bytes
+        self.persistent = persistent
+        self.ttl_days = ttl_days
+        self.size_bytes = 0
+        self._entries: OrderedDict[CacheKey, array] = OrderedDict()
+        self._writes: set[asyncio.Task] = set()
+        self._used: set[CacheKey] = set()   # Entrées servies depuis la dernière mise à jour de last_used_at
+        self._touched_at = time.monotonic()
+
+    # ── LRU en mémoire ───────────────────────────────────────────────────────
+
+    def _remember(self, key: CacheKey, embedding: list[float]) -> None:
+        vector = array("f", embedding)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size_bytes -= previous.itemsize * len(previous) + _ENTRY_OVERHEAD
+        self._entries[key] = vector
+        self.size_bytes += vector.itemsize * len(vector) + _ENTRY_OVERHEAD
+        while self.size_bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= evicted.itemsize * len(evicted) + _ENTRY_OVERHEAD
+
+    def _memory_get(self, key: CacheKey) -> list[float] | None:
+        vector = self._entries.get(key)
+        if vector is None:
+            return None
+        self._entries.move_to_end(key)
+        return vector.tolist()
+
+    # ── Tier Postgres ────────────────────────────────────────────────────────
+
+    def _db_get(self, model: str, input_type: str, hashes: list[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        for i in range(0, len(hashes), _DB_LOOKUP):
+            result = (
+                get_supabase().table("embedding_cache")
+                .select("text_hash, embedding")
+                .eq("model", model)
+                .eq("input_type", input_type)
+                .in_("text_hash", hashes[i : i + _DB_LOOKUP])
+                .execute()
+            )
+            for row in result.data:
+                embedding = row["embedding"]
+                found[row["text_hash"]] = json.loads(embedding) if isinstance(embedding, str) else embedding
+        return found
+
+    def _db_store(self, rows: list[dict]) -> None:
+        for i in range(0, len(rows), 50):
+            get_supabase().table("embedding_cache").upsert(
+                rows[i : i + 50], on_conflict="model,input_type,text_hash"
+            ).execute()
+
+    def _db_touch(self, keys: list[CacheKey], now: str) -> None:
+        groups: dict[tuple[str, str], list[str]] = {}
+        for model, input_type, text_hash in keys:
+            groups.setdefault((model, input_type), []).append(text_hash)
+        for (model, input_type), hashes in groups.items():
+            for i in range(0, len(hashes), _DB_LOOKUP):
+                (
+                    get_supabase().table("embedding_cache")
+                    .update({"last_used_at": now})
+                    .eq("model", model)
+                    .eq("input_type", input_type)
+                    .in_("text_hash", hashes[i : i + _DB_LOOKUP])
+                    .execute()
+                )
+
+    def _db_purge(self, cutoff: str) -> int:
+        result = get_supabase().table("embedding_cache").delete().lt("last_used_at", cutoff).execute()
+        return len(result.data or [])
+
+    def _background(self, fn, *args) -> None:
+        task = asyncio.get_running_loop().create_task(self._db_call(fn, *args))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def _mark_used(self, keys: list[CacheKey]) -> None:
+        """Note les entrées servies ; last_used_at est rafraîchi par lots, en tâche de fond."""
+        if not self.persistent:
+            return
+        self._used.update(keys)
+        if self._used and time.monotonic() - self._touched_at >= _TOUCH_INTERVAL:
+            used, self._used = sorted(self._used), set()
+            self._touched_at = time.monotonic()
+            self._background(self._db_touch, used, datetime.now(timezone.utc).isoformat())
+
+    async def _db_call(self, fn, *args):
+        """Les appels Supabase sont synchrones : exécutés hors boucle, erreurs non bloquantes."""
+        if not self.persistent:
+            return None
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            logger.warning("[EMBED_CACHE] Postgres indisponible (%s): %s", fn.__name__, e)
+            return None
+
+    # ── API publique ─────────────────────────────────────────────────────────
+
+    async def get_many(self, model: str, input_type: str, texts: list[str]) -> list[list[float] | None]:
+        """Embeddings en cache pour chaque texte (None : absent des deux niveaux)."""
+        start = time.perf_counter()
+        hashes = [text_sha256(text) for text in texts]
+        found: list[list[float] | None] = [self._memory_get((model, input_type, h)) for h in hashes]
+        memory_hits = sum(vector is not None for vector in found)
+        if memory_hits:
+            CACHE_LATENCY.observe(time.perf_counter() - start, source="memory")
+
+        missing = sorted({h for h, vector in zip(hashes, found) if vector is None})
+        db_hits = 0
+        if missing:
+            db_start = time.perf_counter()
+            stored = await self._db_call(self._db_get, model, input_type, missing) or {}
+            if stored:
+                CACHE_LATENCY.observe(time.perf_counter() - db_start, source="postgres")
+            for i, (h, vector) in enumerate(zip(hashes, found)):
+                if vector is None and h in stored:
+                    found[i] = stored[h]
+                    self._remember((model, input_type, h), stored[h])
+                    db_hits += 1
+
+        self._mark_used([(model, input_type, h) for h, vector in zip(hashes, found) if vector is not None])
+        CACHE_LOOKUPS.inc(len(texts), input_type=input_type)
+        CACHE_HITS.inc(memory_hits, tier="memory", input_type=input_type)
+        CACHE_HITS.inc(db_hits, tier="postgres", input_type=input_type)
+        CACHE_MISSES.inc(len(texts) - memory_hits - db_hits, input_type=input_type)
+        return found
+
+    async def get(self, model: str, input_type: str, text: str) -> list[float] | None:
+        return (await self.get_many(model, input_type, [text]))[0]
+
+    def put_many(self, model: str, input_type: str, texts: list[str], embeddings: list[list[float]]) -> None:
+        """Mémorise les embeddings ; l'écriture Postgres part en tâche de fond."""
+        now = datetime.now(timezone.utc).isoformat()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            text_hash = text_sha256(text)
+            self._remember((model, input_type, text_hash), embedding)
+            rows.append({
+                "model": model, "input_type": input_type, "text_hash": text_hash,
+                "embedding": embedding, "last_used_at": now,
+            })
+        if self.persistent and rows:
+            self._background(self._db_store, rows)
+
+    async def purge(self) -> int:
+        """Supprime du tier Postgres les entrées inutilisées depuis ttl_days ; retourne leur nombre."""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.ttl_days)).isoformat()
+        return await self._db_call(self._db_purge, cutoff) or 0
+
+
+embedding_cache = EmbeddingCache(
+    max_bytes=settings.embedding_cache_max_mb * 1024 * 1024,
+    persistent=settings.embedding_cache_persistent,
+    ttl_days=settings.embedding_cache_ttl_days,
+)
@@ -0,0 +1,157 @@
+"""
+Fournisseurs d'embeddings — choisis par settings.embedding_provider.
+
+- "voyage" : API Voyage AI (settings.embedding_model, 1024 dims)
+- "local"  : TF-IDF de n-grammes de caractères hachés, projeté sur
+  settings.embedding_dimensions avec NumPy. Déterministe, hors ligne,
+  quelques dizaines de µs par chunk : benchmarks, CI, tests de charge, et
+  secours automatique quand Voyage est indisponible (rag/embeddings.py)
+
+Les vecteurs de deux fournisseurs ne sont pas comparables : chaque
+fournisseur expose un identifiant de modèle (`model`), qui sert de clé au
+cache d'embeddings, à l'empreinte de chunking des cours et au filtre de la
+recherche.
+"""
+import asyncio
+import hashlib
+import unicodedata
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+import voyageai
+import voyageai.error
+
+from config import get_settings
+
+settings = get_settings()
+
+_FNV_PRIME = np.uint64(0x100000001B3)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)   # Hachage multiplicatif (Knuth)
+
+
+class EmbeddingProvider(ABC):
+    name: str
+    model: str
+    # Erreurs transitoires : retentées, puis bascule vers le secours
+    retryable: tuple[type[Exception], ...] = ()
+
+    @abstractmethod
+    async def embed(self, texts: list[str], input_type: str) -> list[list[float]]:
+        """Un vecteur par texte ; input_type vaut "document" ou "query"."""
+
+
+class VoyageProvider(EmbeddingProvider):
+    name = "voyage"
+    retryable = (
+        voyageai.error.RateLimitError,
+        voyageai.error.ServiceUnavailableError,
+        voyageai.error.ServerError,
+        voyageai.error.APIConnectionError,
+        voyageai.error.Timeout,
+    )
+
+    def __init__(self, api_key: str, model: str) -> None:
+        self.model = model
+        self.client = voyageai.AsyncClient(api_key=api_key)
+
+    async def embed(self, texts: list[str], input_type: str) -> list[list[float]]:
+        result = await self.client.embed(texts, model=self.model, input_type=input_type)
+        return result.embeddings
+
+
+class LocalProvider(EmbeddingProvider):
+    """
+    TF-IDF de n-grammes de caractères (3 à 5 par défaut) :
+    - texte normalisé (minuscules, accents conservés, espaces réduits), chaque
+      n-gramme haché sur 2^feature_bits colonnes (FNV-1a vectorisé NumPy)
+    - poids : (1 + log tf) × idf, l'idf étant appris par fit() ou chargé
+      depuis settings.local_embedding_idf_path (uniforme sinon)
+    - projection signée (count-sketch) vers `dimensions`, puis norme L2 :
+      le cosinus approche celui des vecteurs TF-IDF creux
+
+    Symétrique : "query" et "document" donnent le même vecteur.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        dimensions: int,
+        ngram_range: tuple[int, int] = (3, 5),
+        feature_bits: int = 18,
+        idf: np.ndarray | None = None,
+        seed: int = 0,
+    ) -> None:
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+        self.feature_bits = feature_bits
+        rng = np.random.default_rng(seed)
+        n_features = 1 << feature_bits
+        self._bucket = rng.integers(0, dimensions, n_features)
+        self._sign = rng.choice(np.array([-1.0, 1.0]), n_features)
+        self.idf = np.ones(n_features) if idf is None else idf
+        self.model = self._model_id()
+
+    def _model_id(self) -> str:
+        """L'idf change les vecteurs : son empreinte fait partie de l'identifiant."""
+        low, high = self.ngram_range
+        idf_tag = "tf" if np.all(self.idf == 1.0) else hashlib.sha256(self.idf.tobytes()).hexdigest()[:8]
+        return f"local-ngram{low}{high}-{self.feature_bits}b-{self.dimensions}d-{idf_tag}"
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " " + " ".join(unicodedata.normalize("NFC", text).lower().split()) + " "
+
+    def _features(self, text: str) -> np.ndarray:
+        """Colonnes (hachées) des n-grammes du texte, avec répétitions."""
+        codes = np.frombuffer(self._normalize(text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        shift = np.uint64(64 - self.feature_bits)
+        features = []
+        low, high = self.ngram_range
+        with np.errstate(over="ignore"):   # Débordement uint64 voulu (arithmétique modulo 2^64)
+            for n in range(low, high + 1):
+                if len(codes) < n:
+                    break
+                h = np.full(len(codes) - n + 1, 0xCBF29CE484222325 ^ n, dtype=np.uint64)
+                for k in range(n):
+                    h = (h ^ codes[k : len(codes) - n + 1 + k]) * _FNV_PRIME
+                features.append((h * _GOLDEN) >> shift)
+        return np.concatenate(features) if features else np.empty(0, dtype=np.uint64)
+
+    def embed_one(self, text: str) -> np.ndarray:
+        columns, counts = np.unique(self._features(text), return_counts=True)
+        columns = columns.astype(np.intp)
+        weights = (1.0 + np.log(counts)) * self.idf[columns] * self._sign[columns]
+        vector = np.bincount(self._bucket[columns], weights=weights, minlength=self.dimensions)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_sync(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_one(text).tolist() for text in texts]
+
+    async def embed(self, texts: list[str], input_type: str) -> list[list[float]]:
+        if len(texts) == 1:
+            return self.embed_sync(texts)
+        return await asyncio.to_thread(self.embed_sync, texts)   # Lot de chunks : hors boucle
+
+    def fit(self, corpus: list[str]) -> "LocalProvider":
+        """Apprend l'idf lissé, log((1 + N) / (1 + df)) + 1, sur un corpus de documents."""
+        df = np.zeros(1 << self.feature_bits)
+        for text in corpus:
+            df[np.unique(self._features(text)).astype(np.intp)] += 1
+        self.idf = np.log((1 + len(corpus)) / (1 + df)) + 1
+        self.model = self._model_id()
+        return self
+
+    def save_idf(self, path: Path) -> None:
+        np.save(path, self.idf)
+
+
+def make_provider(name: str) -> EmbeddingProvider:
+    if name == "voyage":
+        return VoyageProvider(settings.voyage_api_key, settings.embedding_model)
+    if name == "local":
+        idf = np.load(settings.local_embedding_idf_path) if settings.local_embedding_idf_path else None
+        return LocalProvider(settings.embedding_dimensions, idf=idf)
+    raise ValueError(f"Fournisseur d'embeddings inconnu : {name!r} (voyage, local)")
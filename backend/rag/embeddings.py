@@ -1,50 +1,444 @@
 """
-Embeddings module — génère les vecteurs via Voyage AI (voyage-3, 1024 dims).
-Partenaire officiel Anthropic. Gratuit jusqu'à 200M tokens/mois.
+Embeddings module — génère les vecteurs via le fournisseur choisi par
+settings.embedding_provider (rag/embedding_providers.py) : Voyage AI
+(voyage-3, 1024 dims) en production, TF-IDF local pour les benchmarks et la CI.
+
+Chaque texte passe d'abord par le cache d'embeddings (rag/embedding_cache.py) :
+seuls les textes jamais embeddés avec ce modèle et cet input_type partent
+chez le fournisseur.
+
+Appels au fournisseur :
+- lots remplis par nombre de tokens estimé (embed_batch_max_tokens) autant
+  que par nombre de textes : un lot de longs chunks n'est plus refusé
+- lots envoyés en parallèle, au plus settings.embed_concurrency requêtes
+  simultanées par process (toutes origines confondues)
+- 429, 5xx et erreurs réseau retentés avec backoff exponentiel et gigue,
+  en respectant l'en-tête Retry-After quand Voyage le fournit
+- embed_query concurrents (heures de pointe) regroupés sur une courte
+  fenêtre en un seul appel (QueryBatcher)
+
+Mode dégradé : quand le fournisseur reste indisponible après ses nouvelles
+tentatives, le secours (settings.embedding_fallback, local par défaut)
+prend le relais pendant embedding_fallback_cooldown_s. Ses vecteurs portent
+l'identifiant de son modèle : une requête de secours ne cherche que dans
+les cours embeddés par le secours, et un chunk de secours est marqué
+(metadata["embedding_model"]) pour être ré-embeddé par
+scripts.rechunk_courses une fois le fournisseur revenu.
 """
-import voyageai
+import asyncio
+import logging
+import random
+import time
+import weakref
+from collections.abc import Callable
+from email.utils import parsedate_to_datetime
 
 from config import get_settings
-from rag.chunking import TextChunk
+from metrics import counter, histogram
+from rag.chunking import TextChunk, chunk_body, estimate_tokens
+from rag.embedding_cache import CACHE_LATENCY, embedding_cache
+from rag.embedding_providers import EmbeddingProvider, make_provider
 
 settings = get_settings()
-client = voyageai.AsyncClient(api_key=settings.voyage_api_key)
+logger = logging.getLogger("studybuddy.embeddings")
+provider: EmbeddingProvider = make_provider(settings.embedding_provider)
+fallback: EmbeddingProvider | None = (
+    make_provider(settings.embedding_fallback)
+    if settings.embedding_fallback and settings.embedding_fallback != settings.embedding_provider
+    else None
+)
+
+EMBED_RETRIES = counter(
+    "embedding_retries_total", "Appels au fournisseur retentés après une erreur transitoire (erreur)",
+)
+EMBED_FALLBACKS = counter("embedding_fallback_total", "Textes embeddés par le fournisseur de secours (input_type)")
+QUERY_BATCH_SIZE = histogram(
+    "query_embed_batch_size", "Requêtes distinctes par appel groupé (embed_query)",
+    (1, 2, 4, 8, 16, 32, 64, 128),
+)
+QUERY_QUEUE_DELAY = histogram(
+    "query_embed_queue_delay_seconds", "Attente ajoutée par le regroupement des embed_query",
+    (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1),
+)
+
+# Un sémaphore par boucle d'événements (scripts et benchmarks en enchaînent plusieurs)
+_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+# Retry-After d'un 429 : aucun appel ne part avant cette échéance (time.monotonic)
+_paused_until = 0.0
+# Fournisseur indisponible : le secours sert les appels jusqu'à cette échéance (0 : fournisseur sain)
+_degraded_until = 0.0
+
+
+def _embed_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _slots.get(loop)
+    if semaphore is None:
+        semaphore = _slots[loop] = asyncio.Semaphore(settings.embed_concurrency)
+    return semaphore
+
+
+def retry_after(error: Exception) -> float | None:
+    """Délai demandé par l'en-tête Retry-After (secondes ou date HTTP), s'il existe."""
+    value = (getattr(error, "headers", None) or {}).get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, error: Exception) -> float:
+    """Backoff exponentiel avec gigue (±20 %), jamais plus court que le Retry-After demandé."""
+    backoff = min(settings.embed_retry_base_delay * 2 ** attempt, settings.embed_retry_max_delay)
+    return max(backoff * random.uniform(0.8, 1.2), retry_after(error) or 0.0)
+
+
+async def _provider_embed(texts: list[str], input_type: str, max_retries: int) -> list[list[float]]:
+    """
+    Un appel au fournisseur, sous le sémaphore du process, retenté sur erreur
+    transitoire. Le Retry-After d'un 429 suspend tous les appels du process,
+    pas seulement celui qui l'a reçu : sinon les lots en file prennent la
+    place libérée et le lot refusé retombe sur la limite à chaque tentative.
+    La pause s'attend hors du sémaphore : aucune place n'est tenue pendant
+    qu'elle court.
+    """
+    global _paused_until
+    attempt = 0
+    while True:
+        while (pause := _paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(pause)
+        try:
+            async with _embed_slots():
+                if _paused_until > time.monotonic():
+                    continue   # Pause posée pendant l'attente d'une place : on la rend
+                start = time.perf_counter()
+                embeddings = await provider.embed(texts, input_type)
+            CACHE_LATENCY.observe(time.perf_counter() - start, source=provider.name)
+            return embeddings
+        except provider.retryable as e:
+            if attempt >= max_retries:
+                raise
+            delay = retry_delay(attempt, e)
+            requested = retry_after(e)
+            if requested is not None:
+                _paused_until = max(_paused_until, time.monotonic() + requested)
+            EMBED_RETRIES.inc(error=type(e).__name__)
+            logger.warning(
+                "[EMBED] %s (%d textes), nouvelle tentative %d/%d dans %.1fs",
+                type(e).__name__, len(texts), attempt + 1, max_retries, delay,
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+async def _fallback_embed(texts: list[str], input_type: str) -> tuple[list[list[float]], str]:
+    start = time.perf_counter()
+    embeddings = await fallback.embed(texts, input_type)
+    CACHE_LATENCY.observe(time.perf_counter() - start, source=fallback.name)
+    EMBED_FALLBACKS.inc(len(texts), input_type=input_type)
+    return embeddings, fallback.model
+
+
+async def _embed(texts: list[str], input_type: str, allow_fallback: bool = True) -> tuple[list[list[float]], str]:
+    """
+    Embeddings des textes et identifiant du modèle qui les a produits. Pendant
+    le mode dégradé, le secours répond sans attendre ; à son échéance, le
+    fournisseur est sondé par un appel sans nouvelle tentative.
+    """
+    global _degraded_until
+    use_fallback = allow_fallback and fallback is not None
+    if use_fallback and time.monotonic() < _degraded_until:
+        return await _fallback_embed(texts, input_type)
+    try:
+        max_retries = 0 if use_fallback and _degraded_until else settings.embed_max_retries
+        embeddings = await _provider_embed(texts, input_type, max_retries)
+    except provider.retryable as e:
+        if not use_fallback:
+            raise
+        if time.monotonic() >= _degraded_until:
+            logger.error(
+                "[EMBED] %s indisponible (%s) : secours %s pendant %.0fs",
+                provider.name, type(e).__name__, fallback.name, settings.embedding_fallback_cooldown_s,
+            )
+        _degraded_until = time.monotonic() + settings.embedding_fallback_cooldown_s
+        return await _fallback_embed(texts, input_type)
+    if _degraded_until:
+        logger.info("[EMBED] %s de nouveau disponible, fin du mode dégradé", provider.name)
+        _degraded_until = 0.0
+    return embeddings, provider.model
+
+
+def pack_batches(texts: list[str], max_inputs: int | None = None, max_tokens: int | None = None) -> list[list[int]]:
+    """
+    Regroupe les textes (indices, ordre conservé) en lots d'au plus max_inputs
+    textes et max_tokens tokens estimés. Un texte plus long que max_tokens
+    part seul (Voyage le tronque à la longueur de contexte du modèle).
+    """
+    max_inputs = max_inputs or settings.embed_batch_max_inputs
+    max_tokens = max_tokens or settings.embed_batch_max_tokens
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class QueryBatcher:
+    """
+    Regroupe les embed_query concurrents : le premier appel ouvre une fenêtre
+    de window secondes, les suivants s'y ajoutent, et le lot part en un seul
+    appel à la fin de la fenêtre (ou dès max_batch requêtes). Chaque appelant
+    reçoit son vecteur et le modèle qui l'a produit ; une erreur est remontée
+    à tous.
+    """
+
+    def __init__(self, window: float, max_batch: int) -> None:
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: list[tuple[str, asyncio.Future, float]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._sends: set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> tuple[list[float], str]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future, float]]) -> None:
+        sent = time.perf_counter()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))   # Même question posée deux fois : un seul input
+        QUERY_BATCH_SIZE.observe(len(texts))
+        for _, _, queued in batch:
+            QUERY_QUEUE_DELAY.observe(sent - queued)
+        try:
+            embeddings, model = await _embed(texts, "query")
+            vectors = dict(zip(texts, embeddings))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future, _ in batch:
+            if not future.done():   # Appelant annulé entre-temps
+                future.set_result((vectors[text], model))
+
+
+_query_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, QueryBatcher]" = weakref.WeakKeyDictionary()
+
+
+def _query_batcher() -> QueryBatcher:
+    loop = asyncio.get_running_loop()
+    batcher = _query_batchers.get(loop)
+    if batcher is None:
+        batcher = _query_batchers[loop] = QueryBatcher(
+            settings.query_embed_batch_window_ms / 1000, settings.query_embed_max_batch,
+        )
+    return batcher
+
+
+async def _embed_one(text: str, input_type: str) -> tuple[list[float], str]:
+    """Embedding d'un texte unique, servi par le cache si possible, et son modèle."""
+    if settings.embedding_cache_enabled:
+        cached = await embedding_cache.get(provider.model, input_type, text)
+        if cached is not None:
+            return cached, provider.model
+    if input_type == "query" and settings.query_embed_batch_window_ms > 0:
+        embedding, model = await _query_batcher().embed(text)
+    else:
+        embeddings, model = await _embed([text], input_type)
+        embedding = embeddings[0]
+    if settings.embedding_cache_enabled and model == provider.model:
+        embedding_cache.put_many(model, input_type, [text], [embedding])
+    return embedding, model
 
 
 async def embed_text(text: str) -> list[float]:
     """Génère l'embedding d'un texte unique (document)."""
-    result = await client.embed([text], model=settings.embedding_model, input_type="document")
-    return result.embeddings[0]
+    return (await _embed_one(text, "document"))[0]
+
 
+def primary_model() -> str:
+    """Identifiant du modèle du fournisseur choisi (settings.embedding_provider)."""
+    return provider.model
 
-async def embed_chunks(chunks: list[TextChunk]) -> list[tuple[TextChunk, list[float]]]:
+
+def embedding_model_of(chunks_with_embeddings: list[tuple[TextChunk, list[float]]]) -> str:
+    """Modèle des embeddings d'un cours : celui du secours si un chunk en vient."""
+    for chunk, _ in chunks_with_embeddings:
+        if "embedding_model" in chunk.metadata:
+            return chunk.metadata["embedding_model"]
+    return provider.model
+
+
+async def align_embeddings(
+    chunks_with_embeddings: list[tuple[TextChunk, list[float]]],
+) -> list[tuple[TextChunk, list[float]]]:
     """
-    Génère les embeddings pour une liste de chunks.
-    Voyage AI supporte jusqu'à 128 inputs par batch.
+    Un cours dont une partie des chunks a été embeddée par le secours est
+    entièrement ré-embeddé par le secours : tous ses vecteurs doivent être
+    comparables à la même requête.
+    """
+    model = embedding_model_of(chunks_with_embeddings)
+    stale = [i for i, (chunk, _) in enumerate(chunks_with_embeddings) if chunk.metadata.get("embedding_model") != model]
+    if model == provider.model or not stale:
+        return chunks_with_embeddings
+    embeddings, _ = await _fallback_embed([chunk_body(chunks_with_embeddings[i][0].content) for i in stale], "document")
+    aligned = list(chunks_with_embeddings)
+    for i, embedding in zip(stale, embeddings):
+        chunk = aligned[i][0]
+        chunk.metadata["embedding_model"] = model
+        aligned[i] = (chunk, embedding)
+    return aligned
 
-    Returns:
-        Liste de tuples (chunk, embedding)
+
+async def embed_chunks(
+    chunks: list[TextChunk],
+    on_batch: Callable[[int], None] | None = None,
+    allow_fallback: bool = True,
+) -> list[tuple[TextChunk, list[float]]]:
     """
-    BATCH_SIZE = 128
+    Génère les embeddings pour une liste de chunks.
+    Les textes absents du cache sont groupés par pack_batches (128 textes et
+    embed_batch_max_tokens tokens estimés au plus par lot) et les lots
+    partent en parallèle, dans la limite de settings.embed_concurrency.
 
-    results: list[tuple[TextChunk, list[float]]] = []
+    Args:
+        on_batch: appelé après chaque lot avec le nombre de chunks déjà embeddés
+        allow_fallback: False pour lever l'erreur du fournisseur plutôt que
+            d'embedder par le secours (chunks ajoutés à un cours existant)
 
-    for i in range(0, len(chunks), BATCH_SIZE):
-        batch = chunks[i : i + BATCH_SIZE]
-        texts = [chunk.content for chunk in batch]
+    Seul le corps des chunks est embeddé (clé chunk_body_hash) : l'en-tête
+    « [matière — titre] » reste dans le contenu, hors du vecteur partagé.
 
-        result = await client.embed(texts, model=settings.embedding_model, input_type="document")
+    Returns:
+        Liste de tuples (chunk, embedding), dans l'ordre des chunks
+    """
+    texts = [chunk_body(chunk.content) for chunk in chunks]
+    embeddings: list[list[float] | None] = [None] * len(chunks)
+    if settings.embedding_cache_enabled and chunks:
+        embeddings = await embedding_cache.get_many(provider.model, "document", texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    done = len(chunks) - len(missing)
+    if done and on_batch is not None:
+        on_batch(done)
 
-        for chunk, embedding in zip(batch, result.embeddings):
-            results.append((chunk, embedding))
+    async def embed_batch(batch: list[int]) -> None:
+        nonlocal done
+        batch_texts = [texts[i] for i in batch]
+        batch_embeddings, model = await _embed(batch_texts, "document", allow_fallback)
+        if model != provider.model:
+            for i in batch:
+                chunks[i].metadata["embedding_model"] = model
+        elif settings.embedding_cache_enabled:
+            embedding_cache.put_many(model, "document", batch_texts, batch_embeddings)
+        for i, embedding in zip(batch, batch_embeddings):
+            embeddings[i] = embedding
+        done += len(batch)
+        if on_batch is not None:
+            on_batch(done)
 
-    return results
+    batches = [[missing[j] for j in batch] for batch in pack_batches([texts[i] for i in missing])]
+    tasks = [asyncio.create_task(embed_batch(batch)) for batch in batches]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return await align_embeddings(list(zip(chunks, embeddings)))
 
 
 async def embed_query(query: str) -> list[float]:
     """
     Génère l'embedding d'une requête de recherche.
     input_type="query" optimise pour la recherche asymétrique (différent de "document").
+    Une requête déjà posée est servie par le cache, sans appel réseau.
+    """
+    return (await _embed_one(query, "query"))[0]
+
+
+async def embed_query_with_model(query: str) -> tuple[list[float], str]:
+    """embed_query, avec le modèle du vecteur (celui du secours en mode dégradé)."""
+    return await _embed_one(query, "query")
+
+
+class EmbeddingBatcher:
     """
-    result = await client.embed([query], model=settings.embedding_model, input_type="query")
-    return result.embeddings[0]
+    Embedde les chunks par petits lots dès qu'ils arrivent, sans attendre la
+    fin du texte : utilisé pendant l'OCR en streaming pour que l'embedding se
+    fasse en parallèle de la génération.
+    """
+
+    def __init__(
+        self,
+        batch_size: int | None = None,
+        on_embedded: Callable[[int, int], None] | None = None,
+    ) -> None:
+        """on_embedded(embeddés, ajoutés) est appelé à la fin de chaque lot."""
+        self.batch_size = batch_size or settings.stream_embed_batch_size
+        self.on_embedded = on_embedded
+        self.added = 0
+        self.embedded = 0
+        self._pending: list[TextChunk] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def add(self, chunk: TextChunk) -> None:
+        self._pending.append(chunk)
+        self.added += 1
+        if len(self._pending) >= self.batch_size:
+            self._launch()
+
+    async def _embed(self, batch: list[TextChunk]) -> list[tuple[TextChunk, list[float]]]:
+        pairs = await embed_chunks(batch)
+        self.embedded += len(pairs)
+        if self.on_embedded is not None:
+            self.on_embedded(self.embedded, self.added)
+        return pairs
+
+    def _launch(self) -> None:
+        if self._pending:
+            self._tasks.append(asyncio.create_task(self._embed(self._pending)))
+            self._pending = []
+
+    async def finish(self) -> list[tuple[TextChunk, list[float]]]:
+        """Envoie le dernier lot et attend tous les embeddings, dans l'ordre d'ajout."""
+        self._launch()
+        try:
+            batches = await asyncio.gather(*self._tasks)
+        except BaseException:
+            self.cancel()
+            raise
+        return await align_embeddings([pair for batch in batches for pair in batch])
+
+    def cancel(self) -> None:
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,661 @@
+"""
+Ingestion d'un cours : texte → chunking incrémental → embedding.
+
+- Photo : OCR en streaming. Les paragraphes sortent du modèle au fil de la
+  génération ; ils sont chunkés et envoyés à l'embedding par petits lots
+  immédiatement, si bien que le temps total d'un upload tend vers le seul
+  temps de l'OCR.
+- Plusieurs photos d'un même cours : pages lues en parallèle (concurrence
+  bornée), remises dans l'ordre, puis chunkées en un seul passage — un chunk
+  peut chevaucher deux pages — et embeddées en un minimum d'appels Voyage.
+- Document numérique (PDF, Markdown, texte) : même pipeline, alimenté par
+  l'extraction locale page par page — aucun appel Vision.
+- Édition d'un cours (correction d'une faute d'OCR) : le texte est re-chunké
+  et comparé, par hash, aux chunks déjà stockés ; seuls les chunks nouveaux
+  sont embeddés, le reste est réindexé sur place.
+
+Chaque ingestion renvoie la durée de ses étapes (IngestedCourse.timings),
+exposée dans le statut du job d'upload, et signale chaque étape au fil de
+l'eau via `progress(stage, **détails)` : ocr / extraction, chunking,
+embedding (done/total).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+from postgrest.exceptions import APIError
+
+from config import get_settings
+from db.client import get_supabase
+from metrics import counter
+from rag.chunking import (
+    CHUNKER_VERSION,
+    CourseSection,
+    IncrementalChunker,
+    ParagraphSplitter,
+    TextChunk,
+    chunk_body_hash,
+    chunk_content_hash,
+    chunk_course_sections,
+    make_text_chunk,
+)
+from rag.documents import (
+    DocumentError,
+    DocumentHeaders,
+    DocumentKind,
+    DocumentReader,
+    clean_markdown,
+    detect_headers,
+    markdown_headings,
+)
+from rag.embeddings import EmbeddingBatcher, embed_chunks, embedding_model_of, primary_model
+from rag.ocr import (
+    CourseOCRResult,
+    extract_course_from_image,
+    merge_course_pages,
+    page_separator,
+    stream_course_from_image,
+)
+from rag.retrieval import build_chunk_rows, stored_body_hashes
+
+settings = get_settings()
+logger = logging.getLogger("studybuddy.ingestion")
+
+DOCUMENT_IMPORTS = counter("document_imports_total", "Cours importés depuis un document numérique (kind)")
+DOCUMENT_PAGES = counter("document_import_pages_total", "Pages PDF extraites localement")
+COURSE_PAGES = counter("course_upload_pages_total", "Photos lues par les uploads de cours multi-pages")
+COURSE_EDIT_CHUNKS = counter("course_edit_chunks_total", "Chunks traités par les éditions de cours (action)")
+
+# Texte lu avant de déduire titre / matière / niveau (≈ une page)
+_HEADER_SAMPLE_CHARS = 3000
+# L'extraction locale va bien plus vite que l'OCR : des lots plus gros
+# limitent le nombre d'appels Voyage sans retarder la fin de l'import
+_DOCUMENT_EMBED_BATCH = 64
+
+# progress(stage, **détails) — ne doit pas bloquer : appelé depuis le pipeline
+ProgressCallback = Callable[..., None]
+
+
+def _no_progress(stage: str, **details) -> None:
+    pass
+
+
+def _embedding_progress(progress: ProgressCallback) -> Callable[[int, int], None]:
+    return lambda done, total: progress("embedding", done=done, total=total)
+
+
+@dataclass
+class IngestedCourse:
+    ocr: CourseOCRResult
+    chunks_with_embeddings: list[tuple[TextChunk, list[float]]]
+    timings: dict[str, float] = field(default_factory=dict)  # Durée de chaque étape (s)
+    sections: list[CourseSection] = field(default_factory=list)  # Contexte parent des chunks
+
+
+async def ingest_course_image(
+    image_bytes: bytes,
+    course_id: str,
+    user_id: str | None = None,
+    progress: ProgressCallback = _no_progress,
+) -> IngestedCourse:
+    """
+    OCR + chunking + embedding d'une photo de cours, en pipeline.
+
+    Les chunks sont construits dès que les en-têtes (titre, matière) sont
+    connus ; les mots-clés et le nombre total de chunks, qui n'arrivent qu'en
+    fin de génération, sont reportés dans les métadonnées à la fin. Si l'OCR
+    remplace sa sortie ("replace" : sortie corrigée), chunks et embeddings
+    repartent du cours validé.
+    """
+    chunker = IncrementalChunker()
+    batcher = EmbeddingBatcher(on_embedded=_embedding_progress(progress))
+    chunks: list[TextChunk] = []
+    headers: CourseOCRResult | None = None
+    result: CourseOCRResult | None = None
+    start = time.perf_counter()
+    progress("ocr")
+
+    def add_chunks(texts: list[str]) -> None:
+        for text in texts:
+            chunk = make_text_chunk(
+                text, len(chunks), course_id, headers.subject, headers.title, keywords=[],
+                section_index=chunker.chunk_sections[len(chunks)],
+            )
+            chunks.append(chunk)
+            batcher.add(chunk)
+
+    try:
+        async for event in stream_course_from_image(image_bytes, user_id=user_id):
+            if event.kind == "headers":
+                headers = event.result
+            elif event.kind == "block":
+                add_chunks(chunker.feed(event.block))
+            elif event.kind == "replace":
+                # Sortie corrigée : les chunks déjà construits ne valent plus, on repart du cours validé
+                batcher.cancel()
+                batcher = EmbeddingBatcher(on_embedded=_embedding_progress(progress))
+                chunker = IncrementalChunker()
+                chunks.clear()
+                headers = result = event.result
+                splitter = ParagraphSplitter()
+                for block in splitter.feed(result.content) + splitter.flush():
+                    add_chunks(chunker.feed(block))
+            else:
+                result = event.result
+        ocr_done = time.perf_counter()
+        progress("chunking")
+
+        if headers is not None:
+            add_chunks(chunker.flush())
+        chunks_with_embeddings = await batcher.finish()
+    except BaseException:
+        batcher.cancel()
+        raise
+
+    for chunk in chunks:
+        chunk.metadata["keywords"] = result.keywords
+        chunk.metadata["total_chunks"] = len(chunks)
+
+    end = time.perf_counter()
+    logger.info(
+        "[INGESTION] course_id=%s chunks=%d ocr=%.1fs embedding après OCR=%.2fs",
+        course_id, len(chunks), ocr_done - start, end - ocr_done,
+    )
+    return IngestedCourse(
+        ocr=result,
+        chunks_with_embeddings=chunks_with_embeddings,
+        timings={"ocr": round(ocr_done - start, 3), "embedding": round(end - ocr_done, 3)},
+        sections=chunker.sections,
+    )
+
+
+async def ingest_course_pages(
+    pages: list[bytes],
+    course_id: str,
+    user_id: str | None = None,
+    progress: ProgressCallback = _no_progress,
+) -> IngestedCourse:
+    """
+    OCR + chunking + embedding d'un cours photographié sur plusieurs pages.
+
+    Les pages sont lues en parallèle (au plus settings.ocr_page_concurrency
+    appels Vision simultanés). Dès que la page suivante dans l'ordre est
+    disponible, elle est découpée en blocs : les pages forment un seul texte,
+    si bien qu'un paragraphe coupé par le bas de page reste dans un même chunk.
+    Les chunks, construits une fois les en-têtes de toutes les pages connus,
+    partent ensuite à l'embedding en lots de 128 (un appel Voyage par lot).
+    """
+    semaphore = asyncio.Semaphore(settings.ocr_page_concurrency)
+    results: list[CourseOCRResult | None] = [None] * len(pages)
+    splitter = ParagraphSplitter()
+    chunker = IncrementalChunker()
+    texts: list[str] = []
+    content = ""
+    next_page = 0
+    chunking = 0.0
+    start = time.perf_counter()
+    progress("ocr", done=0, total=len(pages))
+
+    async def read(index: int, image_bytes: bytes) -> int:
+        async with semaphore:
+            results[index] = await extract_course_from_image(image_bytes, user_id=user_id)
+        return index
+
+    def add_page(page: CourseOCRResult) -> None:
+        nonlocal content
+        text = page.content.strip()
+        if not text:
+            return
+        if content:
+            text = page_separator(content, text) + text
+        content += text
+        for block in splitter.feed(text):
+            texts.extend(chunker.feed(block))
+
+    tasks = [asyncio.create_task(read(i, image_bytes)) for i, image_bytes in enumerate(pages)]
+    try:
+        for read_count, done in enumerate(asyncio.as_completed(tasks), start=1):
+            index = await done
+            logger.info("[INGESTION] course_id=%s page %d/%d lue", course_id, index + 1, len(pages))
+            progress("ocr", done=read_count, total=len(pages))
+            started = time.perf_counter()
+            while next_page < len(pages) and results[next_page] is not None:
+                add_page(results[next_page])
+                next_page += 1
+            chunking += time.perf_counter() - started
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    ocr_done = time.perf_counter()
+    progress("chunking")
+
+    for block in splitter.flush():
+        texts.extend(chunker.feed(block))
+    texts.extend(chunker.flush())
+    course = merge_course_pages(results)
+    chunks = [
+        make_text_chunk(
+            text, i, course_id, course.subject, course.title, course.keywords,
+            total_chunks=len(texts), section_index=chunker.chunk_sections[i],
+        )
+        for i, text in enumerate(texts)
+    ]
+    chunked = time.perf_counter()
+    chunking += chunked - ocr_done
+
+    progress("embedding", done=0, total=len(chunks))
+    chunks_with_embeddings = await embed_chunks(
+        chunks, on_batch=lambda done: progress("embedding", done=done, total=len(chunks)),
+    )
+    end = time.perf_counter()
+
+    COURSE_PAGES.inc(len(pages))
+    logger.info(
+        "[INGESTION] %d pages course_id=%s chunks=%d ocr=%.1fs chunking=%.3fs embedding=%.2fs",
+        len(pages), course_id, len(chunks), ocr_done - start, chunking, end - chunked,
+    )
+    return IngestedCourse(
+        ocr=course,
+        chunks_with_embeddings=chunks_with_embeddings,
+        timings={
+            "ocr": round(ocr_done - start, 3),
+            "chunking": round(chunking, 3),
+            "embedding": round(end - chunked, 3),
+        },
+        sections=chunker.sections,
+    )
+
+
+async def ingest_course_document(
+    path: Path,
+    kind: DocumentKind,
+    course_id: str,
+    filename: str | None = None,
+    subject: str | None = None,
+    progress: ProgressCallback = _no_progress,
+) -> IngestedCourse:
+    """
+    Extraction locale + chunking + embedding d'un document numérique, en pipeline.
+
+    Les blocs sont mis en attente jusqu'à ce que le début du document suffise
+    à déduire titre, matière et niveau ; ensuite chaque page extraite part
+    directement au chunking et à l'embedding.
+
+    Raises:
+        DocumentError: document illisible ou sans couche texte (PDF scanné)
+    """
+    reader = DocumentReader(path, kind)
+    splitter = ParagraphSplitter()
+    chunker = IncrementalChunker()
+    batcher = EmbeddingBatcher(batch_size=_DOCUMENT_EMBED_BATCH, on_embedded=_embedding_progress(progress))
+    chunks: list[TextChunk] = []
+    parts: list[str] = []
+    pending: list[str] = []
+    headers: DocumentHeaders | None = None
+    sample_length = 0
+    start = time.perf_counter()
+    progress("extraction")
+
+    def resolve_headers() -> DocumentHeaders:
+        detected = detect_headers("".join(parts)[:_HEADER_SAMPLE_CHARS], reader.metadata_title, filename)
+        if subject:
+            detected.subject = subject
+        return detected
+
+    def add_chunks(texts: list[str]) -> None:
+        for text in texts:
+            chunk = make_text_chunk(
+                text, len(chunks), course_id, headers.subject, headers.title, keywords=[],
+                section_index=chunker.chunk_sections[len(chunks)],
+            )
+            chunks.append(chunk)
+            batcher.add(chunk)
+
+    def add_blocks(blocks: list[str]) -> None:
+        for block in blocks:
+            add_chunks(chunker.feed(clean_markdown(block) if kind == "text" else block))
+
+    try:
+        async for text in reader.iter_text():
+            parts.append(text)
+            blocks = splitter.feed(text)
+            if headers is None:
+                pending.extend(blocks)
+                sample_length += len(text)
+                if sample_length < _HEADER_SAMPLE_CHARS:
+                    continue
+                headers = resolve_headers()
+                blocks, pending = pending, []
+            add_blocks(blocks)
+
+        if headers is None:
+            headers = resolve_headers()
+        progress("chunking")
+        add_blocks(pending + splitter.flush())
+        add_chunks(chunker.flush())
+        extracted = time.perf_counter()
+
+        if not chunks:
+            raise DocumentError(
+                "Aucun texte exploitable dans ce document (PDF scanné ?). Utilise l'upload photo."
+            )
+        chunks_with_embeddings = await batcher.finish()
+    except BaseException:
+        batcher.cancel()
+        raise
+
+    content = "".join(parts).strip()
+    keywords = reader.outline or markdown_headings(content)
+    for chunk in chunks:
+        chunk.metadata["keywords"] = keywords
+        chunk.metadata["total_chunks"] = len(chunks)
+
+    DOCUMENT_IMPORTS.inc(kind=kind)
+    DOCUMENT_PAGES.inc(reader.pages)
+    end = time.perf_counter()
+    logger.info(
+        "[INGESTION] document course_id=%s kind=%s pages=%d chunks=%d extraction=%.2fs embedding après extraction=%.2fs",
+        course_id, kind, reader.pages, len(chunks), extracted - start, end - extracted,
+    )
+    course = CourseOCRResult(
+        title=headers.title,
+        subject=headers.subject,
+        level=headers.level,
+        content=content,
+        keywords=keywords,
+        raw_text=content,
+    )
+    return IngestedCourse(
+        ocr=course,
+        chunks_with_embeddings=chunks_with_embeddings,
+        timings={"extraction": round(extracted - start, 3), "embedding": round(end - extracted, 3)},
+        sections=chunker.sections,
+    )
+
+
+def current_chunk_scheme(embedding_model: str | None = None) -> str:
+    """
+    Empreinte de l'algorithme de découpe (CHUNKER_VERSION), des réglages de
+    chunking et du modèle d'embedding (celui du fournisseur par défaut),
+    stockée sur chaque cours (courses.chunk_scheme) : un cours dont
+    l'empreinte diffère est à reconstruire par scripts.rechunk_courses —
+    dont un cours embeddé par le secours.
+    """
+    scheme = {
+        "chunker": CHUNKER_VERSION,
+        "mode": settings.chunk_mode,
+        "size": settings.chunk_size,
+        "overlap": settings.chunk_overlap,
+        "max_tokens": settings.chunk_max_tokens,
+        "overlap_tokens": settings.chunk_overlap_tokens,
+        "min_tokens": settings.chunk_min_tokens,
+        "model": embedding_model or primary_model(),
+    }
+    return hashlib.sha256(json.dumps(scheme, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+async def save_course(
+    course_id: str,
+    user_id: str,
+    ingested: IngestedCourse,
+    content_hash: str | None = None,
+) -> str:
+    """
+    Insertion du cours, de ses chunks (et de leurs embeddings partagés) et de
+    ses sections en une transaction et un seul aller-retour (RPC
+    create_course_with_chunks) ; retourne created_at (ISO). Un échec
+    n'écrit rien : pas de cours orphelin aux chunks partiels.
+
+    content_hash (hash du fichier envoyé) est unique par élève : un second
+    cours issu du même contenu est refusé par la base (postgrest APIError 23505)
+    avant que le moindre chunk soit inséré.
+    """
+    course = ingested.ocr
+    now = datetime.now(timezone.utc).isoformat()
+    shared, chunks = build_chunk_rows(ingested.chunks_with_embeddings)
+    embedding_model = embedding_model_of(ingested.chunks_with_embeddings)
+    params = {
+        "p_course": {
+            "id": course_id,
+            "user_id": user_id,
+            "title": course.title,
+            "subject": course.subject,
+            "level": course.level,
+            "keywords": course.keywords,
+            "raw_content": course.content,
+            "content_hash": content_hash,
+            "chunk_scheme": current_chunk_scheme(embedding_model),
+            "embedding_model": embedding_model,
+            "created_at": now,
+        },
+        "p_embeddings": shared,
+        "p_chunks": chunks,
+        "p_sections": [
+            {"section_index": section.section_index, "heading": section.heading, "content": section.content}
+            for section in ingested.sections
+        ],
+    }
+    await asyncio.to_thread(lambda: get_supabase().rpc("create_course_with_chunks", params).execute())
+    return now
+
+
+# ── Édition d'un cours ───────────────────────────────────────────────────────
+
+class CourseEditConflict(Exception):
+    """Le cours a été modifié entre sa lecture et l'application de l'édition."""
+
+
+@dataclass
+class ChunkDiff:
+    kept: list[tuple[str, TextChunk]] = field(default_factory=list)  # (id du chunk stocké, chunk réindexé)
+    added: list[TextChunk] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)  # ids des chunks stockés devenus inutiles
+
+
+@dataclass
+class EditedCourse:
+    course: dict  # ligne courses après édition
+    chunk_count: int
+    diff: ChunkDiff
+    embedded: int = 0  # Chunks ajoutés réellement embeddés (les autres réutilisent un corps stocké)
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+def diff_chunks(stored: list[dict], chunks: list[TextChunk]) -> ChunkDiff:
+    """
+    Apparie les nouveaux chunks aux chunks stockés ({id, chunk_index,
+    content_hash}) par hash de contenu. Un contenu présent deux fois est
+    apparié deux fois, dans l'ordre du cours.
+    """
+    by_hash: dict[str, list[str]] = {}
+    for row in sorted(stored, key=lambda row: row["chunk_index"]):
+        by_hash.setdefault(row["content_hash"], []).append(row["id"])
+
+    diff = ChunkDiff()
+    for chunk in chunks:
+        ids = by_hash.get(chunk_content_hash(chunk.content))
+        if ids:
+            diff.kept.append((ids.pop(0), chunk))
+        else:
+            diff.added.append(chunk)
+    diff.removed = [chunk_id for ids in by_hash.values() for chunk_id in ids]
+    return diff
+
+
+def _load_course(course_id: str, user_id: str) -> tuple[dict | None, list[dict]]:
+    supabase = get_supabase()
+    course = (
+        supabase.table("courses")
+        .select(
+            "id, title, subject, level, keywords, raw_content, created_at, updated_at, chunk_generation, "
+            "embedding_model"
+        )
+        .eq("id", course_id)
+        .eq("user_id", user_id)
+        .execute()
+    )
+    if not course.data:
+        return None, []
+    chunks = (
+        supabase.table("course_chunks")
+        .select("id, chunk_index, content_hash")
+        .eq("course_id", course_id)
+        .eq("generation", course.data[0]["chunk_generation"])
+        .execute()
+    )
+    return course.data[0], chunks.data
+
+
+def _apply_edit(
+    course: dict,
+    user_id: str,
+    diff: ChunkDiff,
+    embeddings: list[list[float] | None],
+    sections: list[CourseSection],
+) -> str:
+    """
+    Applique l'édition en une transaction (RPC apply_course_edit) ; retourne
+    le nouvel updated_at. Un embedding None : corps déjà dans chunk_embeddings.
+    """
+    result = get_supabase().rpc("apply_course_edit", {
+        "p_course_id": course["id"],
+        "p_user_id": user_id,
+        "p_expected_updated_at": course["updated_at"],
+        "p_course": {
+            key: course.get(key)
+            for key in ("title", "subject", "level", "keywords", "raw_content", "embedding_model", "chunk_scheme")
+        },
+        "p_removed": diff.removed,
+        "p_kept": [
+            {
+                "id": chunk_id,
+                "chunk_index": chunk.chunk_index,
+                "section_index": chunk.metadata["section_index"],
+                "metadata": chunk.metadata,
+            }
+            for chunk_id, chunk in diff.kept
+        ],
+        "p_inserted": [
+            {
+                "content": chunk.content,
+                "content_hash": chunk_content_hash(chunk.content),
+                "body_hash": chunk_body_hash(chunk.content, primary_model()),
+                "embedding": embedding,
+                "chunk_index": chunk.chunk_index,
+                "section_index": chunk.metadata["section_index"],
+                "metadata": chunk.metadata,
+            }
+            for chunk, embedding in zip(diff.added, embeddings)
+        ],
+        "p_sections": [
+            {"section_index": section.section_index, "heading": section.heading, "content": section.content}
+            for section in sections
+        ],
+    }).execute()
+    return result.data
+
+
+async def edit_course(
+    course_id: str,
+    user_id: str,
+    raw_content: str | None = None,
+    title: str | None = None,
+    subject: str | None = None,
+    level: str | None = None,
+    keywords: list[str] | None = None,
+) -> EditedCourse | None:
+    """
+    Met à jour le texte et/ou les métadonnées d'un cours, en ne ré-embeddant
+    que les chunks dont le contenu a changé. None si le cours n'existe pas.
+
+    Le contenu stocké commence par « [matière — titre] » : changer l'un des
+    deux renouvelle toutes les lignes de chunks, mais pas leurs vecteurs (le
+    corps seul est embeddé) ; un corps déjà présent dans chunk_embeddings
+    n'est pas ré-embeddé. Un cours importé depuis un document (découpe
+    guidée par ses titres) peut voir plus de chunks renouvelés à sa
+    première édition, le temps de s'aligner sur chunk_course_text.
+
+    Un cours embeddé par un autre modèle que celui du fournisseur (importé en
+    mode dégradé) est entièrement ré-embeddé, sans secours : ses chunks
+    restent comparables à une même requête.
+
+    Raises:
+        CourseEditConflict: le cours a été modifié par une autre édition entretemps
+    """
+    start = time.perf_counter()
+    course, stored = await asyncio.to_thread(_load_course, course_id, user_id)
+    if course is None:
+        return None
+    loaded = time.perf_counter()
+
+    edits = {"raw_content": raw_content, "title": title, "subject": subject, "level": level, "keywords": keywords}
+    course = course | {key: value for key, value in edits.items() if value is not None}
+    chunks, sections = chunk_course_sections(
+        course["raw_content"] or "", course_id, course["subject"], course["title"], course["keywords"] or [],
+    )
+    diff = diff_chunks(stored, chunks)
+    if course["embedding_model"] != primary_model():
+        # Cours embeddé par un autre modèle (secours, ancien fournisseur) : les
+        # chunks ajoutés ne seraient pas comparables aux chunks conservés, le
+        # cours entier est ré-embeddé par le fournisseur et ré-estampillé
+        diff = ChunkDiff(added=chunks, removed=[row["id"] for row in stored])
+        course["embedding_model"] = primary_model()
+        course["chunk_scheme"] = current_chunk_scheme()
+    chunked = time.perf_counter()
+
+    hashes = [chunk_body_hash(chunk.content, primary_model()) for chunk in diff.added]
+    reusable = await asyncio.to_thread(stored_body_hashes, user_id, sorted(set(hashes)))
+    vectors: dict[str, list[float]] = {}
+    embedded = 0
+    while True:
+        # Pas de secours : les chunks ajoutés doivent être comparables aux chunks conservés
+        to_embed = [
+            chunk for chunk, body_hash in zip(diff.added, hashes)
+            if body_hash not in reusable and body_hash not in vectors
+        ]
+        for chunk, embedding in await embed_chunks(to_embed, allow_fallback=False):
+            vectors[chunk_body_hash(chunk.content, primary_model())] = embedding
+        embedded += len(to_embed)
+        end_embedding = time.perf_counter()
+        try:
+            course["updated_at"] = await asyncio.to_thread(
+                _apply_edit, course, user_id, diff, [vectors.get(body_hash) for body_hash in hashes], sections,
+            )
+            break
+        except APIError as e:
+            if e.code == "40001":
+                raise CourseEditConflict(f"Cours {course_id} modifié pendant l'édition") from e
+            if e.code == "23503" and reusable:
+                # Embedding partagé purgé depuis la lecture (plus référencé) : on embedde tout
+                reusable = set()
+                continue
+            raise
+    end = time.perf_counter()
+
+    COURSE_EDIT_CHUNKS.inc(len(diff.kept), action="kept")
+    COURSE_EDIT_CHUNKS.inc(embedded, action="embedded")
+    COURSE_EDIT_CHUNKS.inc(len(diff.added) - embedded, action="reused")
+    COURSE_EDIT_CHUNKS.inc(len(diff.removed), action="removed")
+    logger.info(
+        "[EDIT] course_id=%s chunks=%d conservés=%d ajoutés=%d embeddés=%d supprimés=%d",
+        course_id, len(chunks), len(diff.kept), len(diff.added), embedded, len(diff.removed),
+    )
+    return EditedCourse(
+        course=course,
+        chunk_count=len(chunks),
+        diff=diff,
+        embedded=embedded,
+        timings={
+            "loading": round(loaded - start, 3),
+            "chunking": round(chunked - loaded, 3),
+            "embedding": round(end_embedding - chunked, 3),
+            "storing": round(end - end_embedding, 3),
+        },
+    )
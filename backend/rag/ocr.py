@@ -1,51 +1,165 @@
 """
 OCR module — extrait et structure le texte d'une image de cours via Claude Vision.
+
+La sortie est contrainte par un outil à schéma JSON (tool_choice forcé) puis
+validée vers CourseOCRResult / ExerciseOCRResult. Une sortie invalide donne
+lieu à une seule relance ciblée, en texte seul : le modèle reçoit sa sortie
+et la liste des erreurs, jamais une nouvelle fois l'image.
 """
+import asyncio
 import base64
-from dataclasses import dataclass
+import copy
+import json
+import logging
+import re
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import asdict, dataclass
+from difflib import SequenceMatcher
+from typing import Literal
 
 import anthropic
+from jiter import from_json  # Parseur JSON partiel (aussi utilisé par le SDK anthropic)
+from pydantic import TypeAdapter, ValidationError
 
 from config import get_settings
+from metrics import counter, histogram
+from rag.chunking import ParagraphSplitter
+from rag.ocr_cache import OCRKind, image_sha256, ocr_cache
+from rag.preprocessing import NormalizedImage, normalize_image, run_preprocessing, split_into_tiles
 
+logger = logging.getLogger("studybuddy.ocr")
 settings = get_settings()
-client = anthropic.Anthropic(api_key=settings.anthropic_api_key)
+# Client asynchrone : un appel Vision (10-30 s) ne doit pas bloquer la boucle
+# d'événements, sinon tous les streams SSE en cours sont figés pendant l'OCR.
+client = anthropic.AsyncAnthropic(api_key=settings.anthropic_api_key, timeout=settings.ocr_timeout_s)
+
+OCR_LATENCY = histogram(
+    "ocr_latency_seconds", "Durée d'un appel Vision (tier)",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 60),
+)
+OCR_REQUESTS = counter("ocr_requests_total", "Appels Vision (tier, model)")
+OCR_TOKENS = counter("ocr_tokens_total", "Tokens consommés par l'OCR (tier, direction)")
+OCR_COST = counter("ocr_cost_usd_total", "Coût estimé des appels Vision en USD (tier)")
+OCR_ESCALATIONS = counter("ocr_escalations_total", "Exercices renvoyés du modèle rapide au modèle Vision (reason)")
+OCR_VALIDATIONS = counter("ocr_validations_total", "Sorties d'outil OCR validées (kind, tier, stage)")
+OCR_PARSE_FAILURES = counter("ocr_parse_failures_total", "Sorties d'outil OCR invalides (kind, tier, stage)")
+
+# Prix publics (USD par million de tokens entrée / sortie), par préfixe de modèle
+_MODEL_PRICES = {
+    "claude-haiku-4-5": (1.0, 5.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-opus-4": (15.0, 75.0),
+}
+# Message Batches : -50 % sur les tokens, latence non mesurée (jusqu'à 24 h)
+BATCH_TIER = "batch"
+_BATCH_DISCOUNT = 0.5
 
 COURSE_OCR_PROMPT = """Tu es un assistant spécialisé dans l'extraction de contenu pédagogique.
 
-Analyse cette image de cours (page de manuel, fiche de révision, notes de cours, etc.) et extrais son contenu de manière structurée.
-
-Retourne le contenu sous ce format EXACT :
+Analyse cette image de cours (page de manuel, fiche de révision, notes de cours, etc.) et enregistre son contenu avec l'outil enregistrer_cours.
 
-TITRE: [titre du cours ou de la section, ou "Sans titre" si absent]
-MATIERE: [matière détectée : Mathématiques, Physique-Chimie, SVT, Histoire-Géographie, Français, Anglais, Philosophie, etc.]
-NIVEAU: [niveau estimé : 6ème, 5ème, 4ème, 3ème, 2nde, 1ère, Terminale, ou "Inconnu"]
-
-CONTENU:
-[Retranscris fidèlement TOUT le contenu textuel de l'image.
-- Conserve la structure : titres, sous-titres, listes, définitions, formules
+Pour le contenu :
+- Retranscris fidèlement TOUT le contenu textuel de l'image
+- Conserve la structure : titres (#, ##), sous-titres, listes, définitions, formules
 - Pour les formules mathématiques, utilise une notation lisible (ex: x^2, sqrt(x), a/b)
 - Pour les schémas, décris-les brièvement entre crochets : [Schéma : ...]
-- Conserve les exemples et exercices résolus présents dans le cours]
-
-MOTS_CLES: [liste de 5-10 mots-clés séparés par des virgules, concepts importants du cours]"""
+- Conserve les exemples et exercices résolus présents dans le cours"""
 
 EXERCISE_OCR_PROMPT = """Tu es un assistant spécialisé dans l'extraction d'exercices scolaires.
 
-Analyse cette image d'exercice et extrais son contenu de manière précise.
+Analyse cette image d'exercice et enregistre son contenu avec l'outil enregistrer_exercice.
 
-Retourne le contenu sous ce format EXACT :
-
-MATIERE: [matière : Mathématiques, Physique-Chimie, SVT, Histoire-Géographie, Français, Anglais, etc.]
-TYPE: [type d'exercice : Problème, QCM, Dissertation, Exercice d'application, Rédaction, etc.]
-TRAVAIL_ELEVE: [oui / non — y a-t-il du travail manuscrit de l'élève visible dans l'image (calculs, réponses écrites à la main, ratures, annotations) en plus de l'énoncé imprimé ?]
-
-ENONCE:
-[Retranscris l'énoncé COMPLET et fidèle de l'exercice.
+Pour l'énoncé :
+- Retranscris l'énoncé COMPLET et fidèle de l'exercice
 - Inclus toutes les données, valeurs numériques, unités
 - Inclus toutes les questions (Q1, Q2, etc.)
 - Pour les formules, utilise une notation lisible
-- Si des figures ou tableaux sont présents, décris-les entre crochets]"""
+- Si des figures ou tableaux sont présents, décris-les entre crochets"""
+
+# Variante du modèle rapide : même schéma, plus une auto-évaluation
+EXERCISE_FAST_OCR_PROMPT = EXERCISE_OCR_PROMPT + """
+
+Évalue ensuite ta transcription dans le champ confidence. Note [illisible] tout passage que tu ne peux pas lire."""
+
+# Les propriétés sont générées dans l'ordre du schéma : les en-têtes du cours
+# arrivent avant le contenu, ce qui permet de chunker pendant le streaming.
+COURSE_TOOL = {
+    "name": "enregistrer_cours",
+    "description": "Enregistre le contenu structuré d'une image de cours.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string", "description": "Titre du cours ou de la section, « Sans titre » si absent"},
+            "subject": {
+                "type": "string",
+                "description": "Matière : Mathématiques, Physique-Chimie, SVT, Histoire-Géographie, Français, Anglais, Philosophie, etc.",
+            },
+            "level": {
+                "type": "string",
+                "description": "Niveau estimé : 6ème, 5ème, 4ème, 3ème, 2nde, 1ère, Terminale, ou « Inconnu »",
+            },
+            "content": {"type": "string", "description": "Transcription fidèle et complète du cours, en Markdown"},
+            "keywords": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "5 à 10 mots-clés : concepts importants du cours",
+            },
+        },
+        "required": ["title", "subject", "level", "content", "keywords"],
+    },
+}
+
+EXERCISE_TOOL = {
+    "name": "enregistrer_exercice",
+    "description": "Enregistre l'énoncé structuré d'une image d'exercice.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "subject": {
+                "type": "string",
+                "description": "Matière : Mathématiques, Physique-Chimie, SVT, Histoire-Géographie, Français, Anglais, etc.",
+            },
+            "exercise_type": {
+                "type": "string",
+                "description": "Type d'exercice : Problème, QCM, Dissertation, Exercice d'application, Rédaction, etc.",
+            },
+            "student_work_detected": {
+                "type": "boolean",
+                "description": (
+                    "Du travail manuscrit de l'élève (calculs, réponses écrites à la main, ratures, "
+                    "annotations) est-il visible en plus de l'énoncé imprimé ?"
+                ),
+            },
+            "statement": {"type": "string", "description": "Énoncé complet et fidèle de l'exercice"},
+        },
+        "required": ["subject", "exercise_type", "student_work_detected", "statement"],
+    },
+}
+
+EXERCISE_FAST_TOOL = copy.deepcopy(EXERCISE_TOOL)
+EXERCISE_FAST_TOOL["input_schema"]["properties"]["confidence"] = {
+    "type": "integer",
+    "minimum": 0,
+    "maximum": 100,
+    "description": (
+        "Certitude (0-100) que l'énoncé transcrit est complet et exact. Baisse-la si une partie "
+        "est manuscrite, floue, coupée, si des formules sont complexes ou si une figure "
+        "indispensable ne peut pas être décrite."
+    ),
+}
+EXERCISE_FAST_TOOL["input_schema"]["required"].append("confidence")
+
+_TOOLS = {"course": COURSE_TOOL, "exercise": EXERCISE_TOOL}
+
+REPAIR_PROMPT = """Tu as transcrit une image avec l'outil {tool}, mais ta sortie ne respecte pas son schéma :
+
+{output}
+
+Erreurs :
+{errors}
+
+Rappelle l'outil {tool} avec la même transcription, en corrigeant uniquement ces points."""
 
 
 @dataclass
@@ -67,152 +181,791 @@ class ExerciseOCRResult:
     student_work_detected: bool = False
 
 
-def _image_to_base64(image_bytes: bytes) -> tuple[str, str]:
-    """Convertit les bytes d'une image en base64 et détecte le media type."""
-    # Détection basique du format par magic bytes
-    if image_bytes[:3] == b"\xff\xd8\xff":
-        media_type = "image/jpeg"
-    elif image_bytes[:8] == b"\x89PNG\r\n\x1a\n":
-        media_type = "image/png"
-    elif image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
-        media_type = "image/webp"
-    else:
-        media_type = "image/jpeg"  # fallback
-
-    return base64.standard_b64encode(image_bytes).decode("utf-8"), media_type
+async def _prepare_image(image_bytes: bytes) -> NormalizedImage:
+    """
+    Normalise l'image (EXIF, taille, format) avant l'envoi à Claude Vision.
+    Travail CPU hors boucle : thread, ou pool de processus pour le HEIC.
+    """
+    image = await run_preprocessing(normalize_image, image_bytes)
+    logger.info(
+        "[OCR] image %dx%d : %d -> %d octets (-%d), ~%d -> %d tokens image (-%d)",
+        image.width, image.height, image.original_bytes, len(image.data), image.bytes_saved,
+        image.original_tokens, image.tokens, image.tokens_saved,
+    )
+    return image
+
+
+class OCRValidationError(ValueError):
+    """Sortie d'outil OCR invalide, y compris après la relance ciblée."""
+
+    def __init__(self, kind: OCRKind, errors: list[str]) -> None:
+        super().__init__(f"OCR {kind} : réponse du modèle invalide ({'; '.join(errors)})")
+        self.errors = errors
+
+
+_ADAPTERS = {"course": TypeAdapter(CourseOCRResult), "exercise": TypeAdapter(ExerciseOCRResult)}
+
+# Valeurs par défaut des champs descriptifs (jamais bloquants)
+_DEFAULTS = {
+    "course": {"title": "Sans titre", "subject": "Inconnu", "level": "Inconnu", "keywords": []},
+    "exercise": {"subject": "Inconnu", "exercise_type": "Exercice", "student_work_detected": False},
+}
+_TEXT_FIELD = {"course": "content", "exercise": "statement"}
+_MAX_REPAIR_ECHO = 20_000   # Caractères de la sortie fautive renvoyés au modèle
+
+
+def validate_ocr_output(
+    kind: OCRKind,
+    data: object,
+) -> tuple[CourseOCRResult | ExerciseOCRResult | None, list[str]]:
+    """
+    Valide l'entrée d'outil produite par le modèle vers le dataclass du type.
+
+    Un texte principal vide n'est pas une erreur de format (photo sans texte) :
+    le résultat est renvoyé tel quel, les endpoints répondent OCR_EMPTY.
+
+    Returns:
+        (résultat, erreurs) — résultat None si la structure est inutilisable.
+    """
+    if not isinstance(data, dict):
+        return None, ["l'entrée de l'outil doit être un objet JSON"]
+
+    fields = {**_DEFAULTS[kind], **{k: v for k, v in data.items() if v is not None}}
+    if kind == "course" and isinstance(fields.get("keywords"), str):
+        # Tolérance : mots-clés renvoyés sous forme de chaîne « a, b, c »
+        fields["keywords"] = [k.strip() for k in fields["keywords"].split(",") if k.strip()]
+    fields["raw_text"] = json.dumps(data, ensure_ascii=False)
+    fields.pop("confidence", None)
+
+    try:
+        result = _ADAPTERS[kind].validate_python(fields)
+    except ValidationError as e:
+        errors = [f"{'.'.join(str(p) for p in err['loc']) or 'entrée'} : {err['msg']}" for err in e.errors()]
+        return None, errors
+
+    text_field = _TEXT_FIELD[kind]
+    setattr(result, text_field, getattr(result, text_field).strip())
+    return result, []
+
+
+def _tool_input(response: anthropic.types.Message, tool_name: str) -> tuple[object, str | None]:
+    """Entrée de l'appel d'outil de la réponse, et son identifiant (pour la relance)."""
+    for block in response.content:
+        if block.type == "tool_use" and block.name == tool_name:
+            return block.input, block.id
+    return None, None
+
+
+def _vision_messages(image: NormalizedImage, prompt: str) -> list[dict]:
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": image.media_type,
+                        "data": base64.standard_b64encode(image.data).decode("utf-8"),
+                    },
+                },
+                {"type": "text", "text": prompt},
+            ],
+        }
+    ]
 
 
-def _parse_course_response(text: str) -> CourseOCRResult:
-    """Parse la réponse structurée du modèle pour un cours."""
-    lines = text.strip().split("\n")
-    result = {
-        "title": "Sans titre",
-        "subject": "Inconnu",
-        "level": "Inconnu",
-        "content": "",
-        "keywords": [],
-    }
+def _ocr_timeout_error() -> TimeoutError:
+    logger.warning("[OCR] timeout après %.0fs", settings.ocr_timeout_s)
+    return TimeoutError(f"OCR : pas de réponse du modèle après {settings.ocr_timeout_s:.0f}s")
 
-    content_lines: list[str] = []
-    in_content = False
-
-    for line in lines:
-        if line.startswith("TITRE:"):
-            result["title"] = line.replace("TITRE:", "").strip()
-        elif line.startswith("MATIERE:"):
-            result["subject"] = line.replace("MATIERE:", "").strip()
-        elif line.startswith("NIVEAU:"):
-            result["level"] = line.replace("NIVEAU:", "").strip()
-        elif line.startswith("MOTS_CLES:"):
-            kw_raw = line.replace("MOTS_CLES:", "").strip()
-            result["keywords"] = [k.strip() for k in kw_raw.split(",") if k.strip()]
-            in_content = False
-        elif line.startswith("CONTENU:"):
-            in_content = True
-        elif in_content:
-            content_lines.append(line)
-
-    result["content"] = "\n".join(content_lines).strip()
 
-    return CourseOCRResult(
-        title=result["title"],
-        subject=result["subject"],
-        level=result["level"],
-        content=result["content"],
-        keywords=result["keywords"],
-        raw_text=text,
+def _record_usage(tier: str, model: str, usage, elapsed: float | None) -> float:
+    """Latence, tokens et coût estimé d'un appel Vision ; retourne le coût en USD."""
+    input_price, output_price = next(
+        (prices for prefix, prices in _MODEL_PRICES.items() if model.startswith(prefix)), (0.0, 0.0)
+    )
+    cost = (usage.input_tokens * input_price + usage.output_tokens * output_price) / 1_000_000
+    if tier == BATCH_TIER:
+        cost *= _BATCH_DISCOUNT
+    else:
+        OCR_LATENCY.observe(elapsed, tier=tier)
+    OCR_REQUESTS.inc(tier=tier, model=model)
+    OCR_TOKENS.inc(usage.input_tokens, tier=tier, direction="input")
+    OCR_TOKENS.inc(usage.output_tokens, tier=tier, direction="output")
+    OCR_COST.inc(cost, tier=tier)
+    return cost
+
+
+def _tool_params(tool: dict) -> dict:
+    """Outil unique, appel forcé : la réponse est toujours un tool_use conforme au schéma."""
+    return {"tools": [tool], "tool_choice": {"type": "tool", "name": tool["name"]}}
+
+
+async def _vision_call(
+    messages: list[dict],
+    tool: dict,
+    max_tokens: int,
+    model: str | None = None,
+    tier: str = "vision",
+    timeout: float | None = None,
+) -> anthropic.types.Message:
+    """
+    Appel Claude Vision non bloquant, borné par `timeout` (défaut : settings.ocr_timeout_s).
+
+    L'appel réseau est annulable : si la requête HTTP cliente est abandonnée
+    (déconnexion SSE), la tâche est annulée et la requête Anthropic interrompue.
+    """
+    model = model or settings.vision_model
+    start = time.perf_counter()
+    try:
+        async with asyncio.timeout(timeout or settings.ocr_timeout_s):
+            response = await client.messages.create(
+                model=model,
+                max_tokens=max_tokens,
+                messages=messages,
+                **_tool_params(tool),
+            )
+    except TimeoutError:
+        raise _ocr_timeout_error() from None
+
+    _record_usage(tier, model, response.usage, time.perf_counter() - start)
+    return response
+
+
+def _repair_messages(response: anthropic.types.Message, tool: dict, errors: list[str]) -> list[dict]:
+    """
+    Conversation de relance, sans l'image : la sortie fautive et les erreurs
+    suffisent pour corriger la structure (la transcription est déjà faite).
+    """
+    tool_input, _ = _tool_input(response, tool["name"])
+    if tool_input is None:
+        tool_input = "".join(block.text for block in response.content if block.type == "text")
+    output = json.dumps(tool_input, ensure_ascii=False)[:_MAX_REPAIR_ECHO]
+    prompt = REPAIR_PROMPT.format(tool=tool["name"], output=output, errors="\n".join(f"- {e}" for e in errors))
+    return [{"role": "user", "content": prompt}]
+
+
+def _validate_response(
+    kind: OCRKind,
+    response: anthropic.types.Message,
+    tool: dict,
+    tier: str,
+    stage: Literal["initial", "repair"],
+) -> tuple[CourseOCRResult | ExerciseOCRResult | None, list[str]]:
+    result, errors = validate_ocr_output(kind, _tool_input(response, tool["name"])[0])
+    OCR_VALIDATIONS.inc(kind=kind, tier=tier, stage=stage)
+    if errors:
+        OCR_PARSE_FAILURES.inc(kind=kind, tier=tier, stage=stage)
+    return result, errors
+
+
+async def _repair_ocr(
+    kind: OCRKind,
+    response: anthropic.types.Message,
+    tool: dict,
+    errors: list[str],
+    max_tokens: int,
+    model: str | None = None,
+    tier: str = "vision",
+    timeout: float | None = None,
+) -> tuple[CourseOCRResult | ExerciseOCRResult | None, anthropic.types.Message, list[str]]:
+    """Relance ciblée unique (texte seul) après une sortie invalide."""
+    logger.warning("[OCR] sortie %s invalide, relance ciblée : %s", kind, "; ".join(errors))
+    response = await _vision_call(
+        _repair_messages(response, tool, errors), tool, max_tokens, model=model, tier=tier, timeout=timeout,
+    )
+    result, errors = _validate_response(kind, response, tool, tier, "repair")
+    return result, response, errors
+
+
+async def _structured_ocr(
+    kind: OCRKind,
+    image: NormalizedImage,
+    prompt: str,
+    max_tokens: int,
+    tool: dict | None = None,
+    model: str | None = None,
+    tier: str = "vision",
+    timeout: float | None = None,
+    repair: bool = True,
+) -> tuple[CourseOCRResult | ExerciseOCRResult | None, anthropic.types.Message, list[str]]:
+    """
+    Appel Vision à sortie contrainte, validé vers le dataclass du type.
+    Sur erreur de validation et si `repair`, une seule relance ciblée (sans image).
+
+    Returns:
+        (résultat ou None, dernière réponse, erreurs restantes)
+    """
+    tool = tool or _TOOLS[kind]
+    response = await _vision_call(
+        _vision_messages(image, prompt), tool, max_tokens, model=model, tier=tier, timeout=timeout,
     )
+    result, errors = _validate_response(kind, response, tool, tier, "initial")
+    if not errors or not repair:
+        return result, response, errors
+    return await _repair_ocr(kind, response, tool, errors, max_tokens, model=model, tier=tier, timeout=timeout)
+
+
+async def _ocr_result(
+    kind: OCRKind,
+    image: NormalizedImage,
+    prompt: str,
+    max_tokens: int,
+) -> CourseOCRResult | ExerciseOCRResult:
+    """OCR structuré avec relance ; lève OCRValidationError si la structure reste inutilisable."""
+    result, _, errors = await _structured_ocr(kind, image, prompt, max_tokens)
+    if result is None:
+        raise OCRValidationError(kind, errors)
+    return result
+
+
+def _has_text(result: CourseOCRResult | ExerciseOCRResult) -> bool:
+    if isinstance(result, CourseOCRResult):
+        return bool(result.content)
+    return bool(result.statement)
+
+
+_RESULT_TYPES = {"course": CourseOCRResult, "exercise": ExerciseOCRResult}
+
+
+async def _lookup_cache(
+    kind: OCRKind,
+    image_bytes: bytes,
+    user_id: str | None,
+) -> tuple[dict | None, str, NormalizedImage | None]:
+    """
+    Cache OCR : SHA-256 exact, puis dHash (même élève) sur l'image normalisée.
+    Retourne (résultat en cache ou None, sha256, image normalisée si calculée).
+    """
+    sha256 = image_sha256(image_bytes)
+
+    if settings.ocr_cache_enabled:
+        cached = await ocr_cache.get_exact(kind, sha256)
+        if cached is not None:
+            return cached, sha256, None
+
+    image = await _prepare_image(image_bytes)
+
+    if settings.ocr_cache_enabled:
+        cached = await ocr_cache.get_similar(kind, sha256, image.phash, user_id)
+        if cached is not None:
+            return cached, sha256, image
+
+    return None, sha256, image
+
+
+async def _store_cache(
+    kind: OCRKind,
+    sha256: str,
+    image: NormalizedImage,
+    user_id: str | None,
+    result: CourseOCRResult | ExerciseOCRResult,
+) -> None:
+    """
+    Seuls les résultats exploitables (texte non vide) sont mis en cache,
+    pour qu'une nouvelle tentative après un échec relance bien le modèle.
+    """
+    if settings.ocr_cache_enabled and _has_text(result):
+        await ocr_cache.put(kind, sha256, image.phash, user_id, asdict(result))
+
+
+async def _cached_ocr(
+    kind: OCRKind,
+    image_bytes: bytes,
+    user_id: str | None,
+    run: Callable[[NormalizedImage], Awaitable[CourseOCRResult | ExerciseOCRResult]],
+):
+    """OCR avec cache : SHA-256 exact → dHash (même élève) → appel(s) Vision."""
+    cached, sha256, image = await _lookup_cache(kind, image_bytes, user_id)
+    if cached is not None:
+        return _RESULT_TYPES[kind](**cached)
+
+    start = time.perf_counter()
+    result = await run(image)
+    ocr_cache.record_miss_latency(kind, time.perf_counter() - start)
+
+    await _store_cache(kind, sha256, image, user_id, result)
+    return result
+
+
+# ── OCR par tuiles ────────────────────────────────────────────────────────────
+
+TILE_PROMPT_PREFIX = """Cette image est la partie {index}/{count} d'une page plus grande, découpée en tuiles qui se chevauchent.
+Retranscris uniquement ce qui est visible, y compris les lignes coupées au bord.
 
+"""
 
-def _parse_exercise_response(text: str) -> ExerciseOCRResult:
-    """Parse la réponse structurée du modèle pour un exercice."""
-    lines = text.strip().split("\n")
-    result = {
-        "subject": "Inconnu",
-        "exercise_type": "Exercice",
-        "student_work_detected": False,
-    }
+# Nombre max de lignes comparées dans la zone de chevauchement entre deux tuiles
+_MAX_OVERLAP_LINES = 12
+
+
+def _normalize_line(line: str) -> str:
+    return " ".join(line.lower().split())
+
+
+def _lines_match(a: str, b: str) -> bool:
+    """Égalité tolérante : le modèle ne retranscrit pas toujours une ligne à l'identique."""
+    a, b = _normalize_line(a), _normalize_line(b)
+    if a == b:
+        return True
+    return len(a) > 8 and len(b) > 8 and SequenceMatcher(None, a, b, autojunk=False).ratio() >= 0.85
+
+
+def _overlap_length(previous: list[str], following: list[str]) -> int:
+    """Plus grand k tel que les k dernières lignes de `previous` = les k premières de `following`."""
+    for k in range(min(len(previous), len(following), _MAX_OVERLAP_LINES), 0, -1):
+        if k == 1 and len(_normalize_line(previous[-1])) < 15:
+            continue  # Une ligne courte isolée (« Exemple », « 1. ») n'est pas une preuve de chevauchement
+        if all(_lines_match(a, b) for a, b in zip(previous[-k:], following[:k])):
+            return k
+    return 0
+
+
+def merge_tile_transcripts(transcripts: list[str]) -> str:
+    """
+    Fusionne les transcriptions de tuiles consécutives en supprimant les lignes
+    dupliquées par le chevauchement. Une ligne coupée au bord d'une tuile est
+    remplacée par sa version complète dans la tuile suivante.
+    """
+    merged: list[str] = []
+    for transcript in transcripts:
+        lines = transcript.strip().split("\n")
+        if not merged:
+            merged = lines
+            continue
+        previous = [line for line in merged if line.strip()]
+        following = [line for line in lines if line.strip()]
+        overlap = _overlap_length(previous, following)
+        if not overlap and len(previous) > 1 and len(following) > 1:
+            # Dernière ligne de la tuile précédente tronquée par le bord
+            overlap = _overlap_length(previous[:-1], following)
+            if overlap:
+                _drop_last_nonblank(merged)
+        if overlap:
+            # Texte continu d'une tuile à l'autre : pas de saut de paragraphe ajouté
+            merged = merged + _drop_first_nonblank(lines, overlap)
+        else:
+            merged = merged + [""] + lines
+    return "\n".join(merged).strip()
+
+
+def _drop_last_nonblank(lines: list[str]) -> None:
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if lines:
+        lines.pop()
+
+
+def _drop_first_nonblank(lines: list[str], count: int) -> list[str]:
+    index = 0
+    while count and index < len(lines):
+        if lines[index].strip():
+            count -= 1
+        index += 1
+    return lines[index:]
+
+
+def _first_known(values: list[str], unknown: str) -> str:
+    return next((v for v in values if v and v != unknown), unknown)
+
+
+def _merge_course_results(parts: list[CourseOCRResult], content: str) -> CourseOCRResult:
+    """En-têtes du premier morceau qui les connaît, mots-clés réunis (10 max)."""
+    keywords: list[str] = []
+    for part in parts:
+        keywords.extend(k for k in part.keywords if k.lower() not in {kw.lower() for kw in keywords})
 
-    statement_lines: list[str] = []
-    in_statement = False
-
-    for line in lines:
-        if line.startswith("MATIERE:"):
-            result["subject"] = line.replace("MATIERE:", "").strip()
-        elif line.startswith("TYPE:"):
-            result["exercise_type"] = line.replace("TYPE:", "").strip()
-        elif line.startswith("TRAVAIL_ELEVE:"):
-            val = line.replace("TRAVAIL_ELEVE:", "").strip().lower()
-            result["student_work_detected"] = val.startswith("oui")
-        elif line.startswith("ENONCE:"):
-            in_statement = True
-        elif in_statement:
-            statement_lines.append(line)
-
-    statement = "\n".join(statement_lines).strip()
-
-    return ExerciseOCRResult(
-        subject=result["subject"],
-        exercise_type=result["exercise_type"],
-        statement=statement,
-        raw_text=text,
-        student_work_detected=result["student_work_detected"],
+    return CourseOCRResult(
+        title=_first_known([p.title for p in parts], "Sans titre"),
+        subject=_first_known([p.subject for p in parts], "Inconnu"),
+        level=_first_known([p.level for p in parts], "Inconnu"),
+        content=content,
+        keywords=keywords[:10],
+        raw_text=json.dumps([json.loads(p.raw_text) for p in parts], ensure_ascii=False),
     )
 
 
-async def extract_course_from_image(image_bytes: bytes) -> CourseOCRResult:
-    """Extrait le contenu d'une image de cours via Claude Vision."""
-    image_data, media_type = _image_to_base64(image_bytes)
+def _merge_course_tiles(parts: list[CourseOCRResult]) -> CourseOCRResult:
+    """Reconstitue un seul résultat de cours à partir des tuiles."""
+    return _merge_course_results(parts, merge_tile_transcripts([p.content for p in parts]))
+
+
+async def _course_tiles(image_bytes: bytes, tiled: bool | None) -> list[NormalizedImage]:
+    """Tuiles à OCRiser séparément, ou liste vide pour un appel unique."""
+    if tiled is False or (tiled is None and not settings.ocr_tiling_enabled):
+        return []
+    return await run_preprocessing(split_into_tiles, image_bytes, tiled is True)
+
+
+async def _tiled_course_ocr(tiles: list[NormalizedImage]) -> CourseOCRResult:
+    """
+    OCR des tuiles en parallèle (au plus settings.ocr_tile_concurrency appels
+    simultanés), puis fusion en un seul résultat.
+    """
+    semaphore = asyncio.Semaphore(settings.ocr_tile_concurrency)
+
+    async def run(index: int, tile: NormalizedImage) -> CourseOCRResult:
+        prompt = TILE_PROMPT_PREFIX.format(index=index + 1, count=len(tiles)) + COURSE_OCR_PROMPT
+        async with semaphore:
+            return await _ocr_result("course", tile, prompt, max_tokens=4096)
+
+    logger.info("[OCR] mode tuiles : %d tuiles", len(tiles))
+    parts = await asyncio.gather(*(run(i, tile) for i, tile in enumerate(tiles)))
+    return _merge_course_tiles(parts)
+
+
+async def extract_course_from_image(
+    image_bytes: bytes,
+    user_id: str | None = None,
+    tiled: bool | None = None,
+) -> CourseOCRResult:
+    """
+    Extrait le contenu d'une image de cours via Claude Vision (avec cache).
+
+    Args:
+        tiled: True force l'OCR par tuiles, False l'interdit ; None laisse
+            décider settings.ocr_tiling_enabled et la taille/densité de l'image
+    """
+    async def run(image: NormalizedImage) -> CourseOCRResult:
+        tiles = await _course_tiles(image_bytes, tiled)
+        if tiles:
+            return await _tiled_course_ocr(tiles)
+        return await _ocr_result("course", image, COURSE_OCR_PROMPT, max_tokens=4096)
+
+    return await _cached_ocr("course", image_bytes, user_id, run)
+
+
+# ── Cours sur plusieurs pages ─────────────────────────────────────────────────
+
+_SENTENCE_END = ".!?:;»)]"
+
+
+def page_separator(previous: str, following: str) -> str:
+    """
+    Jointure entre deux pages consécutives : une phrase coupée par le bas de
+    page (pas de ponctuation finale, page suivante en minuscule) continue le
+    même paragraphe ; sinon la page suivante ouvre un nouveau paragraphe.
+    """
+    previous, following = previous.rstrip(), following.lstrip()
+    if previous and following[:1].islower() and previous[-1] not in _SENTENCE_END:
+        return " "
+    return "\n\n"
+
+
+def merge_course_pages(pages: list[CourseOCRResult]) -> CourseOCRResult:
+    """Réunit les pages d'un même cours, dans l'ordre, en un seul résultat."""
+    content = ""
+    for page in pages:
+        text = page.content.strip()
+        if text:
+            content = content + page_separator(content, text) + text if content else text
+    return _merge_course_results(pages, content)
+
+
+# ── Routage par niveau de modèle (exercices) ─────────────────────────────────
+
+_UNREADABLE = re.compile(r"\[\s*illisible", re.IGNORECASE)
+
+
+def _fast_tier_rejection(
+    response: anthropic.types.Message,
+    result: ExerciseOCRResult | None,
+) -> str | None:
+    """
+    Vérifie la réponse du modèle rapide ; retourne la raison d'escalade, ou
+    None si la transcription peut être utilisée telle quelle.
+    """
+    if response.stop_reason == "max_tokens":
+        return "truncated"
+    if result is None:
+        return "parse_failure"
+    if not result.statement:
+        return "empty_statement"
+    if len(result.statement) < settings.ocr_fast_min_statement_chars:
+        return "too_short"
+    if _UNREADABLE.search(result.statement):
+        return "unreadable"
+    confidence = _tool_input(response, EXERCISE_FAST_TOOL["name"])[0].get("confidence")
+    if not isinstance(confidence, (int, float)) or isinstance(confidence, bool):
+        return "parse_failure"
+    if confidence < settings.ocr_fast_min_confidence:
+        return "low_confidence"
+    return None
+
+
+async def _tiered_exercise_ocr(image: NormalizedImage) -> ExerciseOCRResult:
+    """
+    Modèle rapide d'abord (auto-évaluation + contrôle de structure) ; escalade
+    vers settings.vision_model sur faible confiance, énoncé vide ou sortie invalide.
+    Le modèle rapide n'a pas droit à la relance : l'escalade en tient lieu.
+    """
+    fast_model = settings.ocr_fast_model or settings.evaluator_model
+    try:
+        result, response, _ = await _structured_ocr(
+            "exercise", image, EXERCISE_FAST_OCR_PROMPT, max_tokens=2048, tool=EXERCISE_FAST_TOOL,
+            model=fast_model, tier="fast", timeout=settings.ocr_fast_timeout_s, repair=False,
+        )
+        reason = _fast_tier_rejection(response, result)
+    except (anthropic.APIError, TimeoutError) as e:
+        logger.warning("[OCR] modèle rapide en échec, escalade: %s", e)
+        reason = "error"
+
+    if reason is None:
+        logger.info("[OCR] exercice lu par le modèle rapide (%s)", fast_model)
+        return result
+
+    OCR_ESCALATIONS.inc(reason=reason)
+    logger.info("[OCR] escalade vers %s : %s", settings.vision_model, reason)
+    return await _ocr_result("exercise", image, EXERCISE_OCR_PROMPT, max_tokens=2048)
+
+
+async def extract_exercise_from_image(image_bytes: bytes, user_id: str | None = None) -> ExerciseOCRResult:
+    """Extrait l'énoncé d'une image d'exercice via Claude Vision (avec cache et routage par tier)."""
+    async def run(image: NormalizedImage) -> ExerciseOCRResult:
+        if settings.ocr_tiered_enabled:
+            return await _tiered_exercise_ocr(image)
+        return await _ocr_result("exercise", image, EXERCISE_OCR_PROMPT, max_tokens=2048)
+
+    return await _cached_ocr("exercise", image_bytes, user_id, run)
+
+
+# ── OCR de cours en streaming ─────────────────────────────────────────────────
 
-    response = client.messages.create(
+@dataclass
+class CourseStreamEvent:
+    """
+    Événement émis pendant l'OCR en streaming d'un cours :
+    - "headers" : titre / matière / niveau connus (result partiel, sans contenu)
+    - "block"   : un paragraphe du contenu terminé
+    - "done"    : fin de génération, result complet et validé
+    - "replace" : fin de génération, result complet et validé qui remplace
+      en-têtes et blocs déjà émis (sortie corrigée, ou différente de ce qui
+      a été streamé) ; tient lieu de "done"
+    """
+    kind: Literal["headers", "block", "done", "replace"]
+    result: CourseOCRResult | None = None
+    block: str = ""
+
+
+class _CourseStreamParser:
+    """
+    Lit l'entrée JSON de l'outil enregistrer_cours au fil des deltas
+    (input_json_delta). Le JSON partiel est reparsé, chaînes incomplètes
+    comprises, uniquement quand un delta peut terminer un paragraphe ou un
+    champ (retour à la ligne ou guillemet) : les en-têtes sont émis dès que
+    le champ content commence, puis chaque paragraphe dès qu'il est terminé.
+    """
+
+    def __init__(self) -> None:
+        self._json = ""
+        self._content = ""   # Contenu streamé jusqu'ici
+        self._headers: tuple[str, str, str] | None = None
+        self.headers_sent = False
+        self._content_done = False
+        self.blocks_emitted = 0
+        self._paragraphs = ParagraphSplitter()
+
+    def _snapshot(self) -> dict:
+        try:
+            value = from_json(self._json.encode(), partial_mode="trailing-strings")
+        except ValueError:
+            return {}  # Séquence d'échappement coupée : le delta suivant la complètera
+        return value if isinstance(value, dict) else {}
+
+    def _blocks(self, blocks: list[str]) -> list[CourseStreamEvent]:
+        self.blocks_emitted += len(blocks)
+        return [CourseStreamEvent(kind="block", block=b) for b in blocks]
+
+    def feed(self, partial_json: str) -> list[CourseStreamEvent]:
+        self._json += partial_json
+        if self._content_done or not ("\\" in partial_json or '"' in partial_json):
+            return []
+        snapshot = self._snapshot()
+        content = snapshot.get("content")
+        if not isinstance(content, str):
+            return []
+
+        events: list[CourseStreamEvent] = []
+        if not self.headers_sent:
+            self.headers_sent = True
+            defaults = _DEFAULTS["course"]
+            headers = CourseOCRResult(
+                title=str(snapshot.get("title") or defaults["title"]),
+                subject=str(snapshot.get("subject") or defaults["subject"]),
+                level=str(snapshot.get("level") or defaults["level"]),
+                content="", keywords=[], raw_text="",
+            )
+            events.append(CourseStreamEvent(kind="headers", result=headers))
+            self._headers = (headers.title, headers.subject, headers.level)
+
+        if len(content) > len(self._content):
+            events.extend(self._blocks(self._paragraphs.feed(content[len(self._content):])))
+            self._content = content
+        if "keywords" in snapshot:
+            # Le champ suivant a commencé : le contenu est complet
+            self._content_done = True
+            events.extend(self._blocks(self._paragraphs.flush()))
+        return events
+
+    def finish(self, result: CourseOCRResult, repaired: bool = False) -> list[CourseStreamEvent]:
+        """
+        Fin de génération : derniers paragraphes, puis le résultat validé.
+
+        Le stream n'est prolongé que si le résultat validé commence par ce qui
+        a été émis. Sortie corrigée (repaired), en-têtes émis différents (lus
+        avant leur champ, le modèle ne suit pas toujours l'ordre du schéma) ou
+        contenu réécrit : un seul "replace" porte le cours complet.
+        """
+        if not self.headers_sent:
+            return _replay_course(result)
+        streamed = self._content.lstrip()   # Le contenu validé est strippé
+        if self._content_done:
+            consistent = result.content == streamed.rstrip()
+        else:
+            consistent = result.content.startswith(streamed) or result.content == streamed.rstrip()
+        if repaired or not consistent or self._headers != (result.title, result.subject, result.level):
+            return [CourseStreamEvent(kind="replace", result=result)]
+
+        events: list[CourseStreamEvent] = []
+        if not self._content_done:
+            events.extend(self._blocks(self._paragraphs.feed(result.content[len(streamed):])))
+            events.extend(self._blocks(self._paragraphs.flush()))
+        events.append(CourseStreamEvent(kind="done", result=result))
+        return events
+
+
+def _replay_course(result: CourseOCRResult) -> list[CourseStreamEvent]:
+    """Rejoue un résultat complet (cache, tuiles, relance) sous forme d'événements de stream."""
+    headers = CourseOCRResult(
+        title=result.title, subject=result.subject, level=result.level,
+        content="", keywords=[], raw_text="",
+    )
+    splitter = ParagraphSplitter()
+    blocks = splitter.feed(result.content) + splitter.flush()
+    events = [CourseStreamEvent(kind="headers", result=headers)]
+    events.extend(CourseStreamEvent(kind="block", block=b) for b in blocks)
+    events.append(CourseStreamEvent(kind="done", result=result))
+    return events
+
+
+async def stream_course_from_image(
+    image_bytes: bytes,
+    user_id: str | None = None,
+    tiled: bool | None = None,
+) -> AsyncIterator[CourseStreamEvent]:
+    """
+    OCR d'un cours via l'API Messages en streaming : les paragraphes du contenu
+    sont émis dès qu'ils sont terminés, pendant que le modèle génère la suite.
+    Les en-têtes (titre, matière, niveau) précèdent toujours le premier bloc.
+
+    En mode tuiles, les tuiles sont lues en parallèle puis le résultat fusionné
+    est rejoué sous forme d'événements. Si la sortie streamée est invalide, la
+    relance ciblée est faite sans streaming et son résultat arrive en un seul
+    événement "replace" (de même si le résultat validé diffère de ce qui a
+    été streamé) : le consommateur repart de ce cours complet.
+    """
+    cached, sha256, image = await _lookup_cache("course", image_bytes, user_id)
+    if cached is not None:
+        for event in _replay_course(CourseOCRResult(**cached)):
+            yield event
+        return
+
+    tiles = await _course_tiles(image_bytes, tiled)
+    if tiles:
+        start = time.perf_counter()
+        result = await _tiled_course_ocr(tiles)
+        ocr_cache.record_miss_latency("course", time.perf_counter() - start)
+        await _store_cache("course", sha256, image, user_id, result)
+        for event in _replay_course(result):
+            yield event
+        return
+
+    parser = _CourseStreamParser()
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    deadline = loop.time() + settings.ocr_timeout_s
+    async with client.messages.stream(
         model=settings.vision_model,
         max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": image_data,
-                        },
-                    },
-                    {"type": "text", "text": COURSE_OCR_PROMPT},
-                ],
-            }
-        ],
-    )
-
-    raw_text = response.content[0].text
-    return _parse_course_response(raw_text)
-
-
-async def extract_exercise_from_image(image_bytes: bytes) -> ExerciseOCRResult:
-    """Extrait l'énoncé d'une image d'exercice via Claude Vision."""
-    image_data, media_type = _image_to_base64(image_bytes)
+        messages=_vision_messages(image, COURSE_OCR_PROMPT),
+        **_tool_params(COURSE_TOOL),
+    ) as stream:
+        stream_events = stream.__aiter__()
+        while True:
+            # Le délai ne couvre que l'attente du modèle, pas le traitement des blocs
+            try:
+                async with asyncio.timeout_at(deadline):
+                    stream_event = await stream_events.__anext__()
+            except StopAsyncIteration:
+                break
+            except TimeoutError:
+                raise _ocr_timeout_error() from None
+            if stream_event.type == "input_json":
+                for event in parser.feed(stream_event.partial_json):
+                    yield event
+        final = await stream.get_final_message()
+
+    elapsed = time.perf_counter() - start
+    _record_usage("vision", settings.vision_model, final.usage, elapsed)
+    ocr_cache.record_miss_latency("course", elapsed)
+
+    result, errors = _validate_response("course", final, COURSE_TOOL, "vision", "initial")
+    repaired = bool(errors)
+    if errors:
+        result, _, errors = await _repair_ocr("course", final, COURSE_TOOL, errors, max_tokens=4096)
+        if result is None:
+            raise OCRValidationError("course", errors)
+
+    await _store_cache("course", sha256, image, user_id, result)
+    for event in parser.finish(result, repaired):
+        yield event
+
+
+# ── OCR de cours par Message Batches (import en masse) ───────────────────────
+
+def course_request_params(image: NormalizedImage) -> dict:
+    """Paramètres Messages d'un OCR de cours, tels qu'envoyés dans une requête de batch."""
+    return {
+        "model": settings.vision_model,
+        "max_tokens": 4096,
+        "messages": _vision_messages(image, COURSE_OCR_PROMPT),
+        **_tool_params(COURSE_TOOL),
+    }
 
-    response = client.messages.create(
-        model=settings.vision_model,
-        max_tokens=2048,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": image_data,
-                        },
-                    },
-                    {"type": "text", "text": EXERCISE_OCR_PROMPT},
-                ],
-            }
-        ],
-    )
 
-    raw_text = response.content[0].text
-    return _parse_exercise_response(raw_text)
+async def prepare_course_image(
+    image_bytes: bytes,
+    user_id: str | None = None,
+) -> tuple[CourseOCRResult | None, str, NormalizedImage | None]:
+    """
+    Cache OCR d'abord ; sinon normalise l'image pour course_request_params.
+
+    Returns:
+        (résultat en cache ou None, sha256, image normalisée si calculée)
+    """
+    cached, sha256, image = await _lookup_cache("course", image_bytes, user_id)
+    return (CourseOCRResult(**cached) if cached is not None else None), sha256, image
+
+
+async def course_from_batch_message(message: anthropic.types.Message) -> CourseOCRResult:
+    """
+    Valide la réponse d'une requête de batch vers CourseOCRResult. La relance
+    ciblée éventuelle passe par l'API Messages classique (texte seul).
+
+    Raises:
+        OCRValidationError: structure inutilisable même après la relance
+    """
+    _record_usage(BATCH_TIER, settings.vision_model, message.usage, elapsed=None)
+    result, errors = _validate_response("course", message, COURSE_TOOL, BATCH_TIER, "initial")
+    if errors:
+        result, _, errors = await _repair_ocr("course", message, COURSE_TOOL, errors, max_tokens=4096)
+    if result is None:
+        raise OCRValidationError("course", errors)
+    return result
+
+
+async def store_course_result(sha256: str, phash: int | None, user_id: str | None, result: CourseOCRResult) -> None:
+    """Met en cache un résultat de batch : un upload ultérieur de la même photo ne repasse pas par Vision."""
+    if settings.ocr_cache_enabled and _has_text(result):
+        await ocr_cache.put("course", sha256, phash, user_id, asdict(result))
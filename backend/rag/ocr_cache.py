@@ -0,0 +1,188 @@
+"""
+Cache des résultats OCR — évite de repayer un appel Vision pour une image déjà lue.
+
+Deux clés :
+- SHA-256 des bytes de l'image : renvoi exact du même fichier (retry, re-soumission)
+- dHash de l'image normalisée : nouvelle photo de la même page. Limité aux
+  images du même élève pour ne jamais servir le cours d'un autre utilisateur.
+
+Deux niveaux :
+- LRU en mémoire (par process)
+- Table Postgres `ocr_cache` (partagée entre workers, survit aux redémarrages)
+
+Les résultats sont stockés sous forme de dict (dataclasses.asdict) : c'est
+rag.ocr qui reconstruit CourseOCRResult / ExerciseOCRResult.
+"""
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Literal
+
+from config import get_settings
+from db.client import get_supabase
+from metrics import counter
+from rag.preprocessing import PHASH_SIZE
+
+logger = logging.getLogger("studybuddy.ocr_cache")
+settings = get_settings()
+
+OCRKind = Literal["course", "exercise"]
+
+CACHE_LOOKUPS = counter("ocr_cache_lookups_total", "Recherches dans le cache OCR")
+CACHE_HITS = counter("ocr_cache_hits_total", "Résultats OCR servis depuis le cache (tier, match)")
+CACHE_TIME_SAVED = counter("ocr_cache_time_saved_seconds_total", "Latence Vision évitée (estimée)")
+
+
+@dataclass
+class _Entry:
+    kind: OCRKind
+    user_id: str | None
+    phash: int | None
+    result: dict
+
+
+def image_sha256(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _phash_to_bits(phash: int) -> str:
+    return format(phash, f"0{PHASH_SIZE * PHASH_SIZE}b")
+
+
+class OCRCache:
+    def __init__(self, max_entries: int, max_distance: int, persistent: bool) -> None:
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.persistent = persistent
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        # Latence Vision moyenne observée par type (moyenne glissante) — sert à estimer le temps gagné
+        self._avg_latency: dict[str, float] = {}
+
+    # ── Métriques ────────────────────────────────────────────────────────────
+
+    def record_miss_latency(self, kind: OCRKind, seconds: float) -> None:
+        previous = self._avg_latency.get(kind)
+        self._avg_latency[kind] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+    def _record_hit(self, kind: OCRKind, tier: str, match: str) -> None:
+        CACHE_HITS.inc(kind=kind, tier=tier, match=match)
+        CACHE_TIME_SAVED.inc(self._avg_latency.get(kind, 0.0), kind=kind)
+        logger.info("[OCR_CACHE] hit kind=%s tier=%s match=%s", kind, tier, match)
+
+    # ── LRU en mémoire ───────────────────────────────────────────────────────
+
+    def _remember(self, kind: OCRKind, sha256: str, entry: _Entry) -> None:
+        key = (kind, sha256)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _memory_exact(self, kind: OCRKind, sha256: str) -> dict | None:
+        entry = self._entries.get((kind, sha256))
+        if entry is None:
+            return None
+        self._entries.move_to_end((kind, sha256))
+        return entry.result
+
+    def _memory_similar(self, kind: OCRKind, phash: int, user_id: str) -> dict | None:
+        best: tuple[int, tuple[str, str]] | None = None
+        for key, entry in self._entries.items():
+            if entry.kind != kind or entry.user_id != user_id or entry.phash is None:
+                continue
+            distance = (entry.phash ^ phash).bit_count()
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, key)
+        if best is None:
+            return None
+        self._entries.move_to_end(best[1])
+        return self._entries[best[1]].result
+
+    # ── Tier Postgres ────────────────────────────────────────────────────────
+
+    def _db_exact(self, kind: OCRKind, sha256: str) -> dict | None:
+        result = (
+            get_supabase().table("ocr_cache")
+            .select("result")
+            .eq("kind", kind)
+            .eq("sha256", sha256)
+            .limit(1)
+            .execute()
+        )
+        return result.data[0]["result"] if result.data else None
+
+    def _db_similar(self, kind: OCRKind, phash: int, user_id: str) -> dict | None:
+        result = get_supabase().rpc("match_ocr_cache", {
+            "kind_filter": kind,
+            "user_id_filter": user_id,
+            "query_phash": _phash_to_bits(phash),
+            "max_distance": self.max_distance,
+        }).execute()
+        return result.data[0]["result"] if result.data else None
+
+    def _db_store(self, kind: OCRKind, sha256: str, entry: _Entry) -> None:
+        get_supabase().table("ocr_cache").upsert({
+            "kind": kind,
+            "sha256": sha256,
+            "user_id": entry.user_id,
+            "phash": _phash_to_bits(entry.phash) if entry.phash is not None else None,
+            "result": entry.result,
+        }, on_conflict="kind,sha256").execute()
+
+    async def _db_call(self, fn, *args):
+        """Les appels Supabase sont synchrones : exécutés hors boucle, erreurs non bloquantes."""
+        if not self.persistent:
+            return None
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            logger.warning("[OCR_CACHE] Postgres indisponible (%s): %s", fn.__name__, e)
+            return None
+
+    # ── API publique ─────────────────────────────────────────────────────────
+
+    async def get_exact(self, kind: OCRKind, sha256: str) -> dict | None:
+        """Recherche par SHA-256 des bytes bruts (avant tout décodage d'image)."""
+        CACHE_LOOKUPS.inc(kind=kind)
+        result = self._memory_exact(kind, sha256)
+        if result is not None:
+            self._record_hit(kind, "memory", "exact")
+            return result
+
+        result = await self._db_call(self._db_exact, kind, sha256)
+        if result is not None:
+            self._remember(kind, sha256, _Entry(kind=kind, user_id=None, phash=None, result=result))
+            self._record_hit(kind, "postgres", "exact")
+        return result
+
+    async def get_similar(self, kind: OCRKind, sha256: str, phash: int | None, user_id: str | None) -> dict | None:
+        """Recherche perceptuelle (dHash), restreinte aux images du même élève."""
+        if phash is None or user_id is None:
+            return None
+
+        result = self._memory_similar(kind, phash, user_id)
+        tier = "memory"
+        if result is None:
+            result = await self._db_call(self._db_similar, kind, phash, user_id)
+            tier = "postgres"
+        if result is None:
+            return None
+
+        # Le nouvel SHA-256 pointe désormais aussi vers ce résultat
+        self._remember(kind, sha256, _Entry(kind=kind, user_id=user_id, phash=phash, result=result))
+        self._record_hit(kind, tier, "perceptual")
+        return result
+
+    async def put(self, kind: OCRKind, sha256: str, phash: int | None, user_id: str | None, result: dict) -> None:
+        entry = _Entry(kind=kind, user_id=user_id, phash=phash, result=result)
+        self._remember(kind, sha256, entry)
+        await self._db_call(self._db_store, kind, sha256, entry)
+
+
+ocr_cache = OCRCache(
+    max_entries=settings.ocr_cache_max_entries,
+    max_distance=settings.ocr_cache_phash_max_distance,
+    persistent=settings.ocr_cache_persistent,
+)
@@ -0,0 +1,368 @@
+"""
+Prétraitement des images avant l'OCR Claude Vision.
+
+Une photo de téléphone (12 MP, 3-8 Mo) est redimensionnée par l'API de toute
+façon : l'envoyer brute ne coûte que de la bande passante et de la latence.
+Étapes :
+- Rotation selon l'orientation EXIF (photos prises en mode portrait)
+- Réduction du grand côté à la résolution utile du modèle
+- Conversion optionnelle en niveaux de gris (pages de texte)
+- Ré-encodage WebP/JPEG à la qualité configurée
+
+Les photos HEIC/HEIF (iPhone) sont décodées via pillow-heif dans un pool de
+processus : le décodage HEVC est lourd et ne doit pas occuper la boucle
+d'événements ni le GIL du process API.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import TypeVar
+
+from PIL import Image, ImageFilter, ImageOps
+
+from config import get_settings
+
+logger = logging.getLogger("studybuddy.preprocessing")
+settings = get_settings()
+
+try:
+    from pillow_heif import register_heif_opener
+
+    register_heif_opener()
+    HEIF_SUPPORTED = True
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    HEIF_SUPPORTED = False
+    logger.warning("[PREPROCESS] pillow-heif absent : les photos HEIC seront refusées")
+
+T = TypeVar("T")
+
+# Limites appliquées côté API avant tokenisation (cf. doc Anthropic Vision)
+API_MAX_LONG_EDGE = 1568
+API_MAX_PIXELS = 1_150_000
+PIXELS_PER_TOKEN = 750
+
+PHASH_SIZE = 16  # dHash 16x16 = 256 bits
+_INK_TABLE = [255 if level < 128 else 0 for level in range(256)]  # pixels sombres = encre
+
+_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+_SAVE_OPTIONS = {
+    "WEBP": {"method": 4},
+    "JPEG": {"optimize": True},
+}
+_API_FORMATS = {"JPEG", "PNG", "WEBP"}
+# Marques ISO-BMFF (boîte ftyp) des fichiers HEIC/HEIF produits par les iPhone
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"}
+_EXIF_ORIENTATION = 0x0112
+
+
+@dataclass
+class NormalizedImage:
+    data: bytes
+    media_type: str
+    width: int
+    height: int
+    original_bytes: int
+    original_tokens: int
+    tokens: int
+    phash: int | None = None
+    region: tuple[float, float, float, float] | None = None  # Tuile : (x0, y0, x1, y1) en fraction de la page
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+class UnsupportedImageError(ValueError):
+    """Image qu'il est inutile d'envoyer au modèle (format non décodable)."""
+
+
+def is_heif(image_bytes: bytes) -> bool:
+    return image_bytes[4:8] == b"ftyp" and image_bytes[8:12] in _HEIF_BRANDS
+
+
+def sniff_media_type(image_bytes: bytes) -> str:
+    """Détection basique du format par magic bytes."""
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if image_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"  # fallback
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Estime les tokens image facturés, après le redimensionnement fait par l'API."""
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, API_MAX_LONG_EDGE / max(width, height))
+    scale = min(scale, (API_MAX_PIXELS / (width * height)) ** 0.5)
+    return int((width * scale) * (height * scale) / PIXELS_PER_TOKEN)
+
+
+def perceptual_hash(image: Image.Image, hash_size: int = PHASH_SIZE) -> int:
+    """
+    dHash adapté aux pages de texte : compare la luminosité de pixels voisins
+    sur une vignette (hash_size + 1) x hash_size.
+
+    Avant le hash, l'image est recadrée sur la zone imprimée et floutée pour
+    que les lignes de texte deviennent des bandes : deux photos de la même page
+    (cadrage, exposition différents) restent proches en distance de Hamming,
+    alors qu'un dHash brut confond facilement deux pages d'un même manuel.
+    """
+    gray = image.convert("L")
+    gray.thumbnail((512, 512))
+    gray = ImageOps.autocontrast(gray, cutoff=1)
+    bbox = gray.point(_INK_TABLE).getbbox()
+    if bbox:
+        gray = gray.crop(bbox)
+    gray = gray.filter(ImageFilter.BoxBlur(2))
+
+    thumb = gray.resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = thumb.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _resize_to_long_edge(image: Image.Image, max_long_edge: int) -> Image.Image:
+    long_edge = max(image.size)
+    if long_edge <= max_long_edge:
+        return image
+    ratio = max_long_edge / long_edge
+    size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+def _flatten(image: Image.Image, grayscale: bool) -> Image.Image:
+    """Convertit en RGB (fond blanc pour la transparence) ou en niveaux de gris."""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    if grayscale:
+        return image.convert("L")
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def _encode(image: Image.Image) -> tuple[bytes, str]:
+    """Ré-encode au format et à la qualité configurés ; retourne (bytes, media type)."""
+    pil_format, media_type = _FORMATS.get(settings.ocr_output_format, _FORMATS["webp"])
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, quality=settings.ocr_output_quality, **_SAVE_OPTIONS[pil_format])
+    return buffer.getvalue(), media_type
+
+
+def normalize_image(
+    image_bytes: bytes,
+    grayscale: bool | None = None,
+    max_long_edge: int | None = None,
+) -> NormalizedImage:
+    """
+    Normalise une image pour l'OCR : EXIF → resize → gris optionnel → ré-encodage.
+
+    Si l'image ne peut pas être décodée, ou si le ré-encodage n'apporte rien,
+    les bytes d'origine sont renvoyés tels quels.
+
+    Args:
+        image_bytes: Image brute uploadée
+        grayscale: Force/désactive la conversion en gris (défaut : settings)
+        max_long_edge: Grand côté max en pixels (défaut : settings)
+    """
+    _grayscale = settings.ocr_grayscale if grayscale is None else grayscale
+    _max_long_edge = max_long_edge or settings.ocr_max_long_edge
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as source:
+            original_size = source.size
+            source_format = source.format
+            rotated = source.getexif().get(_EXIF_ORIENTATION, 1) != 1
+            if source.format == "JPEG":
+                # Décodage JPEG directement à l'échelle 1/2, 1/4… : bien plus rapide
+                ratio = min(1.0, _max_long_edge / max(original_size))
+                source.draft("RGB", (int(original_size[0] * ratio), int(original_size[1] * ratio)))
+            image = ImageOps.exif_transpose(source)
+            image = _resize_to_long_edge(image, _max_long_edge)
+            image = _flatten(image, _grayscale)
+
+            phash = perceptual_hash(image)
+            encoded, media_type = _encode(image)
+    except Exception as e:
+        if is_heif(image_bytes):
+            # L'API n'accepte pas le HEIC : l'envoyer brut ferait échouer l'appel Vision
+            raise UnsupportedImageError("Photo HEIC illisible. Réessaie en JPEG (Réglages → Appareil photo → Formats → Le plus compatible).") from e
+        logger.warning("[PREPROCESS] image non décodable, envoi brut: %s", e)
+        return NormalizedImage(
+            data=image_bytes,
+            media_type=sniff_media_type(image_bytes),
+            width=0,
+            height=0,
+            original_bytes=len(image_bytes),
+            original_tokens=0,
+            tokens=0,
+        )
+
+    original_tokens = estimate_image_tokens(*original_size)
+
+    # Image déjà compacte et non modifiée : inutile de perdre en qualité
+    unchanged = image.size == original_size and not (_grayscale or rotated)
+    if unchanged and source_format in _API_FORMATS and len(encoded) >= len(image_bytes):
+        return NormalizedImage(
+            data=image_bytes,
+            media_type=sniff_media_type(image_bytes),
+            width=original_size[0],
+            height=original_size[1],
+            original_bytes=len(image_bytes),
+            original_tokens=original_tokens,
+            tokens=original_tokens,
+            phash=phash,
+        )
+
+    return NormalizedImage(
+        data=encoded,
+        media_type=media_type,
+        width=image.width,
+        height=image.height,
+        original_bytes=len(image_bytes),
+        original_tokens=original_tokens,
+        tokens=estimate_image_tokens(image.width, image.height),
+        phash=phash,
+    )
+
+
+# ── Découpe en tuiles (pages denses, doubles pages) ──────────────────────────
+
+def text_line_count(image: Image.Image) -> int:
+    """
+    Estime le nombre de lignes de texte par profil de projection horizontal :
+    chaque bande de lignes de pixels contenant de l'encre compte pour une ligne.
+    """
+    width, height = 32, 1024
+    gray = ImageOps.autocontrast(image.convert("L"), cutoff=1)
+    pixels = gray.resize((width, height), Image.Resampling.BOX).tobytes()
+    count, previous = 0, False
+    for row in range(height):
+        has_ink = min(pixels[row * width:(row + 1) * width]) < 200
+        count += has_ink and not previous
+        previous = has_ink
+    return count
+
+
+def tile_grid(image: Image.Image, force: bool = False) -> tuple[int, int] | None:
+    """
+    Choisit une grille (colonnes, lignes) pour l'OCR par tuiles, ou None.
+    - Paysage (double page de manuel) → 2 colonnes, une par page
+    - Portrait dense (fiche de révision) → 2 bandes horizontales
+    """
+    width, height = image.size
+    landscape = width >= height * 1.2
+    if force:
+        return (2, 1) if landscape else (1, 2)
+    if max(width, height) < settings.ocr_tile_min_long_edge:
+        return None
+    if landscape:
+        return (2, 1)
+    if text_line_count(image) >= settings.ocr_tile_dense_min_lines:
+        return (1, 2)
+    return None
+
+
+def split_into_tiles(image_bytes: bytes, force: bool = False) -> list[NormalizedImage]:
+    """
+    Découpe une grande image en tuiles qui se chevauchent (settings.ocr_tile_overlap),
+    dans l'ordre de lecture. Chaque tuile est normalisée comme une image entière,
+    ce qui lui rend la résolution qu'un envoi en un seul morceau aurait perdue.
+
+    Retourne une liste vide si l'image ne justifie pas de découpe (ou n'est pas décodable).
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as source:
+            page = ImageOps.exif_transpose(source)
+            grid = tile_grid(page, force=force)
+            if grid is None:
+                return []
+            page = _flatten(page, settings.ocr_grayscale)
+    except Exception as e:
+        logger.warning("[PREPROCESS] découpe en tuiles impossible: %s", e)
+        return []
+
+    cols, rows = grid
+    width, height = page.size
+    tile_w, tile_h = width / cols, height / rows
+    margin_x, margin_y = tile_w * settings.ocr_tile_overlap, tile_h * settings.ocr_tile_overlap
+    original_tokens = estimate_image_tokens(width, height)
+
+    tiles: list[NormalizedImage] = []
+    for row in range(rows):
+        for col in range(cols):
+            box = (
+                max(0, int(col * tile_w - margin_x)),
+                max(0, int(row * tile_h - margin_y)),
+                min(width, int((col + 1) * tile_w + margin_x)),
+                min(height, int((row + 1) * tile_h + margin_y)),
+            )
+            tile = _resize_to_long_edge(page.crop(box), settings.ocr_max_long_edge)
+            encoded, media_type = _encode(tile)
+            tiles.append(NormalizedImage(
+                data=encoded,
+                media_type=media_type,
+                width=tile.width,
+                height=tile.height,
+                original_bytes=len(image_bytes),
+                original_tokens=original_tokens,
+                tokens=estimate_image_tokens(tile.width, tile.height),
+                region=(box[0] / width, box[1] / height, box[2] / width, box[3] / height),
+            ))
+    return tiles
+
+
+# ── Exécution hors boucle d'événements ───────────────────────────────────────
+
+_heif_pool: ProcessPoolExecutor | None = None
+
+
+def _get_heif_pool() -> ProcessPoolExecutor:
+    """Pool créé à la demande ; « spawn » évite de forker un process API multi-threadé."""
+    global _heif_pool
+    if _heif_pool is None:
+        _heif_pool = ProcessPoolExecutor(
+            max_workers=settings.heif_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _heif_pool
+
+
+async def run_preprocessing(fn: Callable[..., T], image_bytes: bytes, *args) -> T:
+    """
+    Exécute une étape de prétraitement (normalize_image, split_into_tiles…) hors
+    de la boucle : pool de processus pour le HEIC, thread pour les autres formats.
+    """
+    if is_heif(image_bytes):
+        if not HEIF_SUPPORTED:
+            raise UnsupportedImageError("Format HEIC non supporté par le serveur. Réessaie en JPEG.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_heif_pool(), fn, image_bytes, *args)
+    return await asyncio.to_thread(fn, image_bytes, *args)
+
+
+def shutdown_preprocessing() -> None:
+    """Arrête le pool HEIC (appelé à l'arrêt de l'application)."""
+    global _heif_pool
+    if _heif_pool is not None:
+        _heif_pool.shutdown(cancel_futures=True)
+        _heif_pool = None
@@ -0,0 +1,176 @@
+"""
+Contrôle qualité local d'une photo — avant de payer un appel Claude Vision.
+
+Mesures (sur une version réduite en niveaux de gris, ~1024 px) :
+- Résolution : petit côté de l'image d'origine
+- Netteté : variance du laplacien (NumPy) sur les zones écrites — proche de 0 si floue
+- Exposition : niveau du papier (percentile haut) et de l'encre (percentile bas)
+- Contraste : écart papier / encre
+
+Le percentile bas est pris à 0,1 % : une feuille d'exercice ne contient parfois
+que trois lignes d'encre, un percentile plus large ne verrait que du papier.
+
+Une photo JPEG 12 MP est analysée en 30-70 ms grâce au décodage réduit (draft).
+"""
+import io
+import logging
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+from config import get_settings
+from metrics import counter, histogram
+from rag.preprocessing import run_preprocessing
+
+logger = logging.getLogger("studybuddy.quality")
+settings = get_settings()
+
+ANALYSIS_LONG_EDGE = 1024
+_INK_PERCENTILE = 0.1
+_PAPER_PERCENTILE = 95
+_BLOCK = 64                 # Taille des blocs pour la netteté (px, à ANALYSIS_LONG_EDGE)
+_SHARPEST_BLOCKS = 0.05     # Fraction des blocs les plus nets retenue
+
+QUALITY_CHECKS = counter("image_quality_checks_total", "Photos passées au contrôle qualité (kind)")
+QUALITY_REJECTIONS = counter("image_quality_rejections_total", "Photos refusées avant OCR (kind, code)")
+QUALITY_DURATION = histogram(
+    "image_quality_check_seconds", "Durée du contrôle qualité",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+# Codes d'erreur renvoyés au client, avec un conseil concret pour reprendre la photo
+REJECTION_MESSAGES = {
+    "IMAGE_TOO_SMALL": "Photo trop petite pour être lue. Reprends-la plus près de la feuille, sans zoom numérique.",
+    "IMAGE_TOO_DARK": "Photo trop sombre. Rapproche-toi d'une fenêtre ou d'une lampe, ou active le flash.",
+    "IMAGE_OVEREXPOSED": "Photo surexposée : le texte est délavé. Évite le flash direct et les reflets sur la feuille.",
+    "IMAGE_LOW_CONTRAST": "Le texte est à peine visible. Vérifie que la feuille est bien cadrée et éclairée.",
+    "IMAGE_BLURRY": "Photo floue. Tiens le téléphone immobile et touche l'écran pour faire la mise au point.",
+}
+
+
+@dataclass
+class QualityReport:
+    width: int
+    height: int
+    sharpness: float       # Variance du laplacien
+    paper_level: float     # Luminance du fond (0-255)
+    ink_level: float       # Luminance des traits les plus sombres (0-255)
+    code: str | None = None
+
+    @property
+    def contrast(self) -> float:
+        return self.paper_level - self.ink_level
+
+    @property
+    def accepted(self) -> bool:
+        return self.code is None
+
+    @property
+    def message(self) -> str | None:
+        return REJECTION_MESSAGES.get(self.code) if self.code else None
+
+
+class ImageQualityError(ValueError):
+    """Photo refusée par le contrôle qualité — `code` est renvoyé tel quel au client."""
+
+    def __init__(self, report: QualityReport) -> None:
+        super().__init__(report.message)
+        self.report = report
+        self.code = report.code
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """
+    Variance du laplacien 4-voisins, mesurée par blocs de _BLOCK px : on garde
+    la moyenne des blocs les plus nets. Sur une feuille presque blanche, la
+    variance globale serait diluée par le papier et confondrait « peu de texte »
+    avec « flou ».
+    """
+    lap = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+    rows, cols = lap.shape[0] // _BLOCK, lap.shape[1] // _BLOCK
+    if rows == 0 or cols == 0:
+        return float(lap.var())
+    blocks = lap[:rows * _BLOCK, :cols * _BLOCK].reshape(rows, _BLOCK, cols, _BLOCK)
+    per_block = blocks.var(axis=(1, 3)).ravel()
+    top = max(1, int(per_block.size * _SHARPEST_BLOCKS))
+    return float(np.partition(per_block, -top)[-top:].mean())
+
+
+def _classify(report: QualityReport) -> str | None:
+    if min(report.width, report.height) < settings.quality_min_short_edge:
+        return "IMAGE_TOO_SMALL"
+    if report.paper_level < settings.quality_min_paper_level:
+        return "IMAGE_TOO_DARK"
+    if report.contrast < settings.quality_min_contrast:
+        # Fond saturé : c'est la lumière qui a effacé l'encre, pas la feuille qui est vide
+        if report.paper_level >= settings.quality_max_paper_level:
+            return "IMAGE_OVEREXPOSED"
+        return "IMAGE_LOW_CONTRAST"
+    if report.sharpness < settings.quality_min_sharpness:
+        return "IMAGE_BLURRY"
+    return None
+
+
+def assess_image_quality(image_bytes: bytes) -> QualityReport | None:
+    """
+    Mesure la qualité d'une photo. Retourne None si l'image n'est pas décodable :
+    ce cas est laissé au prétraitement OCR, qui sait déjà le gérer.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as source:
+            width, height = source.size
+            if source.format == "JPEG":
+                ratio = min(1.0, ANALYSIS_LONG_EDGE / max(width, height))
+                source.draft("L", (int(width * ratio), int(height * ratio)))
+            # Pas de rotation EXIF : toutes les mesures sont invariantes par rotation
+            image = source.convert("L")
+    except Exception as e:
+        logger.warning("[QUALITY] image non décodable, contrôle ignoré: %s", e)
+        return None
+
+    image.thumbnail((ANALYSIS_LONG_EDGE, ANALYSIS_LONG_EDGE), Image.Resampling.BILINEAR)
+    gray = np.asarray(image, dtype=np.float32)
+    ink_level, paper_level = np.percentile(gray, [_INK_PERCENTILE, _PAPER_PERCENTILE])
+
+    report = QualityReport(
+        width=width,
+        height=height,
+        sharpness=laplacian_variance(gray),
+        paper_level=float(paper_level),
+        ink_level=float(ink_level),
+    )
+    report.code = _classify(report)
+    return report
+
+
+async def check_image_quality(image_bytes: bytes, kind: str) -> QualityReport | None:
+    """
+    Contrôle qualité hors boucle d'événements (thread, ou pool HEIC).
+    Lève ImageQualityError si la photo doit être reprise.
+    """
+    if not settings.quality_gate_enabled:
+        return None
+
+    start = time.perf_counter()
+    report = await run_preprocessing(assess_image_quality, image_bytes)
+    elapsed = time.perf_counter() - start
+    QUALITY_DURATION.observe(elapsed, kind=kind)
+    QUALITY_CHECKS.inc(kind=kind)
+
+    if report is None:
+        return None
+
+    logger.info(
+        "[QUALITY] kind=%s %dx%d netteté=%.0f papier=%.0f encre=%.0f → %s (%.0fms)",
+        kind, report.width, report.height, report.sharpness, report.paper_level, report.ink_level,
+        report.code or "OK", elapsed * 1000,
+    )
+    if not report.accepted:
+        QUALITY_REJECTIONS.inc(kind=kind, code=report.code)
+        raise ImageQualityError(report)
+    return report
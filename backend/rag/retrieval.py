@@ -1,13 +1,30 @@
 """
 Retrieval module — recherche vectorielle dans pgvector via Supabase.
+
+Les embeddings sont partagés entre chunks de même corps (table
+chunk_embeddings, migration 011) : une page photographiée deux fois n'est
+stockée et indexée qu'une fois, et la recherche ne renvoie qu'un chunk par
+corps distinct.
+
+Recherche en deux temps : les chunks (feuilles) les plus proches de la
+requête, puis, quand plusieurs d'entre eux viennent de la même section du
+cours et que cette section reste courte, la section entière à leur place —
+un contexte cohérent pour le spécialiste, sans extraits qui se recouvrent.
 """
+import asyncio
+import logging
 from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 
 from db.client import get_supabase
-from rag.embeddings import embed_query
+from rag.chunking import chunk_body_hash, chunk_content_hash, estimate_tokens
+from rag.embeddings import embed_query_with_model, primary_model
 from config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger("studybuddy.retrieval")
+
+_HASH_LOOKUP = 100   # body_hash par requête sur chunk_embeddings
 
 
 @dataclass
@@ -18,48 +35,181 @@ class RetrievedChunk:
     similarity: float
     chunk_index: int
     course_id: str
+    section_index: int | None = None
+    section_heading: str | None = None  # Renseigné quand l'extrait est une section entière
+    copies: int = 1                     # Chunks de la bibliothèque qui partagent ce corps
 
 
 async def store_chunks(
     chunks_with_embeddings: list[tuple],
     user_id: str,
     course_id: str,
+    generation: int = 0,
 ) -> None:
     """
     Stocke les chunks et leurs embeddings dans Supabase/pgvector.
 
+    L'embedding est écrit une fois par corps de chunk dans chunk_embeddings
+    (upsert : un corps déjà présent dans la bibliothèque de l'élève est
+    partagé) ; les chunks n'en portent que le hash, le trigger de la
+    migration 011 tient le compteur de références.
+
     Args:
-        chunks_with_embeddings: Liste de (TextChunk, embedding)
+        chunks_with_embeddings: Liste de (TextChunk, embedding) ; embedding None
+            pour un corps déjà présent dans chunk_embeddings (rien à réécrire)
         user_id: ID de l'utilisateur
         course_id: ID du cours
+        generation: génération des chunks (fantôme pendant un re-chunking,
+            voir scripts/rechunk_courses.py)
     """
-    supabase = get_supabase()
+    shared, rows = build_chunk_rows(chunks_with_embeddings)
+    now = datetime.now(timezone.utc).isoformat()
+    shared = [{**row, "user_id": user_id, "updated_at": now} for row in shared]
+    rows = [{**row, "course_id": course_id, "user_id": user_id, "generation": generation} for row in rows]
+    await asyncio.to_thread(_insert_chunks, shared, rows)
+    bodies = len({row["body_hash"] for row in rows})
+    if bodies < len(rows):
+        logger.info("[RAG] course_id=%s : %d chunks, %d corps distincts", course_id, len(rows), bodies)
 
+
+def build_chunk_rows(chunks_with_embeddings: list[tuple]) -> tuple[list[dict], list[dict]]:
+    """
+    Lignes à écrire pour des (TextChunk, embedding) : un embedding par corps
+    distinct (chunk_embeddings) et une ligne par chunk (course_chunks), sans
+    les colonnes propres au cours. Un embedding None n'est pas réécrit.
+    """
     rows = []
+    embeddings: dict[str, list[float]] = {}
     for chunk, embedding in chunks_with_embeddings:
+        body_hash = chunk_body_hash(chunk.content, chunk.metadata.get("embedding_model") or primary_model())
+        if embedding is not None:
+            embeddings.setdefault(body_hash, embedding)
         rows.append(
             {
-                "course_id": course_id,
-                "user_id": user_id,
                 "content": chunk.content,
-                "embedding": embedding,
+                "content_hash": chunk_content_hash(chunk.content),
+                "body_hash": body_hash,
                 "chunk_index": chunk.chunk_index,
+                "section_index": chunk.metadata.get("section_index"),
                 "metadata": chunk.metadata,
             }
         )
+    shared = [{"body_hash": body_hash, "embedding": embedding} for body_hash, embedding in embeddings.items()]
+    return shared, rows
+
 
-    # Insertion par batch
+def _insert_chunks(shared: list[dict], rows: list[dict]) -> None:
+    """
+    Insertion par batch : les embeddings d'abord, référencés par les chunks.
+    Un embedding déjà stocké (même modèle, même corps) est conservé, comme
+    dans les RPC create_course_with_chunks et apply_course_edit.
+    """
+    supabase = get_supabase()
     BATCH_SIZE = 50
+    for i in range(0, len(shared), BATCH_SIZE):
+        supabase.table("chunk_embeddings").upsert(
+            shared[i : i + BATCH_SIZE], on_conflict="user_id,body_hash", ignore_duplicates=True
+        ).execute()
     for i in range(0, len(rows), BATCH_SIZE):
         batch = rows[i : i + BATCH_SIZE]
         supabase.table("course_chunks").insert(batch).execute()
 
 
+def stored_body_hashes(user_id: str, hashes: list[str]) -> set[str]:
+    """
+    body_hash déjà présents dans chunk_embeddings pour cet élève : leurs
+    chunks n'ont pas à être embeddés (même corps, même modèle, même vecteur).
+    """
+    found: set[str] = set()
+    for i in range(0, len(hashes), _HASH_LOOKUP):
+        result = (
+            get_supabase().table("chunk_embeddings")
+            .select("body_hash")
+            .eq("user_id", user_id)
+            .in_("body_hash", hashes[i : i + _HASH_LOOKUP])
+            .execute()
+        )
+        found.update(row["body_hash"] for row in result.data)
+    return found
+
+
+def _expand_sections(chunks: list[RetrievedChunk]) -> list[RetrievedChunk]:
+    """
+    Remplace les chunks d'une même section (au moins settings.section_expand_min_hits)
+    par la section entière, si elle ne dépasse pas settings.section_max_tokens.
+    L'ordre par similarité est conservé : la section prend la place de sa
+    meilleure feuille. Le total reste dans le budget en tokens des feuilles
+    trouvées : les feuilles les moins pertinentes cèdent leur place aux
+    sections, et sans place suffisante les feuilles sont renvoyées telles quelles.
+    """
+    groups: dict[tuple[str, int], list[RetrievedChunk]] = {}
+    for chunk in chunks:
+        if chunk.section_index is not None:
+            groups.setdefault((chunk.course_id, chunk.section_index), []).append(chunk)
+    candidates = {key: hits for key, hits in groups.items() if len(hits) >= settings.section_expand_min_hits}
+    if not candidates:
+        return chunks
+
+    result = (
+        get_supabase().table("course_sections")
+        .select("course_id, section_index, heading, content")
+        .in_("course_id", list({course_id for course_id, _ in candidates}))
+        .in_("section_index", list({index for _, index in candidates}))
+        .execute()
+    )
+    sections = {
+        (row["course_id"], row["section_index"]): row
+        for row in result.data
+        if (row["course_id"], row["section_index"]) in candidates
+        and estimate_tokens(row["content"]) <= settings.section_max_tokens
+    }
+
+    expanded: list[RetrievedChunk] = []
+    covered: set[tuple[str, int]] = set()
+    for chunk in chunks:
+        key = (chunk.course_id, chunk.section_index)
+        if key in covered:
+            continue
+        section = sections.get(key)
+        if section is None:
+            expanded.append(chunk)
+            continue
+        covered.add(key)
+        hits = candidates[key]
+        expanded.append(RetrievedChunk(
+            content=f"[{chunk.subject} — {chunk.course_title}]\n{section['content']}",
+            course_title=chunk.course_title,
+            subject=chunk.subject,
+            similarity=max(hit.similarity for hit in hits),
+            chunk_index=min(hit.chunk_index for hit in hits),
+            course_id=chunk.course_id,
+            section_index=chunk.section_index,
+            section_heading=section["heading"] or chunk.course_title,
+        ))
+
+    # Budget : jamais plus de tokens que les feuilles qu'on aurait envoyées
+    budget = sum(estimate_tokens(chunk.content) for chunk in chunks)
+    total = sum(estimate_tokens(chunk.content) for chunk in expanded)
+    while total > budget:
+        leaf = next((c for c in reversed(expanded) if c.section_heading is None), None)
+        if leaf is None:
+            return chunks
+        expanded.remove(leaf)
+        total -= estimate_tokens(leaf.content)
+
+    logger.info(
+        "[RAG] %d extraits → %d (%d section(s) entière(s)), tokens %d → %d",
+        len(chunks), len(expanded), len(covered), budget, total,
+    )
+    return expanded
+
+
 async def search_relevant_chunks(
     query: str,
     user_id: str,
     subject: str | None = None,
     top_k: int | None = None,
+    expand_sections: bool = True,
 ) -> list[RetrievedChunk]:
     """
     Recherche les chunks les plus pertinents pour une requête.
@@ -68,28 +218,29 @@ async def search_relevant_chunks(
         query: Texte de la requête (énoncé de l'exercice)
         user_id: ID de l'utilisateur (on cherche uniquement dans ses cours)
         subject: Filtre optionnel par matière
-        top_k: Nombre de résultats à retourner
+        top_k: Nombre de chunks recherchés
+        expand_sections: remplace les feuilles d'une même section par la section
 
     Returns:
-        Liste de chunks triés par similarité décroissante
+        Liste d'extraits (chunks ou sections) triés par similarité décroissante
     """
     _top_k = top_k or settings.retrieval_top_k
 
-    # Embed la requête
-    query_embedding = await embed_query(query)
-
-    supabase = get_supabase()
+    # Embed la requête ; seuls les cours embeddés par le même modèle sont comparables
+    query_embedding, embedding_model = await embed_query_with_model(query)
 
     # Appel à la fonction RPC pgvector définie dans la migration SQL
     params = {
         "query_embedding": query_embedding,
         "user_id_filter": user_id,
         "match_count": _top_k,
+        "embedding_model_filter": embedding_model,
     }
     if subject:
         params["subject_filter"] = subject
 
-    result = supabase.rpc("search_course_chunks", params).execute()
+    # Client Supabase synchrone : appels hors de la boucle d'événements
+    result = await asyncio.to_thread(lambda: get_supabase().rpc("search_course_chunks", params).execute())
 
     chunks: list[RetrievedChunk] = []
     for row in result.data:
@@ -101,13 +252,40 @@ async def search_relevant_chunks(
                 similarity=row["similarity"],
                 chunk_index=row["chunk_index"],
                 course_id=row["course_id"],
+                section_index=row.get("section_index"),
+                copies=row.get("copies") or 1,
             )
         )
 
-    return chunks
+    if not expand_sections:
+        return chunks
+    return await asyncio.to_thread(_expand_sections, chunks)
+
+
+def _purge_orphans(cutoff: str) -> int:
+    result = (
+        get_supabase().table("chunk_embeddings")
+        .delete()
+        .lte("ref_count", 0)
+        .lt("updated_at", cutoff)
+        .execute()
+    )
+    return len(result.data or [])
+
+
+async def purge_orphan_embeddings() -> int:
+    """
+    Supprime les embeddings partagés qu'aucun chunk ne référence plus depuis
+    settings.embedding_orphan_grace_minutes ; retourne leur nombre. Le délai
+    laisse à un chunk en cours d'insertion le temps de référencer un
+    embedding que la suppression d'un autre cours vient de libérer.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(minutes=settings.embedding_orphan_grace_minutes)).isoformat()
+    return await asyncio.to_thread(_purge_orphans, cutoff)
 
 
 async def delete_course_chunks(course_id: str) -> None:
     """Supprime tous les chunks d'un cours (lors de la suppression du cours)."""
-    supabase = get_supabase()
-    supabase.table("course_chunks").delete().eq("course_id", course_id).execute()
+    await asyncio.to_thread(
+        lambda: get_supabase().table("course_chunks").delete().eq("course_id", course_id).execute()
+    )
@@ -0,0 +1,5 @@
+"""
+Scripts d'exploitation, lancés depuis backend/ avec les variables d'environnement
+de l'application :
+    python -m scripts.backfill_courses --help
+"""
@@ -0,0 +1,354 @@
+"""
+Import en masse de photos de cours (onboarding d'une classe) via l'API
+Message Batches, au lieu de centaines d'appels à POST /api/cours/upload.
+
+    python -m scripts.backfill_courses photos/ --user-id <uuid>
+    python -m scripts.backfill_courses photos/ --user-id <uuid> --local   # substitut local du batch
+
+Étapes :
+1. Analyse : contrôle qualité, cache OCR et normalisation de chaque photo ;
+   les photos à lire partent en un seul batch (découpé au-delà de 200 Mo).
+2. Attente : le batch est interrogé jusqu'à la fin du traitement.
+3. Résultats : chaque sortie d'outil est validée (relance ciblée si besoin).
+4. Stockage : chunking, embedding par lots de 128 chunks, insertion des cours.
+
+Le checkpoint (JSON, réécrit atomiquement) garde les identifiants de batch,
+le statut de chaque photo et les résultats OCR : relancer la même commande
+après une interruption reprend là où elle s'est arrêtée, sans resoumettre ni
+refacturer les photos déjà lues. Les photos sont marquées comme envoyées
+avant la création du batch : si l'interruption survient avant que son
+identifiant soit connu, elles ne sont pas resoumises d'office (--retry-failed).
+
+Avec --local, le batch est exécuté par rag.batches.LocalMessageBatches
+(API Messages classique, état dans <checkpoint>.batches/).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import anthropic
+
+from db.client import get_supabase
+from rag import ocr
+from rag.batches import LocalMessageBatches
+from rag.chunking import chunk_course_sections
+from rag.embeddings import embed_chunks
+from rag.ingestion import IngestedCourse, save_course
+from rag.ocr import (
+    CourseOCRResult,
+    OCRValidationError,
+    course_from_batch_message,
+    course_request_params,
+    prepare_course_image,
+    store_course_result,
+)
+from rag.preprocessing import UnsupportedImageError, shutdown_preprocessing
+from rag.quality import ImageQualityError, check_image_quality
+
+logger = logging.getLogger("studybuddy.backfill")
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".heic", ".heif"}
+
+_MAX_BATCH_BYTES = 200 * 1024 * 1024   # Limite de l'API : 256 Mo par batch
+_SCAN_SLICE = 16                       # Photos analysées en parallèle
+_STORE_GROUP = 32                      # Cours embeddés et insérés ensemble
+
+# Statuts d'une photo dans le checkpoint
+PENDING = "pending"        # Analysée, requête pas encore soumise (oubliée à la reprise)
+SUBMITTING = "submitting"  # Envoyée, batch non confirmé (interruption pendant create)
+SUBMITTED = "submitted"    # Dans un batch en cours
+OCR_DONE = "ocr_done"      # Résultat OCR validé, en attente de stockage
+STORING = "storing"        # Insertion commencée (à refaire proprement à la reprise)
+STORED = "stored"
+DUPLICATE = "duplicate"    # Même photo qu'une autre du dossier
+REJECTED = "rejected"      # Refusée avant OCR (qualité, format)
+FAILED = "failed"          # Erreur du batch ou sortie inutilisable
+
+
+@dataclass
+class Checkpoint:
+    path: Path
+    user_id: str
+    batches: list[str] = field(default_factory=list)
+    collected: list[str] = field(default_factory=list)
+    items: dict[str, dict] = field(default_factory=dict)   # Chemin relatif → état de la photo
+
+    @classmethod
+    def load(cls, path: Path, user_id: str, retry_failed: bool = False) -> "Checkpoint":
+        if not path.exists():
+            return cls(path=path, user_id=user_id)
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data["user_id"] != user_id:
+            raise SystemExit(f"{path} appartient à l'utilisateur {data['user_id']}, pas à {user_id}")
+        dropped = {PENDING, SUBMITTING, FAILED} if retry_failed else {PENDING}
+        items = {p: item for p, item in data["items"].items() if item["status"] not in dropped}
+        unconfirmed = sum(item["status"] == SUBMITTING for item in items.values())
+        if unconfirmed:
+            logger.warning(
+                "[BACKFILL] %d photo(s) envoyée(s) sans batch confirmé (interruption) : non resoumises, "
+                "--retry-failed pour les relancer (au risque de les payer deux fois)", unconfirmed,
+            )
+        return cls(path=path, user_id=user_id, batches=data["batches"], collected=data["collected"], items=items)
+
+    def save(self) -> None:
+        data = {"user_id": self.user_id, "batches": self.batches, "collected": self.collected, "items": self.items}
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def by_custom_id(self) -> dict[str, dict]:
+        return {item["custom_id"]: item for item in self.items.values() if "custom_id" in item}
+
+    def counts(self) -> Counter:
+        return Counter(item["status"] for item in self.items.values())
+
+
+# ── 1. Analyse et soumission ─────────────────────────────────────────────────
+
+async def _scan_photo(path: Path, user_id: str) -> tuple[dict, dict | None]:
+    """Prépare une photo ; retourne (état, requête de batch ou None)."""
+    data = await asyncio.to_thread(path.read_bytes)
+    try:
+        await check_image_quality(data, kind="backfill")
+        cached, sha256, image = await prepare_course_image(data, user_id)
+    except ImageQualityError as e:
+        return {"status": REJECTED, "error": e.code}, None
+    except UnsupportedImageError:
+        return {"status": REJECTED, "error": "IMAGE_UNSUPPORTED"}, None
+
+    item = {"sha256": sha256, "custom_id": f"img-{sha256[:40]}"}
+    if cached is not None:
+        return {**item, "status": OCR_DONE, "ocr": asdict(cached)}, None
+    if image.width == 0:
+        # Non décodable : l'envoyer brut dans le batch serait payer pour une erreur
+        return {**item, "status": REJECTED, "error": "IMAGE_UNREADABLE"}, None
+    request = {"custom_id": item["custom_id"], "params": course_request_params(image)}
+    return {**item, "status": PENDING, "phash": image.phash, "bytes": len(image.data)}, request
+
+
+async def submit_photos(directory: Path, checkpoint: Checkpoint, batches) -> int:
+    """Analyse les photos pas encore connues du checkpoint et soumet les requêtes."""
+    paths = [
+        p for p in sorted(directory.rglob("*"))
+        if p.suffix.lower() in IMAGE_SUFFIXES and str(p.relative_to(directory)) not in checkpoint.items
+    ]
+    known = {item["sha256"]: rel for rel, item in checkpoint.items.items() if "sha256" in item}
+    requests: list[dict] = []
+    request_bytes = 0
+    submitted = 0
+
+    async def submit() -> None:
+        nonlocal requests, request_bytes, submitted
+        if not requests:
+            return
+        ids = {r["custom_id"] for r in requests}
+        sending = [
+            item for item in checkpoint.items.values() if item.get("custom_id") in ids and item["status"] == PENDING
+        ]
+        for item in sending:
+            item["status"] = SUBMITTING
+        # Écrit avant l'envoi : une interruption entre create et la sauvegarde
+        # ne fait pas relire (et refacturer) ces photos à la reprise
+        checkpoint.save()
+        try:
+            batch = await batches.create(requests=requests)
+        except anthropic.APIStatusError:
+            # Refusé par l'API : aucun batch créé, les photos seront resoumises
+            for item in sending:
+                item["status"] = PENDING
+            checkpoint.save()
+            raise
+        for item in sending:
+            item.update(status=SUBMITTED, batch_id=batch.id)
+        checkpoint.batches.append(batch.id)
+        checkpoint.save()
+        logger.info("[BACKFILL] batch %s soumis : %d photo(s), %.0f Mo", batch.id, len(requests), request_bytes / 1e6)
+        submitted += len(requests)
+        requests, request_bytes = [], 0
+
+    for start in range(0, len(paths), _SCAN_SLICE):
+        chunk = paths[start:start + _SCAN_SLICE]
+        scanned = await asyncio.gather(*(_scan_photo(p, checkpoint.user_id) for p in chunk))
+        for path, (item, request) in zip(chunk, scanned):
+            rel = str(path.relative_to(directory))
+            if item.get("sha256") in known:
+                checkpoint.items[rel] = {"status": DUPLICATE, "duplicate_of": known[item["sha256"]]}
+                continue
+            if "sha256" in item:
+                known[item["sha256"]] = rel
+            checkpoint.items[rel] = item
+            if request is not None:
+                requests.append(request)
+                # Base64 : +33 % sur l'image, plus le prompt et le schéma de l'outil
+                request_bytes += item["bytes"] * 4 // 3 + 8192
+                if request_bytes >= _MAX_BATCH_BYTES:
+                    await submit()
+        logger.info("[BACKFILL] analyse : %d/%d photo(s)", min(start + _SCAN_SLICE, len(paths)), len(paths))
+
+    await submit()
+    checkpoint.save()
+    return submitted
+
+
+# ── 2-3. Attente et récupération des résultats ───────────────────────────────
+
+async def wait_for_batches(checkpoint: Checkpoint, batches, poll_interval: float) -> None:
+    pending = [b for b in checkpoint.batches if b not in checkpoint.collected]
+    while pending:
+        for batch_id in list(pending):
+            batch = await batches.retrieve(batch_id)
+            counts = batch.request_counts
+            logger.info(
+                "[BACKFILL] batch %s : %s (en cours %d, réussies %d, erreurs %d, expirées %d)",
+                batch_id, batch.processing_status, counts.processing, counts.succeeded,
+                counts.errored, counts.expired,
+            )
+            if batch.processing_status == "ended":
+                await collect_results(checkpoint, batches, batch_id)
+                pending.remove(batch_id)
+        if pending:
+            await asyncio.sleep(poll_interval)
+
+
+async def collect_results(checkpoint: Checkpoint, batches, batch_id: str) -> None:
+    """Valide chaque résultat du batch ; les OCR réussis sont gardés dans le checkpoint."""
+    items = checkpoint.by_custom_id()
+    async for entry in await batches.results(batch_id):
+        item = items.get(entry.custom_id)
+        if item is None or item["status"] != SUBMITTED:
+            continue
+        if entry.result.type != "succeeded":
+            item.update(status=FAILED, error=f"BATCH_{entry.result.type.upper()}")
+            continue
+        try:
+            result: CourseOCRResult = await course_from_batch_message(entry.result.message)
+        except OCRValidationError as e:
+            item.update(status=FAILED, error="OCR_INVALID", detail=str(e))
+            continue
+        if not result.content:
+            item.update(status=FAILED, error="OCR_EMPTY")
+            continue
+        item.update(status=OCR_DONE, ocr=asdict(result))
+        await store_course_result(item["sha256"], item.get("phash"), checkpoint.user_id, result)
+
+    checkpoint.collected.append(batch_id)
+    checkpoint.save()
+
+
+# ── 4. Chunking, embedding et stockage ───────────────────────────────────────
+
+async def store_courses(checkpoint: Checkpoint, group_size: int = _STORE_GROUP) -> int:
+    """
+    Chunke et embedde les cours par groupes (un appel Voyage pour 128 chunks,
+    tous cours confondus), puis les insère. Un cours dont l'insertion avait
+    commencé avant une interruption est supprimé puis réinséré.
+    """
+    ready = [item for item in checkpoint.items.values() if item["status"] in (OCR_DONE, STORING)]
+    stored = 0
+    for start in range(0, len(ready), group_size):
+        group = ready[start:start + group_size]
+        courses, chunks = [], []
+        for item in group:
+            course = CourseOCRResult(**item["ocr"])
+            course_id = item.setdefault("course_id", str(uuid.uuid4()))
+            course_chunks, sections = chunk_course_sections(
+                course.content, course_id, course.subject, course.title, course.keywords,
+            )
+            courses.append((item, course, len(course_chunks), sections))
+            chunks.extend(course_chunks)
+
+        pairs = await embed_chunks(chunks)
+
+        offset = 0
+        for item, course, count, sections in courses:
+            if item["status"] == STORING:
+                get_supabase().table("courses").delete().eq("id", item["course_id"]).execute()
+            item["status"] = STORING
+            checkpoint.save()
+            ingested = IngestedCourse(
+                ocr=course, chunks_with_embeddings=pairs[offset:offset + count], sections=sections,
+            )
+            await save_course(item["course_id"], checkpoint.user_id, ingested)
+            item.update(status=STORED, chunks=count)
+            item.pop("ocr", None)   # Le contenu est désormais en base
+            offset += count
+            stored += 1
+        checkpoint.save()
+        logger.info(
+            "[BACKFILL] stockage : %d/%d cours (%d chunks, %d appel(s) Voyage)",
+            min(start + group_size, len(ready)), len(ready), len(chunks), -(-len(chunks) // 128),
+        )
+    return stored
+
+
+async def run_backfill(
+    directory: Path,
+    checkpoint: Checkpoint,
+    batches,
+    poll_interval: float,
+    group_size: int = _STORE_GROUP,
+) -> Counter:
+    start = time.perf_counter()
+    submitted = await submit_photos(directory, checkpoint, batches)
+    scanned = time.perf_counter()
+    await wait_for_batches(checkpoint, batches, poll_interval)
+    ocr_done = time.perf_counter()
+    stored = await store_courses(checkpoint, group_size)
+    end = time.perf_counter()
+
+    counts = checkpoint.counts()
+    logger.info(
+        "[BACKFILL] terminé : %d soumise(s), %d cours stocké(s) | analyse %.1fs, batch %.1fs, stockage %.1fs"
+        " | coût OCR estimé %.2f $ | %s",
+        submitted, stored, scanned - start, ocr_done - scanned, end - ocr_done, ocr.OCR_COST.total(), dict(counts),
+    )
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", type=Path, help="Dossier de photos de cours (parcouru récursivement)")
+    parser.add_argument("--user-id", required=True, help="Propriétaire des cours importés")
+    parser.add_argument("--checkpoint", type=Path, help="Défaut : <dossier>/.backfill-checkpoint.json")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="Secondes entre deux interrogations")
+    parser.add_argument("--retry-failed", action="store_true", help="Resoumet les photos en échec ou au batch non confirmé")
+    parser.add_argument("--local", action="store_true", help="Substitut local du batch (API Messages classique)")
+    parser.add_argument("--local-concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        stream=sys.stdout,
+    )
+    checkpoint_path = args.checkpoint or args.directory / ".backfill-checkpoint.json"
+    checkpoint = Checkpoint.load(checkpoint_path, args.user_id, retry_failed=args.retry_failed)
+
+    async def run() -> None:
+        if args.local:
+            batches = LocalMessageBatches(
+                checkpoint_path.with_suffix(".batches"), ocr.client.messages.create, args.local_concurrency,
+            )
+        else:
+            # Un batch de 200 Mo ne s'envoie pas dans le délai d'un appel OCR
+            batches = ocr.client.with_options(timeout=600).messages.batches
+        try:
+            await run_backfill(args.directory, checkpoint, batches, args.poll_interval)
+        finally:
+            if args.local:
+                await batches.aclose()
+            shutdown_preprocessing()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
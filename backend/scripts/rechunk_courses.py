@@ -0,0 +1,241 @@
+"""
+Re-chunking / ré-embedding en masse des cours existants, après un
+changement de chunk_mode, chunk_size, chunk_overlap (ou des budgets du mode
+tokens), d'embedding_model ou d'embedding_provider — et pour ré-embedder
+les cours importés en mode dégradé (secours local pendant une panne de
+Voyage, voir rag/embeddings.py).
+
+    python -m scripts.rechunk_courses                              # tous les élèves
+    python -m scripts.rechunk_courses --user-id <uuid> --concurrency 8
+    python -m scripts.rechunk_courses --dry-run                    # compte seulement
+
+Chaque cours est reconstruit depuis courses.raw_content avec les réglages
+courants. Ses nouveaux chunks sont insérés dans une génération fantôme
+(chunk_generation + 1, invisible de la recherche), puis la RPC
+swap_course_generation (migration 012) active cette génération, supprime
+l'ancienne, réécrit les sections et estampille le cours de l'empreinte
+courante (rag.ingestion.current_chunk_scheme), en une transaction : la
+recherche ne voit jamais un cours à moitié migré.
+
+Reprise : l'estampille, écrite dans la même transaction que le swap, sert
+de checkpoint. Relancer la commande ne relit que les cours dont l'empreinte
+diffère ; les chunks fantômes laissés par une interruption sont supprimés
+avant d'être reconstruits. Un cours édité pendant sa reconstruction est
+refusé par le swap et repris au passage suivant. Un cours sans texte est
+estampillé de la même façon, vers une génération vide.
+
+Les corps déjà embeddés par le modèle courant (la clé de chunk_embeddings
+inclut le modèle) ne repassent pas par Voyage : si seul le découpage
+change, seuls les nouveaux corps sont embeddés.
+La reconstruction n'utilise jamais le secours : pendant une panne, le cours
+échoue et reste à reconstruire.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+
+from postgrest.exceptions import APIError
+
+from config import get_settings
+from db.client import get_supabase
+from rag.chunking import chunk_body_hash, chunk_course_sections
+from rag.embeddings import embed_chunks, primary_model
+from rag.ingestion import CourseEditConflict, current_chunk_scheme
+from rag.retrieval import store_chunks, stored_body_hashes
+
+settings = get_settings()
+logger = logging.getLogger("studybuddy.rechunk")
+
+_PAGE_SIZE = 200             # Cours lus par requête
+_REPORT_INTERVAL = 10.0      # s entre deux lignes de progression
+
+_COURSE_COLUMNS = "id, user_id, title, subject, keywords, raw_content, updated_at, chunk_generation"
+
+
+@dataclass
+class Progress:
+    total: int
+    migrated: int = 0
+    conflicts: int = 0
+    failed: int = 0
+    skipped: int = 0          # Cours sans texte (estampillés, sans chunks)
+    chunks: int = 0
+    embedded: int = 0
+    reused: int = 0           # Chunks dont l'embedding était déjà stocké
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def processed(self) -> int:
+        return self.migrated + self.conflicts + self.failed + self.skipped
+
+    def line(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        rate = self.processed / elapsed
+        remaining = self.total - self.processed
+        eta = _format_duration(remaining / rate) if rate else "?"
+        return (
+            f"{self.processed}/{self.total} cours ({self.processed / max(self.total, 1):.1%}) · "
+            f"{rate:.2f} cours/s · {self.chunks / elapsed:.0f} chunks/s · "
+            f"embeddés {self.embedded}, réutilisés {self.reused} · "
+            f"conflits {self.conflicts}, échecs {self.failed} · ETA {eta}"
+        )
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+# ── Accès base (synchrones, appelés via asyncio.to_thread) ───────────────────
+
+def _pending(query, scheme: str, user_id: str | None):
+    """Cours dont l'empreinte diffère de l'empreinte courante."""
+    query = query.or_(f"chunk_scheme.is.null,chunk_scheme.neq.{scheme}")
+    return query.eq("user_id", user_id) if user_id else query
+
+
+def _count_pending(scheme: str, user_id: str | None) -> int:
+    query = get_supabase().table("courses").select("id", count="exact")
+    return _pending(query, scheme, user_id).limit(1).execute().count or 0
+
+
+def _fetch_page(scheme: str, user_id: str | None, after: str | None) -> list[dict]:
+    query = _pending(get_supabase().table("courses").select(_COURSE_COLUMNS), scheme, user_id)
+    if after:
+        query = query.gt("id", after)
+    return query.order("id").limit(_PAGE_SIZE).execute().data
+
+
+def _drop_shadow(course_id: str, active_generation: int) -> None:
+    """Supprime les chunks fantômes d'un cours (reconstruction interrompue ou refusée)."""
+    (
+        get_supabase().table("course_chunks")
+        .delete()
+        .eq("course_id", course_id)
+        .gt("generation", active_generation)
+        .execute()
+    )
+
+
+def _swap(course: dict, generation: int, scheme: str, sections: list) -> None:
+    get_supabase().rpc("swap_course_generation", {
+        "p_course_id": course["id"],
+        "p_expected_updated_at": course["updated_at"],
+        "p_generation": generation,
+        "p_scheme": scheme,
+        "p_embedding_model": primary_model(),
+        "p_sections": [
+            {"section_index": section.section_index, "heading": section.heading, "content": section.content}
+            for section in sections
+        ],
+    }).execute()
+
+
+# ── Reconstruction d'un cours ────────────────────────────────────────────────
+
+async def rechunk_course(course: dict, scheme: str, progress: Progress) -> None:
+    """Reconstruit un cours dans une génération fantôme puis l'active."""
+    generation = course["chunk_generation"] + 1
+    chunks, sections = chunk_course_sections(
+        course["raw_content"] or "", course["id"], course["subject"], course["title"], course["keywords"] or [],
+    )
+    hashes = [chunk_body_hash(chunk.content, primary_model()) for chunk in chunks]
+    reusable = await asyncio.to_thread(stored_body_hashes, course["user_id"], sorted(set(hashes)))
+
+    to_embed = [chunk for chunk, body_hash in zip(chunks, hashes) if body_hash not in reusable]
+    vectors = {id(chunk): embedding for chunk, embedding in await embed_chunks(to_embed, allow_fallback=False)}
+
+    await asyncio.to_thread(_drop_shadow, course["id"], course["chunk_generation"])
+    await store_chunks(
+        [(chunk, vectors.get(id(chunk))) for chunk in chunks],
+        user_id=course["user_id"], course_id=course["id"], generation=generation,
+    )
+    try:
+        await asyncio.to_thread(_swap, course, generation, scheme, sections)
+    except APIError as e:
+        await asyncio.to_thread(_drop_shadow, course["id"], course["chunk_generation"])
+        if e.code == "40001":
+            raise CourseEditConflict(f"Cours {course['id']} modifié pendant sa reconstruction") from e
+        raise
+
+    progress.chunks += len(chunks)
+    progress.embedded += len(to_embed)
+    progress.reused += len(chunks) - len(to_embed)
+
+
+async def run_rechunk(user_id: str | None, concurrency: int, dry_run: bool = False) -> Progress:
+    scheme = current_chunk_scheme()
+    total = await asyncio.to_thread(_count_pending, scheme, user_id)
+    progress = Progress(total=total)
+    logger.info(
+        "[RECHUNK] %d cours à reconstruire (empreinte %s, mode %s, modèle %s)",
+        total, scheme, settings.chunk_mode, primary_model(),
+    )
+    if dry_run or not total:
+        return progress
+
+    queue: asyncio.Queue[dict | None] = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def produce() -> None:
+        after = None
+        while page := await asyncio.to_thread(_fetch_page, scheme, user_id, after):
+            for course in page:
+                await queue.put(course)
+            after = page[-1]["id"]
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def consume() -> None:
+        while (course := await queue.get()) is not None:
+            try:
+                # Un cours sans texte passe aussi par le swap (génération vide) : il est
+                # estampillé et ne revient pas au passage suivant
+                await rechunk_course(course, scheme, progress)
+                if (course["raw_content"] or "").strip():
+                    progress.migrated += 1
+                else:
+                    progress.skipped += 1
+            except CourseEditConflict as e:
+                progress.conflicts += 1
+                logger.info("[RECHUNK] %s — repris au prochain passage", e)
+            except Exception as e:
+                progress.failed += 1
+                logger.warning("[RECHUNK] course_id=%s échec : %s", course["id"], e)
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(_REPORT_INTERVAL)
+            logger.info("[RECHUNK] %s", progress.line())
+
+    reporter = asyncio.create_task(report())
+    try:
+        await asyncio.gather(produce(), *(consume() for _ in range(concurrency)))
+    finally:
+        reporter.cancel()
+    logger.info("[RECHUNK] terminé : %s", progress.line())
+    return progress
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", help="Limite la migration aux cours d'un élève")
+    parser.add_argument("--concurrency", type=int, default=4, help="Cours reconstruits en parallèle")
+    parser.add_argument("--dry-run", action="store_true", help="Compte les cours à reconstruire, sans rien écrire")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        stream=sys.stdout,
+    )
+    progress = asyncio.run(run_rechunk(args.user_id, max(args.concurrency, 1), args.dry_run))
+    if progress.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
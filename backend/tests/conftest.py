@@ -0,0 +1,17 @@
+"""
+Configuration des tests — lancés depuis backend/ :
+    python -m pytest -q
+
+Aucune clé ni service externe : des valeurs factices sont injectées avant
+l'import de config (comme pour les benchmarks), et les caches adossés à
+Supabase sont coupés. Les clients Anthropic, Voyage et Supabase sont
+remplacés test par test.
+"""
+import os
+
+from benchmarks._common import bootstrap_env
+
+bootstrap_env()
+os.environ.setdefault("OCR_CACHE_ENABLED", "false")
+os.environ.setdefault("OCR_TIERED_ENABLED", "false")
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
@@ -0,0 +1,56 @@
+"""Import en masse : checkpoint et reprise sans refacturer (scripts/backfill_courses.py)."""
+import asyncio
+
+import pytest
+
+from scripts import backfill_courses
+from scripts.backfill_courses import PENDING, SUBMITTED, SUBMITTING, Checkpoint
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class _FakeBatches:
+    """Batch accepté par l'API, mais le script est interrompu avant d'en lire la réponse."""
+
+    def __init__(self, interrupt: bool) -> None:
+        self.interrupt = interrupt
+        self.submitted: list[str] = []
+
+    async def create(self, *, requests):
+        self.submitted.extend(request["custom_id"] for request in requests)
+        if self.interrupt:
+            raise _Interrupted()
+        return type("Batch", (), {"id": "batch-1"})()
+
+
+@pytest.fixture
+def photos(tmp_path, monkeypatch):
+    directory = tmp_path / "photos"
+    directory.mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        (directory / name).write_bytes(name.encode())
+
+    async def scan(path, user_id):
+        item = {"sha256": path.stem * 64, "custom_id": f"img-{path.stem}"}
+        return {**item, "status": PENDING, "phash": None, "bytes": 10}, {"custom_id": item["custom_id"], "params": {}}
+
+    monkeypatch.setattr(backfill_courses, "_scan_photo", scan)
+    return directory
+
+
+def test_photos_sent_before_an_interruption_are_not_billed_again(photos, tmp_path):
+    path = tmp_path / "checkpoint.json"
+    with pytest.raises(_Interrupted):
+        asyncio.run(backfill_courses.submit_photos(photos, Checkpoint.load(path, "u"), _FakeBatches(interrupt=True)))
+
+    checkpoint = Checkpoint.load(path, "u")
+    assert {item["status"] for item in checkpoint.items.values()} == {SUBMITTING}
+    batches = _FakeBatches(interrupt=False)
+    assert asyncio.run(backfill_courses.submit_photos(photos, checkpoint, batches)) == 0
+    assert batches.submitted == []
+
+    checkpoint = Checkpoint.load(path, "u", retry_failed=True)   # Relance explicite
+    assert asyncio.run(backfill_courses.submit_photos(photos, checkpoint, batches)) == 2
+    assert {item["status"] for item in Checkpoint.load(path, "u").items.values()} == {SUBMITTED}
@@ -0,0 +1,77 @@
+"""Lots d'embedding et appels au fournisseur (rag/embeddings.py)."""
+import asyncio
+import time
+
+from rag import embeddings
+from rag.chunking import estimate_tokens
+from rag.embeddings import pack_batches
+
+
+def test_pack_batches_respects_the_input_limit_in_order():
+    batches = pack_batches(["mot"] * 10, max_inputs=4, max_tokens=10_000)
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_pack_batches_respects_the_token_limit():
+    texts = ["paragraphe " * 20] * 6
+    per_text = estimate_tokens(texts[0])
+    batches = pack_batches(texts, max_inputs=100, max_tokens=per_text * 2)
+    assert batches == [[0, 1], [2, 3], [4, 5]]
+    assert all(sum(estimate_tokens(texts[i]) for i in batch) <= per_text * 2 for batch in batches)
+
+
+def test_pack_batches_sends_an_oversized_text_alone():
+    texts = ["court", "très long " * 500, "court"]
+    assert pack_batches(texts, max_inputs=100, max_tokens=50) == [[0], [1], [2]]
+
+
+def test_pack_batches_of_nothing():
+    assert pack_batches([], max_inputs=4, max_tokens=100) == []
+
+
+class _RateLimited(Exception):
+    def __init__(self, retry_after: str) -> None:
+        super().__init__("429")
+        self.headers = {"retry-after": retry_after}
+
+
+class _FakeProvider:
+    """Fournisseur simulé : 429 (Retry-After 0,3 s) au premier appel, puis des vecteurs nuls."""
+
+    name = "fake"
+    model = "fake-model"
+    retryable = (_RateLimited,)
+
+    def __init__(self) -> None:
+        self.calls: list[float] = []
+
+    async def embed(self, texts, input_type):
+        self.calls.append(time.monotonic())
+        if len(self.calls) == 1:
+            raise _RateLimited("0.3")
+        await asyncio.sleep(0.01)
+        return [[0.0] for _ in texts]
+
+
+def test_retry_after_pause_holds_no_concurrency_slot(monkeypatch):
+    fake = _FakeProvider()
+    monkeypatch.setattr(embeddings, "provider", fake)
+    monkeypatch.setattr(embeddings, "_paused_until", 0.0)
+    monkeypatch.setattr(embeddings.settings, "embed_concurrency", 2)
+    monkeypatch.setattr(embeddings.settings, "embed_retry_base_delay", 0.01)
+
+    async def scenario() -> bool:
+        first = asyncio.create_task(embeddings._provider_embed(["a"], "document", 3))
+        while embeddings._paused_until == 0.0:
+            await asyncio.sleep(0.005)
+        paused_until = embeddings._paused_until
+        others = [asyncio.create_task(embeddings._provider_embed([t], "query", 3)) for t in "bcd"]
+        await asyncio.sleep(0.1)
+        slots = embeddings._embed_slots()
+        free = not slots.locked()
+        await asyncio.gather(first, *others)
+        assert all(called >= paused_until for called in fake.calls[1:])   # Rien ne part pendant la pause
+        return free
+
+    assert asyncio.run(scenario())
+    assert len(fake.calls) == 5
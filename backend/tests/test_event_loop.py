@@ -0,0 +1,100 @@
+"""
+Réactivité de l'API pendant des OCR concurrents : un appel Vision en cours
+ne doit jamais bloquer la boucle d'événements (GET /health reste rapide).
+Version automatisée de benchmarks/bench_ocr_concurrency.py.
+"""
+import asyncio
+import io
+import time
+from types import SimpleNamespace
+
+import httpx
+from PIL import Image, ImageDraw
+
+import main
+from rag import ocr
+
+_EXERCISE = {
+    "subject": "Mathématiques", "exercise_type": "Exercice",
+    "student_work_detected": False, "statement": "Développer A = 4(2x − 3) + 5x",
+}
+
+
+class _FakeMessages:
+    """Claude Vision simulé : `latency` secondes par appel, bloquantes ou non."""
+
+    def __init__(self, latency: float, blocking: bool) -> None:
+        self.latency = latency
+        self.blocking = blocking
+
+    async def create(self, **kwargs):
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="tool_use", id="toolu_0", name="enregistrer_exercice", input=_EXERCISE)],
+            stop_reason="end_turn",
+            usage=SimpleNamespace(input_tokens=1600, output_tokens=120),
+        )
+
+
+def _photo() -> bytes:
+    image = Image.new("RGB", (900, 1200), (246, 243, 236))
+    draw = ImageDraw.Draw(image)
+    for line in range(30):
+        draw.text((60, 40 + line * 36), f"Exercice {line} : développer A = 4(2x - 3) + 5x", fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def _stall_during_ocr(calls: int, latency: float, blocking: bool) -> float:
+    """
+    Plus long blocage de la boucle (s) pendant `calls` OCR simultanés : le
+    plus lent des GET /health, ou le plus long silence d'un battement de 5 ms
+    (un stream SSE qui s'arrête).
+    """
+    image = _photo()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        await http.get("/health")   # Démarrage du pool de threads hors mesure
+        ocr.client = SimpleNamespace(messages=_FakeMessages(latency, blocking))
+        tasks = [asyncio.create_task(ocr.extract_exercise_from_image(image)) for _ in range(calls)]
+
+        async def probe() -> float:
+            worst = 0.0
+            while not all(task.done() for task in tasks):
+                start = time.perf_counter()
+                response = await http.get("/health")
+                assert response.status_code == 200
+                worst = max(worst, time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+            return worst
+
+        async def heartbeat() -> float:
+            worst = 0.0
+            last = time.perf_counter()
+            while not all(task.done() for task in tasks):
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                worst, last = max(worst, now - last), now
+            return worst
+
+        stalls = await asyncio.gather(probe(), heartbeat())
+        results = await asyncio.gather(*tasks)
+    assert all(result.statement == _EXERCISE["statement"] for result in results)
+    return max(stalls)
+
+
+def test_health_stays_fast_during_concurrent_ocr(monkeypatch):
+    monkeypatch.setattr(ocr, "client", ocr.client)
+    stall = asyncio.run(_stall_during_ocr(calls=8, latency=0.5, blocking=False))
+    assert stall < 0.2   # Prétraitement des images (threads) compris
+
+
+def test_probe_detects_a_blocking_ocr_call(monkeypatch):
+    """Témoin : un appel Vision bloquant fige /health pendant toute sa durée."""
+    monkeypatch.setattr(ocr, "client", ocr.client)
+    stall = asyncio.run(_stall_during_ocr(calls=2, latency=0.5, blocking=True))
+    assert stall >= 0.45
@@ -0,0 +1,101 @@
+"""Édition d'un cours : appariement avec les chunks stockés, vecteurs réutilisés (rag/ingestion.py)."""
+import asyncio
+
+from rag import ingestion
+from rag.chunking import chunk_body_hash, chunk_content_hash, make_text_chunk
+from rag.embeddings import primary_model
+from rag.ingestion import diff_chunks
+
+
+def _chunks(*bodies: str, title: str = "Les dérivées") -> list:
+    return [make_text_chunk(body, i, "c", "Mathématiques", title, []) for i, body in enumerate(bodies)]
+
+
+def _stored(chunks: list) -> list[dict]:
+    return [
+        {"id": f"id-{chunk.chunk_index}", "chunk_index": chunk.chunk_index, "content_hash": chunk_content_hash(chunk.content)}
+        for chunk in chunks
+    ]
+
+
+def test_diff_keeps_unchanged_chunks_and_embeds_only_new_ones():
+    stored = _stored(_chunks("Définition.", "Exemple.", "Exercice."))
+    edited = _chunks("Définition.", "Exemple corrigé.", "Exercice.", "Méthode.")
+
+    diff = diff_chunks(stored, edited)
+
+    assert [(chunk_id, chunk.chunk_index) for chunk_id, chunk in diff.kept] == [("id-0", 0), ("id-2", 2)]
+    assert [chunk.content for chunk in diff.added] == [edited[1].content, edited[3].content]
+    assert diff.removed == ["id-1"]
+
+
+def test_diff_pairs_repeated_content_once_per_copy_in_course_order():
+    stored = _stored(_chunks("À retenir.", "Exemple.", "À retenir."))
+    edited = _chunks("À retenir.", "À retenir.", "À retenir.")
+
+    diff = diff_chunks(stored, edited)
+
+    assert [chunk_id for chunk_id, _ in diff.kept] == ["id-0", "id-2"]
+    assert [chunk.chunk_index for chunk in diff.added] == [2]
+    assert diff.removed == ["id-1"]
+
+
+def test_diff_renews_every_chunk_when_the_title_changes():
+    stored = _stored(_chunks("Définition.", "Exemple."))
+    diff = diff_chunks(stored, _chunks("Définition.", "Exemple.", title="Dérivation"))
+    assert not diff.kept
+    assert len(diff.added) == 2
+    assert diff.removed == ["id-0", "id-1"]
+
+
+class _FakeEdit:
+    """Cours stocké et RPC apply_course_edit simulés pour edit_course."""
+
+    def __init__(self, monkeypatch, embedding_model: str, known_bodies: bool) -> None:
+        self.course = {
+            "id": "c", "title": "Les dérivées", "subject": "Mathématiques", "level": "Terminale", "keywords": [],
+            "raw_content": "Définition du nombre dérivé.\n\nExemple : f(x) = x².", "created_at": "t0",
+            "updated_at": "t0", "chunk_generation": 0, "embedding_model": embedding_model,
+        }
+        chunks, _ = ingestion.chunk_course_sections(
+            self.course["raw_content"], "c", self.course["subject"], self.course["title"], [],
+        )
+        self.count = len(chunks)
+        self.known = {chunk_body_hash(chunk.content, primary_model()) for chunk in chunks} if known_bodies else set()
+        self.embedded: list[str] = []
+        self.applied: list[tuple] = []
+        monkeypatch.setattr(ingestion, "_load_course", lambda course_id, user_id: (dict(self.course), _stored(chunks)))
+        monkeypatch.setattr(ingestion, "stored_body_hashes", lambda user_id, hashes: set(hashes) & self.known)
+        monkeypatch.setattr(ingestion, "embed_chunks", self._embed)
+        monkeypatch.setattr(ingestion, "_apply_edit", self._apply)
+
+    async def _embed(self, chunks, allow_fallback=True):
+        assert not allow_fallback
+        self.embedded.extend(chunk.content for chunk in chunks)
+        return [(chunk, [0.0]) for chunk in chunks]
+
+    def _apply(self, course, user_id, diff, embeddings, sections):
+        self.applied.append((course, diff, embeddings))
+        return "t1"
+
+
+def test_renaming_a_course_reuses_the_stored_vectors(monkeypatch):
+    fake = _FakeEdit(monkeypatch, primary_model(), known_bodies=True)
+
+    edited = asyncio.run(ingestion.edit_course("c", "u", title="Dérivation"))
+
+    assert len(edited.diff.added) == fake.count and edited.embedded == 0
+    assert fake.embedded == []
+    assert fake.applied[0][2] == [None] * fake.count   # Corps déjà stockés : aucun vecteur réécrit
+
+
+def test_editing_a_fallback_course_re_embeds_it_with_the_provider(monkeypatch):
+    fake = _FakeEdit(monkeypatch, "local-ngram35-18b-1024d-tf", known_bodies=False)
+
+    edited = asyncio.run(ingestion.edit_course("c", "u", level="Première"))
+
+    assert not edited.diff.kept and len(edited.diff.removed) == fake.count
+    assert edited.embedded == fake.count
+    course = fake.applied[0][0]
+    assert course["embedding_model"] == primary_model()
+    assert course["chunk_scheme"] == ingestion.current_chunk_scheme()
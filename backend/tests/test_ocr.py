@@ -0,0 +1,105 @@
+"""Fusion des tuiles et lecture en streaming de l'outil enregistrer_cours (rag/ocr.py)."""
+import json
+
+from rag.ocr import CourseOCRResult, _CourseStreamParser, merge_tile_transcripts
+
+_COURSE = {
+    "title": "Les dérivées",
+    "subject": "Mathématiques",
+    "level": "Terminale",
+    "content": "Définition\n\nLe nombre dérivé est la limite du taux d'accroissement.\n\n"
+               "Exemple : f(x) = x² donne f'(x) = 2x.\n\nÀ retenir : \"tangente\" et pente.",
+    "keywords": ["dérivée", "tangente"],
+}
+
+
+def _result(course: dict) -> CourseOCRResult:
+    return CourseOCRResult(**course, raw_text=json.dumps(course, ensure_ascii=False))
+
+
+def _stream(parser: _CourseStreamParser, payload: str, step: int = 7) -> list:
+    events = []
+    for i in range(0, len(payload), step):
+        events.extend(parser.feed(payload[i : i + step]))
+    return events
+
+
+def test_merge_drops_lines_repeated_by_the_overlap():
+    merged = merge_tile_transcripts([
+        "Première ligne de la page\nDeuxième ligne partagée\nTroisième ligne partagée",
+        "Deuxième ligne partagée\nTroisième ligne partagée\nQuatrième ligne, suite du cours",
+    ])
+    assert merged.split("\n") == [
+        "Première ligne de la page", "Deuxième ligne partagée",
+        "Troisième ligne partagée", "Quatrième ligne, suite du cours",
+    ]
+
+
+def test_merge_replaces_a_line_cut_by_the_tile_edge():
+    merged = merge_tile_transcripts([
+        "Première ligne de la page\nLigne commune aux deux tuiles\nLigne coup",
+        "Ligne commune aux deux tuiles\nLigne coupée par le bord, complète ici\nSuite",
+    ])
+    assert merged.split("\n") == [
+        "Première ligne de la page", "Ligne commune aux deux tuiles",
+        "Ligne coupée par le bord, complète ici", "Suite",
+    ]
+
+
+def test_merge_without_overlap_keeps_both_tiles_as_paragraphs():
+    merged = merge_tile_transcripts(["Exemple\nHaut de page", "Exemple\nBas de page"])
+    assert merged == "Exemple\nHaut de page\n\nExemple\nBas de page"
+
+
+def test_stream_parser_emits_headers_then_each_paragraph():
+    parser = _CourseStreamParser()
+    events = _stream(parser, json.dumps(_COURSE, ensure_ascii=False))
+    events += parser.finish(_result(_COURSE))
+
+    assert [event.kind for event in events] == ["headers"] + ["block"] * 4 + ["done"]
+    headers = events[0].result
+    assert (headers.title, headers.subject, headers.level) == ("Les dérivées", "Mathématiques", "Terminale")
+    assert [event.block for event in events[1:-1]] == _COURSE["content"].split("\n\n")
+    assert events[-1].result.keywords == ["dérivée", "tangente"]
+
+
+def test_stream_parser_flushes_unterminated_content_at_finish():
+    parser = _CourseStreamParser()
+    payload = json.dumps(_COURSE, ensure_ascii=False)
+    events = _stream(parser, payload[: payload.index('"keywords"')])   # Coupé avant les mots-clés
+    events += parser.finish(_result(_COURSE))
+
+    assert [event.block for event in events if event.kind == "block"] == _COURSE["content"].split("\n\n")
+    assert events[-1].kind == "done"
+
+
+def test_repaired_output_replaces_everything_streamed():
+    parser = _CourseStreamParser()
+    payload = json.dumps(_COURSE, ensure_ascii=False)
+    streamed = _stream(parser, payload[: payload.index("Exemple")])
+    assert [event.kind for event in streamed] == ["headers", "block", "block"]
+
+    repaired = _COURSE | {"content": "Le nombre dérivé, réécrit par la relance.\n\nExemple : f'(x) = 2x."}
+    events = parser.finish(_result(repaired), repaired=True)
+
+    assert [event.kind for event in events] == ["replace"]
+    assert events[0].result.content == repaired["content"]
+
+
+def test_headers_read_before_their_field_are_replaced():
+    parser = _CourseStreamParser()
+    reordered = {"content": _COURSE["content"], "title": _COURSE["title"], "subject": _COURSE["subject"],
+                 "level": _COURSE["level"], "keywords": _COURSE["keywords"]}
+    events = _stream(parser, json.dumps(reordered, ensure_ascii=False))
+    assert events[0].result.title == "Sans titre"
+
+    events = parser.finish(_result(_COURSE))
+    assert [event.kind for event in events] == ["replace"]
+    assert events[0].result.title == "Les dérivées"
+
+
+def test_content_rewritten_by_validation_is_replaced():
+    parser = _CourseStreamParser()
+    _stream(parser, json.dumps(_COURSE, ensure_ascii=False))
+    events = parser.finish(_result(_COURSE | {"content": _COURSE["content"].replace("Définition", "Définitions")}))
+    assert [event.kind for event in events] == ["replace"]
@@ -0,0 +1,38 @@
+"""Re-chunking en masse : l'estampille sert de checkpoint (scripts/rechunk_courses.py)."""
+import asyncio
+
+from scripts import rechunk_courses
+
+
+def test_courses_without_text_are_stamped_and_not_pending_again(monkeypatch):
+    courses = [
+        {"id": "a", "user_id": "u", "title": "Vide", "subject": "Maths", "keywords": [], "raw_content": "  ",
+         "updated_at": "t0", "chunk_generation": 0},
+        {"id": "b", "user_id": "u", "title": "Vide", "subject": "Maths", "keywords": None, "raw_content": None,
+         "updated_at": "t0", "chunk_generation": 2},
+    ]
+    stamped: dict[str, str] = {}
+
+    def pending(scheme: str) -> list[dict]:
+        return [course for course in courses if stamped.get(course["id"]) != scheme]
+
+    def swap(course, generation, scheme, sections):
+        assert generation == course["chunk_generation"] + 1 and sections == []
+        stamped[course["id"]] = scheme
+
+    async def store(chunks_with_embeddings, user_id, course_id, generation=0):
+        assert chunks_with_embeddings == []
+
+    monkeypatch.setattr(rechunk_courses, "_count_pending", lambda scheme, user_id: len(pending(scheme)))
+    monkeypatch.setattr(
+        rechunk_courses, "_fetch_page", lambda scheme, user_id, after: [] if after else pending(scheme),
+    )
+    monkeypatch.setattr(rechunk_courses, "stored_body_hashes", lambda user_id, hashes: set())
+    monkeypatch.setattr(rechunk_courses, "_drop_shadow", lambda course_id, generation: None)
+    monkeypatch.setattr(rechunk_courses, "store_chunks", store)
+    monkeypatch.setattr(rechunk_courses, "_swap", swap)
+
+    progress = asyncio.run(rechunk_courses.run_rechunk(None, concurrency=2))
+
+    assert (progress.total, progress.skipped, progress.processed, progress.failed) == (2, 2, 2, 0)
+    assert asyncio.run(rechunk_courses.run_rechunk(None, concurrency=2)).total == 0
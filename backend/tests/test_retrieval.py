@@ -0,0 +1,99 @@
+"""Remplacement des feuilles d'une même section par la section entière (rag/retrieval.py)."""
+from types import SimpleNamespace
+
+import pytest
+
+from rag import retrieval
+from rag.chunking import estimate_tokens
+from rag.retrieval import RetrievedChunk, _expand_sections
+
+
+class _FakeSections:
+    """Table course_sections simulée : select().in_().in_().execute()."""
+
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+        self.queries = 0
+
+    def table(self, name: str) -> "_FakeSections":
+        assert name == "course_sections"
+        return self
+
+    def select(self, columns: str) -> "_FakeSections":
+        return self
+
+    def in_(self, column: str, values: list) -> "_FakeSections":
+        return self
+
+    def execute(self) -> SimpleNamespace:
+        self.queries += 1
+        return SimpleNamespace(data=self.rows)
+
+
+@pytest.fixture
+def sections(monkeypatch):
+    def install(rows: list[dict]) -> _FakeSections:
+        fake = _FakeSections(rows)
+        monkeypatch.setattr(retrieval, "get_supabase", lambda: fake)
+        return fake
+
+    monkeypatch.setattr(retrieval.settings, "section_expand_min_hits", 2)
+    monkeypatch.setattr(retrieval.settings, "section_max_tokens", 600)
+    return install
+
+
+def _leaf(text: str, similarity: float, chunk_index: int, section_index: int | None, course_id: str = "c1"):
+    return RetrievedChunk(
+        content=f"[Mathématiques — Les dérivées]\n{text}", course_title="Les dérivées", subject="Mathématiques",
+        similarity=similarity, chunk_index=chunk_index, course_id=course_id, section_index=section_index,
+    )
+
+
+def _section(section_index: int, content: str, course_id: str = "c1") -> dict:
+    return {"course_id": course_id, "section_index": section_index, "heading": "Définition", "content": content}
+
+
+def test_section_replaces_its_leaves_at_the_best_leaf_rank(sections):
+    sections([_section(1, "Le nombre dérivé. Exemple.")])
+    chunks = [
+        _leaf("Le nombre dérivé, une longue définition.", 0.9, 4, 1),
+        _leaf("Une autre section, sans voisine.", 0.8, 9, 2),
+        _leaf("Exemple détaillé de la définition.", 0.7, 5, 1),
+    ]
+
+    expanded = _expand_sections(chunks)
+
+    assert [chunk.section_heading for chunk in expanded] == ["Définition", None]
+    section = expanded[0]
+    assert section.content == "[Mathématiques — Les dérivées]\nLe nombre dérivé. Exemple."
+    assert (section.similarity, section.chunk_index) == (0.9, 4)
+    assert expanded[1] is chunks[1]
+
+
+def test_single_hits_are_returned_without_a_query(sections):
+    fake = sections([])
+    chunks = [_leaf("Définition.", 0.9, 0, 1), _leaf("Exemple.", 0.8, 3, 2), _leaf("Sans section.", 0.7, 5, None)]
+    assert _expand_sections(chunks) == chunks
+    assert fake.queries == 0
+
+
+def test_sections_over_the_token_limit_keep_their_leaves(sections, monkeypatch):
+    monkeypatch.setattr(retrieval.settings, "section_max_tokens", 5)
+    sections([_section(1, "Une section bien trop longue pour la limite fixée.")])
+    chunks = [_leaf("Définition.", 0.9, 0, 1), _leaf("Exemple.", 0.8, 1, 1)]
+    assert _expand_sections(chunks) == chunks
+
+
+def test_least_relevant_leaves_make_room_for_the_section(sections):
+    content = "Définition, propriétés et exemples du nombre dérivé. " * 2
+    chunks = [
+        _leaf("Définition.", 0.9, 0, 1),
+        _leaf("Exemple.", 0.8, 1, 1),
+        _leaf("Annexe du cours, rappels et compléments.", 0.5, 7, None),
+    ]
+    sections([_section(1, content)])
+
+    expanded = _expand_sections(chunks)
+
+    assert [chunk.section_heading for chunk in expanded] == ["Définition"]
+    assert estimate_tokens(expanded[0].content) <= sum(estimate_tokens(chunk.content) for chunk in chunks)
@@ -0,0 +1,5 @@
+"""
+Workers de fond. Dans le process API (settings.job_worker_enabled) ou en
+service dédié, lancé depuis backend/ :
+    python -m workers.ingestion --help
+"""
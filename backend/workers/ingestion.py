@@ -0,0 +1,393 @@
+"""
+Worker d'ingestion — traite les jobs d'upload de la table upload_jobs.
+
+    python -m workers.ingestion                   # service dédié
+    python -m workers.ingestion --concurrency 4
+
+Chaque worker réclame au plus `concurrency` jobs à la fois (claim_upload_jobs,
+FOR UPDATE SKIP LOCKED) : plusieurs workers, dans plusieurs process ou
+machines, se partagent la file sans jamais traiter deux fois le même job.
+
+- Bail : renouvelé tant que le job tourne ; un worker mort laisse expirer le
+  sien et le job est repris par un autre.
+- Échec : nouvelle tentative avec backoff exponentiel, sauf pour les erreurs
+  définitives (image sans texte, document illisible) ou après
+  settings.job_max_attempts tentatives.
+- Arrêt : les jobs en cours ont un délai de grâce pour finir ; les autres sont
+  remis en file immédiatement.
+- Les jobs terminés sont purgés après settings.job_ttl_hours.
+- Chaque étape (ocr, chunking, embedding n/m, storing, retry) est ajoutée,
+  horodatée, aux événements du job : GET /api/cours/jobs/{id}/events les pousse
+  au client.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from postgrest.exceptions import APIError
+
+from config import get_settings
+from db.client import get_supabase
+from db.jobs import (
+    UploadJob,
+    append_job_event,
+    claim_jobs,
+    complete_job,
+    delete_staged_files,
+    fail_job,
+    find_course_by_hash,
+    job_event,
+    load_file,
+    notify_job_watchers,
+    purge_expired_jobs,
+    release_job,
+    renew_leases,
+)
+from metrics import counter, histogram
+from rag.documents import DocumentError
+from rag.embedding_cache import embedding_cache
+from rag.ingestion import (
+    IngestedCourse,
+    ProgressCallback,
+    ingest_course_document,
+    ingest_course_image,
+    ingest_course_pages,
+    save_course,
+)
+from rag.retrieval import purge_orphan_embeddings
+
+logger = logging.getLogger("studybuddy.worker")
+settings = get_settings()
+
+JOBS_FINISHED = counter("upload_jobs_finished_total", "Jobs d'upload terminés (kind, status)")
+JOB_RETRIES = counter("upload_job_retries_total", "Jobs d'upload remis en file après un échec (kind)")
+JOB_DURATION = histogram(
+    "upload_job_duration_seconds", "Durée de traitement d'un job d'upload (kind)",
+    buckets=(2, 5, 10, 20, 30, 60, 120, 300),
+)
+
+_PURGE_INTERVAL = 600.0   # s entre deux purges (jobs expirés, embeddings orphelins)
+_SHUTDOWN_GRACE = 20.0    # s laissées aux jobs en cours à l'arrêt
+
+
+class JobFailed(Exception):
+    """Erreur définitive, affichée telle quelle à l'élève : pas de nouvelle tentative."""
+
+
+class JobProgress:
+    """
+    Étapes d'un job, écrites dans upload_jobs.events dans l'ordre par une
+    tâche de fond : l'ingestion n'attend jamais la base.
+    """
+
+    def __init__(self, job: UploadJob, worker_id: str) -> None:
+        self.job = job
+        self.worker_id = worker_id
+        self._queue: asyncio.Queue[dict | None] = asyncio.Queue()
+        self._task = asyncio.create_task(self._write())
+
+    def __call__(self, stage: str, **details) -> None:
+        self._queue.put_nowait(job_event(stage, **details))
+
+    async def _write(self) -> None:
+        while (event := await self._queue.get()) is not None:
+            try:
+                await append_job_event(self.job.id, self.worker_id, event)
+            except Exception as e:
+                logger.warning("[WORKER] étape non enregistrée job=%s stage=%s: %s", self.job.id, event["stage"], e)
+            notify_job_watchers(self.job.id)
+
+    async def close(self) -> None:
+        """Attend l'écriture des étapes en attente."""
+        self._queue.put_nowait(None)
+        await self._task
+
+    def cancel(self) -> None:
+        self._task.cancel()
+
+
+# ── Traitement d'un job ───────────────────────────────────────────────────────
+
+async def _ingest_photos(job: UploadJob, course_id: str, progress: ProgressCallback) -> IngestedCourse:
+    """OCR en streaming pour une page, pages en parallèle puis chunking d'un seul tenant sinon."""
+    pages = await asyncio.gather(*(load_file(f) for f in job.files))
+    if len(pages) == 1:
+        ingested = await ingest_course_image(pages[0], course_id, user_id=job.user_id, progress=progress)
+    else:
+        ingested = await ingest_course_pages(list(pages), course_id, user_id=job.user_id, progress=progress)
+    if not ingested.ocr.content:
+        raise JobFailed("Impossible d'extraire du texte de cette image.")
+    return ingested
+
+
+async def _ingest_document(job: UploadJob, course_id: str, progress: ProgressCallback) -> IngestedCourse:
+    """Extraction locale depuis une copie temporaire du document."""
+    staged = job.files[0]
+    data = await load_file(staged)
+    with tempfile.NamedTemporaryFile(
+        prefix="studybuddy-import-", suffix=Path(staged.filename or "").suffix, delete=False,
+    ) as tmp:
+        tmp.write(data)
+        path = Path(tmp.name)
+    try:
+        return await ingest_course_document(
+            path,
+            job.payload["document_kind"],
+            course_id,
+            filename=staged.filename,
+            subject=job.payload.get("subject"),
+            progress=progress,
+        )
+    except DocumentError as e:
+        raise JobFailed(str(e)) from e
+    finally:
+        path.unlink(missing_ok=True)
+
+
+_HANDLERS = {"photo": _ingest_photos, "document": _ingest_document}
+
+
+async def _discard_partial_course(course_id: str) -> None:
+    """
+    Une tentative précédente a pu enregistrer le cours (transaction validée)
+    puis échouer avant la fin du job : il est remplacé. Chunks et sections
+    suivent par ON DELETE CASCADE.
+    """
+    await asyncio.to_thread(lambda: get_supabase().table("courses").delete().eq("id", course_id).execute())
+
+
+async def process_job(job: UploadJob, progress: ProgressCallback) -> dict:
+    """Ingestion + stockage du cours ; retourne le résultat du job (cours créé, durée des étapes)."""
+    started = time.perf_counter()
+    course_id = job.payload["course_id"]
+    if job.attempts > 1:
+        await _discard_partial_course(course_id)
+
+    ingested = await _HANDLERS[job.kind](job, course_id, progress)
+    logger.info("[WORKER] ingestion OK job=%s titre=%s", job.id, ingested.ocr.title)
+
+    progress("storing")
+    storing = time.perf_counter()
+    try:
+        created_at = await save_course(course_id, job.user_id, ingested, content_hash=job.content_hash)
+    except APIError as e:
+        existing = None
+        if e.code == "23505" and job.content_hash:
+            existing = await asyncio.to_thread(find_course_by_hash, job.user_id, job.content_hash)
+        if existing is None:
+            raise
+        # Le même contenu a déjà donné un cours (upload concurrent) : c'est lui le résultat
+        logger.info("[WORKER] job=%s cours déjà existant course_id=%s", job.id, existing["id"])
+        return {"course": existing, "timings": {**ingested.timings, "total": round(time.perf_counter() - started, 3)}}
+    end = time.perf_counter()
+
+    course = ingested.ocr
+    return {
+        "course": {
+            "id": course_id,
+            "title": course.title,
+            "subject": course.subject,
+            "level": course.level,
+            "keywords": course.keywords,
+            "chunk_count": len(ingested.chunks_with_embeddings),
+            "created_at": created_at,
+        },
+        "timings": {
+            **ingested.timings,
+            "storing": round(end - storing, 3),
+            "total": round(end - started, 3),
+        },
+    }
+
+
+# ── Worker ────────────────────────────────────────────────────────────────────
+
+class IngestionWorker:
+    def __init__(self, concurrency: int | None = None, worker_id: str | None = None) -> None:
+        self.concurrency = concurrency or settings.job_concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._running: dict[str, tuple[UploadJob, asyncio.Task]] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._loop_task: asyncio.Task | None = None
+
+    def notify(self) -> None:
+        """Nouveau job en file ou place libérée : réclamation sans attendre le prochain poll."""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        self._loop_task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        logger.info("[WORKER] %s démarré (concurrence %d)", self.worker_id, self.concurrency)
+        last_renewal = last_purge = time.monotonic()
+        while not self._stopping:
+            self._wakeup.clear()
+            free = self.concurrency - len(self._running)
+            if free > 0:
+                try:
+                    for job in await claim_jobs(self.worker_id, free):
+                        self._running[job.id] = (job, asyncio.create_task(self._execute(job)))
+                except Exception as e:
+                    logger.warning("[WORKER] réclamation impossible : %s", e)
+
+            now = time.monotonic()
+            if now - last_renewal >= settings.job_lease_seconds / 3:
+                last_renewal = now
+                await self._renew_leases()
+            if now - last_purge >= _PURGE_INTERVAL:
+                last_purge = now
+                await self._purge()
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.job_poll_interval)
+            except TimeoutError:
+                pass
+
+    async def stop(self, grace: float = _SHUTDOWN_GRACE) -> None:
+        """Arrête de réclamer, laisse `grace` secondes aux jobs en cours, remet les autres en file."""
+        self._stopping = True
+        self.notify()
+        if self._loop_task is not None:
+            await self._loop_task
+        tasks = [task for _, task in self._running.values()]
+        if tasks:
+            logger.info("[WORKER] arrêt : %d job(s) en cours", len(tasks))
+            _, pending = await asyncio.wait(tasks, timeout=grace)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        logger.info("[WORKER] %s arrêté", self.worker_id)
+
+    async def _renew_leases(self) -> None:
+        try:
+            await renew_leases(list(self._running), self.worker_id)
+        except Exception as e:
+            logger.warning("[WORKER] renouvellement des baux impossible : %s", e)
+
+    async def _purge(self) -> None:
+        try:
+            purged = await purge_expired_jobs()
+            if purged:
+                logger.info("[WORKER] %d job(s) expiré(s) purgé(s)", purged)
+            orphans = await purge_orphan_embeddings()
+            if orphans:
+                logger.info("[WORKER] %d embedding(s) orphelin(s) purgé(s)", orphans)
+            expired = await embedding_cache.purge()
+            if expired:
+                logger.info("[WORKER] %d entrée(s) du cache d'embeddings purgée(s)", expired)
+        except Exception as e:
+            logger.warning("[WORKER] purge impossible : %s", e)
+
+    async def _execute(self, job: UploadJob) -> None:
+        logger.info("[WORKER] job=%s kind=%s tentative %d/%d", job.id, job.kind, job.attempts, job.max_attempts)
+        start = time.perf_counter()
+        progress = JobProgress(job, self.worker_id)
+        try:
+            if job.attempts > job.max_attempts:
+                # Bail expiré à chaque tentative : le job fait probablement tomber le worker
+                raise JobFailed("Le traitement a été interrompu à plusieurs reprises. Réessaie l'upload.")
+            try:
+                result = await process_job(job, progress)
+            finally:
+                await progress.close()
+            if not await complete_job(job, self.worker_id, result):
+                logger.warning("[WORKER] job=%s repris par un autre worker, résultat ignoré", job.id)
+                return
+            await delete_staged_files(job)
+            JOBS_FINISHED.inc(kind=job.kind, status="done")
+            JOB_DURATION.observe(time.perf_counter() - start, kind=job.kind)
+            logger.info("[WORKER] SUCCES job=%s timings=%s", job.id, result["timings"])
+        except asyncio.CancelledError:
+            progress.cancel()
+            try:
+                await release_job(job, self.worker_id)
+            except Exception as e:
+                logger.warning("[WORKER] job=%s non remis en file (bail à expirer) : %s", job.id, e)
+            raise
+        except JobFailed as e:
+            logger.warning("[WORKER] job=%s refusé : %s", job.id, e)
+            await self._fail(job, str(e), retryable=False)
+        except Exception as e:
+            logger.error("[WORKER] ERREUR job=%s: %s", job.id, e, exc_info=True)
+            await self._fail(job, str(e), retryable=True)
+        finally:
+            self._running.pop(job.id, None)
+            notify_job_watchers(job.id)
+            self.notify()
+
+    async def _fail(self, job: UploadJob, error: str, retryable: bool) -> None:
+        try:
+            if retryable and job.attempts < job.max_attempts:
+                await append_job_event(job.id, self.worker_id, job_event("retry", attempt=job.attempts, error=error))
+            retry = await fail_job(job, self.worker_id, error, retryable)
+        except Exception as e:
+            # Le bail expirera et le job sera repris
+            logger.warning("[WORKER] état du job=%s non enregistré : %s", job.id, e)
+            return
+        if retry:
+            JOB_RETRIES.inc(kind=job.kind)
+            return
+        await delete_staged_files(job)
+        JOBS_FINISHED.inc(kind=job.kind, status="error")
+
+
+# ── Worker du process API ─────────────────────────────────────────────────────
+
+_worker: IngestionWorker | None = None
+
+
+def start_worker() -> IngestionWorker:
+    global _worker
+    _worker = IngestionWorker()
+    _worker.start()
+    return _worker
+
+
+async def stop_worker() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
+
+
+def notify_worker() -> None:
+    """Réveille le worker du process, s'il y en a un (sinon un worker dédié réclamera au prochain poll)."""
+    if _worker is not None:
+        _worker.notify()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, help=f"Défaut : {settings.job_concurrency}")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        stream=sys.stdout,
+    )
+
+    async def run() -> None:
+        worker = IngestionWorker(concurrency=args.concurrency)
+        worker.start()
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stopped.set)
+        await stopped.wait()
+        await worker.stop()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
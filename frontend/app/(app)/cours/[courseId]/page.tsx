@@ -2,13 +2,13 @@
 
 import { useEffect, useState } from 'react'
 import { useParams, useRouter } from 'next/navigation'
-import { ChevronLeft, BookOpen, Calendar, Tag } from 'lucide-react'
+import { ChevronLeft, BookOpen, Calendar, Tag, Pencil } from 'lucide-react'
 import { Header } from '@/components/layout/header'
 import { PageWrapper } from '@/components/layout/page-wrapper'
 import { SubjectBadge } from '@/components/shared/subject-badge'
 import { MathRenderer } from '@/components/shared/math-renderer'
 import { Skeleton } from '@/components/ui/skeleton'
-import { getCourse } from '@/lib/api'
+import { getCourse, updateCourse } from '@/lib/api'
 import type { CourseDetail } from '@/lib/api'
 
 export default function CourseDetailPage() {
@@ -17,6 +17,9 @@ export default function CourseDetailPage() {
   const [course, setCourse] = useState<CourseDetail | null>(null)
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
+  const [draft, setDraft] = useState<string | null>(null)
+  const [saving, setSaving] = useState(false)
+  const [saveError, setSaveError] = useState<string | null>(null)
 
   useEffect(() => {
     if (!courseId) return
@@ -26,6 +29,26 @@ export default function CourseDetailPage() {
       .finally(() => setLoading(false))
   }, [courseId])
 
+  async function saveDraft() {
+    if (!course || draft === null) return
+    if (draft === course.raw_content) {
+      setDraft(null)
+      return
+    }
+    setSaving(true)
+    setSaveError(null)
+    try {
+      // Seuls les passages modifiés sont ré-indexés côté serveur
+      const edited = await updateCourse(course.id, { raw_content: draft })
+      setCourse(edited.course)
+      setDraft(null)
+    } catch (e) {
+      setSaveError(e instanceof Error ? e.message : 'Enregistrement impossible.')
+    } finally {
+      setSaving(false)
+    }
+  }
+
   const date = course
     ? new Date(course.created_at).toLocaleDateString('fr-FR', {
         day: 'numeric',
@@ -105,12 +128,54 @@ export default function CourseDetailPage() {
 
             {/* Contenu */}
             <div className="bg-white rounded-2xl border border-slate-100 p-4 shadow-sm">
-              <div className="prose prose-sm max-w-none prose-headings:text-slate-900 prose-p:text-slate-700 prose-strong:text-slate-900 prose-li:text-slate-700 prose-code:text-indigo-700 prose-code:bg-indigo-50 prose-code:rounded prose-code:px-1">
-                <MathRenderer
-                  content={course.raw_content}
-                  className="text-slate-800 leading-relaxed text-sm"
-                />
-              </div>
+              {draft !== null ? (
+                <div className="flex flex-col gap-3">
+                  <textarea
+                    value={draft}
+                    onChange={(e) => setDraft(e.target.value)}
+                    rows={16}
+                    className="w-full text-sm text-slate-800 leading-relaxed border border-slate-200 rounded-xl p-3 focus:outline-none focus:ring-2 focus:ring-indigo-200"
+                  />
+                  {saveError && <p className="text-xs text-red-500">{saveError}</p>}
+                  <div className="flex justify-end gap-2">
+                    <button
+                      type="button"
+                      onClick={() => setDraft(null)}
+                      disabled={saving}
+                      className="px-3 py-1.5 text-sm text-slate-600 rounded-xl hover:bg-slate-100 cursor-pointer"
+                    >
+                      Annuler
+                    </button>
+                    <button
+                      type="button"
+                      onClick={saveDraft}
+                      disabled={saving || !draft.trim()}
+                      className="px-3 py-1.5 text-sm text-white bg-indigo-600 rounded-xl hover:bg-indigo-700 disabled:opacity-50 cursor-pointer"
+                    >
+                      {saving ? 'Enregistrement…' : 'Enregistrer'}
+                    </button>
+                  </div>
+                </div>
+              ) : (
+                <>
+                  <div className="flex justify-end -mt-1 mb-1">
+                    <button
+                      type="button"
+                      onClick={() => setDraft(course.raw_content)}
+                      className="flex items-center gap-1 text-xs text-slate-500 hover:text-indigo-600 cursor-pointer"
+                    >
+                      <Pencil className="w-3.5 h-3.5" strokeWidth={2} />
+                      Corriger le texte
+                    </button>
+                  </div>
+                  <div className="prose prose-sm max-w-none prose-headings:text-slate-900 prose-p:text-slate-700 prose-strong:text-slate-900 prose-li:text-slate-700 prose-code:text-indigo-700 prose-code:bg-indigo-50 prose-code:rounded prose-code:px-1">
+                    <MathRenderer
+                      content={course.raw_content}
+                      className="text-slate-800 leading-relaxed text-sm"
+                    />
+                  </div>
+                </>
+              )}
             </div>
           </div>
         )}
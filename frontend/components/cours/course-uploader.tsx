@@ -1,106 +1,127 @@
 'use client'
 
-import { useState, useRef, useEffect, useCallback } from 'react'
+import { useState, useRef, useEffect } from 'react'
 import { useRouter } from 'next/navigation'
 import Image from 'next/image'
-import { Camera, Upload, CheckCircle, AlertCircle, ArrowLeft } from 'lucide-react'
+import { Camera, Upload, CheckCircle, AlertCircle, ArrowLeft, Plus, X } from 'lucide-react'
 import { Button } from '@/components/ui/button'
 import { Progress } from '@/components/ui/progress'
 import { Spinner } from '@/components/shared/spinner'
-import { uploadCourse, getUploadJob } from '@/lib/api'
+import { uploadCourse, streamUploadJob } from '@/lib/api'
 import { useCoursStore } from '@/store/cours.store'
+import type { UploadJobEvent } from '@/types'
 
 type Step = 'select' | 'preview' | 'uploading' | 'done' | 'error'
 
 const ACCEPT = 'image/jpeg,image/png,image/webp,image/heic,image/heif'
 const MAX_MB = 10
-const POLL_INTERVAL_MS = 2000
+const MAX_PAGES = 12
+
+// Libellé + avancement affichés pour chaque étape poussée par le serveur
+function stageProgress(event: UploadJobEvent): { label: string; value: number } | null {
+  const ratio = event.total ? (event.done ?? 0) / event.total : 0
+  switch (event.stage) {
+    case 'queued':
+      return { label: 'En attente...', value: 20 }
+    case 'ocr':
+      return event.total && event.total > 1
+        ? { label: `Lecture des pages (${event.done ?? 0}/${event.total})...`, value: 25 + Math.round(30 * ratio) }
+        : { label: 'Lecture du cours...', value: 30 }
+    case 'extraction':
+      return { label: 'Lecture du document...', value: 30 }
+    case 'chunking':
+      return { label: 'Découpage du cours...', value: 60 }
+    case 'embedding':
+      return { label: `Vectorisation (${event.done ?? 0}/${event.total ?? 0})...`, value: 60 + Math.round(25 * ratio) }
+    case 'storing':
+      return { label: 'Finalisation...', value: 90 }
+    case 'retry':
+      return { label: 'Nouvelle tentative...', value: 20 }
+    default:
+      return null
+  }
+}
 
 export function CourseUploader() {
   const router = useRouter()
   const { setCourses, courses } = useCoursStore()
 
   const [step, setStep] = useState<Step>('select')
-  const [file, setFile] = useState<File | null>(null)
-  const [preview, setPreview] = useState<string | null>(null)
+  const [files, setFiles] = useState<File[]>([])
+  const [previews, setPreviews] = useState<string[]>([])
   const [progressLabel, setProgressLabel] = useState('Chargement...')
   const [progressValue, setProgressValue] = useState(10)
   const [error, setError] = useState<string | null>(null)
 
-  const pollTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null)
-  const startTimeRef = useRef<number>(0)
+  const streamRef = useRef<AbortController | null>(null)
 
   useEffect(() => {
-    return () => {
-      if (pollTimerRef.current) clearTimeout(pollTimerRef.current)
-    }
+    return () => streamRef.current?.abort()
   }, [])
 
-  function handleFileSelect(f: File) {
-    if (f.size > MAX_MB * 1024 * 1024) {
+  // Ajoute des pages à la suite de celles déjà choisies (un seul cours)
+  function handleFilesSelect(selected: File[]) {
+    if (selected.length === 0) return
+    if (selected.some((f) => f.size > MAX_MB * 1024 * 1024)) {
       setError(`L'image est trop lourde (max ${MAX_MB} Mo).`)
       setStep('error')
       return
     }
-    setFile(f)
-    setPreview(URL.createObjectURL(f))
+    if (files.length + selected.length > MAX_PAGES) {
+      setError(`Trop de pages (max ${MAX_PAGES} photos par cours).`)
+      setStep('error')
+      return
+    }
+    setFiles([...files, ...selected])
+    setPreviews([...previews, ...selected.map((f) => URL.createObjectURL(f))])
     setStep('preview')
     setError(null)
   }
 
-  const pollJob = useCallback(async (jobId: string) => {
-    try {
-      const job = await getUploadJob(jobId)
-
-      if (job.status === 'done' && job.course) {
-        if (pollTimerRef.current) clearTimeout(pollTimerRef.current)
-        setCourses([{ ...job.course, keywords: job.course.keywords }, ...courses])
-        setProgressValue(100)
-        setStep('done')
-        return
-      }
-
-      if (job.status === 'error') {
-        if (pollTimerRef.current) clearTimeout(pollTimerRef.current)
-        setError(job.error ?? "Une erreur s'est produite. Réessaie avec une photo plus claire.")
-        setStep('error')
-        return
-      }
+  function removePage(index: number) {
+    URL.revokeObjectURL(previews[index])
+    const remaining = files.filter((_, i) => i !== index)
+    setFiles(remaining)
+    setPreviews(previews.filter((_, i) => i !== index))
+    if (remaining.length === 0) setStep('select')
+  }
 
-      // Label progressif basé sur le temps écoulé
-      const elapsed = Date.now() - startTimeRef.current
-      if (elapsed < 5000) {
-        setProgressLabel('Lecture du cours...')
-        setProgressValue(30)
-      } else if (elapsed < 12000) {
-        setProgressLabel('Vectorisation en cours...')
-        setProgressValue(65)
-      } else {
-        setProgressLabel('Finalisation...')
-        setProgressValue(85)
-      }
+  function handleJobEvent(event: UploadJobEvent) {
+    if (event.stage === 'done' && event.course) {
+      setCourses([{ ...event.course, keywords: event.course.keywords }, ...courses])
+      setProgressValue(100)
+      setStep('done')
+      return
+    }
 
-      pollTimerRef.current = setTimeout(() => pollJob(jobId), POLL_INTERVAL_MS)
-    } catch {
-      if (pollTimerRef.current) clearTimeout(pollTimerRef.current)
-      setError('Erreur réseau. Vérifie ta connexion et réessaie.')
+    if (event.stage === 'error') {
+      setError(event.error ?? "Une erreur s'est produite. Réessaie avec une photo plus claire.")
       setStep('error')
+      return
+    }
+
+    const progress = stageProgress(event)
+    if (progress) {
+      setProgressLabel(progress.label)
+      setProgressValue(progress.value)
     }
-  }, [courses, setCourses])
+  }
 
   async function handleUpload() {
-    if (!file) return
+    if (files.length === 0) return
     setStep('uploading')
     setProgressLabel('Envoi en cours...')
     setProgressValue(10)
-    startTimeRef.current = Date.now()
 
+    const controller = new AbortController()
+    streamRef.current = controller
     try {
-      const job = await uploadCourse(file)
+      const job = await uploadCourse(files)
       setProgressLabel('Lecture du cours...')
       setProgressValue(25)
-      pollTimerRef.current = setTimeout(() => pollJob(job.job_id), POLL_INTERVAL_MS)
+      await streamUploadJob(job.job_id, handleJobEvent, controller.signal)
     } catch (err) {
+      if (controller.signal.aborted) return
       setError(
         err instanceof Error
           ? err.message
@@ -111,46 +132,51 @@ export function CourseUploader() {
   }
 
   function reset() {
-    if (pollTimerRef.current) clearTimeout(pollTimerRef.current)
+    streamRef.current?.abort()
     setStep('select')
-    setFile(null)
-    if (preview) URL.revokeObjectURL(preview)
-    setPreview(null)
+    setFiles([])
+    previews.forEach((url) => URL.revokeObjectURL(url))
+    setPreviews([])
     setError(null)
     setProgressValue(10)
   }
 
+  const fileInputs = (
+    <>
+      <input
+        type="file"
+        accept={ACCEPT}
+        multiple
+        aria-label="Choisir une ou plusieurs images depuis la galerie"
+        className="hidden"
+        id="file-gallery"
+        onChange={(e) => {
+          handleFilesSelect(Array.from(e.target.files ?? []))
+          e.target.value = ''
+        }}
+      />
+      <input
+        type="file"
+        accept="image/*"
+        // eslint-disable-next-line @typescript-eslint/ban-ts-comment
+        // @ts-ignore capture is a valid HTML attribute for mobile inputs
+        capture="environment"
+        aria-label="Prendre une photo avec l'appareil photo"
+        className="hidden"
+        id="file-camera"
+        onChange={(e) => {
+          handleFilesSelect(Array.from(e.target.files ?? []))
+          e.target.value = ''
+        }}
+      />
+    </>
+  )
+
   // ── Select ────────────────────────────────────────────────────────────────
   if (step === 'select') {
     return (
       <div className="flex flex-col gap-4">
-        <input
-          type="file"
-          accept={ACCEPT}
-          aria-label="Choisir une image depuis la galerie"
-          className="hidden"
-          id="file-gallery"
-          onChange={(e) => {
-            const f = e.target.files?.[0]
-            if (f) handleFileSelect(f)
-            e.target.value = ''
-          }}
-        />
-        <input
-          type="file"
-          accept="image/*"
-          // eslint-disable-next-line @typescript-eslint/ban-ts-comment
-          // @ts-ignore capture is a valid HTML attribute for mobile inputs
-          capture="environment"
-          aria-label="Prendre une photo avec l'appareil photo"
-          className="hidden"
-          id="file-camera"
-          onChange={(e) => {
-            const f = e.target.files?.[0]
-            if (f) handleFileSelect(f)
-            e.target.value = ''
-          }}
-        />
+        {fileInputs}
 
         <button
           type="button"
@@ -176,7 +202,9 @@ export function CourseUploader() {
           </div>
           <div>
             <p className="font-semibold text-slate-900 text-sm">Choisir depuis la galerie</p>
-            <p className="text-xs text-slate-500 mt-0.5">JPEG, PNG, WEBP — max 10 Mo</p>
+            <p className="text-xs text-slate-500 mt-0.5">
+              JPEG, PNG, WEBP — max 10 Mo, jusqu&apos;à {MAX_PAGES} pages
+            </p>
           </div>
         </button>
       </div>
@@ -184,18 +212,50 @@ export function CourseUploader() {
   }
 
   // ── Preview ───────────────────────────────────────────────────────────────
-  if (step === 'preview' && preview) {
+  if (step === 'preview' && previews.length > 0) {
     return (
       <div className="flex flex-col gap-4">
+        {fileInputs}
         <div className="relative w-full aspect-[3/4] rounded-2xl overflow-hidden bg-slate-100">
           <Image
-            src={preview}
+            src={previews[0]}
             alt="Aperçu du cours"
             fill
             className="object-cover"
             sizes="(max-width: 640px) 100vw, 480px"
           />
         </div>
+        <div className="flex gap-2 overflow-x-auto pb-1">
+          {previews.map((url, index) => (
+            <div
+              key={url}
+              className="relative w-16 aspect-[3/4] rounded-lg overflow-hidden bg-slate-100 flex-shrink-0"
+            >
+              <Image src={url} alt={`Page ${index + 1}`} fill className="object-cover" sizes="64px" />
+              <span className="absolute bottom-0.5 left-1 text-[10px] font-semibold text-white drop-shadow">
+                {index + 1}
+              </span>
+              <button
+                type="button"
+                onClick={() => removePage(index)}
+                aria-label={`Retirer la page ${index + 1}`}
+                className="absolute top-0.5 right-0.5 w-5 h-5 rounded-full bg-black/50 flex items-center justify-center"
+              >
+                <X className="w-3 h-3 text-white" />
+              </button>
+            </div>
+          ))}
+          {files.length < MAX_PAGES && (
+            <button
+              type="button"
+              onClick={() => document.getElementById('file-camera')?.click()}
+              aria-label="Ajouter une page"
+              className="w-16 aspect-[3/4] rounded-lg border border-dashed border-slate-300 flex items-center justify-center flex-shrink-0 hover:border-indigo-300"
+            >
+              <Plus className="w-5 h-5 text-slate-400" />
+            </button>
+          )}
+        </div>
         <div className="flex gap-3">
           <Button variant="outline" onClick={reset} className="flex-1 h-12 gap-2">
             <ArrowLeft className="w-4 h-4" />
@@ -205,7 +265,7 @@ export function CourseUploader() {
             onClick={handleUpload}
             className="flex-1 h-12 bg-indigo-600 hover:bg-indigo-700 text-white font-medium"
           >
-            Envoyer
+            {files.length > 1 ? `Envoyer ${files.length} pages` : 'Envoyer'}
           </Button>
         </div>
       </div>
@@ -3,6 +3,7 @@ import type {
   CourseListItem,
   CorrectionResponse,
   CorrectParams,
+  UploadJobEvent,
   UploadJobResponse,
 } from '@/types'
 
@@ -19,38 +20,127 @@ async function getAuthHeader(): Promise<string> {
   return `Bearer ${session.access_token}`
 }
 
+// Erreurs structurées de l'API : {"detail": {"code": "IMAGE_BLURRY", "message": "..."}}
+function errorMessage(text: string): string {
+  try {
+    const detail = JSON.parse(text)?.detail
+    if (typeof detail === 'string') return detail
+    if (detail?.message) return detail.message
+  } catch {
+    // réponse non JSON
+  }
+  return text
+}
+
 async function handleResponse<T>(res: Response): Promise<T> {
   if (!res.ok) {
     const text = await res.text().catch(() => res.statusText)
-    throw new Error(text || `HTTP ${res.status}`)
+    throw new Error(errorMessage(text) || `HTTP ${res.status}`)
   }
   return res.json() as Promise<T>
 }
 
 // ── Cours ─────────────────────────────────────────────────────────────────────
 
+const UPLOAD_RETRIES = 3
+const RETRYABLE_STATUS = new Set([502, 503, 504])
+
 /**
- * Lance un upload asynchrone. Retourne immédiatement {job_id, status:'queued'}.
- * Poll getUploadJob(job_id) toutes les 2s jusqu'à status='done' | 'error'.
+ * POST d'un upload, rejoué sur coupure réseau ou passerelle indisponible.
+ * La même Idempotency-Key accompagne chaque essai : le serveur renvoie le job
+ * déjà créé au lieu de retraiter le fichier.
  */
-export async function uploadCourse(file: File): Promise<UploadJobResponse> {
+async function postUpload(path: string, form: FormData): Promise<UploadJobResponse> {
+  const idempotencyKey = crypto.randomUUID()
+  for (let attempt = 1; ; attempt++) {
+    const authHeader = await getAuthHeader()
+    try {
+      const res = await fetch(`${API_URL}${path}`, {
+        method: 'POST',
+        headers: { Authorization: authHeader, 'Idempotency-Key': idempotencyKey },
+        body: form,
+      })
+      if (!RETRYABLE_STATUS.has(res.status) || attempt === UPLOAD_RETRIES) {
+        return handleResponse<UploadJobResponse>(res)
+      }
+    } catch (err) {
+      // fetch ne rejette que sur erreur réseau
+      if (attempt === UPLOAD_RETRIES) throw err
+    }
+    await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** (attempt - 1)))
+  }
+}
+
+/**
+ * Lance un upload asynchrone : une photo, ou les pages d'un même cours dans
+ * l'ordre (un seul cours créé). Retourne immédiatement {job_id, status:'queued'}.
+ * Suivre la progression avec streamUploadJob(job_id).
+ */
+export async function uploadCourse(files: File[]): Promise<UploadJobResponse> {
+  const form = new FormData()
+  for (const file of files) form.append('file', file)
+  return postUpload('/api/cours/upload', form)
+}
+
+/**
+ * Importe un cours numérique (PDF avec couche texte, Markdown, texte).
+ * Même suivi que uploadCourse : streamUploadJob(job_id).
+ */
+export async function importCourseDocument(file: File, subject?: string): Promise<UploadJobResponse> {
   const form = new FormData()
   form.append('file', file)
+  if (subject) form.append('subject', subject)
+  return postUpload('/api/cours/import', form)
+}
+
+export async function getUploadJob(jobId: string): Promise<UploadJobResponse> {
   const authHeader = await getAuthHeader()
-  const res = await fetch(`${API_URL}/api/cours/upload`, {
-    method: 'POST',
+  const res = await fetch(`${API_URL}/api/cours/jobs/${jobId}`, {
     headers: { Authorization: authHeader },
-    body: form,
   })
   return handleResponse<UploadJobResponse>(res)
 }
 
-export async function getUploadJob(jobId: string): Promise<UploadJobResponse> {
+/**
+ * Progression d'un job poussée en SSE : onEvent est appelé à chaque étape
+ * (ocr, chunking, embedding n/m, storing...). Se termine sur l'événement
+ * 'done' ou 'error', ou quand signal est annulé.
+ */
+export async function streamUploadJob(
+  jobId: string,
+  onEvent: (event: UploadJobEvent) => void,
+  signal?: AbortSignal,
+): Promise<void> {
   const authHeader = await getAuthHeader()
-  const res = await fetch(`${API_URL}/api/cours/jobs/${jobId}`, {
+  const res = await fetch(`${API_URL}/api/cours/jobs/${jobId}/events`, {
     headers: { Authorization: authHeader },
+    signal,
   })
-  return handleResponse<UploadJobResponse>(res)
+  if (!res.ok) {
+    const text = await res.text().catch(() => res.statusText)
+    throw new Error(errorMessage(text) || `HTTP ${res.status}`)
+  }
+  const reader = res.body?.getReader()
+  if (!reader) throw new Error('Pas de réponse du serveur.')
+
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop() ?? ''
+
+    for (const line of lines) {
+      if (!line.startsWith('data: ')) continue
+      const event = JSON.parse(line.slice(6)) as UploadJobEvent
+      onEvent(event)
+      if (event.stage === 'done' || event.stage === 'error') return
+    }
+  }
+  throw new Error('Connexion interrompue pendant le traitement.')
 }
 
 export interface CourseDetail {
@@ -71,6 +161,28 @@ export async function getCourse(courseId: string): Promise<CourseDetail> {
   return handleResponse<CourseDetail>(res)
 }
 
+export interface CourseEditResponse {
+  course: CourseDetail
+  chunk_count: number
+  embedded: number
+  kept: number
+  removed: number
+  timings: Record<string, number>
+}
+
+export async function updateCourse(
+  courseId: string,
+  edits: Partial<Pick<CourseDetail, 'raw_content' | 'title' | 'subject' | 'level' | 'keywords'>>
+): Promise<CourseEditResponse> {
+  const authHeader = await getAuthHeader()
+  const res = await fetch(`${API_URL}/api/cours/${courseId}`, {
+    method: 'PATCH',
+    headers: { Authorization: authHeader, 'Content-Type': 'application/json' },
+    body: JSON.stringify(edits),
+  })
+  return handleResponse<CourseEditResponse>(res)
+}
+
 export async function listCourses(): Promise<CourseListItem[]> {
   const authHeader = await getAuthHeader()
   const res = await fetch(`${API_URL}/api/cours/`, {
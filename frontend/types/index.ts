@@ -62,6 +62,30 @@ export interface UploadJobResponse {
   status: 'queued' | 'processing' | 'done' | 'error'
   course?: CourseResponse
   error?: string
+  timings?: Record<string, number> | null  // Durée de chaque étape (s)
+}
+
+// Événements SSE de GET /api/cours/jobs/{job_id}/events
+export type UploadJobStage =
+  | 'queued'
+  | 'ocr'
+  | 'extraction'
+  | 'chunking'
+  | 'embedding'
+  | 'storing'
+  | 'retry'
+  | 'done'
+  | 'error'
+
+export interface UploadJobEvent {
+  stage: UploadJobStage
+  at: string | null            // Horodatage ISO
+  done?: number                // ocr (pages lues) / embedding (chunks embeddés)
+  total?: number
+  attempt?: number             // retry
+  course?: CourseResponse      // done
+  timings?: Record<string, number> | null
+  error?: string               // error / retry
 }
 
 export interface CorrectParams {
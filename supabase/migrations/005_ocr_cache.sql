@@ -0,0 +1,50 @@
+-- ============================================================
+-- StudyBuddy — Migration 005 : cache des résultats OCR
+-- Évite de repayer un appel Claude Vision pour une image déjà lue :
+--   - sha256 : bytes identiques (retry, re-soumission du même fichier)
+--   - phash  : dHash 256 bits de l'image normalisée (nouvelle photo de la même page)
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    id          UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    kind        TEXT NOT NULL CHECK (kind IN ('course', 'exercise')),
+    sha256      TEXT NOT NULL,
+    phash       BIT(256),
+    user_id     UUID,
+    result      JSONB NOT NULL,
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (kind, sha256)
+);
+
+-- La recherche perceptuelle est toujours restreinte à un élève
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_user ON ocr_cache(user_id, kind);
+
+-- ============================================================
+-- FONCTION RPC : match_ocr_cache
+-- Plus proche voisin en distance de Hamming parmi les images de l'élève
+-- ============================================================
+CREATE OR REPLACE FUNCTION match_ocr_cache(
+    kind_filter     TEXT,
+    user_id_filter  UUID,
+    query_phash     TEXT,
+    max_distance    INTEGER DEFAULT 28
+)
+RETURNS TABLE (
+    result    JSONB,
+    distance  INTEGER
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT oc.result, bit_count(oc.phash # query_phash::BIT(256))::INTEGER AS distance
+    FROM ocr_cache oc
+    WHERE
+        oc.kind = kind_filter
+        AND oc.user_id = user_id_filter
+        AND oc.phash IS NOT NULL
+        AND bit_count(oc.phash # query_phash::BIT(256)) <= max_distance
+    ORDER BY distance
+    LIMIT 1;
+$$;
+
+-- Table interne au backend (service_role) : aucun accès côté client
+ALTER TABLE ocr_cache ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,77 @@
+-- ============================================================
+-- StudyBuddy — Migration 006 : file des jobs d'upload
+-- Remplace le dict _JOBS en mémoire du process API :
+--   - l'état d'un job est lisible depuis n'importe quel worker uvicorn
+--   - un job en cours survit au redémarrage (bail expiré → repris)
+--   - les workers d'ingestion se partagent la file avec FOR UPDATE SKIP LOCKED
+-- Les fichiers envoyés attendent leur traitement dans le bucket Storage
+-- « course-uploads » ; ils sont supprimés dès que le job est terminé.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id            UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id       UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    kind          TEXT NOT NULL CHECK (kind IN ('photo', 'document')),
+    status        TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'processing', 'done', 'error')),
+    payload       JSONB NOT NULL DEFAULT '{}'::jsonb,   -- fichiers stagés, course_id, options
+    result        JSONB,                                -- cours créé + durée des étapes
+    error         TEXT,                                 -- dernière erreur (définitive si status = 'error')
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL DEFAULT 3,
+    run_after     TIMESTAMPTZ NOT NULL DEFAULT NOW(),   -- backoff entre deux tentatives
+    locked_by     TEXT,
+    locked_at     TIMESTAMPTZ,                          -- bail, renouvelé par le worker pendant le traitement
+    created_at    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at    TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- File d'attente : seuls les jobs à prendre sont indexés
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_queue ON upload_jobs(run_after)
+    WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_lease ON upload_jobs(locked_at)
+    WHERE status = 'processing';
+-- Purge des jobs terminés (TTL)
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_finished ON upload_jobs(updated_at)
+    WHERE status IN ('done', 'error');
+
+-- ============================================================
+-- FONCTION RPC : claim_upload_jobs
+-- Réserve jusqu'à max_jobs jobs prêts pour un worker. SKIP LOCKED : deux
+-- workers qui réclament en même temps ne prennent jamais le même job. Un job
+-- 'processing' dont le bail a expiré (worker mort) est repris.
+-- ============================================================
+CREATE OR REPLACE FUNCTION claim_upload_jobs(
+    worker_id      TEXT,
+    max_jobs       INTEGER DEFAULT 1,
+    lease_seconds  INTEGER DEFAULT 120
+)
+RETURNS SETOF upload_jobs
+LANGUAGE sql
+AS $$
+    UPDATE upload_jobs j
+    SET
+        status     = 'processing',
+        locked_by  = worker_id,
+        locked_at  = NOW(),
+        attempts   = j.attempts + 1,
+        updated_at = NOW()
+    WHERE j.id IN (
+        SELECT id
+        FROM upload_jobs
+        WHERE
+            (status = 'queued' AND run_after <= NOW())
+            OR (status = 'processing' AND locked_at < NOW() - make_interval(secs => lease_seconds))
+        ORDER BY run_after
+        LIMIT max_jobs
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+$$;
+
+-- Table interne au backend (service_role) : aucun accès côté client
+ALTER TABLE upload_jobs ENABLE ROW LEVEL SECURITY;
+
+-- Bucket privé des fichiers en attente de traitement
+INSERT INTO storage.buckets (id, name, public)
+VALUES ('course-uploads', 'course-uploads', false)
+ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,26 @@
+-- ============================================================
+-- StudyBuddy — Migration 007 : étapes de progression des jobs d'upload
+-- Le worker ajoute un événement horodaté à chaque étape (ocr, chunking,
+-- embedding n/m, storing...) ; GET /api/cours/jobs/{id}/events les pousse
+-- au client en SSE, à la place du polling toutes les 2 s.
+-- ============================================================
+
+ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS events JSONB NOT NULL DEFAULT '[]'::jsonb;
+
+-- ============================================================
+-- FONCTION RPC : append_upload_job_event
+-- Ajout atomique en fin de tableau (pas de lecture-modification-écriture
+-- côté backend), réservé au worker qui détient le job.
+-- ============================================================
+CREATE OR REPLACE FUNCTION append_upload_job_event(
+    job_id     UUID,
+    worker_id  TEXT,
+    event      JSONB
+)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    UPDATE upload_jobs
+    SET events = events || jsonb_build_array(event)
+    WHERE id = job_id AND locked_by = worker_id;
+$$;
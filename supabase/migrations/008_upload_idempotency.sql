@@ -0,0 +1,28 @@
+-- ============================================================
+-- StudyBuddy — Migration 008 : uploads idempotents
+-- Un upload rejoué (réseau mobile instable, retry du frontend) renvoie le job
+-- ou le cours existant au lieu de relancer l'OCR et de dupliquer les chunks :
+--   - idempotency_key : en-tête Idempotency-Key envoyé par le client
+--   - content_hash    : SHA-256 du contenu envoyé (pages dans l'ordre)
+-- Les index uniques rendent le doublon impossible même avec des retries
+-- concurrents : la seconde insertion échoue et l'API renvoie la première.
+-- ============================================================
+
+ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS content_hash    TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_upload_jobs_idempotency_key
+    ON upload_jobs(user_id, idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
+
+-- Un seul job vivant par contenu ; un job en erreur n'empêche pas de réessayer
+CREATE UNIQUE INDEX IF NOT EXISTS uq_upload_jobs_content_hash
+    ON upload_jobs(user_id, content_hash)
+    WHERE content_hash IS NOT NULL AND status <> 'error';
+
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Un contenu donne au plus un cours par élève (NULL : cours antérieurs, import en masse)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_courses_content_hash
+    ON courses(user_id, content_hash)
+    WHERE content_hash IS NOT NULL;
@@ -0,0 +1,77 @@
+-- ============================================================
+-- StudyBuddy — Migration 009 : édition d'un cours, réingestion incrémentale
+-- Corriger une faute d'OCR dans raw_content ne doit pas ré-embedder tout le
+-- cours : le backend re-chunke le texte, compare les chunks au hash de ceux
+-- déjà stockés et n'embedde que les nouveaux. apply_course_edit applique le
+-- tout (cours, suppressions, réindexation, insertions) en une transaction.
+-- ============================================================
+
+-- SHA-256 (hex) de course_chunks.content, calculé par le backend à l'insertion
+ALTER TABLE course_chunks ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+UPDATE course_chunks
+SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+WHERE content_hash IS NULL;
+
+-- ============================================================
+-- FONCTION RPC : apply_course_edit
+-- kept     : [{id, chunk_index, metadata}] chunks conservés, réindexés
+-- inserted : [{content, content_hash, embedding, chunk_index, metadata}]
+-- Refuse l'édition (SQLSTATE 40001) si le cours a changé depuis sa lecture
+-- (expected_updated_at) : deux éditions concurrentes ne peuvent pas produire
+-- de chunks en double.
+-- ============================================================
+CREATE OR REPLACE FUNCTION apply_course_edit(
+    p_course_id            UUID,
+    p_user_id              UUID,
+    p_expected_updated_at  TIMESTAMPTZ,
+    p_course               JSONB,
+    p_removed              UUID[],
+    p_kept                 JSONB,
+    p_inserted             JSONB
+)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    current_updated_at  TIMESTAMPTZ;
+    edited_at           TIMESTAMPTZ := NOW();
+BEGIN
+    SELECT updated_at INTO current_updated_at
+    FROM courses
+    WHERE id = p_course_id AND user_id = p_user_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'course % not found', p_course_id USING ERRCODE = 'P0002';
+    END IF;
+    IF current_updated_at IS DISTINCT FROM p_expected_updated_at THEN
+        RAISE EXCEPTION 'course % modified concurrently', p_course_id USING ERRCODE = '40001';
+    END IF;
+
+    UPDATE courses
+    SET
+        title       = p_course->>'title',
+        subject     = p_course->>'subject',
+        level       = p_course->>'level',
+        keywords    = ARRAY(SELECT jsonb_array_elements_text(p_course->'keywords')),
+        raw_content = p_course->>'raw_content',
+        updated_at  = edited_at
+    WHERE id = p_course_id;
+
+    DELETE FROM course_chunks
+    WHERE course_id = p_course_id AND id = ANY(p_removed);
+
+    UPDATE course_chunks cc
+    SET chunk_index = k.chunk_index, metadata = k.metadata
+    FROM jsonb_to_recordset(p_kept) AS k(id UUID, chunk_index INTEGER, metadata JSONB)
+    WHERE cc.id = k.id AND cc.course_id = p_course_id;
+
+    INSERT INTO course_chunks (course_id, user_id, content, content_hash, embedding, chunk_index, metadata)
+    SELECT p_course_id, p_user_id, i.content, i.content_hash, i.embedding::vector, i.chunk_index, i.metadata
+    FROM jsonb_to_recordset(p_inserted)
+        AS i(content TEXT, content_hash TEXT, embedding TEXT, chunk_index INTEGER, metadata JSONB);
+
+    RETURN edited_at;
+END;
+$$;
@@ -0,0 +1,145 @@
+-- ============================================================
+-- StudyBuddy — Migration 010 : sections de cours (retrieval en deux temps)
+-- Chaque cours est aussi stocké par sections (découpées sur ses titres),
+-- non vectorisées. Un chunk (feuille) pointe vers sa section : la recherche
+-- renvoie des feuilles précises, puis remplace plusieurs feuilles d'une même
+-- section par la section entière quand elle reste courte.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS course_sections (
+    course_id      UUID NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+    user_id        UUID NOT NULL,
+    section_index  INTEGER NOT NULL,
+    heading        TEXT NOT NULL DEFAULT '',   -- '' pour le texte avant le premier titre
+    content        TEXT NOT NULL,
+    PRIMARY KEY (course_id, section_index)
+);
+
+ALTER TABLE course_chunks ADD COLUMN IF NOT EXISTS section_index INTEGER;
+
+ALTER TABLE course_sections ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "users_own_sections"
+    ON course_sections FOR ALL
+    USING (auth.uid() = user_id)
+    WITH CHECK (auth.uid() = user_id);
+
+-- ============================================================
+-- FONCTION RPC : search_course_chunks
+-- Renvoie en plus la section de chaque chunk (NULL : cours antérieurs)
+-- ============================================================
+DROP FUNCTION IF EXISTS search_course_chunks(VECTOR, UUID, INTEGER, TEXT, FLOAT);
+
+CREATE OR REPLACE FUNCTION search_course_chunks(
+    query_embedding  VECTOR(1024),
+    user_id_filter   UUID,
+    match_count      INTEGER DEFAULT 5,
+    subject_filter   TEXT    DEFAULT NULL,
+    similarity_threshold FLOAT DEFAULT 0.3
+)
+RETURNS TABLE (
+    id            UUID,
+    course_id     UUID,
+    course_title  TEXT,
+    subject       TEXT,
+    content       TEXT,
+    chunk_index   INTEGER,
+    section_index INTEGER,
+    similarity    FLOAT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        cc.id,
+        cc.course_id,
+        c.title  AS course_title,
+        c.subject,
+        cc.content,
+        cc.chunk_index,
+        cc.section_index,
+        1 - (cc.embedding <=> query_embedding) AS similarity
+    FROM course_chunks cc
+    JOIN courses c ON c.id = cc.course_id
+    WHERE
+        cc.user_id = user_id_filter
+        AND (subject_filter IS NULL OR c.subject ILIKE '%' || subject_filter || '%')
+        AND 1 - (cc.embedding <=> query_embedding) > similarity_threshold
+    ORDER BY cc.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+-- ============================================================
+-- FONCTION RPC : apply_course_edit (remplace la version de la migration 009)
+-- Les sections du cours sont réécrites avec le texte édité ; chaque chunk
+-- conservé ou inséré porte son section_index.
+-- ============================================================
+DROP FUNCTION IF EXISTS apply_course_edit(UUID, UUID, TIMESTAMPTZ, JSONB, UUID[], JSONB, JSONB);
+
+CREATE OR REPLACE FUNCTION apply_course_edit(
+    p_course_id            UUID,
+    p_user_id              UUID,
+    p_expected_updated_at  TIMESTAMPTZ,
+    p_course               JSONB,
+    p_removed              UUID[],
+    p_kept                 JSONB,
+    p_inserted             JSONB,
+    p_sections             JSONB DEFAULT '[]'::jsonb
+)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    current_updated_at  TIMESTAMPTZ;
+    edited_at           TIMESTAMPTZ := NOW();
+BEGIN
+    SELECT updated_at INTO current_updated_at
+    FROM courses
+    WHERE id = p_course_id AND user_id = p_user_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'course % not found', p_course_id USING ERRCODE = 'P0002';
+    END IF;
+    IF current_updated_at IS DISTINCT FROM p_expected_updated_at THEN
+        RAISE EXCEPTION 'course % modified concurrently', p_course_id USING ERRCODE = '40001';
+    END IF;
+
+    UPDATE courses
+    SET
+        title       = p_course->>'title',
+        subject     = p_course->>'subject',
+        level       = p_course->>'level',
+        keywords    = ARRAY(SELECT jsonb_array_elements_text(p_course->'keywords')),
+        raw_content = p_course->>'raw_content',
+        updated_at  = edited_at
+    WHERE id = p_course_id;
+
+    DELETE FROM course_chunks
+    WHERE course_id = p_course_id AND id = ANY(p_removed);
+
+    UPDATE course_chunks cc
+    SET chunk_index = k.chunk_index, section_index = k.section_index, metadata = k.metadata
+    FROM jsonb_to_recordset(p_kept) AS k(id UUID, chunk_index INTEGER, section_index INTEGER, metadata JSONB)
+    WHERE cc.id = k.id AND cc.course_id = p_course_id;
+
+    INSERT INTO course_chunks (
+        course_id, user_id, content, content_hash, embedding, chunk_index, section_index, metadata
+    )
+    SELECT
+        p_course_id, p_user_id, i.content, i.content_hash, i.embedding::vector,
+        i.chunk_index, i.section_index, i.metadata
+    FROM jsonb_to_recordset(p_inserted) AS i(
+        content TEXT, content_hash TEXT, embedding TEXT, chunk_index INTEGER, section_index INTEGER, metadata JSONB
+    );
+
+    DELETE FROM course_sections WHERE course_id = p_course_id;
+    INSERT INTO course_sections (course_id, user_id, section_index, heading, content)
+    SELECT p_course_id, p_user_id, s.section_index, s.heading, s.content
+    FROM jsonb_to_recordset(p_sections) AS s(section_index INTEGER, heading TEXT, content TEXT);
+
+    RETURN edited_at;
+END;
+$$;
@@ -0,0 +1,268 @@
+-- ============================================================
+-- StudyBuddy — Migration 011 : déduplication des chunks entre cours
+-- Les élèves photographient souvent deux fois la même page, ou des pages
+-- dont l'en-tête se répète : chaque copie était embeddée et indexée, et les
+-- doublons évinçaient les résultats utiles de search_course_chunks.
+-- L'embedding est désormais stocké une fois par (user_id, body_hash), avec
+-- un compteur de références tenu par trigger ; la recherche classe les
+-- corps distincts, puis renvoie un seul chunk par corps.
+-- ============================================================
+
+-- ============================================================
+-- TABLE : chunk_embeddings
+-- body_hash : SHA-256 (hex) du chunk sans sa ligne d'en-tête « [matière — titre] »
+-- ref_count : nombre de course_chunks qui pointent vers l'embedding. Une
+-- entrée à 0 est purgée par le worker après un délai de grâce (un chunk en
+-- cours d'insertion peut encore la référencer).
+-- ============================================================
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    user_id     UUID NOT NULL,
+    body_hash   TEXT NOT NULL,
+    embedding   VECTOR(1024) NOT NULL,
+    ref_count   INTEGER NOT NULL DEFAULT 0,
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, body_hash)
+);
+
+CREATE INDEX IF NOT EXISTS idx_chunk_embeddings_embedding
+    ON chunk_embeddings USING hnsw (embedding vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX IF NOT EXISTS idx_chunk_embeddings_orphans
+    ON chunk_embeddings(updated_at) WHERE ref_count <= 0;
+
+ALTER TABLE chunk_embeddings ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "users_own_chunk_embeddings"
+    ON chunk_embeddings FOR ALL
+    USING (auth.uid() = user_id)
+    WITH CHECK (auth.uid() = user_id);
+
+-- ============================================================
+-- Reprise de l'existant : hash des corps, un embedding par corps distinct
+-- (celui du chunk le plus ancien), compteurs initiaux
+-- ============================================================
+ALTER TABLE course_chunks ADD COLUMN IF NOT EXISTS body_hash TEXT;
+
+UPDATE course_chunks
+SET body_hash = encode(sha256(convert_to(
+    CASE WHEN content LIKE '[%' AND strpos(content, E'\n') > 0
+        THEN substr(content, strpos(content, E'\n') + 1)
+        ELSE content
+    END, 'UTF8')), 'hex')
+WHERE body_hash IS NULL;
+
+INSERT INTO chunk_embeddings (user_id, body_hash, embedding, ref_count)
+SELECT DISTINCT ON (user_id, body_hash) user_id, body_hash, embedding, 0
+FROM course_chunks
+WHERE embedding IS NOT NULL
+ORDER BY user_id, body_hash, created_at
+ON CONFLICT (user_id, body_hash) DO NOTHING;
+
+UPDATE chunk_embeddings ce
+SET ref_count = refs.n
+FROM (
+    SELECT user_id, body_hash, COUNT(*)::INTEGER AS n
+    FROM course_chunks
+    GROUP BY user_id, body_hash
+) refs
+WHERE ce.user_id = refs.user_id AND ce.body_hash = refs.body_hash;
+
+-- Chunks jamais embeddés : introuvables par la recherche, on les retire
+DELETE FROM course_chunks cc
+WHERE NOT EXISTS (
+    SELECT 1 FROM chunk_embeddings ce
+    WHERE ce.user_id = cc.user_id AND ce.body_hash = cc.body_hash
+);
+
+ALTER TABLE course_chunks ALTER COLUMN body_hash SET NOT NULL;
+
+DROP INDEX IF EXISTS idx_chunks_embedding;
+ALTER TABLE course_chunks DROP COLUMN IF EXISTS embedding;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_body_hash ON course_chunks(user_id, body_hash);
+
+-- ============================================================
+-- TRIGGER : compteur de références
+-- Couvre toutes les suppressions (cours supprimé en cascade, édition,
+-- nettoyage d'un job en échec). L'embedding doit exister avant le chunk :
+-- sinon l'insertion échoue (23503) et le job est retenté.
+-- ============================================================
+CREATE OR REPLACE FUNCTION course_chunks_ref_count()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE chunk_embeddings
+        SET ref_count = ref_count + 1, updated_at = NOW()
+        WHERE user_id = NEW.user_id AND body_hash = NEW.body_hash;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'no embedding for chunk body %', NEW.body_hash USING ERRCODE = '23503';
+        END IF;
+        RETURN NEW;
+    END IF;
+
+    UPDATE chunk_embeddings
+    SET ref_count = ref_count - 1, updated_at = NOW()
+    WHERE user_id = OLD.user_id AND body_hash = OLD.body_hash;
+    RETURN OLD;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_course_chunks_ref_count ON course_chunks;
+CREATE TRIGGER trg_course_chunks_ref_count
+    AFTER INSERT OR DELETE ON course_chunks
+    FOR EACH ROW EXECUTE FUNCTION course_chunks_ref_count();
+
+-- ============================================================
+-- FONCTION RPC : search_course_chunks
+-- Les doublons sont repliés avant le LIMIT : match_count corps distincts,
+-- chacun représenté par son chunk le plus récent (copies = nombre de chunks
+-- qui partagent ce corps).
+-- ============================================================
+DROP FUNCTION IF EXISTS search_course_chunks(VECTOR, UUID, INTEGER, TEXT, FLOAT);
+
+CREATE OR REPLACE FUNCTION search_course_chunks(
+    query_embedding  VECTOR(1024),
+    user_id_filter   UUID,
+    match_count      INTEGER DEFAULT 5,
+    subject_filter   TEXT    DEFAULT NULL,
+    similarity_threshold FLOAT DEFAULT 0.3
+)
+RETURNS TABLE (
+    id            UUID,
+    course_id     UUID,
+    course_title  TEXT,
+    subject       TEXT,
+    content       TEXT,
+    chunk_index   INTEGER,
+    section_index INTEGER,
+    similarity    FLOAT,
+    copies        INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH hits AS (
+        SELECT
+            ce.body_hash,
+            1 - (ce.embedding <=> query_embedding) AS similarity
+        FROM chunk_embeddings ce
+        WHERE
+            ce.user_id = user_id_filter
+            AND ce.ref_count > 0
+            AND 1 - (ce.embedding <=> query_embedding) > similarity_threshold
+            AND (subject_filter IS NULL OR EXISTS (
+                SELECT 1
+                FROM course_chunks cc
+                JOIN courses c ON c.id = cc.course_id
+                WHERE cc.user_id = ce.user_id
+                    AND cc.body_hash = ce.body_hash
+                    AND c.subject ILIKE '%' || subject_filter || '%'
+            ))
+        ORDER BY ce.embedding <=> query_embedding
+        LIMIT match_count
+    ),
+    representatives AS (
+        SELECT DISTINCT ON (h.body_hash)
+            cc.id,
+            cc.course_id,
+            c.title  AS course_title,
+            c.subject,
+            cc.content,
+            cc.chunk_index,
+            cc.section_index,
+            h.similarity,
+            (COUNT(*) OVER (PARTITION BY h.body_hash))::INTEGER AS copies
+        FROM hits h
+        JOIN course_chunks cc ON cc.user_id = user_id_filter AND cc.body_hash = h.body_hash
+        JOIN courses c ON c.id = cc.course_id
+        WHERE subject_filter IS NULL OR c.subject ILIKE '%' || subject_filter || '%'
+        ORDER BY h.body_hash, c.created_at DESC, cc.chunk_index
+    )
+    SELECT r.*
+    FROM representatives r
+    ORDER BY r.similarity DESC;
+END;
+$$;
+
+-- ============================================================
+-- FONCTION RPC : apply_course_edit (remplace la version de la migration 010)
+-- inserted : [{content, content_hash, body_hash, embedding, chunk_index, section_index, metadata}]
+-- L'embedding des chunks insérés rejoint chunk_embeddings (partagé si le
+-- corps y est déjà) ; le trigger tient les compteurs des chunks supprimés
+-- et insérés.
+-- ============================================================
+CREATE OR REPLACE FUNCTION apply_course_edit(
+    p_course_id            UUID,
+    p_user_id              UUID,
+    p_expected_updated_at  TIMESTAMPTZ,
+    p_course               JSONB,
+    p_removed              UUID[],
+    p_kept                 JSONB,
+    p_inserted             JSONB,
+    p_sections             JSONB DEFAULT '[]'::jsonb
+)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    current_updated_at  TIMESTAMPTZ;
+    edited_at           TIMESTAMPTZ := NOW();
+BEGIN
+    SELECT updated_at INTO current_updated_at
+    FROM courses
+    WHERE id = p_course_id AND user_id = p_user_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'course % not found', p_course_id USING ERRCODE = 'P0002';
+    END IF;
+    IF current_updated_at IS DISTINCT FROM p_expected_updated_at THEN
+        RAISE EXCEPTION 'course % modified concurrently', p_course_id USING ERRCODE = '40001';
+    END IF;
+
+    UPDATE courses
+    SET
+        title       = p_course->>'title',
+        subject     = p_course->>'subject',
+        level       = p_course->>'level',
+        keywords    = ARRAY(SELECT jsonb_array_elements_text(p_course->'keywords')),
+        raw_content = p_course->>'raw_content',
+        updated_at  = edited_at
+    WHERE id = p_course_id;
+
+    DELETE FROM course_chunks
+    WHERE course_id = p_course_id AND id = ANY(p_removed);
+
+    UPDATE course_chunks cc
+    SET chunk_index = k.chunk_index, section_index = k.section_index, metadata = k.metadata
+    FROM jsonb_to_recordset(p_kept) AS k(id UUID, chunk_index INTEGER, section_index INTEGER, metadata JSONB)
+    WHERE cc.id = k.id AND cc.course_id = p_course_id;
+
+    INSERT INTO chunk_embeddings (user_id, body_hash, embedding)
+    SELECT DISTINCT ON (i.body_hash) p_user_id, i.body_hash, i.embedding::vector
+    FROM jsonb_to_recordset(p_inserted) AS i(body_hash TEXT, embedding TEXT)
+    ON CONFLICT (user_id, body_hash) DO UPDATE SET updated_at = NOW();
+
+    INSERT INTO course_chunks (
+        course_id, user_id, content, content_hash, body_hash, chunk_index, section_index, metadata
+    )
+    SELECT
+        p_course_id, p_user_id, i.content, i.content_hash, i.body_hash,
+        i.chunk_index, i.section_index, i.metadata
+    FROM jsonb_to_recordset(p_inserted) AS i(
+        content TEXT, content_hash TEXT, body_hash TEXT, chunk_index INTEGER, section_index INTEGER, metadata JSONB
+    );
+
+    DELETE FROM course_sections WHERE course_id = p_course_id;
+    INSERT INTO course_sections (course_id, user_id, section_index, heading, content)
+    SELECT p_course_id, p_user_id, s.section_index, s.heading, s.content
+    FROM jsonb_to_recordset(p_sections) AS s(section_index INTEGER, heading TEXT, content TEXT);
+
+    RETURN edited_at;
+END;
+$$;
@@ -0,0 +1,223 @@
+-- ============================================================
+-- StudyBuddy — Migration 012 : générations de chunks (re-chunking en masse)
+-- Changer chunk_size, chunk_overlap ou embedding_model laissait les cours
+-- existants sur l'ancien découpage. scripts.rechunk_courses reconstruit les
+-- chunks d'un cours depuis raw_content dans une génération fantôme
+-- (invisible de la recherche), puis swap_course_generation la rend active
+-- et supprime l'ancienne en une transaction : la recherche ne voit jamais
+-- un cours à moitié migré.
+-- ============================================================
+
+-- chunk_scheme : empreinte des réglages de chunking + modèle d'embedding
+-- (rag.ingestion.current_chunk_scheme) ; NULL pour les cours antérieurs
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS chunk_generation INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS chunk_scheme     TEXT;
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS embedding_model  TEXT;
+
+ALTER TABLE course_chunks ADD COLUMN IF NOT EXISTS generation INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_course_generation ON course_chunks(course_id, generation);
+CREATE INDEX IF NOT EXISTS idx_courses_chunk_scheme     ON courses(chunk_scheme);
+
+-- ============================================================
+-- FONCTION RPC : search_course_chunks
+-- Seuls les chunks de la génération active de leur cours sont renvoyés
+-- ============================================================
+CREATE OR REPLACE FUNCTION search_course_chunks(
+    query_embedding  VECTOR(1024),
+    user_id_filter   UUID,
+    match_count      INTEGER DEFAULT 5,
+    subject_filter   TEXT    DEFAULT NULL,
+    similarity_threshold FLOAT DEFAULT 0.3
+)
+RETURNS TABLE (
+    id            UUID,
+    course_id     UUID,
+    course_title  TEXT,
+    subject       TEXT,
+    content       TEXT,
+    chunk_index   INTEGER,
+    section_index INTEGER,
+    similarity    FLOAT,
+    copies        INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH hits AS (
+        SELECT
+            ce.body_hash,
+            1 - (ce.embedding <=> query_embedding) AS similarity
+        FROM chunk_embeddings ce
+        WHERE
+            ce.user_id = user_id_filter
+            AND ce.ref_count > 0
+            AND 1 - (ce.embedding <=> query_embedding) > similarity_threshold
+            AND EXISTS (
+                SELECT 1
+                FROM course_chunks cc
+                JOIN courses c ON c.id = cc.course_id
+                WHERE cc.user_id = ce.user_id
+                    AND cc.body_hash = ce.body_hash
+                    AND cc.generation = c.chunk_generation
+                    AND (subject_filter IS NULL OR c.subject ILIKE '%' || subject_filter || '%')
+            )
+        ORDER BY ce.embedding <=> query_embedding
+        LIMIT match_count
+    ),
+    representatives AS (
+        SELECT DISTINCT ON (h.body_hash)
+            cc.id,
+            cc.course_id,
+            c.title  AS course_title,
+            c.subject,
+            cc.content,
+            cc.chunk_index,
+            cc.section_index,
+            h.similarity,
+            (COUNT(*) OVER (PARTITION BY h.body_hash))::INTEGER AS copies
+        FROM hits h
+        JOIN course_chunks cc ON cc.user_id = user_id_filter AND cc.body_hash = h.body_hash
+        JOIN courses c ON c.id = cc.course_id AND cc.generation = c.chunk_generation
+        WHERE subject_filter IS NULL OR c.subject ILIKE '%' || subject_filter || '%'
+        ORDER BY h.body_hash, c.created_at DESC, cc.chunk_index
+    )
+    SELECT r.*
+    FROM representatives r
+    ORDER BY r.similarity DESC;
+END;
+$$;
+
+-- ============================================================
+-- FONCTION RPC : apply_course_edit (remplace la version de la migration 011)
+-- Les chunks insérés rejoignent la génération active du cours
+-- ============================================================
+CREATE OR REPLACE FUNCTION apply_course_edit(
+    p_course_id            UUID,
+    p_user_id              UUID,
+    p_expected_updated_at  TIMESTAMPTZ,
+    p_course               JSONB,
+    p_removed              UUID[],
+    p_kept                 JSONB,
+    p_inserted             JSONB,
+    p_sections             JSONB DEFAULT '[]'::jsonb
+)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    current_updated_at  TIMESTAMPTZ;
+    current_generation  INTEGER;
+    edited_at           TIMESTAMPTZ := NOW();
+BEGIN
+    SELECT updated_at, chunk_generation INTO current_updated_at, current_generation
+    FROM courses
+    WHERE id = p_course_id AND user_id = p_user_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'course % not found', p_course_id USING ERRCODE = 'P0002';
+    END IF;
+    IF current_updated_at IS DISTINCT FROM p_expected_updated_at THEN
+        RAISE EXCEPTION 'course % modified concurrently', p_course_id USING ERRCODE = '40001';
+    END IF;
+
+    UPDATE courses
+    SET
+        title       = p_course->>'title',
+        subject     = p_course->>'subject',
+        level       = p_course->>'level',
+        keywords    = ARRAY(SELECT jsonb_array_elements_text(p_course->'keywords')),
+        raw_content = p_course->>'raw_content',
+        updated_at  = edited_at
+    WHERE id = p_course_id;
+
+    DELETE FROM course_chunks
+    WHERE course_id = p_course_id AND id = ANY(p_removed);
+
+    UPDATE course_chunks cc
+    SET chunk_index = k.chunk_index, section_index = k.section_index, metadata = k.metadata
+    FROM jsonb_to_recordset(p_kept) AS k(id UUID, chunk_index INTEGER, section_index INTEGER, metadata JSONB)
+    WHERE cc.id = k.id AND cc.course_id = p_course_id;
+
+    INSERT INTO chunk_embeddings (user_id, body_hash, embedding)
+    SELECT DISTINCT ON (i.body_hash) p_user_id, i.body_hash, i.embedding::vector
+    FROM jsonb_to_recordset(p_inserted) AS i(body_hash TEXT, embedding TEXT)
+    ON CONFLICT (user_id, body_hash) DO UPDATE SET updated_at = NOW();
+
+    INSERT INTO course_chunks (
+        course_id, user_id, content, content_hash, body_hash, chunk_index, section_index, metadata, generation
+    )
+    SELECT
+        p_course_id, p_user_id, i.content, i.content_hash, i.body_hash,
+        i.chunk_index, i.section_index, i.metadata, current_generation
+    FROM jsonb_to_recordset(p_inserted) AS i(
+        content TEXT, content_hash TEXT, body_hash TEXT, chunk_index INTEGER, section_index INTEGER, metadata JSONB
+    );
+
+    DELETE FROM course_sections WHERE course_id = p_course_id;
+    INSERT INTO course_sections (course_id, user_id, section_index, heading, content)
+    SELECT p_course_id, p_user_id, s.section_index, s.heading, s.content
+    FROM jsonb_to_recordset(p_sections) AS s(section_index INTEGER, heading TEXT, content TEXT);
+
+    RETURN edited_at;
+END;
+$$;
+
+-- ============================================================
+-- FONCTION RPC : swap_course_generation
+-- Active la génération fantôme p_generation (chunks déjà insérés), supprime
+-- les autres et réécrit les sections. Refuse (40001) si le cours a été
+-- édité depuis sa lecture par le script, ou si la génération n'est pas
+-- plus récente que l'active. updated_at avance : une édition lancée sur
+-- l'ancienne génération est refusée à son tour.
+-- ============================================================
+CREATE OR REPLACE FUNCTION swap_course_generation(
+    p_course_id            UUID,
+    p_expected_updated_at  TIMESTAMPTZ,
+    p_generation           INTEGER,
+    p_scheme               TEXT,
+    p_embedding_model      TEXT,
+    p_sections             JSONB DEFAULT '[]'::jsonb
+)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    current_updated_at  TIMESTAMPTZ;
+    current_generation  INTEGER;
+    owner_id            UUID;
+    swapped_at          TIMESTAMPTZ := NOW();
+BEGIN
+    SELECT updated_at, chunk_generation, user_id INTO current_updated_at, current_generation, owner_id
+    FROM courses
+    WHERE id = p_course_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'course % not found', p_course_id USING ERRCODE = 'P0002';
+    END IF;
+    IF current_updated_at IS DISTINCT FROM p_expected_updated_at OR p_generation <= current_generation THEN
+        RAISE EXCEPTION 'course % modified concurrently', p_course_id USING ERRCODE = '40001';
+    END IF;
+
+    UPDATE courses
+    SET
+        chunk_generation = p_generation,
+        chunk_scheme     = p_scheme,
+        embedding_model  = p_embedding_model,
+        updated_at       = swapped_at
+    WHERE id = p_course_id;
+
+    DELETE FROM course_chunks
+    WHERE course_id = p_course_id AND generation <> p_generation;
+
+    DELETE FROM course_sections WHERE course_id = p_course_id;
+    INSERT INTO course_sections (course_id, user_id, section_index, heading, content)
+    SELECT p_course_id, owner_id, s.section_index, s.heading, s.content
+    FROM jsonb_to_recordset(p_sections) AS s(section_index INTEGER, heading TEXT, content TEXT);
+
+    RETURN swapped_at;
+END;
+$$;
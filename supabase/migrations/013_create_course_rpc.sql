@@ -0,0 +1,74 @@
+-- ============================================================
+-- StudyBuddy — Migration 013 : création d'un cours en une transaction
+-- save_course insérait le cours, puis ses chunks par lots de 50, puis ses
+-- sections : autant d'allers-retours HTTP, et un échec au milieu laissait
+-- un cours orphelin aux chunks partiels. create_course_with_chunks écrit
+-- le cours, les embeddings partagés, les chunks et les sections en un seul
+-- appel, tout ou rien.
+-- ============================================================
+
+-- ============================================================
+-- FONCTION RPC : create_course_with_chunks
+-- p_course     : {id, user_id, title, subject, level, keywords, raw_content,
+--                 content_hash, chunk_scheme, embedding_model, created_at}
+-- p_embeddings : [{body_hash, embedding}] un par corps distinct
+-- p_chunks     : [{content, content_hash, body_hash, chunk_index, section_index, metadata}]
+-- p_sections   : [{section_index, heading, content}]
+-- Un content_hash déjà présent pour l'élève lève 23505 avant toute
+-- écriture de chunk (index unique de la migration 008).
+-- ============================================================
+CREATE OR REPLACE FUNCTION create_course_with_chunks(
+    p_course      JSONB,
+    p_embeddings  JSONB,
+    p_chunks      JSONB,
+    p_sections    JSONB DEFAULT '[]'::jsonb
+)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_course_id   UUID        := (p_course->>'id')::UUID;
+    v_user_id     UUID        := (p_course->>'user_id')::UUID;
+    v_created_at  TIMESTAMPTZ := COALESCE((p_course->>'created_at')::TIMESTAMPTZ, NOW());
+BEGIN
+    INSERT INTO courses (
+        id, user_id, title, subject, level, keywords, raw_content,
+        content_hash, chunk_scheme, embedding_model, created_at
+    )
+    VALUES (
+        v_course_id,
+        v_user_id,
+        p_course->>'title',
+        p_course->>'subject',
+        p_course->>'level',
+        ARRAY(SELECT jsonb_array_elements_text(COALESCE(p_course->'keywords', '[]'::jsonb))),
+        p_course->>'raw_content',
+        p_course->>'content_hash',
+        p_course->>'chunk_scheme',
+        p_course->>'embedding_model',
+        v_created_at
+    );
+
+    INSERT INTO chunk_embeddings (user_id, body_hash, embedding)
+    SELECT DISTINCT ON (e.body_hash) v_user_id, e.body_hash, e.embedding::vector
+    FROM jsonb_to_recordset(p_embeddings) AS e(body_hash TEXT, embedding TEXT)
+    ON CONFLICT (user_id, body_hash) DO UPDATE
+        SET embedding = EXCLUDED.embedding, updated_at = NOW();
+
+    INSERT INTO course_chunks (
+        course_id, user_id, content, content_hash, body_hash, chunk_index, section_index, metadata
+    )
+    SELECT
+        v_course_id, v_user_id, c.content, c.content_hash, c.body_hash,
+        c.chunk_index, c.section_index, c.metadata
+    FROM jsonb_to_recordset(p_chunks) AS c(
+        content TEXT, content_hash TEXT, body_hash TEXT, chunk_index INTEGER, section_index INTEGER, metadata JSONB
+    );
+
+    INSERT INTO course_sections (course_id, user_id, section_index, heading, content)
+    SELECT v_course_id, v_user_id, s.section_index, s.heading, s.content
+    FROM jsonb_to_recordset(p_sections) AS s(section_index INTEGER, heading TEXT, content TEXT);
+
+    RETURN v_created_at;
+END;
+$$;
@@ -0,0 +1,22 @@
+-- ============================================================
+-- StudyBuddy — Migration 014 : cache des embeddings
+-- Évite de repayer un appel Voyage pour un texte déjà embeddé (requête
+-- répétée par la boucle de révision, question reposée, chunk réimporté).
+-- Tier persistant du cache rag/embedding_cache.py, derrière un LRU en
+-- mémoire par process.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model       TEXT NOT NULL,
+    input_type  TEXT NOT NULL CHECK (input_type IN ('query', 'document')),
+    text_hash   TEXT NOT NULL,           -- SHA-256 (hex) du texte embeddé
+    embedding   VECTOR NOT NULL,         -- Dimension du modèle
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (model, input_type, text_hash)
+);
+
+-- Purge des entrées expirées (worker d'ingestion)
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_created_at ON embedding_cache(created_at);
+
+-- Table interne au backend (service_role) : aucun accès côté client
+ALTER TABLE embedding_cache ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,86 @@
+-- ============================================================
+-- StudyBuddy — Migration 015 : recherche filtrée par modèle d'embedding
+-- Les embeddings viennent d'un fournisseur au choix (Voyage, ou le
+-- TF-IDF local de rag/embedding_providers.py), et le local sert de secours
+-- quand Voyage est indisponible. Leurs vecteurs ne sont pas comparables :
+-- une requête ne cherche que dans les cours embeddés par le même modèle
+-- (courses.embedding_model).
+-- ============================================================
+
+-- Cours antérieurs à la migration 012 : tous embeddés par voyage-3
+UPDATE courses SET embedding_model = 'voyage-3' WHERE embedding_model IS NULL;
+
+-- ============================================================
+-- FONCTION RPC : search_course_chunks (remplace la version de la migration 012)
+-- Nouveau paramètre : le changement de signature impose de supprimer l'ancienne
+-- ============================================================
+DROP FUNCTION IF EXISTS search_course_chunks(VECTOR, UUID, INTEGER, TEXT, FLOAT);
+
+CREATE FUNCTION search_course_chunks(
+    query_embedding  VECTOR(1024),
+    user_id_filter   UUID,
+    match_count      INTEGER DEFAULT 5,
+    subject_filter   TEXT    DEFAULT NULL,
+    similarity_threshold FLOAT DEFAULT 0.3,
+    embedding_model_filter TEXT  DEFAULT NULL
+)
+RETURNS TABLE (
+    id            UUID,
+    course_id     UUID,
+    course_title  TEXT,
+    subject       TEXT,
+    content       TEXT,
+    chunk_index   INTEGER,
+    section_index INTEGER,
+    similarity    FLOAT,
+    copies        INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH hits AS (
+        SELECT
+            ce.body_hash,
+            1 - (ce.embedding <=> query_embedding) AS similarity
+        FROM chunk_embeddings ce
+        WHERE
+            ce.user_id = user_id_filter
+            AND ce.ref_count > 0
+            AND 1 - (ce.embedding <=> query_embedding) > similarity_threshold
+            AND EXISTS (
+                SELECT 1
+                FROM course_chunks cc
+                JOIN courses c ON c.id = cc.course_id
+                WHERE cc.user_id = ce.user_id
+                    AND cc.body_hash = ce.body_hash
+                    AND cc.generation = c.chunk_generation
+                    AND (embedding_model_filter IS NULL OR c.embedding_model = embedding_model_filter)
+                    AND (subject_filter IS NULL OR c.subject ILIKE '%' || subject_filter || '%')
+            )
+        ORDER BY ce.embedding <=> query_embedding
+        LIMIT match_count
+    ),
+    representatives AS (
+        SELECT DISTINCT ON (h.body_hash)
+            cc.id,
+            cc.course_id,
+            c.title  AS course_title,
+            c.subject,
+            cc.content,
+            cc.chunk_index,
+            cc.section_index,
+            h.similarity,
+            (COUNT(*) OVER (PARTITION BY h.body_hash))::INTEGER AS copies
+        FROM hits h
+        JOIN course_chunks cc ON cc.user_id = user_id_filter AND cc.body_hash = h.body_hash
+        JOIN courses c ON c.id = cc.course_id AND cc.generation = c.chunk_generation
+        WHERE (embedding_model_filter IS NULL OR c.embedding_model = embedding_model_filter)
+            AND (subject_filter IS NULL OR c.subject ILIKE '%' || subject_filter || '%')
+        ORDER BY h.body_hash, c.created_at DESC, cc.chunk_index
+    )
+    SELECT r.*
+    FROM representatives r
+    ORDER BY r.similarity DESC;
+END;
+$$;
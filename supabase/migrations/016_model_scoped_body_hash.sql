@@ -0,0 +1,145 @@
+-- ============================================================
+-- StudyBuddy — Migration 016 : le modèle d'embedding dans la clé des corps
+-- body_hash ne couvrait que le corps du chunk : un même corps embeddé par
+-- deux modèles (fournisseur local, secours pendant une panne de Voyage,
+-- re-chunking vers un nouveau modèle) partageait une ligne de
+-- chunk_embeddings, et create_course_with_chunks écrasait le vecteur dont
+-- dépendaient les cours de l'autre modèle.
+-- body_hash = SHA-256 de « <modèle>\n<corps> » (rag.chunking.chunk_body_hash),
+-- et un conflit conserve toujours le vecteur stocké : même clé, même modèle.
+-- ============================================================
+
+-- Corps d'un chunk, sans l'en-tête « [matière — titre] » (rag.chunking.chunk_body)
+CREATE OR REPLACE FUNCTION chunk_body(content TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE WHEN content LIKE '[%' AND strpos(content, E'\n') > 0
+        THEN substr(content, strpos(content, E'\n') + 1)
+        ELSE content
+    END;
+$$;
+
+-- ============================================================
+-- Reprise de l'existant : les chunks au hash sans modèle (antérieurs aux
+-- fournisseurs ; ceux du secours local l'incluaient déjà) sont rehachés avec
+-- le modèle de leur cours. Le vecteur stocké sous l'ancien hash est celui du
+-- dernier cours écrit (les insertions l'écrasaient) : il est repris pour le
+-- modèle de ce cours.
+-- ============================================================
+CREATE TEMP TABLE body_rehash AS
+SELECT
+    cc.id          AS chunk_id,
+    cc.user_id,
+    cc.body_hash   AS old_hash,
+    c.updated_at,
+    encode(sha256(convert_to(c.embedding_model || E'\n' || chunk_body(cc.content), 'UTF8')), 'hex') AS new_hash
+FROM course_chunks cc
+JOIN courses c ON c.id = cc.course_id
+WHERE cc.body_hash = encode(sha256(convert_to(chunk_body(cc.content), 'UTF8')), 'hex');
+
+INSERT INTO chunk_embeddings (user_id, body_hash, embedding, ref_count)
+SELECT DISTINCT ON (r.user_id, r.old_hash) r.user_id, r.new_hash, ce.embedding, 0
+FROM body_rehash r
+JOIN chunk_embeddings ce ON ce.user_id = r.user_id AND ce.body_hash = r.old_hash
+ORDER BY r.user_id, r.old_hash, r.updated_at DESC
+ON CONFLICT (user_id, body_hash) DO NOTHING;
+
+-- Chunks d'un autre modèle que ce vecteur : sans embedding valable, ils sont
+-- retirés et leur cours sera reconstruit par scripts.rechunk_courses
+UPDATE courses c
+SET chunk_scheme = NULL
+WHERE EXISTS (
+    SELECT 1
+    FROM body_rehash r
+    JOIN course_chunks cc ON cc.id = r.chunk_id
+    WHERE cc.course_id = c.id
+        AND NOT EXISTS (
+            SELECT 1 FROM chunk_embeddings ce
+            WHERE ce.user_id = r.user_id AND ce.body_hash = r.new_hash
+        )
+);
+
+DELETE FROM course_chunks cc
+USING body_rehash r
+WHERE cc.id = r.chunk_id
+    AND NOT EXISTS (
+        SELECT 1 FROM chunk_embeddings ce
+        WHERE ce.user_id = r.user_id AND ce.body_hash = r.new_hash
+    );
+
+UPDATE course_chunks cc
+SET body_hash = r.new_hash
+FROM body_rehash r
+WHERE cc.id = r.chunk_id;
+
+-- Le trigger ne suit pas les UPDATE : compteurs recalculés. Les anciennes
+-- entrées tombent à 0 et sont purgées par le worker après le délai de grâce.
+UPDATE chunk_embeddings ce
+SET ref_count = (
+        SELECT COUNT(*)::INTEGER FROM course_chunks cc
+        WHERE cc.user_id = ce.user_id AND cc.body_hash = ce.body_hash
+    ),
+    updated_at = NOW();
+
+DROP TABLE body_rehash;
+
+-- ============================================================
+-- FONCTION RPC : create_course_with_chunks (remplace la version de la migration 013)
+-- Un corps déjà stocké garde son vecteur, comme dans apply_course_edit
+-- ============================================================
+CREATE OR REPLACE FUNCTION create_course_with_chunks(
+    p_course      JSONB,
+    p_embeddings  JSONB,
+    p_chunks      JSONB,
+    p_sections    JSONB DEFAULT '[]'::jsonb
+)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_course_id   UUID        := (p_course->>'id')::UUID;
+    v_user_id     UUID        := (p_course->>'user_id')::UUID;
+    v_created_at  TIMESTAMPTZ := COALESCE((p_course->>'created_at')::TIMESTAMPTZ, NOW());
+BEGIN
+    INSERT INTO courses (
+        id, user_id, title, subject, level, keywords, raw_content,
+        content_hash, chunk_scheme, embedding_model, created_at
+    )
+    VALUES (
+        v_course_id,
+        v_user_id,
+        p_course->>'title',
+        p_course->>'subject',
+        p_course->>'level',
+        ARRAY(SELECT jsonb_array_elements_text(COALESCE(p_course->'keywords', '[]'::jsonb))),
+        p_course->>'raw_content',
+        p_course->>'content_hash',
+        p_course->>'chunk_scheme',
+        p_course->>'embedding_model',
+        v_created_at
+    );
+
+    INSERT INTO chunk_embeddings (user_id, body_hash, embedding)
+    SELECT DISTINCT ON (e.body_hash) v_user_id, e.body_hash, e.embedding::vector
+    FROM jsonb_to_recordset(p_embeddings) AS e(body_hash TEXT, embedding TEXT)
+    ON CONFLICT (user_id, body_hash) DO UPDATE SET updated_at = NOW();
+
+    INSERT INTO course_chunks (
+        course_id, user_id, content, content_hash, body_hash, chunk_index, section_index, metadata
+    )
+    SELECT
+        v_course_id, v_user_id, c.content, c.content_hash, c.body_hash,
+        c.chunk_index, c.section_index, c.metadata
+    FROM jsonb_to_recordset(p_chunks) AS c(
+        content TEXT, content_hash TEXT, body_hash TEXT, chunk_index INTEGER, section_index INTEGER, metadata JSONB
+    );
+
+    INSERT INTO course_sections (course_id, user_id, section_index, heading, content)
+    SELECT v_course_id, v_user_id, s.section_index, s.heading, s.content
+    FROM jsonb_to_recordset(p_sections) AS s(section_index INTEGER, heading TEXT, content TEXT);
+
+    RETURN v_created_at;
+END;
+$$;
@@ -0,0 +1,16 @@
+-- ============================================================
+-- StudyBuddy — Migration 017 : expiration du cache d'embeddings à l'usage
+-- La purge supprimait les entrées par created_at, jamais rafraîchi : les
+-- embeddings les plus demandés expiraient au même rythme que les autres et
+-- le cache perdait régulièrement son ensemble chaud. last_used_at est
+-- rafraîchi par lots par rag/embedding_cache.py (écriture, lecture servie
+-- par l'un ou l'autre niveau) et sert de critère de purge.
+-- ============================================================
+
+ALTER TABLE embedding_cache ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMPTZ;
+UPDATE embedding_cache SET last_used_at = created_at WHERE last_used_at IS NULL;
+ALTER TABLE embedding_cache ALTER COLUMN last_used_at SET DEFAULT NOW();
+ALTER TABLE embedding_cache ALTER COLUMN last_used_at SET NOT NULL;
+
+DROP INDEX IF EXISTS idx_embedding_cache_created_at;
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used_at ON embedding_cache(last_used_at);
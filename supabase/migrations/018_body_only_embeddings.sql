@@ -0,0 +1,25 @@
+-- ============================================================
+-- StudyBuddy — Migration 018 : seul le corps des chunks est embeddé
+-- body_hash ne couvrait que le corps, mais le vecteur embeddait aussi
+-- l'en-tête « [matière — titre] » : deux cours au même corps partageaient
+-- le vecteur du premier cours écrit, titre et matière compris, et la
+-- recherche renvoyait un chunk noté sur le titre d'un autre cours.
+-- embed_chunks n'embedde plus que le corps : la clé couvre exactement le
+-- texte embeddé (CHUNKER_VERSION 3, rag.chunking.chunk_body_hash).
+-- ============================================================
+
+-- ============================================================
+-- Reprise de l'existant : les vecteurs stockés portent un en-tête et ne
+-- doivent pas être repris sous la nouvelle clé. Ils passent sous une clé
+-- « legacy: » que rien ne recalcule ; la recherche continue de s'en servir
+-- jusqu'à ce que scripts.rechunk_courses ré-embedde chaque cours (son
+-- empreinte change avec CHUNKER_VERSION). Renommage un pour un : les
+-- compteurs de références restent justes.
+-- ============================================================
+UPDATE chunk_embeddings
+SET body_hash = 'legacy:' || body_hash
+WHERE body_hash NOT LIKE 'legacy:%';
+
+UPDATE course_chunks
+SET body_hash = 'legacy:' || body_hash
+WHERE body_hash NOT LIKE 'legacy:%';
@@ -0,0 +1,88 @@
+-- ============================================================
+-- StudyBuddy — Migration 020 : édition d'un cours embeddé par un autre modèle
+-- edit_course embeddait les chunks ajoutés avec le modèle du fournisseur,
+-- même quand le cours venait du secours local (import en mode dégradé) :
+-- chunks conservés et ajoutés vivaient dans deux espaces, et le filtre
+-- embedding_model de search_course_chunks (migration 015) comparait des
+-- vecteurs Voyage à une requête locale. Un tel cours est désormais
+-- entièrement ré-embeddé ; p_course porte alors son nouveau modèle et son
+-- empreinte de chunking (absents : inchangés).
+-- ============================================================
+
+-- ============================================================
+-- FONCTION RPC : apply_course_edit (remplace la version de la migration 019)
+-- ============================================================
+CREATE OR REPLACE FUNCTION apply_course_edit(
+    p_course_id            UUID,
+    p_user_id              UUID,
+    p_expected_updated_at  TIMESTAMPTZ,
+    p_course               JSONB,
+    p_removed              UUID[],
+    p_kept                 JSONB,
+    p_inserted             JSONB,
+    p_sections             JSONB DEFAULT '[]'::jsonb
+)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    current_updated_at  TIMESTAMPTZ;
+    current_generation  INTEGER;
+    edited_at           TIMESTAMPTZ := NOW();
+BEGIN
+    SELECT updated_at, chunk_generation INTO current_updated_at, current_generation
+    FROM courses
+    WHERE id = p_course_id AND user_id = p_user_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'course % not found', p_course_id USING ERRCODE = 'P0002';
+    END IF;
+    IF current_updated_at IS DISTINCT FROM p_expected_updated_at THEN
+        RAISE EXCEPTION 'course % modified concurrently', p_course_id USING ERRCODE = '40001';
+    END IF;
+
+    UPDATE courses
+    SET
+        title           = p_course->>'title',
+        subject         = p_course->>'subject',
+        level           = p_course->>'level',
+        keywords        = ARRAY(SELECT jsonb_array_elements_text(p_course->'keywords')),
+        raw_content     = p_course->>'raw_content',
+        embedding_model = COALESCE(p_course->>'embedding_model', embedding_model),
+        chunk_scheme    = COALESCE(p_course->>'chunk_scheme', chunk_scheme),
+        updated_at      = edited_at
+    WHERE id = p_course_id;
+
+    DELETE FROM course_chunks
+    WHERE course_id = p_course_id AND id = ANY(p_removed);
+
+    UPDATE course_chunks cc
+    SET chunk_index = k.chunk_index, section_index = k.section_index, metadata = k.metadata
+    FROM jsonb_to_recordset(p_kept) AS k(id UUID, chunk_index INTEGER, section_index INTEGER, metadata JSONB)
+    WHERE cc.id = k.id AND cc.course_id = p_course_id;
+
+    INSERT INTO chunk_embeddings (user_id, body_hash, embedding)
+    SELECT DISTINCT ON (i.body_hash) p_user_id, i.body_hash, i.embedding::vector
+    FROM jsonb_to_recordset(p_inserted) AS i(body_hash TEXT, embedding TEXT)
+    WHERE i.embedding IS NOT NULL
+    ON CONFLICT (user_id, body_hash) DO UPDATE SET updated_at = NOW();
+
+    INSERT INTO course_chunks (
+        course_id, user_id, content, content_hash, body_hash, chunk_index, section_index, metadata, generation
+    )
+    SELECT
+        p_course_id, p_user_id, i.content, i.content_hash, i.body_hash,
+        i.chunk_index, i.section_index, i.metadata, current_generation
+    FROM jsonb_to_recordset(p_inserted) AS i(
+        content TEXT, content_hash TEXT, body_hash TEXT, chunk_index INTEGER, section_index INTEGER, metadata JSONB
+    );
+
+    DELETE FROM course_sections WHERE course_id = p_course_id;
+    INSERT INTO course_sections (course_id, user_id, section_index, heading, content)
+    SELECT p_course_id, p_user_id, s.section_index, s.heading, s.content
+    FROM jsonb_to_recordset(p_sections) AS s(section_index INTEGER, heading TEXT, content TEXT);
+
+    RETURN edited_at;
+END;
+$$;